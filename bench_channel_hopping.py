@@ -0,0 +1,96 @@
+"""
+Goodput of a chunked transfer on the fixed home channel versus the hopping
+channel manager, in the link simulator with a Wi-Fi-like interferer sitting
+on top of channel 76:
+    python bench_channel_hopping.py
+"""
+import threading
+import time
+
+import channel_manager
+import handshake
+from link_sim import Interferer, Link
+
+PAYLOAD_BYTES = 60_000
+CHUNK_DATA_SIZE = 30
+RETRIES = 3          # setRetries() count, so interference shows up as failed writes
+CHUNK_TIMEOUT_S = 5.0  # per chunk before the transfer is declared failed
+SEED = 7
+
+
+def offer(mask):
+    return handshake.parse_offer(handshake.build_offer(
+        caps=handshake.CAP_INDEXED_CHUNKS | handshake.CAP_CHANNEL_HOPPING, channel_mask=mask,
+    ))
+
+
+def receiver_loop(radio, channels, received, stop):
+    radio.startListening()
+    while not stop.is_set():
+        if not radio.available():
+            channels.check_resync()
+            time.sleep(0.0002)
+            continue
+        payload = radio.read(32)
+        if channels.handle_packet(payload):
+            continue
+        received.add(int.from_bytes(payload[:2], 'big'))
+
+
+def run(hopping):
+    interferer = Interferer(center_channel=72, duty_cycle=0.6, burst_s=0.05, seed=SEED)
+    link = Link(seed=SEED, interferer=interferer)
+    tx, rx = link.endpoints()
+    for radio in (tx, rx):
+        radio.setRetries(5, RETRIES)
+
+    if hopping:
+        tx_mask = channel_manager.quiet_channel_mask(channel_manager.scan_band(tx))
+        rx_mask = channel_manager.quiet_channel_mask(channel_manager.scan_band(rx))
+        session = handshake.select_config(offer(rx_mask), offer(tx_mask))
+    else:
+        session = handshake.select_config(offer(0), offer(0))
+    tx_channels = channel_manager.ChannelManager.from_session(tx, session, verbose=False)
+    rx_channels = channel_manager.ChannelManager.from_session(rx, session, verbose=False)
+
+    received = set()
+    stop = threading.Event()
+    thread = threading.Thread(target=receiver_loop, args=(rx, rx_channels, received, stop), daemon=True)
+    thread.start()
+
+    num_chunks = PAYLOAD_BYTES // CHUNK_DATA_SIZE
+    chunk = bytes(CHUNK_DATA_SIZE)
+    attempts = 0
+    start = time.perf_counter()
+    for index in range(num_chunks):
+        deadline = time.perf_counter() + CHUNK_TIMEOUT_S
+        while True:
+            attempts += 1
+            ok = tx.write(index.to_bytes(2, 'big') + chunk)
+            tx_channels.record(ok)
+            if ok or time.perf_counter() > deadline:
+                break
+            if not tx_channels.maybe_hop():
+                tx_channels.check_resync()
+        if not ok:
+            break
+    elapsed = time.perf_counter() - start
+    time.sleep(0.01)
+    stop.set()
+    thread.join()
+
+    goodput = len(received) * CHUNK_DATA_SIZE / elapsed
+    label = "hopping" if hopping else "fixed 76"
+    print(f"{label:9s} channels={len(tx_channels.sequence):2d} delivered {len(received):5d}/{num_chunks} chunks "
+          f"in {elapsed:5.2f} s | goodput {goodput / 1000:6.1f} kB/s | "
+          f"writes {attempts} ({attempts / max(len(received), 1):.2f}/chunk) | hops {tx_channels.hops}")
+
+
+def main():
+    print(f"Interferer on channels 61-83 (home channel {channel_manager.HOME_CHANNEL}), {PAYLOAD_BYTES} byte transfer")
+    run(hopping=False)
+    run(hopping=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Compression ratio against CPU time for every codec in compression.py, per
+product, to decide which codec each product should prefer
+(compression.PRODUCT_CODECS). Telemetry is single stamped records as the
+sender sends them; logs and files are larger text blobs; the JPEG stand-in is
+random bytes, which is what a JPEG looks like to a compressor. Frames are
+compact-framing packets (framing.py) per transfer, before and after. CPU
+times are per transfer on this machine; run it on the Pi for the numbers
+that matter:  python bench_compression.py
+"""
+import json
+import os
+import time
+
+import compression
+import framing
+import handshake
+from bench_telemetry_archive import make_records
+from join_buffer import stamp_capture
+
+REPEATS = 200
+
+
+def products():
+    records = make_records(40)
+    telemetry = [stamp_capture(text.encode(), i, 1_700_000_000 + i) for i, text in enumerate(records)]
+    log = "".join(f"{time.strftime('%H:%M:%S', time.gmtime(1_700_000_000 + i))} "
+                  f"  ⚠️ Timeout waiting for ACK on IMAG frame {i}. Retrying...\n"
+                  f"  ✅ ACK received for IMAG frame {i}\n" for i in range(100)).encode()
+    status = json.dumps([{'capture_id': i, 'records': 40 + i, 'pending': i % 7, 'channel': 76,
+                          'loss': round(0.013 * (i % 5), 3)} for i in range(60)]).encode()
+    return [
+        ('telemetry', "telemetry record", telemetry),
+        ('log', "log, 10 KB", [log]),
+        ('file', "JSON status file", [status]),
+        ('image', "JPEG (incompressible)", [os.urandom(4096)]),
+    ]
+
+
+def cpu_per_call(fn, items):
+    start = time.process_time()
+    for _ in range(REPEATS):
+        for item in items:
+            fn(item)
+    return (time.process_time() - start) / (REPEATS * len(items))
+
+
+def frames(length):
+    return len(framing.frame_transfer(b'SENS', bytes(length), 0))
+
+
+def main():
+    available = compression.available_codecs()
+    codecs = [codec for codec in compression.CODEC_NAMES if available & codec]
+    missing = [name for codec, name in compression.CODEC_NAMES.items() if not available & codec]
+    if missing:
+        print(f"Not available here (pip install zstandard): {', '.join(missing)}\n")
+    print(f"{'product':22} {'codec':10} {'bytes':>7} {'packed':>7} {'ratio':>6} {'frames':>9} "
+          f"{'compress':>10} {'decompress':>10}")
+    for kind, name, items in products():
+        raw = sum(map(len, items)) / len(items)
+        raw_frames = sum(frames(len(item)) for item in items) / len(items)
+        for codec in codecs:
+            packed = [compression.compress(item, codec) for item in items]
+            assert all(compression.decompress(p) == item for p, item in zip(packed, items))
+            size = sum(map(len, packed)) / len(packed)
+            packed_frames = sum(frames(len(p)) for p in packed) / len(packed)
+            encode_s = cpu_per_call(lambda item: compression.compress(item, codec), items)
+            decode_s = cpu_per_call(compression.decompress, packed)
+            print(f"{name:22} {compression.CODEC_NAMES[codec]:10} {raw:7.0f} {size:7.0f} {size / raw:6.0%} "
+                  f"{raw_frames:4.1f}->{packed_frames:<4.1f} {encode_s * 1e6:8.0f}µs {decode_s * 1e6:8.0f}µs")
+        chosen = compression.choose_codec(kind, available)
+        print(f"{'':22} -> {kind} uses {compression.CODEC_NAMES[chosen]}"
+              f"{'' if chosen == handshake.CODEC_RAW else ' (raw if it would not shrink)'}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+End-to-end contacts: sender_ziyad.main() against receiver__ziyad.main() over
+link_sim, both scripts unchanged apart from the radio they are handed and a
+synthetic capture in place of the camera and Sense HAT. The receiver runs
+for the whole bench, as it does on the ground, while the sender runs once
+per contact. Each contact must drain the sender's store-and-forward log and
+end with the capture (readings and image) in the receiver's uploads.
+Everything runs in a scratch directory; exits with status 1 on a failure.
+    python bench_contact.py [contacts] [loss]
+"""
+import base64
+import contextlib
+import functools
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import hardware
+import link_sim
+import receiver__ziyad
+import sender_ziyad
+import telemetry_bus
+import upload_sinks
+from join_buffer import new_capture_id, stamp_capture
+from store_forward import StoreForwardLog
+
+CONTACTS = 2
+LOSS = 0.0
+IMAGE_BYTES = 4096
+RECEIVER_START_S = 1.5
+UPLOAD_WAIT_S = 3.0
+
+
+class Captures:
+    """Stands in for sender_ziyad.capture_products(): one reading and one random image per call."""
+
+    def __init__(self):
+        self.taken = []
+
+    def __call__(self):
+        capture_id = new_capture_id()
+        capture_time = time.time()
+        text = f"{time.strftime('%Y-%m-%d %H:%M:%S')}|T:25.5C|H:45.2%|P:1013.1hPa|Pitch:1.2|Roll:-3.4|Yaw:180.0"
+        image = os.urandom(IMAGE_BYTES)
+        self.taken.append((capture_id, image))
+        return [('telemetry', stamp_capture(text.encode(), capture_id, capture_time)),
+                ('image', stamp_capture(image, capture_id, capture_time))]
+
+
+def uploaded(path):
+    """{capture id: document} of everything the receiver uploaded so far."""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        documents = [json.loads(line)['document'] for line in f if line.strip()]
+    return {document.get('capture_id'): document for document in documents}
+
+
+def check_contact(captures, uploads_path):
+    """Returns a list of failure messages for the latest capture."""
+    failures = []
+    store = StoreForwardLog()
+    pending = len(store.pending())
+    store.close()
+    if pending:
+        failures.append(f"{pending} records left in the store-and-forward log")
+
+    capture_id, image = captures.taken[-1]
+    deadline = time.time() + UPLOAD_WAIT_S
+    document = None
+    while document is None and time.time() < deadline:
+        document = uploaded(uploads_path).get(capture_id)
+        time.sleep(0.05)
+    if document is None:
+        failures.append(f"capture {capture_id} never uploaded")
+    else:
+        if document.get('sensor_readings', {}).get('T') != 25.5:
+            failures.append(f"capture {capture_id} uploaded without its readings")
+        if base64.b64decode(document.get('image_base64', '')) != image:
+            failures.append(f"capture {capture_id} uploaded without its image, or a corrupted one")
+    return failures
+
+
+def main():
+    contacts = int(sys.argv[1]) if len(sys.argv) > 1 else CONTACTS
+    loss = float(sys.argv[2]) if len(sys.argv) > 2 else LOSS
+    os.chdir(tempfile.mkdtemp(prefix="bench_contact_"))
+    uploads_path = os.path.abspath("uploads.jsonl")
+    os.environ[upload_sinks.SINK_ENV] = uploads_path
+
+    tx, rx = link_sim.Link(loss=loss, seed=5).endpoints()
+    make_radio = hardware.make_radio
+    hardware.make_radio = lambda role, **options: make_radio(
+        role, radio=tx if role == hardware.ROLE_SENDER else rx, **options)
+    captures = Captures()
+    sender_ziyad.capture_products = captures
+    # Any free port, so the bench can run next to a real receiver
+    receiver__ziyad.TelemetryBus = functools.partial(telemetry_bus.TelemetryBus, port=0)
+
+    output = io.StringIO()
+    failed = False
+    with contextlib.redirect_stdout(output):
+        threading.Thread(target=receiver__ziyad.main, daemon=True).start()
+        time.sleep(RECEIVER_START_S)
+        for contact in range(1, contacts + 1):
+            start = time.perf_counter()
+            sender_ziyad.main()
+            elapsed = time.perf_counter() - start
+            failures = check_contact(captures, uploads_path)
+            failed = failed or bool(failures)
+            print(f"Contact {contact}: {elapsed:.2f} s, {'FAIL: ' + '; '.join(failures) if failures else 'ok'}",
+                  file=sys.__stdout__)
+    if failed:
+        print("\nLast lines of output:\n" + "\n".join(output.getvalue().splitlines()[-40:]))
+        sys.exit(1)
+    print(f"All {contacts} contacts delivered their capture (loss {loss:.0%}).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Throughput of the file service (file_service.py) per file size. A text log
+and an incompressible capture of each size are fetched with a MANIFEST
+request: FileServer sends them through sender_ziyad.send_product over the
+simulated link (compact framing and compression on) to a FileReceiver on the
+ground, and each file is checked against the manifest's SHA-256. The last
+case cuts a contact short part way through a file and resumes it from the
+ranges the ground is missing.
+    python bench_file_service.py
+"""
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import time
+
+import channel_manager
+import compression
+import file_service
+import handshake
+import power
+import rtt
+import sender_ziyad
+from bench_framing import FramedReceiver
+from link_sim import Link
+
+SIZES = [1024, 8 * 1024, 32 * 1024, 64 * 1024]
+
+
+class FileStation(FramedReceiver):
+    """receiver__ziyad's compact path, handing every transfer to a FileReceiver."""
+
+    def __init__(self, radio, download_dir):
+        super().__init__(radio)
+        self.files = file_service.FileReceiver(download_dir)
+        self.messages = []
+
+    def run(self):
+        self.radio.startListening()
+        while not self.stop.is_set():
+            if not power.wait_for_packet(self.radio, 0.05):
+                continue
+            payload = self.radio.read(self.radio.getDynamicPayloadSize())
+            ack, transfer = self.assembler.feed(payload)
+            if ack is not None:
+                self.radio.writeAckPayload(1, ack)
+            if transfer is not None:
+                data = compression.decompress(transfer.data)
+                self.messages.append(self.files.handle(transfer.prefix, data))
+
+
+def make_files(root):
+    """A text log and a JPEG-like (incompressible) capture of every size."""
+    files = []
+    for size in SIZES:
+        log = b"".join(b"Oct 19 12:%02d:%02d sat kernel: [%6d.000] radio ok, %d chunks queued\n"
+                       % (i // 60 % 60, i % 60, i, i % 97) for i in range(size))[:size]
+        for name, data in (("log", log), ("capture", os.urandom(size))):
+            path = os.path.join(root, f"{name}_{size // 1024}k")
+            with open(path, 'wb') as f:
+                f.write(data)
+            files.append((name, path))
+    return files
+
+
+def run_contact(requests, download_dir, time_budget_s=None):
+    tx, rx = Link(loss=0.02, seed=9).endpoints()
+    for radio in (tx, rx):
+        radio.setChannel(channel_manager.HOME_CHANNEL)
+    station = FileStation(rx, download_dir)
+    station.start()
+    sender_ziyad.radio = tx
+    sender_ziyad.channels = channel_manager.ChannelManager(tx, verbose=False)
+    sender_ziyad.ack_timer = rtt.RttEstimator(initial_rto=sender_ziyad.RETRY_TIMEOUT)
+    sender_ziyad.next_seq = 0
+    sender_ziyad.session = handshake.SessionConfig(
+        1, handshake.CAP_ACK_PAYLOAD | handshake.CAP_COMPACT_FRAMING | handshake.CAP_COMPRESSION, 1,
+        handshake.CODEC_RAW, handshake.RF24_1MBPS, codecs=compression.available_codecs())
+    server = file_service.FileServer(roots=[os.path.dirname(requests[0].paths[0])])
+    with contextlib.redirect_stdout(io.StringIO()):
+        left = server.serve(requests, sender_ziyad.send_product, time_budget_s=time_budget_s)
+    time.sleep(0.05)
+    station.stop.set()
+    station.join()
+    return left, station.messages
+
+
+def main():
+    root = tempfile.mkdtemp()
+    download_dir = os.path.join(root, "downloads")
+    try:
+        served = os.path.join(root, "sat")
+        os.makedirs(served)
+        files = make_files(served)
+
+        print(f"{'file':>8} {'bytes':>7} {'time':>8} {'goodput':>11}  result")
+        for name, path in files:
+            start = time.perf_counter()
+            left, messages = run_contact([file_service.Request('MANIFEST', (path,))], download_dir)
+            elapsed = time.perf_counter() - start
+            size = os.path.getsize(path)
+            assert not left and "matches" in messages[-1], messages
+            print(f"{name:>8} {size:7d} {elapsed:7.2f}s {size / elapsed:8.0f}B/s  {messages[-1]}")
+
+        # A contact that ends part way through the largest file, then the next one
+        path = files[-1][1]
+        download_dir = os.path.join(root, "resumed")
+        start = time.perf_counter()
+        left, messages = run_contact([file_service.Request('MANIFEST', (path,))], download_dir, time_budget_s=2.0)
+        receiver = file_service.FileReceiver(download_dir)
+        resume = receiver.pending_requests()
+        print(f"\nContact cut short: {messages[-1]}; satellite has {left[0] if left else None}")
+        print(f"Ground asks for: {', '.join(file_service.format_request(r) for r in resume)}")
+        left, messages = run_contact(resume, download_dir)
+        elapsed = time.perf_counter() - start
+        assert "matches" in messages[-1], messages
+        print(f"Resumed: {messages[-1]} ({elapsed:.2f}s over both contacts)")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Header overhead and transfer time of compact framing (framing.py) against
+the fixed-index chunks, for the payloads the senders actually produce:
+sensor text, the same sealed, a small JPEG-sized blob, and binary data that
+ends in zero bytes (which the padded framing can't carry intact). Each case
+is sent with sender_ziyad over the simulated link to a receiver loop like
+receiver__ziyad's, and the received bytes are checked against the original.
+    python bench_framing.py
+"""
+import contextlib
+import io
+import os
+import threading
+import time
+
+import channel_manager
+import framing
+import power
+import rtt
+import security
+import sender_ziyad
+from link_sim import PACKET_OVERHEAD_BYTES, Link
+
+CHUNK_NUM_BYTES = 2
+SENSOR_TEXT = (b"2024-05-01 12:00:00|T:25.51C|H:45.20%|P:1013.25hPa|"
+               b"Pitch:1.2345678|Roll:359.87654|Yaw:180.01234")
+
+
+class LegacyReceiver(threading.Thread):
+    """receiver__ziyad's fixed-index path: prefix, chunk count, then indexed chunks."""
+
+    def __init__(self, radio):
+        super().__init__(daemon=True)
+        self.radio = radio
+        self.stop = threading.Event()
+        self.meta = []
+        self.chunks = {}
+
+    def run(self):
+        self.radio.startListening()
+        while not self.stop.is_set():
+            if not power.wait_for_packet(self.radio, 0.05):
+                continue
+            payload = self.radio.read(self.radio.getDynamicPayloadSize())
+            index = int.from_bytes(payload[:CHUNK_NUM_BYTES], 'big')
+            self.radio.writeAckPayload(1, b'ACK' + payload[:CHUNK_NUM_BYTES])
+            if index == 0xFFFF:
+                if not self.meta or self.meta[-1] != payload:
+                    self.meta.append(payload)
+            else:
+                self.chunks[index] = payload[CHUNK_NUM_BYTES:]
+
+    def result(self):
+        count = int.from_bytes(self.meta[-1][CHUNK_NUM_BYTES:], 'big')
+        return b''.join(self.chunks[i] for i in range(count))
+
+
+class FramedReceiver(threading.Thread):
+    """receiver__ziyad's compact path: every packet goes through a FrameAssembler."""
+
+    def __init__(self, radio):
+        super().__init__(daemon=True)
+        self.radio = radio
+        self.stop = threading.Event()
+        self.assembler = framing.FrameAssembler()
+        self.transfer = None
+
+    def run(self):
+        self.radio.startListening()
+        while not self.stop.is_set():
+            if not power.wait_for_packet(self.radio, 0.05):
+                continue
+            payload = self.radio.read(self.radio.getDynamicPayloadSize())
+            ack, transfer = self.assembler.feed(payload)
+            if ack is not None:
+                self.radio.writeAckPayload(1, ack)
+            if transfer is not None:
+                self.transfer = transfer
+
+    def result(self):
+        return self.transfer.data
+
+
+def send(payload, compact, prefix=b'IMAG'):
+    tx, rx = Link(loss=0.05, seed=5).endpoints()
+    for radio in (tx, rx):
+        radio.setChannel(channel_manager.HOME_CHANNEL)
+    receiver = (FramedReceiver if compact else LegacyReceiver)(rx)
+    receiver.start()
+    sender_ziyad.radio = tx
+    sender_ziyad.channels = channel_manager.ChannelManager(tx, verbose=False)
+    sender_ziyad.ack_timer = rtt.RttEstimator(initial_rto=sender_ziyad.RETRY_TIMEOUT)
+    sender_ziyad.next_seq = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        if compact:
+            ok = sender_ziyad.send_framed_payload(prefix, payload)
+        else:
+            ok = (sender_ziyad.send_reliable_chunk(prefix, -1, "Prefix")
+                  and sender_ziyad.send_reliable_payload(payload))
+        elapsed = time.perf_counter() - start
+    # The last ACK is read before the receiver loop has necessarily finished with it
+    time.sleep(0.05)
+    receiver.stop.set()
+    receiver.join()
+    assert ok
+    return receiver.result(), elapsed
+
+
+def main():
+    cipher = security.LinkCipher(os.urandom(32))
+    cases = [
+        ("sensor text", SENSOR_TEXT),
+        ("sensor text, sealed", cipher.seal(SENSOR_TEXT, b'SENS')),
+        ("4 KB image", os.urandom(4096)),
+        ("binary ending in zeros", os.urandom(200) + bytes(7)),
+    ]
+    print(f"{'payload':24} {'bytes':>6} | {'fixed-index':>28} | {'compact':>28} | intact")
+    print(f"{'':24} {'':>6} | {'frames':>6} {'headers':>8} {'ms':>6} {'air':>5} | "
+          f"{'frames':>6} {'headers':>8} {'ms':>6} {'air':>5} |")
+    for name, payload in cases:
+        legacy_data, legacy_s = send(payload, compact=False)
+        framed_data, framed_s = send(payload, compact=True)
+        frames = framing.frame_transfer(b'IMAG', payload, 0)
+        header = framing.header_bytes(frames, len(payload))
+        legacy_header = framing.legacy_header_bytes(len(payload))
+        legacy_frames = 2 + -(-len(payload) // framing.LEGACY_CHUNK_DATA)
+        # Airtime share of the payload, counting the nRF24's own preamble/address/CRC too
+        legacy_air = len(payload) / (len(payload) + legacy_header + legacy_frames * PACKET_OVERHEAD_BYTES)
+        framed_air = len(payload) / (len(payload) + header + len(frames) * PACKET_OVERHEAD_BYTES)
+        # What the receivers do with fixed-index transfers to drop the padding
+        legacy_ok = legacy_data.rstrip(b'\x00') == payload
+        framed_ok = framed_data == payload
+        print(f"{name:24} {len(payload):6d} | {legacy_frames:6d} {framing.overhead_ratio(legacy_header, len(payload)):8.1%} "
+              f"{legacy_s * 1000:6.0f} {legacy_air:5.0%} | {len(frames):6d} "
+              f"{framing.overhead_ratio(header, len(payload)):8.1%} {framed_s * 1000:6.0f} {framed_air:5.0%} | "
+              f"{'yes' if legacy_ok else 'NO'} / {'yes' if framed_ok else 'NO'}")
+        assert framed_ok
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+End-to-end latency of ground_station.py: from the last packet of a sensor
+frame arriving at the radio to the decoded reading reaching SSE clients.
+A simulated sender on link_sim pushes sensor frames and one image while
+several local clients are connected.
+Run:  python bench_ground_station.py
+"""
+import asyncio
+import threading
+import time
+
+import link_sim
+from ground_station import GroundStation
+
+CLIENTS = 5
+SENSOR_FRAMES = 200
+FRAME_INTERVAL_S = 0.01
+IMAGE_BYTES = 20_000
+HTTP_PORT = 8765
+
+
+def send_transfer(radio, prefix, payload):
+    """Minimal sender for the receiver__ziyad.py wire format (hardware ACK only)."""
+    radio.write(b'\xff\xff' + prefix)
+    chunks = [payload[i:i + 30] for i in range(0, len(payload), 30)]
+    radio.write(b'\xff\xff' + len(chunks).to_bytes(4, 'big'))
+    for i, chunk in enumerate(chunks):
+        while not radio.write(i.to_bytes(2, 'big') + chunk.ljust(30, b'\x00')):
+            time.sleep(0.001)
+
+
+def sender(radio, done):
+    radio.stopListening()
+    for n in range(SENSOR_FRAMES):
+        text = f"{time.strftime('%Y-%m-%d %H:%M:%S')}|T:25.{n % 10}C|H:45.2%|P:1013.1hPa|Pitch:10.1|Roll:-5.2|Yaw:180.3"
+        send_transfer(radio, b'SENS', text.encode())
+        time.sleep(FRAME_INTERVAL_S)
+    send_transfer(radio, b'IMAG', bytes(range(256)) * (IMAGE_BYTES // 256))
+    time.sleep(0.5)
+    done.set()
+
+
+async def client(port, received):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(b"GET /events HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    await writer.drain()
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.startswith(b"data:"):
+                received[0] += 1
+    except asyncio.CancelledError:
+        writer.close()
+
+
+async def main():
+    link = link_sim.Link(loss=0.02, latency_s=0.0005, seed=7)
+    tx, rx = link.endpoints()
+    rx.startListening()
+    station = GroundStation(rx, upload_target=None, save_dir="/tmp/bench_ground_station",
+                            http_host='127.0.0.1', http_port=HTTP_PORT)
+    station_task = asyncio.create_task(station.run())
+    await asyncio.sleep(0.2)
+
+    received = [0]
+    clients = [asyncio.create_task(client(HTTP_PORT, received)) for _ in range(CLIENTS)]
+    await asyncio.sleep(0.2)
+
+    done = threading.Event()
+    start = time.perf_counter()
+    threading.Thread(target=sender, args=(tx, done), daemon=True).start()
+    while not done.is_set():
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - start
+
+    status = station.status()
+    station.stop()
+    for task in clients:
+        task.cancel()
+    await asyncio.gather(station_task, *clients, return_exceptions=True)
+
+    print(f"Sent {SENSOR_FRAMES} sensor frames + 1 image in {elapsed:.2f}s to {CLIENTS} clients")
+    print(f"Counters: {status['counters']}")
+    print(f"Client messages delivered: {received[0]}")
+    print(f"Packet arrival -> decoded event: {status['latency']['packet_to_event']}")
+    print(f"Packet arrival -> client delivery: {status['latency']['packet_to_client']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
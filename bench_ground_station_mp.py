@@ -0,0 +1,110 @@
+"""
+Load test for ground_station_mp.py: a simulated sender pushes sensor frames
+and images as fast as the link allows while the workers decode and save
+them. Checks that every transfer arrives intact and reports how full the
+packet rings got, how long the reader had to hold packets back, and each
+worker's throughput. The slow-disk cases stall each image save; with a
+small ring that forces back-pressure onto the sender.
+    python bench_ground_station_mp.py
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import ground_station_mp
+import link_sim
+from ground_station_mp import MultiprocessGroundStation
+from join_buffer import stamp_capture
+
+SENSOR_FRAMES = 300
+IMAGES = 10
+IMAGE_BYTES = 20_000
+TIMEOUT_S = 120
+SLOW_SAVE_S = 0.2
+# name, ring slots, extra seconds per image save (an SD card stalling on writes)
+CASES = [
+    ("fast disk, default ring", 4096, 0.0),
+    ("slow disk, default ring", 4096, SLOW_SAVE_S),
+    ("slow disk, 64-slot ring", 64, SLOW_SAVE_S),
+]
+
+
+def send_transfer(radio, prefix, payload):
+    """Minimal sender for the receiver__ziyad.py wire format (hardware ACK only)."""
+    for packet in [b'\xff\xff' + prefix, b'\xff\xff' + len(payload[::30]).to_bytes(4, 'big')] + [
+            (i // 30).to_bytes(2, 'big') + payload[i:i + 30].ljust(30, b'\x00') for i in range(0, len(payload), 30)]:
+        while not radio.write(packet):
+            time.sleep(0.0005)
+
+
+def make_image(n):
+    return hashlib.sha256(str(n).encode()).digest() * (IMAGE_BYTES // 32)
+
+
+def sender(radio):
+    radio.stopListening()
+    for n in range(SENSOR_FRAMES):
+        text = f"2024-01-01 00:00:00|T:25.{n % 10}C|H:45.2%|P:1013.1hPa|Pitch:10.1|Roll:-5.2|Yaw:{n}"
+        send_transfer(radio, b'SENS', stamp_capture(text.encode(), n))
+        if n % (SENSOR_FRAMES // IMAGES) == 0:
+            send_transfer(radio, b'IMAG', stamp_capture(make_image(n), n))
+
+
+def slow_save(delay_s, save_image=ground_station_mp.save_image):
+    def save(*args):
+        time.sleep(delay_s)
+        return save_image(*args)
+    return save
+
+
+def simulated_radio():
+    """Runs in the reader process: the link and its sender live there too."""
+    tx, rx = link_sim.Link(loss=0.02, seed=7, model_airtime=False).endpoints()
+    rx.startListening()
+    threading.Thread(target=sender, args=(tx,), daemon=True).start()
+    return rx
+
+
+def run(name, ring_slots, save_delay_s):
+    # Workers are forked, so they pick up the patched save_image
+    ground_station_mp.save_image = slow_save(save_delay_s)
+    work_dir = tempfile.mkdtemp()
+    station = MultiprocessGroundStation(simulated_radio, ring_slots=ring_slots, upload_target=None,
+                                        save_dir=os.path.join(work_dir, "images"),
+                                        sensor_log=os.path.join(work_dir, "sensor.jsonl"))
+    expected = SENSOR_FRAMES + IMAGES
+    received = []
+    start = time.perf_counter()
+    station.start()
+    try:
+        while len(received) < expected and time.perf_counter() - start < TIMEOUT_S:
+            received += station.poll()
+        elapsed = time.perf_counter() - start
+        stats = station.stats()
+    finally:
+        station.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    sensors = sorted(r['capture_id'] for r in received if r['type'] == 'sensor')
+    # Images come back NUL padded to whole chunks
+    images_ok = all(r['data'].rstrip(b'\x00') == make_image(r['capture_id']).rstrip(b'\x00')
+                    for r in received if r['type'] == 'image')
+    lossless = sensors == list(range(SENSOR_FRAMES)) and len(received) == expected and images_ok
+    print(f"{name}: {len(received)}/{expected} transfers in {elapsed:.1f}s, "
+          f"{'lossless' if lossless else 'LOST DATA'}")
+    print(f"  reader: {stats['reader']}")
+    for i, (ring, worker) in enumerate(zip(stats['rings'], stats['workers'])):
+        print(f"  ring {i}: high water {ring['high_water']}/{ring['capacity']}, "
+              f"full stalls {ring['full_stalls']} | worker {i}: {worker}")
+
+
+def main():
+    for name, ring_slots, save_delay_s in CASES:
+        run(name, ring_slots, save_delay_s)
+
+
+if __name__ == "__main__":
+    main()
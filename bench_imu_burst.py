@@ -0,0 +1,48 @@
+"""
+Achieved sample rate and jitter of IMU bursts (imu_burst.py) at several
+requested rates, and the size of each burst on the wire: encoded, after the
+compression stage, and as the one-line-per-sample text the sensor records
+use today. Uses the Sense HAT when there is one, the synthetic source
+otherwise. Every burst is decoded again and checked against the original.
+    python bench_imu_burst.py [seconds]
+"""
+import sys
+
+import compression
+import imu_burst
+
+RATES = [50, 100, 250, 500, 0]
+
+
+def as_text(burst):
+    """The burst as read_motion_data-style records, two decimals per value."""
+    width = len(imu_burst.CHANNELS)
+    lines = []
+    for i, t in enumerate(burst.times):
+        row = burst.samples[i * width:(i + 1) * width]
+        lines.append(f"{burst.start_time + t:.3f}|" + "|".join(
+            f"{name}:{value:.2f}" for name, value in zip(imu_burst.CHANNELS, row)))
+    return ("\n".join(lines) + "\n").encode()
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+    source = imu_burst.default_source()
+    print(f"{seconds} s bursts from the {source.name} source")
+    print(f"{'asked':>7} {'got':>8} {'jitter':>9} {'max gap':>8} {'encoded':>8} {'packed':>8} {'as text':>8}  codec")
+    for rate in RATES:
+        burst = imu_burst.capture_burst(source, seconds, rate)
+        stats = burst.stats()
+        encoded = burst.encode()
+        packed, codec = compression.pack('imu', encoded, compression.available_codecs())
+        decoded = imu_burst.decode_burst(encoded + b'\x00' * 7)
+        assert decoded.samples == burst.samples and len(decoded) == len(burst)
+        assert all(abs(a - b) <= 1e-6 for a, b in zip(decoded.times, burst.times))
+        asked = f"{rate} Hz" if rate else "max"
+        print(f"{asked:>7} {stats['rate_hz']:6.1f}Hz {stats['jitter_us']:7.1f}us {stats['max_gap_ms']:6.2f}ms "
+              f"{len(encoded):8d} {len(packed):8d} {len(as_text(burst)):8d}  "
+              f"{compression.CODEC_NAMES.get(codec, codec)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Energy and CPU cost of the sender's stop-and-wait transfers on a simulated
+link. Compares the old busy-wait ACK loop with power.wait_for_packet (CPU
+time of the sending thread per transfer), then what the radio does between
+frames: left listening, left in standby, or powered down by
+power.DutyCycle (estimated energy per delivered byte). The simulated
+receiver runs in this process, so the spinning sender also slows it down
+through the GIL; on real hardware the busy-wait costs the same CPU share
+but not the latency.
+    python bench_power.py
+"""
+import os
+import threading
+import time
+
+import power
+import sat_send
+from link_sim import Link
+
+PAYLOAD_BYTES = 4096
+FRAMES = 4
+INTERVAL_S = 1.0
+ACK_TIMEOUT_S = 0.2
+
+
+def responder(radio, stop):
+    """Answers every packet with b'ACK' + its 2-byte index, like sat_receive.py."""
+    radio.startListening()
+    while not stop.is_set():
+        if not power.wait_for_packet(radio, 0.05):
+            continue
+        msg = radio.read(radio.getDynamicPayloadSize())
+        radio.stopListening()
+        radio.write(b'ACK' + msg[:2])
+        radio.startListening()
+
+
+def send_busy_wait(payload, ack_payload, retries=5):
+    """sat_send.send_reliably as it was: spins on radio.available()."""
+    radio = sat_send.radio
+    radio.stopListening()
+    for _ in range(retries):
+        radio.write(payload)
+        radio.startListening()
+        start_time = time.time()
+        while time.time() - start_time < ACK_TIMEOUT_S:
+            if radio.available():
+                if radio.read(radio.getDynamicPayloadSize()) == ack_payload:
+                    radio.stopListening()
+                    return True
+        radio.stopListening()
+    return False
+
+
+def send_frame(send_fn, data):
+    for i in range(0, len(data), 30):
+        index = (i // 30).to_bytes(2, 'big')
+        if not send_fn(index + data[i:i + 30], b'ACK' + index):
+            return False
+    return True
+
+
+def run(send_fn, idle):
+    """Sends FRAMES frames INTERVAL_S apart. idle is 'rx', 'standby' or 'power_down'."""
+    tx, rx = Link(loss=0.05, seed=3).endpoints()
+    radio = power.MeteredRadio(tx)
+    sat_send.radio = radio
+    stop = threading.Event()
+    thread = threading.Thread(target=responder, args=(rx, stop), daemon=True)
+    thread.start()
+    duty_cycle = power.DutyCycle(radio, INTERVAL_S)
+    data = os.urandom(PAYLOAD_BYTES)
+    cpu_per_frame = []
+    wall_per_frame = []
+    delivered = 0
+    for _ in range(FRAMES):
+        with duty_cycle.burst() if idle == 'power_down' else radio.measure():
+            cpu_start = time.thread_time()
+            wall_start = time.perf_counter()
+            if send_frame(send_fn, data):
+                delivered += len(data)
+            cpu_per_frame.append(time.thread_time() - cpu_start)
+            wall_per_frame.append(time.perf_counter() - wall_start)
+        if idle == 'power_down':
+            duty_cycle.sleep()
+        else:
+            if idle == 'rx':
+                radio.startListening()
+            time.sleep(INTERVAL_S)
+            radio.stopListening()
+    stop.set()
+    thread.join()
+    joules = radio.joules()
+    median = len(cpu_per_frame) // 2
+    return joules, delivered, sorted(cpu_per_frame)[median], sorted(wall_per_frame)[median]
+
+
+def main():
+    print(f"{FRAMES} frames of {PAYLOAD_BYTES} B, one every {INTERVAL_S:.1f} s, 5% loss\n")
+    cases = [
+        ("busy-wait ACK, idle listening", send_busy_wait, 'rx'),
+        ("timed-wait ACK, idle listening", sat_send.send_reliably, 'rx'),
+        ("timed-wait ACK, idle standby", sat_send.send_reliably, 'standby'),
+        ("timed-wait ACK, duty-cycled", sat_send.send_reliably, 'power_down'),
+    ]
+    for name, send_fn, idle in cases:
+        joules, delivered, cpu_s, wall_s = run(send_fn, idle)
+        per_byte = joules / delivered * 1e6 if delivered else float('nan')
+        print(f"{name:32s} CPU/frame {cpu_s * 1000:7.1f} ms of {wall_s * 1000:6.1f} ms | "
+              f"{joules * 1000:7.2f} mJ, {per_byte:6.2f} µJ per delivered byte")
+
+
+if __name__ == "__main__":
+    main()
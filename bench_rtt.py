@@ -0,0 +1,157 @@
+"""
+Fixed against measured (rtt.RttEstimator) ACK timeouts on simulated links of
+different latency. Runs both sender styles unchanged: sat_send.send_reliably
+(explicit ACK packets) and sender_ziyad.send_reliable_chunk (ACK payloads,
+which always cost one retransmission per chunk). 5% of packets are lost. For
+explicit ACKs hardware auto-retransmit is off, so every loss is recovered by
+the protocol's own timeout. ACK payloads rely on auto-retransmit to get the
+payload back, so it stays on there and the timeout only sets how long each
+chunk waits for its retry. Reports time per chunk (mean and p95, which is
+where loss recovery shows), retransmissions the receiver saw as duplicates,
+and how often the timeout backed off.
+    python bench_rtt.py [chunks]
+"""
+import contextlib
+import io
+import os
+import sys
+import threading
+import time
+
+import channel_manager
+import power
+import rtt
+import sat_send
+import sender_ziyad
+from link_sim import Link
+
+LOSS = 0.05
+LATENCIES_S = (0.001, 0.01, 0.05)
+
+
+class Responder(threading.Thread):
+    """The receiving end: counts each index once and every repeat as a duplicate."""
+
+    def __init__(self, radio, ack_payloads):
+        super().__init__(daemon=True)
+        self.radio = radio
+        self.ack_payloads = ack_payloads
+        self.stop = threading.Event()
+        self.seen = set()
+        self.duplicates = 0
+
+    def run(self):
+        self.radio.startListening()
+        while not self.stop.is_set():
+            if not power.wait_for_packet(self.radio, 0.05):
+                continue
+            msg = self.radio.read(self.radio.getDynamicPayloadSize())
+            index = msg[:2]
+            if index in self.seen:
+                self.duplicates += 1
+            self.seen.add(index)
+            ack = b'ACK' + index
+            if self.ack_payloads:
+                # Like receiver__ziyad.py: rides on the hardware ACK of the next packet
+                self.radio.writeAckPayload(1, ack)
+            else:
+                # Like sat_receive.py: an explicit ACK packet
+                self.radio.stopListening()
+                self.radio.write(ack)
+                self.radio.startListening()
+
+
+def link(latency_s, seed, hardware_retries):
+    tx, rx = Link(loss=LOSS, latency_s=latency_s, seed=seed).endpoints()
+    for radio in (tx, rx):
+        if not hardware_retries:
+            radio.setRetries(0, 0)
+        radio.setChannel(channel_manager.HOME_CHANNEL)
+    return tx, rx
+
+
+def send_explicit(tx, chunks):
+    sat_send.radio = tx
+    times = []
+    for i, data in enumerate(chunks):
+        index = i.to_bytes(2, 'big')
+        start = time.perf_counter()
+        if not sat_send.send_reliably(index + data, b'ACK' + index):
+            return times, False
+        times.append(time.perf_counter() - start)
+    return times, True
+
+
+def send_ack_payload(tx, chunks):
+    sender_ziyad.radio = tx
+    sender_ziyad.channels = channel_manager.ChannelManager(tx, verbose=False)
+    times = []
+    for i, data in enumerate(chunks):
+        start = time.perf_counter()
+        if not sender_ziyad.send_reliable_chunk(data, i, "Data"):
+            return times, False
+        times.append(time.perf_counter() - start)
+    return times, True
+
+
+def run(style, timer, latency_s, chunks, seed=7):
+    ack_payloads = style == 'ack payload'
+    tx, rx = link(latency_s, seed, hardware_retries=ack_payloads)
+    responder = Responder(rx, ack_payloads)
+    responder.start()
+    if ack_payloads:
+        sender_ziyad.ack_timer = timer
+        send_fn = send_ack_payload
+    else:
+        sat_send.ack_timer = timer
+        send_fn = send_explicit
+    # The senders log every chunk and retry; keep the table readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        times, ok = send_fn(tx, chunks)
+        total_s = time.perf_counter() - start
+    responder.stop.set()
+    responder.join()
+    times.sort()
+    return {
+        'ok': ok,
+        'total_s': total_s,
+        'mean_ms': sum(times) / len(times) * 1000 if times else float('nan'),
+        'p95_ms': times[int(len(times) * 0.95)] * 1000 if times else float('nan'),
+        'duplicates': responder.duplicates,
+        'backoffs': timer.timeouts,
+    }
+
+
+def fixed(timeout_s):
+    """A timer that never moves: what the senders did before rtt.py."""
+    return rtt.RttEstimator(initial_rto=timeout_s, min_rto=timeout_s, max_rto=timeout_s)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    chunks = [os.urandom(30) for _ in range(count)]
+    cases = [
+        ('explicit ACK', 'fixed 200 ms', lambda: fixed(sat_send.ACK_TIMEOUT_S)),
+        ('explicit ACK', 'measured', lambda: rtt.RttEstimator(initial_rto=sat_send.ACK_TIMEOUT_S,
+                                                              min_rto=sat_send.MIN_ACK_TIMEOUT_S)),
+        ('ack payload', 'fixed 50 ms', lambda: fixed(sender_ziyad.RETRY_TIMEOUT)),
+        ('ack payload', 'measured', lambda: rtt.RttEstimator(initial_rto=sender_ziyad.RETRY_TIMEOUT)),
+    ]
+    print(f"{count} chunks per run, {LOSS:.0%} packet loss\n")
+    print(f"{'latency':>8} {'style':13} {'timeout':13} {'total s':>8} {'mean ms':>8} {'p95 ms':>8} "
+          f"{'dups':>5} {'backoffs':>8}")
+    for latency_s in LATENCIES_S:
+        for style, name, make_timer in cases:
+            timer = make_timer()
+            result = run(style, timer, latency_s, chunks)
+            status = "" if result['ok'] else "  (gave up)"
+            print(f"{latency_s * 1000:6.0f}ms {style:13} {name:13} {result['total_s']:8.2f} "
+                  f"{result['mean_ms']:8.1f} {result['p95_ms']:8.1f} {result['duplicates']:5d} "
+                  f"{result['backoffs']:8d}{status}")
+            if name == 'measured':
+                print(f"{'':>8} {'':13} {'':13} {timer.describe()}")
+
+
+if __name__ == "__main__":
+    main()
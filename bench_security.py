@@ -0,0 +1,54 @@
+"""
+Cost of sealing transfers with security.py versus sending them in the clear:
+CPU time per transfer, crypto throughput, and packets on air compared with a
+per-packet AEAD (4-byte nonce + 8-byte tag in every 32-byte packet). Run it
+on the Pi to get the numbers that matter:
+    python bench_security.py
+"""
+import math
+import os
+import time
+
+from security import BLOCK_HEADER, TAG_BYTES, LinkCipher
+
+CASES = [
+    ('telemetry', 120, 2000),
+    ('image', 60_000, 50),
+]
+CHUNK_DATA_SIZE = 30
+PER_PACKET_OVERHEAD = 4 + 8
+
+
+def packets(nbytes, per_packet=CHUNK_DATA_SIZE):
+    return math.ceil(nbytes / per_packet)
+
+
+def run_case(kind, size, count):
+    key = os.urandom(32)
+    sender, receiver = LinkCipher(key), LinkCipher(key)
+    payload = os.urandom(size)
+
+    start = time.process_time()
+    blocks = [sender.seal(payload, b'IMAG') for _ in range(count)]
+    seal_s = time.process_time() - start
+    start = time.process_time()
+    for block in blocks:
+        assert receiver.open(block, b'IMAG') == payload
+    open_s = time.process_time() - start
+
+    plain = packets(size)
+    sealed = packets(size + BLOCK_HEADER.size + TAG_BYTES)
+    per_packet = packets(size, CHUNK_DATA_SIZE - PER_PACKET_OVERHEAD)
+    print(f"{kind:9s} {size:6d} B | seal {seal_s / count * 1e6:8.1f} us {count * size / seal_s / 1e6:6.2f} MB/s | "
+          f"open {open_s / count * 1e6:8.1f} us {count * size / open_s / 1e6:6.2f} MB/s | "
+          f"packets plain {plain} sealed {sealed} (+{(sealed - plain) / plain:.1%}) "
+          f"per-packet AEAD {per_packet} (+{(per_packet - plain) / plain:.1%})")
+
+
+def main():
+    for kind, size, count in CASES:
+        run_case(kind, size, count)
+
+
+if __name__ == "__main__":
+    main()
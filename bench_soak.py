@@ -0,0 +1,351 @@
+"""
+Soak test for ground_station.py: hours of simulated passes pushed through
+link_sim at accelerated time, to catch a receiver that slowly degrades
+rather than one that fails outright. A sender thread sends one stamped
+sensor frame and one image per capture, dropping some packets outright
+(their retries ran out), and now and then reboots part way through a
+transfer. Joined captures are uploaded to the in-process StubServer, which
+refuses a share of them. At every checkpoint the harness samples the
+process RSS, open file descriptors, per-transfer latency (sender starting
+the transfer -> decoded event published), bytes on disk under save_dir,
+printed output, and the join buffer. After a warm-up checkpoint, the last
+checkpoint is compared against the first; any metric that drifted past
+its threshold fails the run with exit status 1.
+    python bench_soak.py [simulated hours] [speedup]
+"""
+import asyncio
+import contextlib
+import os
+import random
+import shutil
+import sys
+import threading
+import time
+
+import handshake
+import link_sim
+import upload_sinks
+from ground_station import GroundStation
+from join_buffer import JOIN_TIMEOUT_S, JoinBuffer, stamp_capture
+
+SIM_HOURS = 6.0
+SPEEDUP = 600                   # simulated seconds per real second
+CAPTURE_INTERVAL_S = 60         # simulated
+CHECKPOINT_S = 1800             # simulated
+WARMUP_CHECKPOINTS = 1
+LOSS = 0.1                      # per attempt; hardware retries hide most of it
+DROP_RATE = 0.0005              # packets whose retries ran out
+RESTART_RATE = 0.02             # transfers cut short by a sender reboot
+UPLOAD_FAILURE_RATE = 0.1
+IMAGE_BYTES = (2000, 8000)
+SIM_EPOCH = 1_714_564_800
+SAVE_DIR = "/tmp/bench_soak"
+HTTP_PORT = 8767
+DRAIN_S = 3.0
+STALE_TRANSFER_S = 10.0         # real
+
+# Allowed change from the first checkpoint after warm-up to the last
+THRESHOLDS = {
+    'rss_growth_mb_per_h': 4.0,
+    'fd_growth': 4,
+    'p95_ratio': 2.0,           # checked above P95_FLOOR_MS only
+    'disk_per_capture_ratio': 1.25,
+    'log_per_capture_ratio': 1.25,
+    'join_pending_ratio': 2.0,
+}
+P95_FLOOR_MS = 20.0
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except OSError:
+        import resource
+        # Peak rather than current outside Linux, still enough to see growth
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+
+def open_fds():
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return None
+
+
+def disk_usage(path):
+    files = size = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+                files += 1
+            except OSError:
+                pass
+    return files, size
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+class CountingWriter:
+    """Stand-in for stdout that only counts what the station prints."""
+
+    def __init__(self):
+        self.bytes = 0
+        self.lines = 0
+        self.lock = threading.Lock()
+
+    def write(self, text):
+        with self.lock:
+            self.bytes += len(text)
+            self.lines += text.count("\n")
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+class Sender(threading.Thread):
+    """
+    One capture every CAPTURE_INTERVAL_S of simulated time, paced against
+    the real clock. started[(kind, capture_id)] is when each transfer began.
+    """
+
+    def __init__(self, radio, captures, speedup, on_checkpoint, seed=1):
+        super().__init__(daemon=True)
+        self.radio = radio
+        self.captures = captures
+        self.speedup = speedup
+        self.on_checkpoint = on_checkpoint
+        self.rng = random.Random(seed)
+        self.started = {}
+        self.counters = {'captures': 0, 'transfers': 0, 'dropped_packets': 0, 'restarts': 0, 'late': 0}
+        self.done = threading.Event()
+
+    def _write(self, packet):
+        if self.rng.random() < DROP_RATE:
+            self.counters['dropped_packets'] += 1
+            return
+        # False here is mostly the receiver's RX FIFO being full
+        while not self.radio.write(packet):
+            time.sleep(0.0005)
+
+    def _restart(self):
+        self.counters['restarts'] += 1
+        self.radio.powerDown()
+        time.sleep(0.01)
+        self.radio.powerUp()
+        self.radio.stopListening()
+        self._write(handshake.build_offer(caps=handshake.CAP_ACK_PAYLOAD | handshake.CAP_INDEXED_CHUNKS))
+
+    def _transfer(self, kind, prefix, capture_id, payload):
+        chunks = [payload[i:i + 30] for i in range(0, len(payload), 30)]
+        restart_at = self.rng.randrange(len(chunks)) if self.rng.random() < RESTART_RATE else None
+        self.started[(kind, capture_id)] = time.perf_counter()
+        self.counters['transfers'] += 1
+        self._write(b'\xff\xff' + prefix)
+        self._write(b'\xff\xff' + len(chunks).to_bytes(4, 'big'))
+        for i, chunk in enumerate(chunks):
+            if i == restart_at:
+                self._restart()
+                return
+            self._write(i.to_bytes(2, 'big') + chunk.ljust(30, b'\x00'))
+
+    def run(self):
+        self.radio.stopListening()
+        start = time.perf_counter()
+        for n in range(self.captures):
+            sim_t = n * CAPTURE_INTERVAL_S
+            delay = start + sim_t / self.speedup - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -CAPTURE_INTERVAL_S / self.speedup:
+                self.counters['late'] += 1
+            if n and sim_t % CHECKPOINT_S == 0:
+                self.on_checkpoint(sim_t)
+
+            capture_id = n
+            capture_time = SIM_EPOCH + sim_t
+            stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(capture_time))
+            text = (f"{stamp}|T:{20 + self.rng.random() * 10:.2f}C|H:{40 + self.rng.random() * 10:.1f}%|"
+                    f"P:{1000 + self.rng.random() * 20:.1f}hPa|Pitch:1.2|Roll:-3.4|Yaw:{sim_t / 30 % 360:.1f}")
+            self._transfer('sensor', b'SENS', capture_id, stamp_capture(text.encode(), capture_id, capture_time))
+            image = self.rng.randbytes(self.rng.randint(*IMAGE_BYTES))
+            self._transfer('image', b'IMAG', capture_id, stamp_capture(image, capture_id, capture_time))
+            self.counters['captures'] += 1
+        self.on_checkpoint(self.captures * CAPTURE_INTERVAL_S)
+        self.done.set()
+
+
+class Monitor:
+    """Collects per-transfer latencies from the station's live feed and samples at checkpoints."""
+
+    def __init__(self, station, sender, stub, log):
+        self.station = station
+        self.sender = sender
+        self.stub = stub
+        self.log = log
+        self.stored = 0
+        self.latencies = []
+        self.completed = 0
+        self.samples = []
+        self.queue = asyncio.Queue()
+
+    async def watch(self):
+        # A subscriber like an SSE client, but unbounded so nothing is dropped
+        self.station.subscribers.add(self.queue)
+        while True:
+            _, message = await self.queue.get()
+            if message.get('type') not in ('sensor', 'image'):
+                continue
+            started = self.sender.started.pop((message['type'], message['capture_id']), None)
+            if started is not None:
+                self.latencies.append((time.perf_counter() - started) * 1000)
+                self.completed += 1
+
+    def sample(self, sim_t):
+        # Transfers cut short never produce an event
+        stale = time.perf_counter() - STALE_TRANSFER_S
+        for key, started in list(self.sender.started.items()):
+            if started < stale:
+                self.sender.started.pop(key, None)
+        # The stub lives in this process: count its documents and let them go
+        with self.stub.lock:
+            self.stored += len(self.stub.documents)
+            self.stub.documents.clear()
+        files, disk_bytes = disk_usage(self.station.save_dir)
+        counters = self.station.counters
+        sample = {
+            'sim_h': sim_t / 3600, 'rss_mb': rss_mb(), 'fds': open_fds(),
+            'p50_ms': percentile(self.latencies, 0.50), 'p95_ms': percentile(self.latencies, 0.95),
+            'transfers': len(self.latencies), 'captures': self.sender.counters['captures'],
+            'files': files, 'disk_bytes': disk_bytes, 'log_bytes': self.log.bytes,
+            'join_pending': len(self.station.join_buffer.pending),
+            'uploads_ok': counters['uploads_ok'], 'uploads_failed': counters['uploads_failed'],
+        }
+        self.latencies = []
+        self.samples.append(sample)
+        print(f"  {sample['sim_h']:5.1f} h  RSS {sample['rss_mb']:6.1f} MB  fds {sample['fds']}  "
+              f"p50 {sample['p50_ms'] or 0:6.1f} ms  p95 {sample['p95_ms'] or 0:6.1f} ms  "
+              f"disk {disk_bytes / 1e6:6.2f} MB in {files} files  log {self.log.bytes / 1e3:7.1f} kB  "
+              f"join pending {sample['join_pending']}  uploads {sample['uploads_ok']} ok / "
+              f"{sample['uploads_failed']} failed", file=sys.__stdout__, flush=True)
+
+
+def per_capture(samples, key, i):
+    """Growth of a cumulative metric per capture over the window ending at checkpoint i."""
+    captures = samples[i]['captures'] - samples[i - 1]['captures']
+    return (samples[i][key] - samples[i - 1][key]) / captures if captures else 0.0
+
+
+def check_drift(samples):
+    """Returns a list of failure messages comparing the last checkpoint with the first after warm-up."""
+    if len(samples) < WARMUP_CHECKPOINTS + 2:
+        return [f"only {len(samples)} checkpoints, need {WARMUP_CHECKPOINTS + 2}: run for longer"]
+    first, last = WARMUP_CHECKPOINTS, len(samples) - 1
+    base, end = samples[first], samples[last]
+    failures = []
+
+    growth = (end['rss_mb'] - base['rss_mb']) / (end['sim_h'] - base['sim_h'])
+    if growth > THRESHOLDS['rss_growth_mb_per_h']:
+        failures.append(f"RSS grew {growth:.1f} MB per simulated hour (limit {THRESHOLDS['rss_growth_mb_per_h']})")
+    if base['fds'] is not None and end['fds'] - base['fds'] > THRESHOLDS['fd_growth']:
+        failures.append(f"open fds grew {base['fds']} -> {end['fds']} (limit +{THRESHOLDS['fd_growth']})")
+    if base['p95_ms'] and end['p95_ms'] and end['p95_ms'] > max(P95_FLOOR_MS, base['p95_ms'] * THRESHOLDS['p95_ratio']):
+        failures.append(f"p95 transfer latency {base['p95_ms']:.1f} -> {end['p95_ms']:.1f} ms "
+                        f"(limit x{THRESHOLDS['p95_ratio']})")
+    for key, label, limit in (('disk_bytes', "disk bytes", 'disk_per_capture_ratio'),
+                              ('log_bytes', "printed bytes", 'log_per_capture_ratio')):
+        before, after = per_capture(samples, key, first), per_capture(samples, key, last)
+        if before and after > before * THRESHOLDS[limit]:
+            failures.append(f"{label} per capture {before:.0f} -> {after:.0f} (limit x{THRESHOLDS[limit]})")
+    pending_limit = max(base['join_pending'], 2) * THRESHOLDS['join_pending_ratio']
+    if end['join_pending'] > pending_limit:
+        failures.append(f"join buffer holds {end['join_pending']} captures (limit {pending_limit:.0f})")
+    return failures
+
+
+def check_accounting(station, monitor):
+    """Every record the join buffer let go of was either stored by the stub or counted as failed."""
+    failures = []
+    counters = station.counters
+    records = station.join_buffer.joined + station.join_buffer.expired
+    if counters['uploads_ok'] + counters['uploads_failed'] != records:
+        failures.append(f"{records} capture records but {counters['uploads_ok']} uploads ok + "
+                        f"{counters['uploads_failed']} failed")
+    stored = monitor.stored + len(monitor.stub.documents)
+    if counters['uploads_ok'] != stored:
+        failures.append(f"{counters['uploads_ok']} uploads ok but the stub stored {stored} documents")
+    return failures
+
+
+async def soak(hours, speedup):
+    captures = int(hours * 3600 / CAPTURE_INTERVAL_S)
+    shutil.rmtree(SAVE_DIR, ignore_errors=True)
+    link = link_sim.Link(loss=LOSS, seed=7, model_airtime=False)
+    tx, rx = link.endpoints()
+    rx.startListening()
+    loop = asyncio.get_running_loop()
+    log = CountingWriter()
+
+    with upload_sinks.StubServer(failure_rate=UPLOAD_FAILURE_RATE, seed=3) as stub, \
+            contextlib.redirect_stdout(log):
+        station = GroundStation(rx, upload_target=stub.url, save_dir=SAVE_DIR,
+                                http_host='127.0.0.1', http_port=HTTP_PORT)
+        # Join timeout in simulated time, but long enough for a transfer in real time
+        station.join_buffer = JoinBuffer(timeout_s=max(JOIN_TIMEOUT_S / speedup, 1.0))
+        station_task = asyncio.create_task(station.run())
+        await asyncio.sleep(0.2)
+
+        checkpoints = []
+        sender = Sender(tx, captures, speedup, lambda sim_t: loop.call_soon_threadsafe(checkpoints.append, sim_t))
+        monitor = Monitor(station, sender, stub, log)
+        watch_task = asyncio.create_task(monitor.watch())
+        print(f"Soak: {hours:g} simulated hours, {captures} captures at {speedup}x, loss {LOSS:.0%} per attempt, "
+              f"{DROP_RATE:.1%} packets dropped, {RESTART_RATE:.0%} transfers cut by restarts, "
+              f"{UPLOAD_FAILURE_RATE:.0%} uploads refused", file=sys.__stdout__, flush=True)
+        start = time.perf_counter()
+        monitor.sample(0)
+        sender.start()
+        while not sender.done.is_set() or checkpoints:
+            while checkpoints:
+                monitor.sample(checkpoints.pop(0))
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - start
+
+        # Let the join buffer flush its stragglers and the uploads finish
+        deadline = time.perf_counter() + DRAIN_S + station.join_buffer.timeout_s
+        while time.perf_counter() < deadline and (station.join_buffer.pending or check_accounting(station, monitor)):
+            await asyncio.sleep(0.1)
+        station.stop()
+        watch_task.cancel()
+        await asyncio.gather(station_task, watch_task, return_exceptions=True)
+
+    counters = dict(station.counters, **sender.counters, stub_failures=stub.failures,
+                    joined=station.join_buffer.joined, expired=station.join_buffer.expired)
+    print(f"\n{elapsed:.1f} s real for {hours:g} h simulated ({hours * 3600 / elapsed:.0f}x), "
+          f"{monitor.completed} of {sender.counters['transfers']} transfers completed")
+    print(f"Counters: {counters}")
+    print(f"Station output: {log.lines} lines, {log.bytes / 1e3:.1f} kB")
+    failures = check_drift(monitor.samples) + check_accounting(station, monitor)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("PASS: no metric drifted past its threshold")
+    return not failures
+
+
+def main():
+    hours = float(sys.argv[1]) if len(sys.argv) > 1 else SIM_HOURS
+    speedup = float(sys.argv[2]) if len(sys.argv) > 2 else SPEEDUP
+    if not asyncio.run(soak(hours, speedup)):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
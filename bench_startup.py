@@ -0,0 +1,103 @@
+"""
+Start-to-first-packet time of the sender scripts, each measured in a fresh
+interpreter the way cron starts them: interpreter start, importing the
+script, building the radio and running up to its first radio.write(). A
+link_sim radio stands in for the nRF24 so this runs anywhere; on the Pi the
+SPI setup adds a few ms. Also reports the bare import time of every script
+and of the heavy libraries they now defer. The max for sender_ziyad is its
+first run, which pays for a full band scan before channel_scan.json exists.
+    python bench_startup.py
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+RUNS = 5
+
+SCRIPTS = [
+    'sender_ziyad', 'receiver__ziyad', 'sat_send', 'sat_receive', 'newSend', 'receive',
+    'firebase_receiver', 'miss_receive', 'sendersenseimage', 'ground_station',
+]
+HEAVY_MODULES = ['PIL.Image', 'numpy', 'requests', 'RF24']
+
+# Each snippet builds a simulated radio pair, wires the script to the sending
+# end and runs its setup path; the first write() prints the elapsed time.
+FIRST_PACKET = {
+    'sender_ziyad': "script.radio = radio\nscript.open_session()",
+    'sat_send': (
+        "script.radio = radio\n"
+        "script.negotiate_session(handshake.build_offer(caps=0, rates=(handshake.RF24_1MBPS,)))"
+    ),
+    'newSend': "script.radio = radio\nscript.handshake()",
+}
+
+HARNESS = """
+import sys, time, os
+start = float(sys.argv[1])
+from link_sim import Link
+import hardware, handshake
+import {script} as script
+tx, rx = Link(model_airtime=False).endpoints()
+def first_write(buf):
+    print(time.time() - start)
+    os._exit(0)
+radio = hardware.make_radio(hardware.ROLE_SENDER, radio=tx)
+radio.write = first_write
+{body}
+"""
+
+
+def run_python(code, cwd, args=()):
+    env = dict(os.environ, PYTHONPATH=REPO)
+    return subprocess.run(
+        [sys.executable, '-c', code, *args], cwd=cwd, env=env, capture_output=True, text=True,
+    )
+
+
+def timed_run(code, cwd):
+    """Median wall time of a fresh interpreter running code, or None if it fails."""
+    samples = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        result = run_python(code, cwd)
+        elapsed = time.perf_counter() - start
+        if result.returncode != 0:
+            return None, result.stderr.strip().splitlines()[-1]
+        samples.append(elapsed)
+    return sorted(samples)[len(samples) // 2], None
+
+
+def main():
+    with tempfile.TemporaryDirectory() as cwd:
+        baseline, _ = timed_run("pass", cwd)
+        print(f"Bare interpreter start: {baseline * 1000:.1f} ms\n")
+
+        print("Import time (fresh interpreter, minus bare start):")
+        for name in SCRIPTS + HEAVY_MODULES:
+            elapsed, error = timed_run(f"import {name}", cwd)
+            if elapsed is None:
+                print(f"  {name:18s} not importable here ({error})")
+            else:
+                print(f"  {name:18s} {(elapsed - baseline) * 1000:7.1f} ms")
+
+        print("\nStart to first packet (simulated radio):")
+        for script, body in FIRST_PACKET.items():
+            samples = []
+            for _ in range(RUNS):
+                result = run_python(HARNESS.format(script=script, body=body), cwd, [repr(time.time())])
+                if result.returncode != 0 or not result.stdout.strip():
+                    samples = None
+                    print(f"  {script:18s} failed: {result.stderr.strip().splitlines()[-1:]}")
+                    break
+                samples.append(float(result.stdout.split()[-1]))
+            if samples:
+                samples.sort()
+                print(f"  {script:18s} median {samples[len(samples) // 2] * 1000:7.1f} ms "
+                      f"(min {samples[0] * 1000:.1f}, max {samples[-1] * 1000:.1f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Enqueue throughput and drain rate of store_forward.py for telemetry-sized
+and image-sized records at several fsync batch sizes. Point it at the SD
+card to get meaningful numbers:
+    python bench_store_forward.py /home/pi/sf_bench
+"""
+import os
+import shutil
+import sys
+import time
+
+from store_forward import StoreForwardLog
+
+CASES = [
+    ('telemetry', 120, 2000),
+    ('image', 20_000, 200),
+]
+FSYNC_BATCHES = [1, 16, 128]
+
+
+def run_case(base_dir, kind, size, count, fsync_every):
+    log_dir = os.path.join(base_dir, f"{kind}_{fsync_every}")
+    shutil.rmtree(log_dir, ignore_errors=True)
+    log = StoreForwardLog(log_dir, fsync_every=fsync_every)
+    payload = os.urandom(size)
+
+    start = time.perf_counter()
+    for _ in range(count):
+        log.append(kind, payload)
+    log.sync()
+    enqueue_s = time.perf_counter() - start
+    log.close()
+
+    # Reopen to include recovery, as after a reboot
+    start = time.perf_counter()
+    log = StoreForwardLog(log_dir, fsync_every=fsync_every)
+    recover_s = time.perf_counter() - start
+    start = time.perf_counter()
+    sent, bytes_sent = log.drain(lambda k, p: True)
+    drain_s = time.perf_counter() - start
+    log.close()
+    shutil.rmtree(log_dir, ignore_errors=True)
+
+    assert sent == count, f"drained {sent} of {count}"
+    print(f"{kind:9s} {size:6d} B  fsync/{fsync_every:<4d} "
+          f"enqueue {count / enqueue_s:9,.0f} rec/s {count * size / enqueue_s / 1e6:7.2f} MB/s | "
+          f"recover {recover_s * 1000:6.1f} ms | "
+          f"drain {sent / drain_s:9,.0f} rec/s {bytes_sent / drain_s / 1e6:7.2f} MB/s")
+
+
+def main():
+    base_dir = sys.argv[1] if len(sys.argv) > 1 else "/tmp/store_forward_bench"
+    os.makedirs(base_dir, exist_ok=True)
+    print(f"Benchmarking in {base_dir}")
+    for kind, size, count in CASES:
+        for fsync_every in FSYNC_BATCHES:
+            run_case(base_dir, kind, size, count, fsync_every)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Telemetry air time with onboard aggregation (telemetry_aggregator.py)
+against sending every reading, for a simulated day of newSend.py readings
+(one every 10 s) with a handful of injected anomalies. Both are counted in
+newSend's SENS framing: prefix, chunk count, then 32-byte chunks. Also
+reports CPU per reading, and how far the P² percentiles and Welford
+std are from exact values computed over the whole window.
+    python bench_telemetry_aggregator.py
+"""
+import math
+import random
+import statistics
+import time
+
+import telemetry_aggregator
+from link_sim import PACKET_OVERHEAD_BYTES
+
+READING_INTERVAL_S = 10
+DAY_S = 24 * 3600
+ANOMALIES = {1000: ('T', 72.0), 3100: ('P', 850.0), 5000: ('Gz', 25.0), 7777: ('Az', -3.5)}
+CHUNK_SIZE = 32
+AIR_RATE_BPS = 1_000_000
+
+
+def make_readings(count, seed=1):
+    """(env, motion) like sat_send's read_* functions: a slow thermal cycle plus noise."""
+    rng = random.Random(seed)
+    readings = []
+    for i in range(count):
+        t = i * READING_INTERVAL_S
+        env = {'temperature': round(22 + 6 * math.sin(2 * math.pi * t / 5400) + rng.gauss(0, 0.2), 2),
+               'humidity': round(45 + rng.gauss(0, 1), 2),
+               'pressure': round(1013 + rng.gauss(0, 0.5), 2)}
+        motion = {'orientation': {'pitch': round(rng.gauss(0, 2), 2), 'roll': round(rng.gauss(0, 2), 2),
+                                  'yaw': round((t / 30) % 360, 2)},
+                  'accel_raw': {'x': round(rng.gauss(0, 0.01), 2), 'y': round(rng.gauss(0, 0.01), 2),
+                                'z': round(1 + rng.gauss(0, 0.01), 2)},
+                  'gyro_raw': {axis: round(rng.gauss(0, 0.05), 2) for axis in 'xyz'},
+                  'compass': {'x': round(20 + rng.gauss(0, 1), 2), 'y': round(-15 + rng.gauss(0, 1), 2),
+                              'z': round(45 + rng.gauss(0, 1), 2)}}
+        if i in ANOMALIES:
+            name, value = ANOMALIES[i]
+            if name == 'T':
+                env['temperature'] = value
+            elif name == 'P':
+                env['pressure'] = value
+            else:
+                motion['gyro_raw' if name[0] == 'G' else 'accel_raw'][name[1].lower()] = value
+        readings.append((t, env, motion))
+    return readings
+
+
+def sensor_text(t, env, motion):
+    """newSend.py's raw telemetry record."""
+    timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(1_700_000_000 + t))
+    return (f"{timestamp}|T:{env['temperature']}C|H:{env['humidity']}%|P:{env['pressure']}hPa|"
+            f"Pitch:{motion['orientation']['pitch']}|Roll:{motion['orientation']['roll']}|"
+            f"Yaw:{motion['orientation']['yaw']}|"
+            f"Ax:{motion['accel_raw']['x']}|Ay:{motion['accel_raw']['y']}|Az:{motion['accel_raw']['z']}|"
+            f"Gx:{motion['gyro_raw']['x']}|Gy:{motion['gyro_raw']['y']}|Gz:{motion['gyro_raw']['z']}|"
+            f"Compass:{motion['compass']}").encode()
+
+
+def packets(payload):
+    """Prefix + chunk count + data chunks, as send_sensor_bytes sends them."""
+    return 2 + -(-len(payload) // CHUNK_SIZE)
+
+
+def air_ms(packet_count):
+    return packet_count * (CHUNK_SIZE + PACKET_OVERHEAD_BYTES) * 8 / AIR_RATE_BPS * 1000
+
+
+def main():
+    readings = make_readings(DAY_S // READING_INTERVAL_S)
+    raw_packets = sum(packets(sensor_text(*r)) for r in readings)
+    raw_bytes = sum(len(sensor_text(*r)) for r in readings)
+
+    aggregator = telemetry_aggregator.TelemetryAggregator(now=0)
+    sent_packets = sent_bytes = summaries = 0
+    triggered = []
+    window = []
+    errors = {'p50': [], 'p95': [], 'std': []}
+    cpu = 0.0
+    for t, env, motion in readings:
+        values = telemetry_aggregator.readings_from(env, motion)
+        start = time.perf_counter()
+        reasons = aggregator.add(values)
+        cpu += time.perf_counter() - start
+        window.append(values['T'])
+        if reasons:
+            triggered.append((t, reasons))
+            text = sensor_text(t, env, motion)
+            sent_packets += packets(text)
+            sent_bytes += len(text)
+        now = t + READING_INTERVAL_S
+        if aggregator.due(now):
+            summary = aggregator.summary(now)
+            summaries += 1
+            sent_packets += packets(summary)
+            sent_bytes += len(summary)
+            decoded = telemetry_aggregator.decode_summary(summary + b'\x00' * (-len(summary) % CHUNK_SIZE))
+            field = decoded['fields']['T']
+            ordered = sorted(window)
+            spread = ordered[-1] - ordered[0]
+            errors['p50'].append(abs(field['p50'] - statistics.median(window)) / spread)
+            errors['p95'].append(abs(field['p95'] - ordered[int(0.95 * (len(ordered) - 1))]) / spread)
+            errors['std'].append(abs(field['std'] - statistics.stdev(window)) / statistics.stdev(window))
+            window = []
+
+    print(f"{len(readings)} readings over a day, one every {READING_INTERVAL_S} s")
+    print(f"{'':22} {'bytes':>8} {'packets':>8} {'air time':>9}")
+    print(f"{'every reading raw':22} {raw_bytes:8d} {raw_packets:8d} {air_ms(raw_packets):7.0f}ms")
+    print(f"{'summaries + anomalies':22} {sent_bytes:8d} {sent_packets:8d} {air_ms(sent_packets):7.0f}ms"
+          f"   ({raw_packets / sent_packets:.1f}x fewer packets)")
+    print(f"\n{summaries} summaries of {aggregator.window_s} s, {len(triggered)} readings sent raw:")
+    for t, reasons in triggered:
+        print(f"  t={t:6d}s  {'; '.join(reasons)}")
+    print(f"\nCPU per reading: {cpu / len(readings) * 1e6:.0f} us ({len(telemetry_aggregator.FIELDS)} fields)")
+    print("Error against exact window statistics (temperature, fraction of the window's range or std):")
+    for name, values in errors.items():
+        print(f"  {name}: mean {statistics.mean(values):.2%}, worst {max(values):.2%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Records/s of telemetry_archive's bulk decoder against the per-record loop the
+receivers use (ground_station.parse_sensor_text after unstamp_capture), on
+synthetic records in both sender layouts. Also checks that both decoders
+agree on every reading.
+    python bench_telemetry_archive.py [records]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import telemetry_archive
+from ground_station import parse_sensor_text
+from join_buffer import stamp_capture, unstamp_capture
+
+CHUNK_DATA_SIZE = 30
+
+
+def make_records(count, seed=1):
+    """Sensor strings like sat_send.py (6 readings) and newSend.py (13 readings)."""
+    rng = random.Random(seed)
+    start = 1_700_000_000
+    records = []
+    for i in range(count):
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(start + 10 * i))
+        text = (f"{timestamp}|T:{rng.uniform(-20, 60):.2f}C|H:{rng.uniform(0, 100):.2f}%|"
+                f"P:{rng.uniform(900, 1100):.2f}hPa|Pitch:{rng.uniform(0, 360)}|"
+                f"Roll:{rng.uniform(0, 360)}|Yaw:{rng.uniform(0, 360)}")
+        if i % 2:
+            text += "".join(f"|{axis}:{rng.gauss(0, 1)}" for axis in ('Ax', 'Ay', 'Az', 'Gx', 'Gy', 'Gz'))
+            text += f"|Compass:{rng.uniform(0, 360):.1f}"
+        records.append(text)
+    return records
+
+
+def pad(payload):
+    """NUL padding up to whole chunks, as the ziyad receiver hands payloads over."""
+    return payload + b'\x00' * (-len(payload) % CHUNK_DATA_SIZE)
+
+
+def per_record(payloads):
+    rows = []
+    for payload in payloads:
+        capture_id, capture_time, data = unstamp_capture(payload)
+        rows.append((capture_id, parse_sensor_text(data.rstrip(b'\x00').decode())))
+    return rows
+
+
+def check(rows, records):
+    assert len(rows) == len(records)
+    for (capture_id, parsed), record in zip(rows, records):
+        assert record['capture_id'] == capture_id
+        assert str(record['timestamp']).replace('T', ' ') == parsed['capture_timestamp']
+        for name in telemetry_archive.FIELDS:
+            if name in parsed:
+                # The loop keeps values like '1.2e-05' as text; the bulk decoder parses them
+                expected = float(parsed[name])
+                assert np.isclose(record[name], expected), (name, record[name], expected)
+            else:
+                assert np.isnan(record[name])
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    texts = make_records(count)
+    payloads = [pad(stamp_capture(text.encode(), i, 1_700_000_000 + i)) for i, text in enumerate(texts)]
+    print(f"{count} records, {sum(map(len, payloads)) / 1e6:.1f} MB of payloads\n")
+
+    rows, loop_s = timed(per_record, payloads)
+    print(f"per-record loop          {count / loop_s:12,.0f} records/s")
+
+    records, bulk_s = timed(lambda: np.concatenate(list(telemetry_archive.iter_payloads(payloads))))
+    check(rows, records)
+    print(f"bulk, stamped payloads   {count / bulk_s:12,.0f} records/s  ({loop_s / bulk_s:.1f}x)")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "captures.txt")
+        with open(path, 'w') as f:
+            f.write("\n".join(texts) + "\n")
+        records, text_s = timed(lambda: np.concatenate(list(telemetry_archive.iter_text_file(path))))
+        assert len(records) == count
+        print(f"bulk, text file          {count / text_s:12,.0f} records/s  ({loop_s / text_s:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Fan-out benchmark for telemetry_bus.py with 100 TCP subscribers, one of which
+never reads. Shows that publish() latency stays flat (the radio loop is never
+stalled), how many messages the healthy subscribers got, and how many were
+dropped for the laggard.
+Run:  python bench_telemetry_bus.py
+"""
+import selectors
+import socket
+import threading
+import time
+
+from telemetry_bus import TelemetryBus
+
+SUBSCRIBERS = 100
+SLOW_SUBSCRIBERS = 1
+MESSAGES = 20_000
+PORT = 5599
+
+
+def fast_readers(socks, counts, stop):
+    """Reads every healthy subscriber socket from one thread and counts lines."""
+    selector = selectors.DefaultSelector()
+    for i, sock in enumerate(socks):
+        sock.setblocking(False)
+        selector.register(sock, selectors.EVENT_READ, i)
+    while not stop.is_set():
+        for key, _ in selector.select(timeout=0.1):
+            try:
+                data = key.fileobj.recv(65536)
+            except BlockingIOError:
+                continue
+            counts[key.data] += data.count(b'\n')
+
+
+def main():
+    bus = TelemetryBus(port=PORT)
+    bus.start()
+
+    socks = [socket.create_connection(("127.0.0.1", PORT)) for _ in range(SUBSCRIBERS)]
+    slow = socks[:SLOW_SUBSCRIBERS]      # connected but never read
+    fast = socks[SLOW_SUBSCRIBERS:]
+    while bus.stats()['subscribers'] < SUBSCRIBERS:
+        time.sleep(0.01)
+
+    counts = [0] * len(fast)
+    stop = threading.Event()
+    reader = threading.Thread(target=fast_readers, args=(fast, counts, stop), daemon=True)
+    reader.start()
+
+    message = {'T': 25.5, 'H': 45.2, 'P': 1013.1, 'Pitch': 10.1, 'Roll': -5.2, 'Yaw': 180.3}
+    latencies = []
+    start = time.perf_counter()
+    for seq in range(MESSAGES):
+        t0 = time.perf_counter()
+        bus.publish('sensor', dict(message, seq=seq))
+        latencies.append(time.perf_counter() - t0)
+    publish_time = time.perf_counter() - start
+
+    # Give the I/O thread time to drain to the healthy subscribers
+    deadline = time.time() + 10
+    while time.time() < deadline and min(counts) < MESSAGES - bus.buffer_size:
+        time.sleep(0.05)
+    stop.set()
+    reader.join()
+    stats = bus.stats()
+    bus.stop()
+    for sock in socks:
+        sock.close()
+
+    latencies.sort()
+    print(f"{SUBSCRIBERS} subscribers ({SLOW_SUBSCRIBERS} never reading), {MESSAGES} messages")
+    print(f"Publish rate: {MESSAGES / publish_time:,.0f} msg/s "
+          f"({MESSAGES * SUBSCRIBERS / publish_time:,.0f} deliveries/s queued)")
+    print(f"publish() latency: p50 {latencies[len(latencies) // 2] * 1e6:.1f} us, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1e6:.1f} us, max {latencies[-1] * 1e6:.1f} us")
+    print(f"Healthy subscribers received: min {min(counts)}, max {max(counts)} of {MESSAGES}")
+    print(f"Dropped (all subscribers): {stats['dropped']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Benchmark for tile_codec.py: bytes per frame versus sending a full JPEG every
+time, and the cost of the tile diff itself. Uses synthetic 2048x2048 frames:
+a static textured scene with a small object moving across it and a slow
+global brightness drift.
+Run on the Pi to get the numbers that matter:  python bench_tile_codec.py
+"""
+import time
+
+import numpy as np
+
+import tile_codec
+
+FRAME_SIZE = 2048
+FRAMES = 15
+OBJECT_SIZE = 200
+
+
+def make_scene(size, seed=1):
+    rng = np.random.default_rng(seed)
+    # Smooth gradients plus texture so the JPEG size is realistic
+    y, x = np.mgrid[0:size, 0:size]
+    base = np.stack([(x * 255 // size), (y * 255 // size), ((x + y) * 127 // size)], axis=-1)
+    noise = rng.integers(0, 24, size=(size, size, 3))
+    return np.clip(base + noise, 0, 255).astype(np.uint8)
+
+
+def frame_at(scene, i):
+    frame = scene.copy()
+    pos = 100 + i * 90
+    frame[pos:pos + OBJECT_SIZE, pos:pos + OBJECT_SIZE] = (250, 40, 40)
+    if i % 5 == 4:
+        # Small lighting change in one quadrant
+        quarter = FRAME_SIZE // 2
+        frame[:quarter, quarter:] = np.clip(frame[:quarter, quarter:].astype(np.int16) + 6, 0, 255)
+    return frame
+
+
+def main():
+    scene = make_scene(FRAME_SIZE)
+    encoder = tile_codec.TileEncoder()
+    decoder = tile_codec.TileDecoder()
+
+    full_total = 0
+    tiled_total = 0
+    diff_ms = []
+    encode_ms = []
+    for i in range(FRAMES):
+        frame = frame_at(scene, i)
+        full = len(tile_codec._jpeg_bytes(frame, tile_codec.TILE_QUALITY))
+
+        start = time.perf_counter()
+        packet = encoder.encode(frame)
+        encode_ms.append((time.perf_counter() - start) * 1000)
+        if i > 0:
+            diff_ms.append(encoder.last_diff_ms)
+
+        reconstruction = decoder.decode(packet)
+        encoder.delivered(packet)
+        error = np.abs(reconstruction.astype(np.int16) - frame.astype(np.int16)).mean()
+        full_total += full
+        tiled_total += len(packet)
+        print(f"frame {i:2d}: full JPEG {full:8d} B | tile codec {len(packet):8d} B | "
+              f"encode {encode_ms[-1]:7.1f} ms | mean abs error {error:.2f}")
+
+    print("-" * 72)
+    print(f"Total: full {full_total} B, tiled {tiled_total} B "
+          f"({100 * (1 - tiled_total / full_total):.1f}% fewer bytes)")
+    print(f"Tile diff: mean {np.mean(diff_ms):.1f} ms, max {np.max(diff_ms):.1f} ms "
+          f"({FRAME_SIZE}x{FRAME_SIZE}, subsample {tile_codec.DIFF_SUBSAMPLE})")
+    print(f"Whole encode: mean {np.mean(encode_ms):.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Round-trip latency of uplink commands (uplink.py) over the simulated link.
+A ground station like receiver__ziyad's compact path puts commands on its
+ACK payloads while sender_ziyad either polls for them (as it does at the end
+of a contact) or is busy sending 4 KB images, whose responses have to wait
+for the image to finish. One command in flight at a time is compared with
+the pipelined window.
+    python bench_uplink.py
+"""
+import contextlib
+import io
+import os
+import tempfile
+import threading
+import time
+
+import channel_manager
+import compression
+import handshake
+import power
+import rtt
+import sender_ziyad
+import uplink
+from bench_framing import FramedReceiver
+from link_sim import Link
+
+COMMANDS = ["PING", "GET jpeg_quality", "SET jpeg_quality 70", "GET image_size",
+            "SET image_size 512", "SET priority_image 2", "GET contact_window_s", "SET jpeg_quality 500"] * 2
+
+
+class CommandStation(FramedReceiver):
+    """Compact-path receiver that uplinks commands and reads RESP transfers."""
+
+    def __init__(self, radio, window):
+        super().__init__(radio)
+        self.client = uplink.CommandClient(window=window)
+        self.lines = []
+
+    def run(self):
+        self.radio.startListening()
+        while not self.stop.is_set():
+            if not power.wait_for_packet(self.radio, 0.05):
+                continue
+            payload = self.radio.read(self.radio.getDynamicPayloadSize())
+            ack, transfer = self.assembler.feed(payload)
+            if ack is not None:
+                self.radio.writeAckPayload(1, ack + self.client.tail())
+            if transfer is not None and transfer.prefix == b'RESP':
+                self.lines += self.client.handle_responses(compression.decompress(transfer.data))
+
+
+def run(window, busy, config_path):
+    tx, rx = Link(loss=0.02, seed=11).endpoints()
+    for radio in (tx, rx):
+        radio.setChannel(channel_manager.HOME_CHANNEL)
+    station = CommandStation(rx, window)
+    for line in COMMANDS:
+        station.client.submit(line)
+    station.start()
+    sender_ziyad.radio = tx
+    sender_ziyad.channels = channel_manager.ChannelManager(tx, verbose=False)
+    sender_ziyad.ack_timer = rtt.RttEstimator(initial_rto=sender_ziyad.RETRY_TIMEOUT)
+    sender_ziyad.next_seq = 0
+    sender_ziyad.session = handshake.SessionConfig(
+        1, handshake.CAP_ACK_PAYLOAD | handshake.CAP_COMPACT_FRAMING | handshake.CAP_COMPRESSION, 1,
+        handshake.CODEC_RAW, handshake.RF24_1MBPS, codecs=compression.available_codecs())
+    sender_ziyad.config = uplink.OnboardConfig(config_path)
+    sender_ziyad.commands = uplink.CommandDispatcher(sender_ziyad.config)
+    image = os.urandom(4096)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        while station.client.pending and time.perf_counter() - start < 120:
+            if busy:
+                sender_ziyad.send_product('image', image)
+            else:
+                sender_ziyad.send_product('responses', sender_ziyad.commands.take_responses())
+    elapsed = time.perf_counter() - start
+    station.stop.set()
+    station.join()
+    return station, elapsed
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'sender':14} {'window':>6} {'all answered':>13}  round trips")
+        for busy in (False, True):
+            for window in (1, uplink.WINDOW):
+                station, elapsed = run(window, busy, os.path.join(tmp, f"config_{busy}_{window}.json"))
+                print(f"{'sending images' if busy else 'polling':14} {window:6d} {elapsed:12.2f}s  "
+                      f"{station.client.describe()}")
+        print("\nLast run:")
+        for line in station.lines:
+            print(f"  {line}")
+
+
+if __name__ == "__main__":
+    main()
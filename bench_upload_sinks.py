@@ -0,0 +1,94 @@
+"""
+Upload throughput of each sink in upload_sinks.py. The Firebase sink posts
+to the in-process StubServer, with and without simulated server latency,
+so pooling, concurrency, batching and gzip can be compared without touching
+the real database. The local SQLite and JSON-lines sinks are also timed.
+Documents are shaped like the receivers' uploads: sensor readings, plus a
+base64 JPEG on every fourth one. Every run checks that the stub (or the
+database) ended up holding every document.
+    python bench_upload_sinks.py [documents]
+"""
+import base64
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import upload_sinks
+
+LATENCIES_S = [0.0, 0.005]
+HTTP_CASES = [
+    # label, sink options, posting threads
+    ("new connection each", {'pool_size': 0}, 1),
+    ("pooled", {'pool_size': 4}, 1),
+    ("pooled, 4 threads", {'pool_size': 4}, 4),
+    ("batches of 50", {'batch_size': 50}, 1),
+    ("batches of 50, gzip", {'batch_size': 50, 'compress': True}, 1),
+]
+LOCAL_CASES = [
+    ("sqlite", "captures.db", {}),
+    ("sqlite, batches of 50", "captures_batched.db", {'batch_size': 50}),
+    ("json lines", "captures.jsonl", {}),
+    ("json lines, batches of 50, gzip", "captures.jsonl.gz", {'batch_size': 50, 'compress': True}),
+]
+
+
+def make_documents(count):
+    documents = []
+    for i in range(count):
+        document = {"timestamp": "2024-05-01 12:00:00", "capture_id": i, "capture_timestamp": 1714564800.0 + i,
+                    "sensor_readings": {"capture_timestamp": "2024-05-01 12:00:00", "T": 25.51, "H": 45.2,
+                                        "P": 1013.25, "Pitch": 1.2345678, "Roll": 359.87654, "Yaw": 180.01234}}
+        if i % 4 == 0:
+            # Random bytes, like JPEG data: only the base64 overhead compresses away
+            document["image_base64"] = base64.b64encode(os.urandom(6000)).decode()
+        documents.append(document)
+    return documents
+
+
+def run(sink, documents, threads):
+    start = time.perf_counter()
+    if threads == 1:
+        for document in documents:
+            sink.post(document)
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(sink.post, documents))
+    sink.close()
+    return time.perf_counter() - start
+
+
+def report(label, documents, elapsed, wire_bytes):
+    json_bytes = sum(len(json.dumps(d)) for d in documents)
+    print(f"  {label:34} {len(documents) / elapsed:8.0f} docs/s {json_bytes / elapsed / 1e6:7.2f} MB/s "
+          f"{wire_bytes / 1e6:8.2f} MB written")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    documents = make_documents(count)
+    for latency_s in LATENCIES_S:
+        print(f"Firebase sink -> stub server, {latency_s * 1000:.0f} ms per request, {count} documents")
+        for label, options, threads in HTTP_CASES:
+            with upload_sinks.StubServer(latency_s=latency_s) as stub:
+                sink = upload_sinks.FirebaseSink(stub.url, **options)
+                elapsed = run(sink, documents, threads)
+                assert len(stub.documents) == count and sink.documents_failed == 0, label
+                report(f"{label} ({stub.requests} requests)", documents, elapsed, stub.bytes_received)
+
+    print(f"Local sinks, {count} documents")
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, filename, options in LOCAL_CASES:
+            sink = upload_sinks.make_sink(os.path.join(tmp, filename), **options)
+            elapsed = run(sink, documents, 1)
+            if isinstance(sink, upload_sinks.SqliteSink):
+                check = upload_sinks.SqliteSink(sink.path)
+                assert len(check.documents()) == count, label
+                check.close()
+            report(label, documents, elapsed, sink.bytes_sent)
+
+
+if __name__ == "__main__":
+    main()
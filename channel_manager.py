@@ -0,0 +1,240 @@
+import json
+import os
+import random
+import time
+from collections import deque
+
+# --- Channel scanning and frequency hopping ---
+# Both ends meet on HOME_CHANNEL for the handshake. Each side scans the band
+# first and offers the channels it found quiet; the receiver intersects the
+# two sets and picks a hop seed, so both derive the same hop sequence. During
+# a session the sender tracks loss per channel and, when the current channel
+# goes bad, tells the receiver to move to the next channel with a HOP packet.
+# With a link key HOP packets carry a control tag (security.py), and the
+# receiver only moves to channels in the negotiated set.
+HOME_CHANNEL = 76
+NUM_CHANNELS = 126
+SCAN_SAMPLES = 20             # RPD samples per channel
+RPD_SETTLE_S = 0.0002         # RPD needs ~170 us of listening to latch
+MAX_BUSY_FRACTION = 0.1       # channels busier than this during the scan are skipped
+MAX_HOP_CHANNELS = 16
+
+LOSS_WINDOW = 32              # recent attempts kept per channel
+MIN_SAMPLES_TO_HOP = 8
+HOP_LOSS_THRESHOLD = 0.3      # hop away when recent loss is above this
+BLACKLIST_LOSS = 0.6          # and stop using the channel for a while above this
+BLACKLIST_S = 30.0
+RESYNC_TIMEOUT_S = 2.0        # receiver goes home if a hopped channel stays silent
+SCAN_CACHE = "channel_scan.json"
+SCAN_MAX_AGE_S = 15 * 60      # a full scan costs ~0.5 s, too much for every short pass
+
+HOP_MARKER = b'\xff\xffHOP'   # metadata index 0xFFFF + 'HOP' + channel byte (+ control tag)
+
+
+def scan_band(radio, channels=range(NUM_CHANNELS), samples=SCAN_SAMPLES):
+    """
+    Measures how often each channel shows energy above -64 dBm (RPD).
+    Returns {channel: busy_fraction}. Leaves the radio on HOME_CHANNEL.
+    """
+    busy = {}
+    radio.startListening()
+    for channel in channels:
+        radio.setChannel(channel)
+        hits = 0
+        for _ in range(samples):
+            time.sleep(RPD_SETTLE_S)
+            if radio.testRPD():
+                hits += 1
+        busy[channel] = hits / samples
+    radio.stopListening()
+    radio.setChannel(HOME_CHANNEL)
+    return busy
+
+
+def cached_scan(radio, path=SCAN_CACHE, max_age_s=SCAN_MAX_AGE_S):
+    """scan_band(), reusing the last result saved in path while it is recent."""
+    try:
+        with open(path) as f:
+            cached = json.load(f)
+        if time.time() - cached['time'] < max_age_s:
+            return {int(channel): fraction for channel, fraction in cached['busy'].items()}
+    except (OSError, ValueError, KeyError):
+        pass
+    busy = scan_band(radio)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'time': time.time(), 'busy': busy}, f)
+    os.replace(tmp_path, path)
+    return busy
+
+
+def quiet_channel_mask(busy, max_busy=MAX_BUSY_FRACTION, max_channels=MAX_HOP_CHANNELS):
+    """Bitmask of the quietest channels, for the handshake offer."""
+    quiet = sorted((fraction, channel) for channel, fraction in busy.items() if fraction <= max_busy)
+    mask = 1 << HOME_CHANNEL
+    for _, channel in quiet[:max_channels]:
+        mask |= 1 << channel
+    return mask
+
+
+def mask_to_channels(mask):
+    return [channel for channel in range(NUM_CHANNELS) if mask >> channel & 1]
+
+
+def hop_sequence(mask, seed):
+    """The shared hop order. Starts at HOME_CHANNEL if it's in the set."""
+    channels = mask_to_channels(mask)
+    random.Random(seed).shuffle(channels)
+    if HOME_CHANNEL in channels:
+        channels.remove(HOME_CHANNEL)
+        channels.insert(0, HOME_CHANNEL)
+    return channels
+
+
+def make_hop_packet(channel):
+    return HOP_MARKER + bytes([channel])
+
+
+def parse_hop_packet(payload):
+    """Returns the target channel of a HOP packet, or None."""
+    payload = bytes(payload)
+    if payload[:len(HOP_MARKER)] == HOP_MARKER and len(payload) > len(HOP_MARKER):
+        return payload[len(HOP_MARKER)]
+    return None
+
+
+class ChannelManager:
+    """
+    Hops over the negotiated channel set. cipher (security.LinkCipher) tags
+    HOP packets on the sender and is required on them by the receiver when set.
+    """
+
+    def __init__(self, radio, sequence=None, verbose=True, cipher=None):
+        self.radio = radio
+        self.verbose = verbose
+        self.cipher = cipher
+        self.rejected = 0
+        self.sequence = sequence or [HOME_CHANNEL]
+        self.position = 0
+        self.history = {channel: deque(maxlen=LOSS_WINDOW) for channel in self.sequence}
+        self.blacklisted_until = {}
+        self.hops = 0
+        self.last_heard = time.time()
+
+    @classmethod
+    def from_session(cls, radio, session, verbose=True, cipher=None):
+        """Builds the manager from a negotiated handshake.SessionConfig."""
+        if session.channel_mask:
+            return cls(radio, hop_sequence(session.channel_mask, session.hop_seed), verbose, cipher)
+        return cls(radio, verbose=verbose, cipher=cipher)
+
+    @property
+    def current(self):
+        return self.sequence[self.position]
+
+    def record(self, success):
+        """Feeds the outcome of one transmit attempt on the current channel."""
+        self.history[self.current].append(bool(success))
+        if success:
+            self.last_heard = time.time()
+
+    def loss(self, channel):
+        history = self.history.get(channel)
+        if not history:
+            return 0.0
+        return history.count(False) / len(history)
+
+    def should_hop(self):
+        history = self.history[self.current]
+        return (
+            len(self.sequence) > 1
+            and len(history) >= MIN_SAMPLES_TO_HOP
+            and self.loss(self.current) > HOP_LOSS_THRESHOLD
+        )
+
+    def next_channel(self):
+        """Next usable channel in the sequence, skipping blacklisted ones."""
+        now = time.time()
+        if self.loss(self.current) > BLACKLIST_LOSS:
+            self.blacklisted_until[self.current] = now + BLACKLIST_S
+        for step in range(1, len(self.sequence) + 1):
+            candidate = self.sequence[(self.position + step) % len(self.sequence)]
+            if self.blacklisted_until.get(candidate, 0) <= now:
+                return candidate
+        return self.current
+
+    def switch(self, channel):
+        if channel not in self.history:
+            self.sequence.append(channel)
+            self.history[channel] = deque(maxlen=LOSS_WINDOW)
+        self.position = self.sequence.index(channel)
+        # Start the new channel with a clean slate
+        self.history[channel].clear()
+        self.radio.setChannel(channel)
+        self.hops += 1
+        self.last_heard = time.time()
+
+    # --- sender side ---
+    def maybe_hop(self):
+        """
+        Moves both ends to the next channel if the current one is lossy.
+        The HOP packet's hardware ACK tells us the receiver got it. Without
+        one we can't tell a lost HOP from a lost ACK, so the HOP is repeated
+        on the target channel: if that is ACKed the receiver did move.
+        """
+        if not self.should_hop():
+            return False
+        previous = self.current
+        target = self.next_channel()
+        if target == previous:
+            return False
+        self.radio.stopListening()
+        hop = make_hop_packet(target)
+        if self.cipher:
+            hop = self.cipher.sign_control(hop)
+        if self.verbose:
+            print(f"📶 Channel {previous} loss {self.loss(previous):.0%}, hopping to {target}")
+        if self.radio.write(hop):
+            self.switch(target)
+            return True
+        self.radio.setChannel(target)
+        if self.radio.write(hop):
+            self.switch(target)
+            return True
+        self.radio.setChannel(previous)
+        return False
+
+    def check_resync(self):
+        """
+        Falls back to HOME_CHANNEL when the current channel has gone quiet.
+        Both ends do this, so a HOP whose ACK was lost (receiver moved, sender
+        didn't) still ends with both radios back on the home channel.
+        """
+        if self.current != HOME_CHANNEL and time.time() - self.last_heard > RESYNC_TIMEOUT_S:
+            if self.verbose:
+                print(f"📶 Nothing heard on channel {self.current}, returning to {HOME_CHANNEL}")
+            self.switch(HOME_CHANNEL)
+
+    # --- receiver side ---
+    def handle_packet(self, payload):
+        """
+        Returns True if payload was a HOP command. It is applied only if its
+        tag checks out and it names a channel in the hop set.
+        """
+        self.last_heard = time.time()
+        if parse_hop_packet(payload) is None:
+            return False
+        body = self.cipher.verify_control(payload) if self.cipher else bytes(payload)
+        channel = parse_hop_packet(body) if body else None
+        if channel is None or channel not in self.history:
+            self.rejected += 1
+            if self.verbose:
+                print(f"🚫 Ignoring HOP {'without a valid tag' if channel is None else f'to channel {channel}'}.")
+            return True
+        self.switch(channel)
+        if self.verbose:
+            print(f"📶 Sender moved us to channel {channel}")
+        return True
+
+    def report(self):
+        return {channel: round(self.loss(channel), 3) for channel in self.sequence}
@@ -0,0 +1,162 @@
+import lzma
+import zlib
+
+import handshake
+
+# --- Payload compression ---
+# Optional stage in the payload path when both ends offer
+# handshake.CAP_COMPRESSION. The sender picks a codec per transfer from the
+# set both ends support (SessionConfig.codecs) and tags the payload with it:
+#   [codec u8][compressed body]
+# before sealing. Telemetry records are too short for a compressor to find
+# much repetition on its own, so the dictionary codecs start from what a
+# record looks like (zlib's preset dictionary, or zstd's when the zstandard
+# package is installed). Images are JPEGs already and go out raw, and so does
+# any payload that wouldn't get smaller. Containers and checksums are left out
+# (raw deflate, raw LZMA2): the radio's CRC and the AEAD tag cover integrity.
+ZLIB_LEVEL = 9
+LZMA_PRESET = 6
+ZSTD_LEVEL = 9
+LZMA_FILTERS = [{'id': lzma.FILTER_LZMA2, 'preset': LZMA_PRESET}]
+
+# A typical record from each sender, most common strings last as zlib wants them
+TELEMETRY_DICTIONARY = (
+    b"|Ax:0.0|Ay:0.0|Az:1.0|Gx:0.0|Gy:0.0|Gz:0.0|Compass:0.0"
+    b"2025-01-01 00:00:00|T:25.0C|H:45.0%|P:1013.0hPa|Pitch:0.0|Roll:0.0|Yaw:0.0"
+    b"CI|T:C|H:%|P:hPa|Pitch:|Roll:|Yaw:"
+)
+
+# Codecs to try per product, best first; the first one both ends share is used
+PRODUCT_CODECS = {
+    'telemetry': [handshake.CODEC_ZSTD_DICT, handshake.CODEC_ZLIB_DICT, handshake.CODEC_ZLIB],
+    'thumbnail': [handshake.CODEC_RAW],
+    'image': [handshake.CODEC_RAW],
+}
+DEFAULT_CODECS = [handshake.CODEC_ZSTD, handshake.CODEC_LZMA, handshake.CODEC_ZLIB]
+
+CODEC_NAMES = {
+    handshake.CODEC_RAW: 'raw', handshake.CODEC_ZLIB: 'zlib', handshake.CODEC_LZMA: 'lzma',
+    handshake.CODEC_ZSTD: 'zstd', handshake.CODEC_ZLIB_DICT: 'zlib+dict', handshake.CODEC_ZSTD_DICT: 'zstd+dict',
+}
+
+_zstd = None
+
+
+def _zstandard():
+    """The zstandard module, or None if it isn't installed."""
+    global _zstd
+    if _zstd is None:
+        try:
+            import zstandard
+        except ImportError:
+            zstandard = False
+        _zstd = zstandard
+    return _zstd or None
+
+
+def available_codecs():
+    """Codec bitmap for the handshake offer: what this machine can encode and decode."""
+    codecs = handshake.CODEC_RAW | handshake.CODEC_ZLIB | handshake.CODEC_LZMA | handshake.CODEC_ZLIB_DICT
+    if _zstandard():
+        codecs |= handshake.CODEC_ZSTD | handshake.CODEC_ZSTD_DICT
+    return codecs
+
+
+def _zstd_dictionary():
+    zstandard = _zstandard()
+    return zstandard.ZstdCompressionDict(TELEMETRY_DICTIONARY, dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+
+
+def _zlib_dictionary(codec):
+    return {'zdict': TELEMETRY_DICTIONARY} if codec == handshake.CODEC_ZLIB_DICT else {}
+
+
+def _encode(codec, payload):
+    if codec == handshake.CODEC_RAW:
+        return payload
+    if codec in (handshake.CODEC_ZLIB, handshake.CODEC_ZLIB_DICT):
+        compressor = zlib.compressobj(ZLIB_LEVEL, zlib.DEFLATED, -15, **_zlib_dictionary(codec))
+        return compressor.compress(payload) + compressor.flush()
+    if codec == handshake.CODEC_LZMA:
+        return lzma.compress(payload, format=lzma.FORMAT_RAW, filters=LZMA_FILTERS)
+    if codec in (handshake.CODEC_ZSTD, handshake.CODEC_ZSTD_DICT):
+        zstandard = _zstandard()
+        dict_data = _zstd_dictionary() if codec == handshake.CODEC_ZSTD_DICT else None
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=dict_data, write_checksum=False,
+                                        write_content_size=True, write_dict_id=False).compress(payload)
+    raise ValueError(f"unknown codec {codec}")
+
+
+def _decode(codec, body):
+    if codec == handshake.CODEC_RAW:
+        return body
+    if codec in (handshake.CODEC_ZLIB, handshake.CODEC_ZLIB_DICT):
+        decompressor = zlib.decompressobj(-15, **_zlib_dictionary(codec))
+        data = decompressor.decompress(body) + decompressor.flush()
+        if not decompressor.eof:
+            raise ValueError("truncated deflate stream")
+        return data
+    # Streaming decoders stop at the end of the stream, so NUL padding from
+    # fixed-index chunks after it is ignored
+    if codec == handshake.CODEC_LZMA:
+        decompressor = lzma.LZMADecompressor(lzma.FORMAT_RAW, filters=LZMA_FILTERS)
+        data = decompressor.decompress(body)
+        if not decompressor.eof:
+            raise ValueError("truncated LZMA stream")
+        return data
+    if codec in (handshake.CODEC_ZSTD, handshake.CODEC_ZSTD_DICT):
+        zstandard = _zstandard()
+        if not zstandard:
+            raise ValueError("zstd payload but the zstandard package isn't installed")
+        dict_data = _zstd_dictionary() if codec == handshake.CODEC_ZSTD_DICT else None
+        return zstandard.ZstdDecompressor(dict_data=dict_data).decompressobj().decompress(body)
+    raise ValueError(f"unknown codec {codec}")
+
+
+def compress(payload, codec):
+    """Tags and compresses payload with one codec (a handshake.CODEC_* bit)."""
+    return bytes([codec]) + _encode(codec, bytes(payload))
+
+
+def decompress(data):
+    """Undoes compress(). Raises ValueError if the data is corrupt or the codec unknown."""
+    data = bytes(data)
+    if not data:
+        raise ValueError("empty payload, no codec tag")
+    try:
+        return _decode(data[0], data[1:])
+    except (zlib.error, lzma.LZMAError) as e:
+        raise ValueError(f"{CODEC_NAMES.get(data[0], data[0])} payload is corrupt: {e}") from e
+    except Exception as e:
+        zstandard = _zstandard()
+        if zstandard and isinstance(e, zstandard.ZstdError):
+            raise ValueError(f"{CODEC_NAMES.get(data[0], data[0])} payload is corrupt: {e}") from e
+        raise
+
+
+def choose_codec(kind, allowed):
+    """First codec for this product that both ends support, or raw."""
+    allowed &= available_codecs()
+    for codec in PRODUCT_CODECS.get(kind, DEFAULT_CODECS):
+        if allowed & codec:
+            return codec
+    return handshake.CODEC_RAW
+
+
+def pack(kind, payload, allowed):
+    """
+    Compresses a product for sending with the best shared codec for its kind.
+    Falls back to raw when compression wouldn't save anything. Returns
+    (tagged payload, codec used).
+    """
+    codec = choose_codec(kind, allowed)
+    packed = compress(payload, codec)
+    if codec != handshake.CODEC_RAW and len(packed) >= len(payload) + 1:
+        codec = handshake.CODEC_RAW
+        packed = compress(payload, codec)
+    return packed, codec
+
+
+def describe(kind, raw_len, packed_len, codec):
+    return (f"{kind} {raw_len} B -> {packed_len} B with {CODEC_NAMES.get(codec, codec)} "
+            f"({packed_len / raw_len:.0%})" if raw_len else f"{kind} empty")
@@ -0,0 +1,116 @@
+import hashlib
+from collections import OrderedDict
+
+# --- Duplicate suppression for images and telemetry ---
+HASH_SIZE = 8                # 8x8 difference hash -> 64-bit fingerprint
+NEAR_DUPLICATE_BITS = 4      # frames within this Hamming distance count as unchanged
+RESEND_EVERY_N_SKIPS = 30    # still send a "still alive" frame now and then
+CONTENT_CACHE_SIZE = 256     # receiver-side LRU of content hashes
+
+
+def dhash(image, hash_size=HASH_SIZE):
+    """
+    Difference hash of a PIL image: compares neighbouring pixels of a tiny
+    grayscale copy. Small changes in lighting or JPEG noise barely move it.
+    """
+    from PIL import Image
+
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+def content_hash(data):
+    """Exact content hash used to recognise byte-identical blobs."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class FrameDeduplicator:
+    """
+    Sender-side check that decides whether a new frame is worth downlinking.
+    Keeps the perceptual hash of the last frame that was actually sent: a
+    frame should_send() lets through only becomes the one to compare against
+    once record_sent() says it went down.
+    """
+
+    def __init__(self, threshold_bits=NEAR_DUPLICATE_BITS, resend_every=RESEND_EVERY_N_SKIPS):
+        self.threshold_bits = threshold_bits
+        self.resend_every = resend_every
+        self.last_hash = None
+        self.candidate_hash = None     # last frame let through, not yet sent
+        self.last_sent_size = 0
+        self.skipped_in_a_row = 0
+        self.frames_skipped = 0
+        self.bytes_saved = 0
+
+    def should_send(self, image):
+        """
+        Returns True if image differs enough from the last sent frame.
+        Run it on the raw capture so unchanged frames skip the JPEG encode too.
+        """
+        frame_hash = dhash(image)
+        if (
+            self.last_hash is not None
+            and hamming_distance(frame_hash, self.last_hash) <= self.threshold_bits
+            and self.skipped_in_a_row < self.resend_every
+        ):
+            self.skipped_in_a_row += 1
+            self.frames_skipped += 1
+            # The skipped frame would have been about as big as the last one
+            self.bytes_saved += self.last_sent_size
+            return False
+        self.candidate_hash = frame_hash
+        return True
+
+    def record_sent(self, encoded_size):
+        """The latest frame should_send() let through has been delivered."""
+        if self.candidate_hash is not None:
+            self.last_hash = self.candidate_hash
+            self.candidate_hash = None
+        self.skipped_in_a_row = 0
+        self.last_sent_size = encoded_size
+
+    def report(self):
+        return f"{self.frames_skipped} near-duplicate frames skipped, ~{self.bytes_saved} bytes saved over the air"
+
+
+class ContentHashCache:
+    """
+    Receiver-side LRU cache mapping content hash -> where the blob was stored.
+    A duplicate upload is replaced by a reference to the first copy.
+    """
+
+    def __init__(self, max_entries=CONTENT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.bytes_saved = 0
+
+    def lookup(self, data):
+        """Returns (hash, stored_reference or None) and refreshes the entry on a hit."""
+        digest = content_hash(data)
+        reference = self.entries.get(digest)
+        if reference is not None:
+            self.entries.move_to_end(digest)
+            self.hits += 1
+            self.bytes_saved += len(data)
+        return digest, reference
+
+    def store(self, digest, reference):
+        self.entries[digest] = reference
+        self.entries.move_to_end(digest)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def report(self):
+        return f"{self.hits} duplicate blobs stored once, {self.bytes_saved} bytes saved on upload"
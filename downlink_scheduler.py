@@ -0,0 +1,216 @@
+import json
+import os
+import time
+import uuid
+
+# --- Product types and their default priorities (lower number = sent first) ---
+PRIORITY_TELEMETRY = 0
+PRIORITY_THUMBNAIL = 1
+PRIORITY_LOG = 2
+PRIORITY_IMAGE = 3
+
+DEFAULT_PRIORITIES = {
+    'telemetry': PRIORITY_TELEMETRY,
+    'summary': PRIORITY_TELEMETRY,
+    'thumbnail': PRIORITY_THUMBNAIL,
+    'log': PRIORITY_LOG,
+    'image': PRIORITY_IMAGE,
+}
+
+QUEUE_DIR = "downlink_queue"
+INDEX_FILE = "index.json"
+
+# Starting point for the goodput estimate before anything has been measured.
+# Roughly what the ACK-per-chunk protocols achieve at 1 Mbps.
+DEFAULT_GOODPUT_BPS = 2000.0
+GOODPUT_SMOOTHING = 0.3     # EWMA weight given to the newest measurement
+PER_ITEM_OVERHEAD_S = 0.05  # prefix + chunk-count round trips for every product
+SAFETY_MARGIN = 0.9         # only plan to use 90% of the contact window
+MIN_PIECE_BYTES = 512       # smallest piece of a split product worth a transfer of its own
+
+
+class DownlinkQueue:
+    """
+    Persistent queue of products waiting for a ground contact.
+    Payloads live as files in the queue directory and a small JSON index keeps
+    their metadata, so anything not sent during one pass survives a reboot and
+    is picked up at the next contact. Products enqueued as splittable go down
+    a piece at a time when they don't fit in one contact, and the index keeps
+    how far they got.
+    """
+
+    def __init__(self, queue_dir=QUEUE_DIR):
+        self.queue_dir = queue_dir
+        os.makedirs(queue_dir, exist_ok=True)
+        self.index_path = os.path.join(queue_dir, INDEX_FILE)
+        self.items = []
+        self.goodput_bps = DEFAULT_GOODPUT_BPS
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Downlink queue index unreadable, starting empty: {e}")
+            return
+        self.goodput_bps = state.get('goodput_bps', DEFAULT_GOODPUT_BPS)
+        # Drop entries whose payload file went missing
+        self.items = [item for item in state.get('items', []) if os.path.exists(self._payload_path(item))]
+
+    def _save(self):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'goodput_bps': self.goodput_bps, 'items': self.items}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.index_path)
+
+    def _payload_path(self, item):
+        return os.path.join(self.queue_dir, item['id'] + ".bin")
+
+    def enqueue(self, kind, payload_bytes, priority=None, deadline_s=None, splittable=False):
+        """
+        Adds a product to the queue and returns its id.
+        deadline_s is how long from now the product stays worth sending.
+        splittable products may be sent in byte ranges over several contacts.
+        """
+        item = {
+            'id': uuid.uuid4().hex,
+            'kind': kind,
+            'priority': DEFAULT_PRIORITIES.get(kind, PRIORITY_LOG) if priority is None else priority,
+            'created': time.time(),
+            'deadline': None if deadline_s is None else time.time() + deadline_s,
+            'size': len(payload_bytes),
+            'splittable': splittable,
+            'sent': 0,              # bytes of a split product already delivered
+        }
+        with open(self._payload_path(item), 'wb') as f:
+            f.write(payload_bytes)
+        self.items.append(item)
+        self._save()
+        return item['id']
+
+    def read_payload(self, item):
+        with open(self._payload_path(item), 'rb') as f:
+            return f.read()
+
+    def remove(self, item_id):
+        for item in self.items:
+            if item['id'] == item_id:
+                self.items.remove(item)
+                try:
+                    os.remove(self._payload_path(item))
+                except FileNotFoundError:
+                    pass
+                self._save()
+                return True
+        return False
+
+    def drop_expired(self, now=None):
+        """Removes products whose deadline has passed. Returns how many were dropped."""
+        now = time.time() if now is None else now
+        expired = [item['id'] for item in self.items if item['deadline'] is not None and item['deadline'] < now]
+        for item_id in expired:
+            self.remove(item_id)
+        return len(expired)
+
+    def pending(self):
+        """Products in send order: priority first, then earliest deadline, then oldest."""
+        return sorted(
+            self.items,
+            key=lambda item: (item['priority'], item['deadline'] or float('inf'), item['created']),
+        )
+
+    def record_goodput(self, nbytes, seconds):
+        """Folds a measured transfer into the goodput estimate."""
+        if nbytes <= 0 or seconds <= 0:
+            return
+        measured = nbytes / seconds
+        self.goodput_bps = (1 - GOODPUT_SMOOTHING) * self.goodput_bps + GOODPUT_SMOOTHING * measured
+        self._save()
+
+    def expected_airtime(self, nbytes):
+        return PER_ITEM_OVERHEAD_S + nbytes / self.goodput_bps
+
+    def piece_bytes(self, airtime):
+        """How many bytes of a split product fit in airtime seconds."""
+        return max(0, int((airtime - PER_ITEM_OVERHEAD_S) * self.goodput_bps))
+
+    def plan_contact(self, window_s, now=None):
+        """
+        Picks the products to send in a contact window of window_s seconds.
+        Returns [(item, end)]: send the item's bytes from item['sent'] up to end.
+        Goes through the queue in priority order and takes everything whose
+        expected air time still fits, so a large image that doesn't fit is
+        deferred without blocking the smaller, fresher products behind it.
+        Whatever budget is left then goes to a piece of the first splittable
+        product that didn't fit.
+        """
+        self.drop_expired(now)
+        budget = window_s * SAFETY_MARGIN
+        plan = []
+        split = []
+        for item in self.pending():
+            sent = item.get('sent', 0)
+            airtime = self.expected_airtime(item['size'] - sent)
+            if airtime <= budget:
+                plan.append((item, item['size']))
+                budget -= airtime
+            elif item.get('splittable'):
+                split.append(item)
+            elif airtime > window_s * SAFETY_MARGIN and not item.get('oversized'):
+                # Products go down whole, so this one waits for a faster link or its deadline
+                print(f"⚠️ {item['kind']} ({item['size']} bytes) needs ~{airtime:.1f} s of air time, more than "
+                      f"a whole {window_s} s contact: it won't be sent at {self.goodput_bps:.0f} B/s.")
+                item['oversized'] = True
+                self._save()
+        for item in split:
+            nbytes = self.piece_bytes(budget)
+            if nbytes < MIN_PIECE_BYTES:
+                break
+            # One piece per contact, last: the receiver only knows a piece
+            # has ended when the sender goes quiet
+            plan.append((item, item.get('sent', 0) + nbytes))
+            break
+        return plan
+
+    def run_contact(self, send_fn, window_s):
+        """
+        Sends as much of the queue as fits in one contact window.
+        send_fn(kind, payload_bytes, start, end) must send payload_bytes[start:end]
+        (the whole product unless it was split) and return True once that
+        range has been delivered. Anything unsent stays queued for the next
+        contact, split products from where they got to.
+        Returns (sent_count, deferred_count).
+        """
+        contact_start = time.time()
+        plan = self.plan_contact(window_s)
+        sent = 0
+        for item, end in plan:
+            remaining = window_s - (time.time() - contact_start)
+            start = item.get('sent', 0)
+            if self.expected_airtime(end - start) > remaining:
+                if not item.get('splittable') or self.piece_bytes(remaining * SAFETY_MARGIN) < MIN_PIECE_BYTES:
+                    print(f"⏳ Not enough pass time left for {item['kind']} ({end - start} bytes), deferring.")
+                    continue
+                end = start + self.piece_bytes(remaining * SAFETY_MARGIN)
+            payload = self.read_payload(item)
+            started = time.time()
+            if send_fn(item['kind'], payload, start, end):
+                self.record_goodput(end - start, time.time() - started)
+                if end < item['size']:
+                    item['sent'] = end
+                    self._save()
+                    print(f"✂️ {item['kind']}: {end} of {item['size']} bytes down, the rest goes next contact.")
+                    continue
+                self.remove(item['id'])
+                sent += 1
+            else:
+                print(f"❌ Downlink of {item['kind']} failed, keeping it queued.")
+                break
+        deferred = len(self.items)
+        print(f"📡 Contact done: {sent} sent, {deferred} deferred, goodput ≈ {self.goodput_bps:.0f} B/s")
+        return sent, deferred
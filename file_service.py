@@ -0,0 +1,398 @@
+import hashlib
+import json
+import mmap
+import os
+import shlex
+import struct
+import time
+from collections import namedtuple
+
+import security
+
+# --- File and log downlink service ---
+# Lets the ground fetch logs and saved captures from the satellite over the
+# same reliable payload path as the captures. Only LOG_DIR, CAPTURE_DIR and
+# /var/log are served: the working directory also holds the link state, the
+# uplink state and sat_config.json, which stay on board. Requests are one
+# line each:
+#   LIST <dir>                     directory listing
+#   GET <path> [<offset> [<length>]]   a file, or a byte range of it
+#   MANIFEST <path> [<path> ...]   sizes and SHA-256 of files (directories are
+#                                  walked), then each file as a GET
+# Until there is an uplink the satellite reads them from REQUEST_FILE. Each
+# reply is its own transfer:
+#   LIST  JSON {"path", "entries": [[name, size, mtime, is_dir], ...]}
+#   MANI  JSON {"files": [{"path", "size", "mtime", "sha256"}, ...]}
+#   FILE  [offset u64][file size u64][mtime u32][length u32][path len u16][path][data]
+#   FERR  JSON {"request", "error"} when a request can't be served
+# Files are mmapped and sent PIECE_BYTES at a time, so a large file never sits
+# in RAM on the Pi, and every piece says where it belongs. A transfer cut off
+# by the end of a contact leaves the rest of the GET in REQUEST_FILE for the
+# next one, and the ground can ask for exactly the ranges it is missing.
+REQUEST_FILE = "file_requests.txt"
+LOG_DIR = "logs"
+CAPTURE_DIR = "captures"
+SERVE_ROOTS = (LOG_DIR, CAPTURE_DIR, "/var/log")
+DOWNLOAD_DIR = "downloads"
+PIECE_BYTES = 8 * 1024
+MAX_LIST_ENTRIES = 500
+MAX_MANIFEST_FILES = 200
+HASH_BLOCK_BYTES = 1024 * 1024
+
+PIECE_HEADER = struct.Struct('>QQIIH')
+
+PREFIXES = {'file': b'FILE', 'listing': b'LIST', 'manifest': b'MANI', 'file_error': b'FERR'}
+KINDS = {prefix: kind for kind, prefix in PREFIXES.items()}
+
+Request = namedtuple('Request', ['op', 'paths', 'offset', 'length'], defaults=(0, None))
+Piece = namedtuple('Piece', ['path', 'offset', 'size', 'mtime', 'data'])
+
+
+def parse_request(line):
+    """Parses one request line. Raises ValueError if it isn't one."""
+    words = shlex.split(line)
+    if not words:
+        raise ValueError("empty request")
+    op, paths = words[0].upper(), tuple(words[1:])
+    if op == 'LIST' and len(paths) == 1 or op == 'MANIFEST' and paths:
+        return Request(op, paths)
+    if op == 'GET' and 1 <= len(paths) <= 3:
+        offset = int(paths[1]) if len(paths) > 1 else 0
+        length = int(paths[2]) if len(paths) > 2 else None
+        if offset < 0 or length is not None and length < 0:
+            raise ValueError(f"negative range in {line!r}")
+        return Request(op, paths[:1], offset, length)
+    raise ValueError(f"not a file request: {line!r}")
+
+
+def format_request(request):
+    words = [request.op, *request.paths]
+    if request.op == 'GET' and (request.offset or request.length is not None):
+        words.append(str(request.offset))
+        if request.length is not None:
+            words.append(str(request.length))
+    return shlex.join(words)
+
+
+def load_requests(path=REQUEST_FILE):
+    """Requests waiting in path, in order. Lines that don't parse are skipped."""
+    if not os.path.exists(path):
+        return []
+    requests = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip() or line.lstrip().startswith('#'):
+                continue
+            try:
+                requests.append(parse_request(line))
+            except ValueError as e:
+                print(f"⚠️ Skipping file request: {e}")
+    return requests
+
+
+def save_requests(requests, path=REQUEST_FILE):
+    """Rewrites path with what is still to be served (removes it when nothing is)."""
+    if not requests:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        f.writelines(format_request(request) + "\n" for request in requests)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def parse_piece(data):
+    """Splits a FILE transfer into a Piece. Raises ValueError if it is cut short."""
+    data = bytes(data)
+    if len(data) < PIECE_HEADER.size:
+        raise ValueError("file piece shorter than its header")
+    offset, size, mtime, length, path_len = PIECE_HEADER.unpack_from(data)
+    start = PIECE_HEADER.size + path_len
+    if len(data) < start + length:
+        raise ValueError("file piece shorter than its length")
+    # Anything after the data is NUL padding from fixed-index chunks
+    return Piece(data[PIECE_HEADER.size:start].decode(), offset, size, mtime, data[start:start + length])
+
+
+def sha256_file(path):
+    """SHA-256 of a file, read through an mmap a block at a time."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return digest.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for start in range(0, len(mapped), HASH_BLOCK_BYTES):
+                digest.update(mapped[start:start + HASH_BLOCK_BYTES])
+    return digest.hexdigest()
+
+
+def merge_ranges(ranges):
+    """Sorted, merged list of [start, end) byte ranges."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def missing_ranges(ranges, size):
+    """The [start, end) ranges of a size-byte file not covered by ranges."""
+    missing = []
+    pos = 0
+    for start, end in merge_ranges(ranges):
+        if start > pos:
+            missing.append((pos, start))
+        pos = max(pos, end)
+    if pos < size:
+        missing.append((pos, size))
+    return missing
+
+
+class FileServer:
+    """
+    Satellite side: turns requests into transfers for send(kind, payload),
+    which is sender_ziyad.send_product. Only files under roots are served,
+    and never the link key.
+    """
+
+    def __init__(self, roots=SERVE_ROOTS, piece_bytes=PIECE_BYTES):
+        self.roots = [os.path.realpath(root) for root in roots]
+        self.piece_bytes = piece_bytes
+        self.files_sent = 0
+        self.bytes_sent = 0
+
+    def resolve(self, path):
+        """Real path of a requested path. Raises PermissionError outside the served roots."""
+        real = os.path.realpath(path)
+        if not any(os.path.commonpath([real, root]) == root for root in self.roots):
+            raise PermissionError(f"{path} is outside the served directories")
+        if os.path.basename(real) == security.KEY_FILE:
+            raise PermissionError(f"{path} is the link key")
+        return real
+
+    def listing(self, path):
+        real = self.resolve(path)
+        entries = []
+        with os.scandir(real) as it:
+            for entry in sorted(it, key=lambda e: e.name)[:MAX_LIST_ENTRIES]:
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                entries.append([entry.name, st.st_size, int(st.st_mtime), entry.is_dir()])
+        return json.dumps({'path': real, 'entries': entries}, separators=(',', ':')).encode()
+
+    def _expand(self, paths):
+        files = []
+        for path in paths:
+            real = self.resolve(path)
+            if os.path.isdir(real):
+                for dirpath, dirnames, filenames in os.walk(real):
+                    dirnames.sort()
+                    for name in sorted(filenames):
+                        if name != security.KEY_FILE:
+                            files.append(os.path.join(dirpath, name))
+            else:
+                files.append(real)
+        return files[:MAX_MANIFEST_FILES]
+
+    def manifest(self, paths):
+        """Returns (MANI payload, files it lists)."""
+        files = []
+        for path in self._expand(paths):
+            try:
+                st = os.stat(path)
+                files.append({'path': path, 'size': st.st_size, 'mtime': int(st.st_mtime),
+                              'sha256': sha256_file(path)})
+            except OSError:
+                continue
+        return json.dumps({'files': files}, separators=(',', ':')).encode(), [f['path'] for f in files]
+
+    def pieces(self, path, offset=0, length=None):
+        """
+        Yields (offset, FILE payload) for a byte range of a file. The file is
+        mmapped, so only the piece being sent is read into memory.
+        """
+        real = self.resolve(path)
+        encoded_path = real.encode()
+        with open(real, 'rb') as f:
+            st = os.fstat(f.fileno())
+            end = st.st_size if length is None else min(st.st_size, offset + length)
+
+            def header(pos, n):
+                return PIECE_HEADER.pack(pos, st.st_size, int(st.st_mtime), n, len(encoded_path))
+
+            if st.st_size == 0 or offset >= end:
+                # Still tell the ground the file exists and how big it is
+                yield offset, header(offset, 0) + encoded_path
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                for pos in range(offset, end, self.piece_bytes):
+                    data = mapped[pos:min(pos + self.piece_bytes, end)]
+                    yield pos, header(pos, len(data)) + encoded_path + data
+
+    def serve(self, requests, send, time_budget_s=None):
+        """
+        Serves requests in order until they are all done, a send fails or the
+        time budget runs out. Returns the requests (or remainders of them)
+        still to be served.
+        """
+        start = time.time()
+
+        def out_of_time():
+            return time_budget_s is not None and time.time() - start > time_budget_s
+
+        queue = list(requests)
+        while queue:
+            if out_of_time():
+                break
+            request = queue[0]
+            print(f"\n--- File request: {format_request(request)} ---")
+            try:
+                if request.op == 'LIST':
+                    ok = send('listing', self.listing(request.paths[0]))
+                elif request.op == 'MANIFEST':
+                    payload, files = self.manifest(request.paths)
+                    ok = send('manifest', payload)
+                    if ok:
+                        # The files follow as ordinary GETs, so they resume the same way
+                        queue[0:1] = [Request('GET', (path,)) for path in files]
+                        continue
+                else:
+                    end = None if request.length is None else request.offset + request.length
+                    for offset, payload in self.pieces(request.paths[0], request.offset, request.length):
+                        # A large file can outlast the contact: stop between pieces
+                        if out_of_time() or not send('file', payload):
+                            queue[0] = request._replace(offset=offset, length=None if end is None else end - offset)
+                            return queue
+                        self.bytes_sent += len(payload) - PIECE_HEADER.size
+                    self.files_sent += 1
+                    ok = True
+            except (OSError, ValueError) as e:
+                print(f"❌ Can't serve {format_request(request)}: {e}")
+                ok = send('file_error', json.dumps({'request': format_request(request), 'error': str(e)}).encode())
+            if not ok:
+                return queue
+            queue.pop(0)
+        return queue
+
+
+class FileReceiver:
+    """
+    Ground side: writes FILE pieces straight into place in a .part file under
+    download_dir (nothing is held in memory) and keeps the received ranges in
+    a .part.json next to it, so transfers resume across passes and restarts.
+    Completed files are checked against the manifest when there was one.
+    """
+
+    def __init__(self, download_dir=DOWNLOAD_DIR):
+        self.download_dir = download_dir
+        os.makedirs(download_dir, exist_ok=True)
+        self.expected_path = os.path.join(download_dir, ".expected.json")
+        self.expected = {}
+        if os.path.exists(self.expected_path):
+            try:
+                with open(self.expected_path) as f:
+                    self.expected = json.load(f)
+            except (OSError, ValueError):
+                pass
+
+    def local_path(self, remote_path):
+        """Where a remote file lands, always inside download_dir."""
+        parts = [p for p in os.path.normpath(remote_path).split(os.sep) if p not in ('', '.', '..')]
+        return os.path.join(self.download_dir, *parts)
+
+    def _save_json(self, path, value):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(value, f)
+        os.replace(tmp_path, path)
+
+    def _load_state(self, state_path):
+        try:
+            with open(state_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def handle(self, prefix, data):
+        """Takes one LIST/MANI/FILE/FERR transfer. Returns a one-line summary."""
+        kind = KINDS.get(bytes(prefix))
+        if kind == 'file':
+            return self.add_piece(parse_piece(data))
+        # Fixed-index transfers come NUL padded; JSON never ends in NUL
+        body = json.loads(bytes(data).rstrip(b'\x00'))
+        if kind == 'listing':
+            lines = [f"{'d' if is_dir else '-'} {size:>10} {time.strftime('%Y-%m-%d %H:%M', time.localtime(mtime))} {name}"
+                     for name, size, mtime, is_dir in body['entries']]
+            print("\n".join([f"📂 {body['path']}:"] + lines))
+            return f"listing of {body['path']}, {len(lines)} entries"
+        if kind == 'manifest':
+            for entry in body['files']:
+                self.expected[entry['path']] = entry
+            self._save_json(self.expected_path, self.expected)
+            return f"manifest of {len(body['files'])} files, {sum(e['size'] for e in body['files'])} bytes"
+        if kind == 'file_error':
+            return f"satellite couldn't serve {body['request']}: {body['error']}"
+        raise ValueError(f"not a file service prefix: {prefix!r}")
+
+    def add_piece(self, piece):
+        path = self.local_path(piece.path)
+        part_path = path + ".part"
+        state_path = part_path + ".json"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        state = self._load_state(state_path)
+        # Logs only grow, so a bigger file still extends what we have; anything
+        # else means the file was replaced and the old bytes are useless
+        if (state is None or piece.size < state['size']
+                or piece.size == state['size'] and piece.mtime != state['mtime']):
+            state = {'path': piece.path, 'size': piece.size, 'mtime': piece.mtime, 'ranges': []}
+            open(part_path, 'wb').close()
+        state['size'], state['mtime'] = piece.size, piece.mtime
+        with open(part_path, 'r+b') as f:
+            f.seek(piece.offset)
+            f.write(piece.data)
+        state['ranges'] = merge_ranges(state['ranges'] + [[piece.offset, piece.offset + len(piece.data)]])
+        missing = missing_ranges(state['ranges'], state['size'])
+        if missing:
+            self._save_json(state_path, state)
+            have = state['size'] - sum(end - start for start, end in missing)
+            return f"{piece.path}: {have}/{state['size']} bytes"
+
+        with open(part_path, 'r+b') as f:
+            f.truncate(state['size'])
+        os.replace(part_path, path)
+        if os.path.exists(state_path):
+            os.remove(state_path)
+        expected = self.expected.pop(piece.path, None)
+        if expected is not None:
+            self._save_json(self.expected_path, self.expected)
+            if sha256_file(path) != expected['sha256']:
+                return f"⚠️ {piece.path} complete but its SHA-256 doesn't match the manifest (changed on board?)"
+            return f"{piece.path} complete ({state['size']} bytes), SHA-256 matches the manifest"
+        return f"{piece.path} complete ({state['size']} bytes)"
+
+    def pending_requests(self):
+        """GET requests for every byte still missing from partial downloads."""
+        requests = []
+        for dirpath, _, filenames in os.walk(self.download_dir):
+            for name in sorted(filenames):
+                if not name.endswith(".part.json"):
+                    continue
+                state = self._load_state(os.path.join(dirpath, name))
+                if state is None:
+                    continue
+                for start, end in missing_ranges(state['ranges'], state['size']):
+                    length = None if end == state['size'] else end - start
+                    requests.append(Request('GET', (state['path'],), start, length))
+        # Files from a manifest that haven't started arriving at all
+        started = {request.paths[0] for request in requests}
+        for path in self.expected:
+            if path not in started and not os.path.exists(self.local_path(path)):
+                requests.append(Request('GET', (path,)))
+        return requests
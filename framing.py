@@ -0,0 +1,188 @@
+from collections import namedtuple
+
+import reassembly
+
+# --- Compact framing ---
+# Used when both ends agree on handshake.CAP_COMPACT_FRAMING. Replaces the
+# fixed [2-byte index][30 data bytes, NUL padded] chunks and the separate
+# prefix and chunk-count packets of receiver__ziyad.py with frames that are
+# only as long as their content (dynamic payloads are on everywhere):
+#   header  1 byte: [kind:2][seq:6]
+#   START   header + varint payload length + 4-byte prefix + first data bytes
+#   DATA    header + up to 31 data bytes
+#   ACK     the header byte with kind ACK, sent back in the ACK payload
+# seq is the low 6 bits of a per-session frame counter. The receiver rebuilds
+# the full number from the one it expects next, which works while fewer than
+# SEQ_WINDOW frames are in flight (stop-and-wait has one). The explicit length
+# replaces the NUL padding, so payloads that end in zero bytes survive and
+# receivers don't need to rstrip.
+FRAME_SIZE = 32
+PREFIX_BYTES = 4
+SEQ_BITS = 6
+SEQ_MASK = (1 << SEQ_BITS) - 1
+SEQ_WINDOW = 1 << (SEQ_BITS - 1)
+KIND_MASK = 0xC0
+KIND_DATA = 0x00
+KIND_START = 0x80
+KIND_ACK = 0xC0             # never sent as data, so 0xFF HOP packets stay unambiguous
+
+# What legacy framing spends per transfer, for the overhead report
+LEGACY_CHUNK_DATA = 30
+LEGACY_META_PACKET = 6      # 2-byte 0xFFFF index + 4 bytes (prefix or chunk count)
+
+Transfer = namedtuple('Transfer', ['prefix', 'data', 'frames', 'header_bytes'])
+
+
+def encode_varint(value):
+    """Unsigned LEB128: 7 bits per byte, high bit set on all but the last."""
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def decode_varint(buf, pos=0):
+    """Returns (value, position after the varint). Raises ValueError if it's cut off."""
+    value = 0
+    shift = 0
+    while pos < len(buf):
+        byte = buf[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+    raise ValueError("truncated varint")
+
+
+def expand_seq(low, expected):
+    """Full sequence number for the 6 bits on the wire, nearest to expected."""
+    seq = expected + ((low - expected) & SEQ_MASK)
+    if seq - expected >= SEQ_WINDOW:
+        seq -= 1 << SEQ_BITS
+    return seq
+
+
+def ack_frame(seq):
+    return bytes([KIND_ACK | (seq & SEQ_MASK)])
+
+
+def is_ack(payload, seq):
+    return bytes(payload) == ack_frame(seq)
+
+
+def frame_transfer(prefix, payload, first_seq):
+    """Splits one transfer into frames. Returns [(seq, frame)], starting at first_seq."""
+    prefix = bytes(prefix[:PREFIX_BYTES]).ljust(PREFIX_BYTES, b'\x00')
+    payload = bytes(payload)
+    start = bytes([KIND_START | (first_seq & SEQ_MASK)]) + encode_varint(len(payload)) + prefix
+    pos = FRAME_SIZE - len(start)
+    frames = [(first_seq, start + payload[:pos])]
+    seq = first_seq + 1
+    while pos < len(payload):
+        frames.append((seq, bytes([KIND_DATA | (seq & SEQ_MASK)]) + payload[pos:pos + FRAME_SIZE - 1]))
+        pos += FRAME_SIZE - 1
+        seq += 1
+    return frames
+
+
+def header_bytes(frames, payload_len):
+    return sum(len(frame) for _, frame in frames) - payload_len
+
+
+def overhead_ratio(header, payload_len):
+    """Share of the bytes sent that isn't payload."""
+    total = header + payload_len
+    return header / total if total else 0.0
+
+
+def legacy_header_bytes(payload_len):
+    """Header and padding bytes the fixed-index framing sends for the same payload."""
+    chunks = -(-payload_len // LEGACY_CHUNK_DATA)
+    return 2 * LEGACY_META_PACKET + chunks * FRAME_SIZE - payload_len
+
+
+def describe(prefix, payload_len, frames, header):
+    legacy = legacy_header_bytes(payload_len)
+    return (f"{prefix.decode(errors='replace')} {payload_len} B in {frames} frames, "
+            f"{header} B of headers ({overhead_ratio(header, payload_len):.1%}; "
+            f"fixed-index framing: {legacy} B, {overhead_ratio(legacy, payload_len):.1%})")
+
+
+class FrameAssembler:
+    """
+    Receiver side, one packet at a time. feed() returns (ack, transfer): the
+    ACK byte to load for the packet (None if it isn't a frame or must not be
+    acknowledged) and a Transfer once one is complete.
+    """
+
+    def __init__(self):
+        self.expected = 0
+        self.buffer = None
+        self.reset()
+
+    def reset(self):
+        if self.buffer is not None:
+            self.buffer.close()
+        self.prefix = None
+        self.length = None
+        self.buffer = None      # reassembly.Reassembler, written in place frame by frame
+        self.received = 0
+        self.frames = 0
+        self.header_bytes = 0
+
+    @property
+    def in_progress(self):
+        return self.prefix is not None
+
+    def feed(self, frame):
+        frame = bytes(frame)
+        if not frame:
+            return None, None
+        kind = frame[0] & KIND_MASK
+        if kind not in (KIND_START, KIND_DATA):
+            return None, None
+        seq = expand_seq(frame[0] & SEQ_MASK, self.expected)
+        if seq < self.expected:
+            # Already taken; its ACK went missing, so just acknowledge it again
+            return ack_frame(seq), None
+        if seq > self.expected and kind != KIND_START:
+            # A gap can only mean we missed the START (e.g. we restarted); let it time out
+            return None, None
+
+        if kind == KIND_START:
+            try:
+                length, pos = decode_varint(frame, 1)
+            except ValueError:
+                return None, None
+            if length > reassembly.MAX_TRANSFER_BYTES:
+                return None, None
+            self.reset()
+            self.prefix = frame[pos:pos + PREFIX_BYTES].rstrip(b'\x00')
+            self.length = length
+            self.start_seq = seq
+            data = frame[pos + PREFIX_BYTES:]
+            frames = 1 + -(-max(0, length - (FRAME_SIZE - pos - PREFIX_BYTES)) // (FRAME_SIZE - 1))
+            self.buffer = reassembly.Reassembler(length, FRAME_SIZE - 1, chunks=frames)
+            self.header_bytes = pos + PREFIX_BYTES
+        elif self.prefix is None:
+            # Joined mid transfer, or gave up on this one: leave it unACKed so
+            # the sender fails the transfer and keeps the product for a retry
+            return None, None
+        else:
+            data = frame[1:]
+            self.header_bytes += 1
+        self.expected = seq + 1
+        if self.buffer.add(seq - self.start_seq, data, offset=self.received):
+            self.received += min(len(data), self.length - self.received)
+        self.frames += 1
+        if self.received < self.length:
+            return ack_frame(seq), None
+        transfer = Transfer(self.prefix, bytes(self.buffer.data()), self.frames, self.header_bytes)
+        self.reset()
+        return ack_frame(seq), transfer
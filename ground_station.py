@@ -0,0 +1,414 @@
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import time
+from collections import deque
+
+import handshake
+import reassembly
+import upload_sinks
+from join_buffer import JoinBuffer, unstamp_capture
+
+# --- Asyncio ground-station daemon ---
+# Same wire protocol as receiver__ziyad.py, but split into concurrent tasks:
+#   radio reader (executor thread) -> reassembly -> storage / upload / live clients
+# A small HTTP server exposes /status, /latest, a Server-Sent Events stream on
+# /events and a WebSocket stream on /ws for dashboards next to the receiver.
+CHUNK_NUM_BYTES = 2
+CHUNK_DATA_SIZE = 30
+META_INDEX = 0xFFFF     # also the modulus chunk indexes wrap at
+RECEPTION_TIMEOUT_S = 5.0
+IMAGE_SAVE_DIR = "received_images"
+UPLOAD_TARGET = os.environ.get(upload_sinks.SINK_ENV, upload_sinks.FIREBASE_URL)   # see upload_sinks.make_sink
+HTTP_HOST = "0.0.0.0"
+HTTP_PORT = 8080
+UPLOAD_CONCURRENCY = 2
+CLIENT_QUEUE_SIZE = 100
+RADIO_POLL_S = 0.0005
+PROGRESS_EVERY_N_CHUNKS = 32
+LATENCY_WINDOW = 1000
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+LOCAL_OFFER = handshake.parse_offer(handshake.build_offer(
+    caps=handshake.CAP_ACK_PAYLOAD | handshake.CAP_INDEXED_CHUNKS,
+    max_window=1,
+    codecs=handshake.CODEC_RAW,
+    rates=(handshake.RF24_1MBPS,),
+    preferred_rate=handshake.RF24_1MBPS,
+))
+
+
+def parse_sensor_text(sensor_text):
+    """Turns 'timestamp|T:25.5C|H:45.2%|...' into a dict, as the receiver scripts do."""
+    parts = sensor_text.split("|")
+    parsed_data = {"capture_timestamp": parts[0]}
+    for item in parts[1:]:
+        if ':' in item:
+            key, value_raw = item.split(":", 1)
+            value = ''.join(c for c in value_raw if c.isdigit() or c == '.' or c == '-')
+            try:
+                parsed_data[key.strip()] = float(value)
+            except (ValueError, TypeError):
+                parsed_data[key.strip()] = value_raw
+    return parsed_data
+
+
+def upload_payload(record):
+    """The Firebase document for a joined capture record."""
+    data_payload = {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "capture_id": record['capture_id'],
+        "capture_timestamp": record['capture_time'],
+        "sensor_readings": record['sensor'] or {"error": "data not received"},
+    }
+    if record['image'] is not None:
+        data_payload["image_base64"] = base64.b64encode(record['image']).decode('utf-8')
+    return data_payload
+
+
+class LatencyStats:
+    """Rolling window of latencies in seconds, reported as percentiles in ms."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+
+    def summary(self):
+        if not self.samples:
+            return {'count': 0}
+        ordered = sorted(self.samples)
+
+        def pct(p):
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 3)
+
+        return {'count': self.count, 'p50_ms': pct(0.50), 'p95_ms': pct(0.95), 'p99_ms': pct(0.99), 'max_ms': pct(1.0)}
+
+
+class Reassembler:
+    """
+    Packet-at-a-time version of receive_reliable_payload(). feed() never
+    blocks; it returns a finished event dict, a progress dict, or None.
+    """
+
+    def __init__(self):
+        self.chunks = None
+        self.reset()
+
+    def reset(self):
+        if self.chunks is not None:
+            self.chunks.close()
+        self.prefix = None
+        self.num_chunks = None
+        self.chunks = None      # reassembly.Reassembler once the chunk count is known
+        self.first_arrival = None
+        self.last_packet_time = None
+
+    def feed(self, payload, arrival):
+        if self.last_packet_time is not None and arrival - self.last_packet_time > RECEPTION_TIMEOUT_S:
+            print(f"⚠️ Transfer of {self.prefix} timed out after {RECEPTION_TIMEOUT_S}s, discarding.")
+            self.reset()
+        self.last_packet_time = arrival
+
+        index = int.from_bytes(payload[:CHUNK_NUM_BYTES], 'big')
+        if index == META_INDEX:
+            meta = payload[CHUNK_NUM_BYTES:CHUNK_NUM_BYTES + 4]
+            prefix = meta.rstrip(b'\x00')
+            if prefix in (b'SENS', b'IMAG'):
+                self.reset()
+                self.prefix = prefix
+                self.first_arrival = arrival
+                self.last_packet_time = arrival
+            elif self.prefix is not None and self.num_chunks is None:
+                total_len = int.from_bytes(meta, 'big') * CHUNK_DATA_SIZE
+                try:
+                    self.chunks = reassembly.Reassembler(total_len, CHUNK_DATA_SIZE)
+                except ValueError:
+                    self.reset()
+                    return None
+                self.num_chunks = self.chunks.chunks
+                if self.num_chunks == 0:
+                    return self._finish(arrival)
+            return None
+
+        if self.prefix is None or self.num_chunks is None:
+            return None
+        # The wire index wraps; widen it from the next chunk we expect
+        if not self.chunks.add(reassembly.expand_index(index, self.chunks.received, META_INDEX),
+                               payload[CHUNK_NUM_BYTES:]):
+            return None
+        if self.chunks.complete:
+            return self._finish(arrival)
+        if self.chunks.received % PROGRESS_EVERY_N_CHUNKS == 0:
+            return {
+                'type': 'progress', 'prefix': self.prefix.decode(), 'received': self.chunks.received,
+                'total': self.num_chunks, 'arrival': arrival,
+            }
+        return None
+
+    def _finish(self, arrival):
+        data = bytes(self.chunks.data())
+        event = {'type': 'sensor' if self.prefix == b'SENS' else 'image', 'data': data,
+                 'first_arrival': self.first_arrival, 'arrival': arrival}
+        self.reset()
+        return event
+
+
+class GroundStation:
+    def __init__(self, radio, upload_target=UPLOAD_TARGET, save_dir=IMAGE_SAVE_DIR,
+                 http_host=HTTP_HOST, http_port=HTTP_PORT):
+        self.radio = radio
+        self.sink = upload_sinks.make_sink(upload_target, **upload_sinks.env_options())
+        self.save_dir = save_dir
+        self.http_host = http_host
+        self.http_port = http_port
+        self.reassembler = Reassembler()
+        self.latest_sensor_data = None
+        self.join_buffer = JoinBuffer()
+        self.subscribers = set()
+        self.running = False
+        self.session = None
+        self.counters = {'packets': 0, 'sensor_frames': 0, 'images': 0, 'uploads_ok': 0,
+                         'uploads_failed': 0, 'client_drops': 0}
+        self.packet_to_event = LatencyStats()
+        self.packet_to_client = LatencyStats()
+        self.server = None
+
+    # ---------- radio ----------
+    def _radio_reader(self, loop, packet_queue):
+        """
+        Runs in an executor thread. Reads the radio, loads the ACK payload
+        straight away (the sender is waiting on it) and hands the packet to
+        the event loop with its arrival time.
+        """
+        radio = self.radio
+        while self.running:
+            if not radio.available():
+                time.sleep(RADIO_POLL_S)
+                continue
+            payload = radio.read(radio.getDynamicPayloadSize())
+            arrival = time.perf_counter()
+            remote_offer = handshake.parse_offer(payload)
+            if remote_offer is not None:
+                self.session = handshake.select_config(LOCAL_OFFER, remote_offer)
+                radio.writeAckPayload(1, handshake.build_reply(self.session))
+                print(f"🤝 Handshake: {handshake.describe(self.session)}")
+                continue
+            radio.writeAckPayload(1, b'ACK' + payload[:CHUNK_NUM_BYTES])
+            loop.call_soon_threadsafe(packet_queue.put_nowait, (arrival, payload))
+
+    async def _reassembly_task(self, packet_queue, storage_queue, upload_queue):
+        while True:
+            arrival, payload = await packet_queue.get()
+            self.counters['packets'] += 1
+            event = self.reassembler.feed(payload, arrival)
+            if event is None:
+                continue
+            self.packet_to_event.record(time.perf_counter() - event['arrival'])
+
+            if event['type'] == 'progress':
+                self.publish(event, event['arrival'])
+                continue
+
+            capture_id, capture_time, data = unstamp_capture(event['data'])
+            if event['type'] == 'sensor':
+                try:
+                    sensor_text = data.rstrip(b'\x00').decode()
+                    self.latest_sensor_data = parse_sensor_text(sensor_text)
+                except Exception as e:
+                    print(f"❌ Failed to decode or parse sensor data: {e}")
+                    continue
+                self.counters['sensor_frames'] += 1
+                self.publish({'type': 'sensor', 'capture_id': capture_id, 'data': self.latest_sensor_data},
+                             event['arrival'])
+                record = self.join_buffer.add('sensor', capture_id, capture_time, self.latest_sensor_data)
+            else:
+                self.counters['images'] += 1
+                await storage_queue.put(data)
+                self.publish({'type': 'image', 'capture_id': capture_id, 'bytes': len(data),
+                              'sha256': hashlib.sha256(data).hexdigest()}, event['arrival'])
+                record = self.join_buffer.add('image', capture_id, capture_time, data)
+            if record is not None:
+                await upload_queue.put(record)
+
+    async def _join_expiry_task(self, upload_queue):
+        """Flushes captures whose other half never arrived."""
+        while True:
+            for record in self.join_buffer.expire():
+                await upload_queue.put(record)
+            await asyncio.sleep(1.0)
+
+    # ---------- storage / upload ----------
+    def _save_image(self, image_bytes):
+        os.makedirs(self.save_dir, exist_ok=True)
+        filename = f"{time.strftime('%Y%m%d_%H%M%S')}_complete_{len(image_bytes)}.jpg"
+        filepath = os.path.join(self.save_dir, filename)
+        with open(filepath, 'wb') as f:
+            f.write(image_bytes)
+        return filepath
+
+    async def _storage_task(self, storage_queue):
+        while True:
+            image_bytes = await storage_queue.get()
+            try:
+                filepath = await asyncio.to_thread(self._save_image, image_bytes)
+                print(f"💾 Raw image data saved to: {filepath}")
+            except Exception as e:
+                print(f"❌ Error saving raw image file: {e}")
+
+    async def _upload_task(self, upload_queue):
+        loop = asyncio.get_running_loop()
+
+        # Counted once the document is stored: with batching that's when its
+        # batch is written, possibly from the sink's timer thread
+        def uploaded(key, error):
+            loop.call_soon_threadsafe(self._uploaded, error)
+
+        while True:
+            record = await upload_queue.get()
+            if self.sink is None:
+                continue
+            await asyncio.to_thread(self.sink.post, upload_payload(record), uploaded)
+
+    def _uploaded(self, error):
+        if error is not None:
+            print(f"❌ Failed to upload: {error}")
+        self.counters['uploads_ok' if error is None else 'uploads_failed'] += 1
+        self.publish({'type': 'upload', 'ok': error is None}, time.perf_counter())
+
+    # ---------- live clients ----------
+    def publish(self, message, arrival):
+        """Queues a message for every connected client, dropping the oldest for laggards."""
+        for queue in self.subscribers:
+            if queue.full():
+                queue.get_nowait()
+                self.counters['client_drops'] += 1
+            queue.put_nowait((arrival, message))
+
+    def status(self):
+        return {
+            'session': handshake.describe(self.session) if self.session else None,
+            'counters': self.counters,
+            'clients': len(self.subscribers),
+            'latency': {
+                'packet_to_event': self.packet_to_event.summary(),
+                'packet_to_client': self.packet_to_client.summary(),
+            },
+        }
+
+    async def _stream(self, writer, frame):
+        queue = asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        self.subscribers.add(queue)
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                arrival, message = item
+                writer.write(frame(json.dumps(message)))
+                await writer.drain()
+                self.packet_to_client.record(time.perf_counter() - arrival)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.subscribers.discard(queue)
+
+    async def _handle_http(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                key, _, value = line.decode(errors='replace').partition(':')
+                headers[key.strip().lower()] = value.strip()
+            parts = request_line.decode(errors='replace').split()
+            path = parts[1] if len(parts) > 1 else '/'
+
+            if path == '/events':
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                             b"Cache-Control: no-cache\r\nConnection: keep-alive\r\n\r\n")
+                await self._stream(writer, lambda text: f"data: {text}\n\n".encode())
+            elif path == '/ws' and 'sec-websocket-key' in headers:
+                accept = base64.b64encode(
+                    hashlib.sha1((headers['sec-websocket-key'] + WS_GUID).encode()).digest()
+                ).decode()
+                writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n"
+                              f"Connection: Upgrade\r\nSec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+                await self._stream(writer, websocket_text_frame)
+            elif path in ('/status', '/latest'):
+                body = json.dumps(self.status() if path == '/status' else self.latest_sensor_data).encode()
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                             + f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+            else:
+                writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n")
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    # ---------- lifecycle ----------
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        packet_queue = asyncio.Queue()
+        storage_queue = asyncio.Queue()
+        upload_queue = asyncio.Queue()
+        self.running = True
+        self.server = await asyncio.start_server(self._handle_http, self.http_host, self.http_port)
+        print(f"🌐 Status API on http://{self.http_host}:{self.http_port}/status, live stream on /events and /ws")
+        tasks = [
+            asyncio.create_task(self._reassembly_task(packet_queue, storage_queue, upload_queue)),
+            asyncio.create_task(self._storage_task(storage_queue)),
+            asyncio.create_task(self._join_expiry_task(upload_queue)),
+        ]
+        tasks += [asyncio.create_task(self._upload_task(upload_queue)) for _ in range(UPLOAD_CONCURRENCY)]
+        reader = loop.run_in_executor(None, self._radio_reader, loop, packet_queue)
+        try:
+            await reader
+        finally:
+            self.running = False
+            for task in tasks:
+                task.cancel()
+            # Let every streaming client finish cleanly
+            for queue in list(self.subscribers):
+                if queue.full():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+            self.server.close()
+            if self.sink is not None:
+                # Whatever is still waiting in a partial batch
+                await asyncio.to_thread(self.sink.close)
+            await asyncio.sleep(0)
+
+    def stop(self):
+        self.running = False
+
+
+def websocket_text_frame(text):
+    """Encodes an unmasked server-to-client WebSocket text frame."""
+    data = text.encode()
+    if len(data) < 126:
+        header = bytes([0x81, len(data)])
+    elif len(data) < 65536:
+        header = bytes([0x81, 126]) + len(data).to_bytes(2, 'big')
+    else:
+        header = bytes([0x81, 127]) + len(data).to_bytes(8, 'big')
+    return header + data
+
+
+if __name__ == "__main__":
+    import hardware
+
+    station = GroundStation(hardware.make_radio(hardware.ROLE_RECEIVER))
+    try:
+        asyncio.run(station.run())
+    except KeyboardInterrupt:
+        station.stop()
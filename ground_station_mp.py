@@ -0,0 +1,276 @@
+import json
+import multiprocessing as mp
+import os
+import queue
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import handshake
+import upload_sinks
+from ground_station import (CHUNK_NUM_BYTES, IMAGE_SAVE_DIR, LOCAL_OFFER, RADIO_POLL_S, UPLOAD_CONCURRENCY,
+                            UPLOAD_TARGET, Reassembler, parse_sensor_text, upload_payload)
+from join_buffer import JoinBuffer, unstamp_capture
+from packet_ring import RING_SLOTS, PacketRing
+
+# --- Multiprocess ground station ---
+# Same wire protocol as receiver__ziyad.py and ground_station.py, split so a
+# busy decoder can never make the radio wait:
+#   radio reader process -> shared-memory ring per worker -> worker processes
+# The reader only reads packets, loads the ACK payloads and pushes raw packets
+# into a PacketRing. Workers reassemble, decode and persist (images to disk,
+# sensor readings to a JSON-lines log) and send finished records back to the
+# main process, which joins capture halves and uploads them.
+#
+# Nothing is dropped under load: when a ring is full the reader leaves the
+# next packet in the nRF24's RX FIFO, the radio stops ACKing once that fills,
+# and the sender's retries hold the data until a worker catches up.
+# Packets are sharded by reading pipe, so each sender's transfer stays on one
+# worker; several senders on different pipes spread over the workers.
+WORKERS = 2
+SENSOR_LOG = "sensor_log.jsonl"
+WORKER_IDLE_S = 0.0005
+STATS_EVERY_S = 5.0
+
+# Per-worker slots in the shared counter array
+PACKETS, EVENTS, BUSY_S = range(3)
+# Reader counters
+READ_PACKETS, HANDSHAKES, RING_WAIT_S = range(3)
+
+
+def radio_reader(radio_factory, ring_names, running, counters):
+    """Reader process: radio -> rings, as little work per packet as possible."""
+    radio = radio_factory()
+    rings = [PacketRing(name=name) for name in ring_names]
+    while running.is_set():
+        has_payload, pipe = radio.available_pipe()
+        if not has_payload:
+            time.sleep(RADIO_POLL_S)
+            continue
+        ring = rings[pipe % len(rings)]
+        if ring.occupancy() >= ring.slots:
+            # Leave the packet in the radio; the sender retries until there's room
+            wait_start = time.perf_counter()
+            if not ring.wait_for_space(running.is_set):
+                break
+            counters[RING_WAIT_S] += time.perf_counter() - wait_start
+        payload = radio.read(radio.getDynamicPayloadSize())
+        arrival = time.perf_counter()
+        remote_offer = handshake.parse_offer(payload)
+        if remote_offer is not None:
+            session = handshake.select_config(LOCAL_OFFER, remote_offer)
+            radio.writeAckPayload(pipe, handshake.build_reply(session))
+            counters[HANDSHAKES] += 1
+            print(f"🤝 Handshake on pipe {pipe}: {handshake.describe(session)}")
+            continue
+        radio.writeAckPayload(pipe, b'ACK' + payload[:CHUNK_NUM_BYTES])
+        ring.push(payload, pipe, arrival)
+        counters[READ_PACKETS] += 1
+    for ring in rings:
+        ring.close()
+
+
+def save_image(save_dir, image_bytes, capture_id):
+    os.makedirs(save_dir, exist_ok=True)
+    # Workers save concurrently, so the name can't rely on the second alone
+    tag = capture_id if capture_id is not None else uuid.uuid4().hex[:8]
+    filename = f"{time.strftime('%Y%m%d_%H%M%S')}_{tag}_complete_{len(image_bytes)}.jpg"
+    filepath = os.path.join(save_dir, filename)
+    with open(filepath, 'wb') as f:
+        f.write(image_bytes)
+    return filepath
+
+
+def finish_event(event, pipe, save_dir, sensor_log):
+    """Decodes and persists a reassembled transfer. Returns the result for the main process."""
+    capture_id, capture_time, data = unstamp_capture(event['data'])
+    result = {'type': event['type'], 'pipe': pipe, 'capture_id': capture_id, 'capture_time': capture_time,
+              'first_arrival': event['first_arrival'], 'arrival': event['arrival']}
+    if event['type'] == 'sensor':
+        try:
+            result['data'] = parse_sensor_text(data.rstrip(b'\x00').decode())
+        except Exception as e:
+            print(f"❌ Failed to decode or parse sensor data: {e}")
+            return None
+        sensor_log.write(json.dumps({'capture_id': capture_id, 'capture_time': capture_time,
+                                     'readings': result['data']}) + "\n")
+        sensor_log.flush()
+    else:
+        try:
+            result['path'] = save_image(save_dir, data, capture_id)
+        except Exception as e:
+            print(f"❌ Error saving raw image file: {e}")
+        result['data'] = data
+    return result
+
+
+def worker(index, ring_name, running, results, counters, save_dir, sensor_log_path):
+    """Worker process: ring -> reassembly -> decode -> disk -> results queue."""
+    ring = PacketRing(name=ring_name)
+    reassemblers = {}
+    base = index * 3
+    with open(sensor_log_path, 'a') as sensor_log:
+        while True:
+            item = ring.pop()
+            if item is None:
+                # Keep draining until the reader has stopped and the ring is empty
+                if not running.is_set():
+                    break
+                time.sleep(WORKER_IDLE_S)
+                continue
+            start = time.perf_counter()
+            arrival, pipe, payload = item
+            event = reassemblers.setdefault(pipe, Reassembler()).feed(payload, arrival)
+            if event is not None and event['type'] != 'progress':
+                result = finish_event(event, pipe, save_dir, sensor_log)
+                if result is not None:
+                    results.put(result)
+                    counters[base + EVENTS] += 1
+            counters[base + PACKETS] += 1
+            counters[base + BUSY_S] += time.perf_counter() - start
+    ring.close()
+
+
+class MultiprocessGroundStation:
+    """
+    Runs the reader and worker processes and handles their results: joins
+    sensor readings with images by capture id and uploads them. radio_factory
+    is called inside the reader process, which owns the radio.
+    """
+
+    def __init__(self, radio_factory, workers=WORKERS, ring_slots=RING_SLOTS, upload_target=UPLOAD_TARGET,
+                 save_dir=IMAGE_SAVE_DIR, sensor_log=SENSOR_LOG):
+        self.radio_factory = radio_factory
+        self.workers = workers
+        self.ring_slots = ring_slots
+        self.sink = upload_sinks.make_sink(upload_target, **upload_sinks.env_options())
+        self.save_dir = save_dir
+        self.sensor_log = sensor_log
+        self.join_buffer = JoinBuffer()
+        self.uploads = ThreadPoolExecutor(max_workers=UPLOAD_CONCURRENCY)
+        self.counters = {'sensor_frames': 0, 'images': 0, 'uploads_ok': 0, 'uploads_failed': 0}
+        self.rings = []
+        self.processes = []
+        self.started_at = None
+
+    def start(self):
+        self.rings = [PacketRing(self.ring_slots) for _ in range(self.workers)]
+        self.reader_running = mp.Event()
+        self.workers_running = mp.Event()
+        self.reader_running.set()
+        self.workers_running.set()
+        self.results = mp.Queue()
+        self.reader_counters = mp.Array('d', 3, lock=False)
+        self.worker_counters = mp.Array('d', self.workers * 3, lock=False)
+        self.reader = mp.Process(
+            target=radio_reader, daemon=True,
+            args=(self.radio_factory, [ring.name for ring in self.rings], self.reader_running, self.reader_counters),
+        )
+        self.processes = [
+            mp.Process(target=worker, daemon=True,
+                       args=(i, ring.name, self.workers_running, self.results, self.worker_counters,
+                             self.save_dir, self.sensor_log))
+            for i, ring in enumerate(self.rings)
+        ]
+        for process in self.processes:
+            process.start()
+        self.reader.start()
+        self.started_at = time.perf_counter()
+
+    def poll(self, timeout=0.1):
+        """Handles finished records from the workers. Returns them as a list."""
+        handled = []
+        try:
+            result = self.results.get(timeout=timeout)
+            while True:
+                handled.append(result)
+                self._handle(result)
+                result = self.results.get_nowait()
+        except queue.Empty:
+            pass
+        for record in self.join_buffer.expire():
+            self._upload(record)
+        return handled
+
+    def _handle(self, result):
+        kind = 'sensor' if result['type'] == 'sensor' else 'image'
+        self.counters['sensor_frames' if kind == 'sensor' else 'images'] += 1
+        record = self.join_buffer.add(kind, result['capture_id'], result['capture_time'], result.get('data'))
+        if record is not None:
+            self._upload(record)
+
+    def _upload(self, record):
+        if self.sink is None:
+            return
+        self.uploads.submit(self.sink.post, upload_payload(record), self._uploaded)
+
+    def _uploaded(self, key, error):
+        # With batching, once the batch this document went out in was written
+        if error is not None:
+            print(f"❌ Failed to upload: {error}")
+        self.counters['uploads_ok' if error is None else 'uploads_failed'] += 1
+
+    def stats(self):
+        """Ring occupancy and per-process throughput since start()."""
+        elapsed = max(time.perf_counter() - self.started_at, 1e-9)
+        workers = []
+        for i in range(self.workers):
+            packets, events, busy_s = self.worker_counters[i * 3:i * 3 + 3]
+            workers.append({'packets': int(packets), 'events': int(events),
+                            'packets_per_s': round(packets / elapsed, 1),
+                            'utilization': round(busy_s / elapsed, 3)})
+        return {
+            'reader': {'packets': int(self.reader_counters[READ_PACKETS]),
+                       'handshakes': int(self.reader_counters[HANDSHAKES]),
+                       'ring_wait_s': round(self.reader_counters[RING_WAIT_S], 3)},
+            'rings': [ring.stats() for ring in self.rings],
+            'workers': workers,
+            'counters': self.counters,
+        }
+
+    def stop(self):
+        # Reader first, so the workers can drain everything it already pushed
+        self.reader_running.clear()
+        self.reader.join()
+        self.workers_running.clear()
+        # A worker can't exit while its results are still queued, so keep reading them
+        while any(process.is_alive() for process in self.processes):
+            self.poll(timeout=0.05)
+        for process in self.processes:
+            process.join()
+        while self.poll(timeout=0.05):
+            pass
+        self.uploads.shutdown(wait=True)
+        if self.sink is not None:
+            self.sink.close()
+        for ring in self.rings:
+            ring.close()
+
+    def run(self):
+        self.start()
+        next_report = time.perf_counter() + STATS_EVERY_S
+        try:
+            while True:
+                for result in self.poll():
+                    latency_ms = (result['arrival'] - result['first_arrival']) * 1000
+                    print(f"✅ {result['type']} from pipe {result['pipe']} "
+                          f"(capture {result['capture_id']}) in {latency_ms:.0f} ms")
+                if time.perf_counter() >= next_report:
+                    print(f"📊 {json.dumps(self.stats())}")
+                    next_report += STATS_EVERY_S
+        finally:
+            self.stop()
+
+
+def make_receiver_radio():
+    import hardware
+
+    return hardware.make_radio(hardware.ROLE_RECEIVER)
+
+
+if __name__ == "__main__":
+    station = MultiprocessGroundStation(make_receiver_radio)
+    try:
+        station.run()
+    except KeyboardInterrupt:
+        pass
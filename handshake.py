@@ -0,0 +1,206 @@
+import random
+import struct
+from collections import namedtuple
+
+# --- Versioned capability handshake ---
+# The sender opens a session with b'SYNC' followed by its capability offer.
+# The receiver answers with b'ACK' followed by the configuration both sides
+# will use. A bare b'SYNC' / b'ACK' is still understood as a legacy peer.
+HANDSHAKE_VERSION = 1
+
+# Capability bitmap (2 bytes)
+CAP_ACK_PAYLOAD = 1 << 0       # ACKs carried in auto-ACK payloads (writeAckPayload)
+CAP_INDEXED_CHUNKS = 1 << 1    # [index][data] chunks, out-of-order tolerant
+CAP_SLIDING_WINDOW = 1 << 2    # more than one chunk in flight per ACK
+CAP_FEC = 1 << 3               # forward error correction parity chunks
+CAP_BINARY_TELEMETRY = 1 << 4  # packed binary sensor frames instead of text
+CAP_CHANNEL_HOPPING = 1 << 5   # hop over an agreed channel set (channel_manager.py)
+CAP_AEAD = 1 << 6              # transfers sealed with the shared link key (security.py)
+CAP_COMPACT_FRAMING = 1 << 7   # variable-length frames with explicit length (framing.py)
+CAP_COMPRESSION = 1 << 8       # codec chosen per transfer from the shared set (compression.py)
+
+# Codec bitmap (1 byte)
+CODEC_RAW = 1 << 0
+CODEC_ZLIB = 1 << 1
+CODEC_LZMA = 1 << 2
+CODEC_ZSTD = 1 << 3
+CODEC_ZLIB_DICT = 1 << 4       # zlib with a preset telemetry dictionary
+CODEC_ZSTD_DICT = 1 << 5       # zstd with the same dictionary
+
+# Data rates, using the RF24 library's rf24_datarate_e values
+RF24_1MBPS = 0
+RF24_2MBPS = 1
+RF24_250KBPS = 2
+RATE_BITS = {RF24_1MBPS: 1 << 0, RF24_2MBPS: 1 << 1, RF24_250KBPS: 1 << 2}
+RATE_KBPS = {RF24_250KBPS: 250, RF24_1MBPS: 1000, RF24_2MBPS: 2000}
+
+# Prefers the fastest codec first when several are shared
+CODEC_PREFERENCE = [CODEC_ZSTD, CODEC_ZLIB, CODEC_LZMA, CODEC_RAW]
+
+# SYNC <version> <caps> <max_window> <codecs> <rates> <preferred_rate>
+OFFER_FORMAT = struct.Struct('>BHBBBB')
+# ACK <version> <caps> <window> <codec> <rate>
+REPLY_FORMAT = struct.Struct('>BHBBB')
+# Optional tail on both packets when CAP_CHANNEL_HOPPING is offered:
+# a 126-bit channel mask (16 bytes), plus the hop seed (2 bytes) in the reply
+CHANNEL_MASK_BYTES = 16
+HOP_SEED_FORMAT = struct.Struct('>H')
+# With CAP_COMPRESSION the reply ends with the shared codec bitmap (1 byte),
+# so the sender can pick a codec per transfer instead of one per session
+
+SessionConfig = namedtuple(
+    'SessionConfig', ['version', 'caps', 'window', 'codec', 'data_rate', 'channel_mask', 'hop_seed', 'codecs'],
+    defaults=(0, 0, 0),
+)
+
+# What a peer that only speaks the bare SYNC/ACK handshake can do
+LEGACY_CONFIG = SessionConfig(0, 0, 1, CODEC_RAW, RF24_1MBPS)
+
+
+def build_offer(caps, max_window=1, codecs=CODEC_RAW, rates=(RF24_1MBPS,), preferred_rate=RF24_1MBPS,
+                channel_mask=0):
+    """
+    Builds the SYNC packet announcing what this side supports.
+    channel_mask lists the channels this side found clean (bit n = channel n)
+    and is only sent along with CAP_CHANNEL_HOPPING.
+    """
+    rate_bits = 0
+    for rate in rates:
+        rate_bits |= RATE_BITS[rate]
+    packet = b'SYNC' + OFFER_FORMAT.pack(HANDSHAKE_VERSION, caps, max_window, codecs, rate_bits, preferred_rate)
+    if caps & CAP_CHANNEL_HOPPING:
+        packet += channel_mask.to_bytes(CHANNEL_MASK_BYTES, 'big')
+    return packet
+
+
+def parse_offer(packet):
+    """
+    Parses a SYNC packet into a dict, or returns None if it isn't one.
+    A bare b'SYNC' (optionally NUL padded) is returned as a legacy offer.
+    """
+    packet = bytes(packet)
+    if packet[:4] != b'SYNC':
+        return None
+    body = packet[4:4 + OFFER_FORMAT.size]
+    if len(body) < OFFER_FORMAT.size or body.rstrip(b'\x00') == b'':
+        return {
+            'version': 0, 'caps': 0, 'max_window': 1, 'codecs': CODEC_RAW,
+            'rates': RATE_BITS[RF24_1MBPS], 'preferred_rate': RF24_1MBPS, 'channel_mask': 0,
+        }
+    version, caps, max_window, codecs, rates, preferred_rate = OFFER_FORMAT.unpack(body)
+    mask_bytes = packet[4 + OFFER_FORMAT.size:4 + OFFER_FORMAT.size + CHANNEL_MASK_BYTES]
+    if len(mask_bytes) < CHANNEL_MASK_BYTES:
+        # Can't hop without knowing which channels the peer is happy with
+        caps &= ~CAP_CHANNEL_HOPPING
+    return {
+        'version': version, 'caps': caps, 'max_window': max(1, max_window), 'codecs': codecs,
+        'rates': rates, 'preferred_rate': preferred_rate,
+        'channel_mask': int.from_bytes(mask_bytes, 'big') if caps & CAP_CHANNEL_HOPPING else 0,
+    }
+
+
+def select_config(local, remote, hop_seed=None):
+    """
+    Picks the highest-throughput configuration both offers support.
+    Both arguments are dicts as returned by parse_offer(). hop_seed fixes
+    the hop sequence when channel hopping is agreed (random otherwise).
+    """
+    version = min(local['version'], remote['version'])
+    if version == 0:
+        return LEGACY_CONFIG
+
+    caps = local['caps'] & remote['caps']
+    window = min(local['max_window'], remote['max_window']) if caps & CAP_SLIDING_WINDOW else 1
+
+    shared_codecs = local['codecs'] & remote['codecs']
+    codec = next((c for c in CODEC_PREFERENCE if shared_codecs & c), CODEC_RAW)
+
+    # A side may prefer a slower rate for range, so never go above the slower
+    # of the two preferences, but take the fastest shared rate below that.
+    shared_rates = local['rates'] & remote['rates']
+    ceiling = min(RATE_KBPS.get(local['preferred_rate'], 1000), RATE_KBPS.get(remote['preferred_rate'], 1000))
+    data_rate = RF24_1MBPS
+    best_kbps = 0
+    for rate, bit in RATE_BITS.items():
+        kbps = RATE_KBPS[rate]
+        if shared_rates & bit and best_kbps < kbps <= ceiling:
+            data_rate, best_kbps = rate, kbps
+
+    channel_mask = local['channel_mask'] & remote['channel_mask'] if caps & CAP_CHANNEL_HOPPING else 0
+    if caps & CAP_CHANNEL_HOPPING and bin(channel_mask).count("1") < 2:
+        # Nothing to hop between; stay on the rendezvous channel
+        caps &= ~CAP_CHANNEL_HOPPING
+        channel_mask = 0
+    if caps & CAP_CHANNEL_HOPPING:
+        hop_seed = random.getrandbits(16) if hop_seed is None else hop_seed
+    else:
+        hop_seed = 0
+
+    codecs = shared_codecs | CODEC_RAW if caps & CAP_COMPRESSION else 0
+
+    return SessionConfig(version, caps, window, codec, data_rate, channel_mask, hop_seed, codecs)
+
+
+def build_reply(config):
+    """Builds the ACK packet telling the sender which configuration was chosen."""
+    if config.version == 0:
+        return b'ACK'
+    packet = b'ACK' + REPLY_FORMAT.pack(config.version, config.caps, config.window, config.codec, config.data_rate)
+    if config.caps & CAP_CHANNEL_HOPPING:
+        packet += config.channel_mask.to_bytes(CHANNEL_MASK_BYTES, 'big') + HOP_SEED_FORMAT.pack(config.hop_seed)
+    if config.caps & CAP_COMPRESSION:
+        packet += bytes([config.codecs])
+    return packet
+
+
+def parse_reply(packet):
+    """
+    Parses the receiver's handshake ACK into a SessionConfig.
+    Returns None if the packet is not a handshake ACK at all.
+    """
+    packet = bytes(packet)
+    if packet[:3] != b'ACK':
+        return None
+    body = packet[3:3 + REPLY_FORMAT.size]
+    if len(body) < REPLY_FORMAT.size:
+        # A bare b'ACK' from a receiver that predates capability negotiation.
+        # receiver__ziyad.py style ACKs (b'ACK' + 2-byte index) also land here.
+        return LEGACY_CONFIG if len(body) == 0 else None
+    version, caps, window, codec, data_rate = REPLY_FORMAT.unpack(body)
+    tail = packet[3 + REPLY_FORMAT.size:]
+    channel_mask = hop_seed = codecs = 0
+    if caps & CAP_CHANNEL_HOPPING and len(tail) >= CHANNEL_MASK_BYTES + HOP_SEED_FORMAT.size:
+        channel_mask = int.from_bytes(tail[:CHANNEL_MASK_BYTES], 'big')
+        (hop_seed,) = HOP_SEED_FORMAT.unpack_from(tail, CHANNEL_MASK_BYTES)
+        tail = tail[CHANNEL_MASK_BYTES + HOP_SEED_FORMAT.size:]
+    else:
+        caps &= ~CAP_CHANNEL_HOPPING
+    if caps & CAP_COMPRESSION and tail:
+        codecs = tail[0]
+    else:
+        caps &= ~CAP_COMPRESSION
+    return SessionConfig(version, caps, window, codec, data_rate, channel_mask, hop_seed, codecs)
+
+
+def describe(config):
+    """Returns a short human readable summary of a negotiated session."""
+    names = [
+        name for bit, name in (
+            (CAP_ACK_PAYLOAD, 'ack-payload'), (CAP_INDEXED_CHUNKS, 'indexed'),
+            (CAP_SLIDING_WINDOW, 'window'), (CAP_FEC, 'fec'), (CAP_BINARY_TELEMETRY, 'binary-telemetry'),
+            (CAP_CHANNEL_HOPPING, 'hopping'), (CAP_AEAD, 'aead'), (CAP_COMPACT_FRAMING, 'compact'),
+            (CAP_COMPRESSION, 'compression'),
+        ) if config.caps & bit
+    ]
+    codec_names = {CODEC_RAW: 'raw', CODEC_ZLIB: 'zlib', CODEC_LZMA: 'lzma', CODEC_ZSTD: 'zstd',
+                   CODEC_ZLIB_DICT: 'zlib+dict', CODEC_ZSTD_DICT: 'zstd+dict'}
+    codec = codec_names.get(config.codec, '?')
+    summary = (
+        f"v{config.version} caps=[{', '.join(names) or 'none'}] window={config.window} "
+        f"codec={codec} rate={RATE_KBPS.get(config.data_rate, '?')}kbps"
+    )
+    if config.caps & CAP_CHANNEL_HOPPING:
+        summary += f" hop_channels={bin(config.channel_mask).count('1')}"
+    if config.caps & CAP_COMPRESSION:
+        summary += f" codecs={','.join(name for bit, name in codec_names.items() if config.codecs & bit)}"
+    return summary
@@ -0,0 +1,102 @@
+import threading
+import time
+
+# --- Hardware construction ---
+# Importing a script must not touch the SPI bus, the camera or the Sense HAT,
+# so benchmarks and the simulator can reuse its functions. Scripts build their
+# devices explicitly in main() through these helpers, and the driver modules
+# themselves are only imported on first use.
+RADIO_CE_PIN = 22          # GPIO22 (pin 15)
+RADIO_CSN = 0              # SPI CE0 (pin 24)
+RADIO_IRQ_PIN = None       # BCM pin of the nRF24 IRQ line, if wired (e.g. 24); None = poll
+RADIO_CHANNEL = 76
+PIPE_ADDRESS = b'1Node'
+PA_LEVEL = 2               # RF24_PA_HIGH
+CAMERA_WARMUP_S = 2.0
+
+ROLE_SENDER = 'sender'
+ROLE_RECEIVER = 'receiver'
+
+
+def make_radio(role, radio=None, channel=RADIO_CHANNEL, pa_level=PA_LEVEL, lna=False):
+    """
+    Configures a radio the way every script in this repo uses it: auto-ACK,
+    dynamic payloads, ACK payloads and the shared '1Node' pipe. A sender is
+    left in TX mode, a receiver listening. Pass radio= to configure an
+    existing object (e.g. a link_sim.SimRadio) instead of the real nRF24.
+    """
+    if radio is None:
+        from RF24 import RF24
+        radio = RF24(RADIO_CE_PIN, RADIO_CSN)
+    radio.begin()
+    radio.setChannel(channel)
+    radio.setPALevel(pa_level, lna)
+    radio.setAutoAck(True)
+    radio.enableDynamicPayloads()
+    radio.enableAckPayload()
+    if RADIO_IRQ_PIN is not None:
+        # Only "packet received" pulls IRQ low, so power.wait_for_packet can sleep on it
+        radio.maskIRQ(True, True, False)
+    if role == ROLE_SENDER:
+        radio.openWritingPipe(PIPE_ADDRESS)
+        radio.stopListening()
+    else:
+        radio.openReadingPipe(1, PIPE_ADDRESS)
+        radio.startListening()
+    return radio
+
+
+_sense_hat = None
+
+
+def sense_hat():
+    """The shared SenseHat instance, created on first use (raises ImportError without one)."""
+    global _sense_hat
+    if _sense_hat is None:
+        from sense_hat import SenseHat
+        _sense_hat = SenseHat()
+    return _sense_hat
+
+
+class CameraWarmup:
+    """
+    Opens the Pi camera on a background thread so its warm-up overlaps with
+    radio setup and the handshake instead of delaying the first packet.
+    camera is None when picamera isn't installed.
+    """
+
+    def __init__(self, resolution=(640, 480), warmup_s=CAMERA_WARMUP_S):
+        self.resolution = resolution
+        self.warmup_s = warmup_s
+        self.camera = None
+        self.ready_at = None
+        self.thread = threading.Thread(target=self._open, daemon=True)
+        self.thread.start()
+
+    def _open(self):
+        try:
+            from picamera import PiCamera
+        except ImportError:
+            return
+        self.camera = PiCamera()
+        self.camera.resolution = self.resolution
+        self.camera.start_preview()
+        self.ready_at = time.time() + self.warmup_s
+
+    def capture(self, filename):
+        """Captures a still once warmed up. Returns False if there is no camera."""
+        self.thread.join()
+        if self.camera is None:
+            return False
+        remaining = self.ready_at - time.time()
+        if remaining > 0:
+            time.sleep(remaining)
+        self.camera.capture(filename)
+        return True
+
+    def close(self):
+        self.thread.join()
+        if self.camera is not None:
+            self.camera.stop_preview()
+            self.camera.close()
+            self.camera = None
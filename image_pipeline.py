@@ -0,0 +1,197 @@
+import functools
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# --- Post-receive image processing ---
+# Runs on a process pool so decoding and thumbnailing never block the radio loop.
+IMAGE_SAVE_DIR = "received_images"
+PROCESSED_DIR = os.path.join(IMAGE_SAVE_DIR, "processed")
+THUMBNAIL_SIZES = (64, 256, 1024)  # longest side in pixels
+THUMBNAIL_QUALITY = 75
+MAX_WORKERS = 2                    # leave cores free for the receiver itself
+POLL_INTERVAL_S = 1.0
+
+# Receivers encode the expected size in the filename:
+#   receiver__ziyad.py -> 20240101_120000_complete_1234.jpg
+#   receive.py         -> 20240101_120000_INCOMPLETE_1000_of_1234.jpg
+_EXPECTED_SIZE_RE = re.compile(r'_(\d+)(?:_of_(\d+))?\.jpg$')
+
+
+def expected_size_from_name(filename):
+    match = _EXPECTED_SIZE_RE.search(filename)
+    if not match:
+        return None
+    received, total = match.groups()
+    return int(total or received)
+
+
+def check_jpeg_structure(data):
+    """Looks at the JPEG markers without decoding. Returns a dict of findings."""
+    has_soi = data[:2] == b'\xff\xd8'
+    eoi_pos = data.rfind(b'\xff\xd9')
+    return {
+        'has_soi': has_soi,
+        'has_eoi': eoi_pos != -1,
+        # Bytes after the EOI marker are usually NUL padding from the fixed-size chunks
+        'trailing_bytes': len(data) - (eoi_pos + 2) if eoi_pos != -1 else 0,
+    }
+
+
+def _count_missing_rows(img):
+    """
+    Counts trailing rows that are one flat colour. When PIL decodes a
+    truncated JPEG it leaves the undecoded area blank, so this estimates
+    how much of the frame was lost.
+    """
+    gray = img.convert("L")
+    width, height = gray.size
+    pixels = gray.load()
+    fill = pixels[0, height - 1]
+    missing = 0
+    for y in range(height - 1, -1, -1):
+        if any(pixels[x, y] != fill for x in range(0, width, max(1, width // 64))):
+            break
+        missing += 1
+    return missing
+
+
+def process_image(path, out_dir=PROCESSED_DIR):
+    """
+    Decodes, validates, thumbnails and measures one received image.
+    Runs inside a worker process, so it only takes and returns plain data.
+    """
+    from PIL import Image, ImageFile, ImageStat
+
+    start = time.perf_counter()
+    os.makedirs(out_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    expected = expected_size_from_name(os.path.basename(path))
+    result = {
+        'file': path,
+        'bytes': len(data),
+        'expected_bytes': expected,
+        'truncated_bytes': max(0, expected - len(data)) if expected else 0,
+        'decodable': False,
+        'thumbnails': {},
+    }
+    result.update(check_jpeg_structure(data))
+
+    try:
+        # Accept truncated files so we still get a preview of what did arrive
+        ImageFile.LOAD_TRUNCATED_IMAGES = True
+        with Image.open(path) as img:
+            img.load()
+            result['decodable'] = True
+            result['format'] = img.format
+            result['mode'] = img.mode
+            result['width'], result['height'] = img.size
+            exif = img.getexif()
+            result['exif'] = {str(tag): str(value) for tag, value in exif.items()} if exif else {}
+
+            rgb = img.convert("RGB")
+            stat = ImageStat.Stat(rgb)
+            result['stats'] = {
+                'mean': [round(v, 2) for v in stat.mean],
+                'stddev': [round(v, 2) for v in stat.stddev],
+                'extrema': stat.extrema,
+            }
+            missing_rows = _count_missing_rows(rgb) if not result['has_eoi'] else 0
+            result['missing_rows'] = missing_rows
+            result['complete_fraction'] = round(1 - missing_rows / img.size[1], 4)
+
+            for size in THUMBNAIL_SIZES:
+                if size >= max(img.size):
+                    continue
+                thumb = rgb.copy()
+                thumb.thumbnail((size, size))
+                thumb_path = os.path.join(out_dir, f"{stem}_{size}.jpg")
+                thumb.save(thumb_path, format="JPEG", quality=THUMBNAIL_QUALITY)
+                result['thumbnails'][size] = thumb_path
+    except Exception as e:
+        result['error'] = str(e)
+    finally:
+        ImageFile.LOAD_TRUNCATED_IMAGES = False
+
+    result['processing_ms'] = round((time.perf_counter() - start) * 1000, 2)
+    with open(os.path.join(out_dir, f"{stem}.json"), 'w') as f:
+        json.dump(result, f, indent=2)
+    return result
+
+
+class ImagePipeline:
+    """
+    Hands received images to a ProcessPoolExecutor.
+    submit() returns immediately; results are logged from a done callback.
+    """
+
+    def __init__(self, out_dir=PROCESSED_DIR, max_workers=MAX_WORKERS):
+        self.out_dir = out_dir
+        self.executor = ProcessPoolExecutor(max_workers=max_workers)
+        # Paths being processed. Finished ones are recognised by their JSON
+        # result instead, so this only holds what's still in the pool
+        self.in_flight = set()
+        self.crashed = set()           # no JSON result, but not worth retrying
+        self.processed = 0
+        self.failed = 0
+        self.total_ms = 0.0
+
+    def submit(self, path):
+        if path in self.in_flight or path in self.crashed:
+            return None
+        self.in_flight.add(path)
+        future = self.executor.submit(process_image, path, self.out_dir)
+        future.add_done_callback(functools.partial(self._on_done, path))
+        return future
+
+    def _on_done(self, path, future):
+        self.in_flight.discard(path)
+        try:
+            result = future.result()
+        except Exception as e:
+            self.failed += 1
+            self.crashed.add(path)
+            print(f"❌ Image processing crashed: {e}")
+            return
+        self.processed += 1
+        self.total_ms += result['processing_ms']
+        status = "✅" if result['decodable'] and result['has_eoi'] else "⚠️"
+        print(
+            f"{status} Processed {os.path.basename(result['file'])} in {result['processing_ms']:.0f} ms "
+            f"(decodable={result['decodable']}, truncated={result['truncated_bytes']} bytes, "
+            f"avg {self.total_ms / self.processed:.0f} ms/image)"
+        )
+
+    def scan(self, image_dir=IMAGE_SAVE_DIR):
+        """Submits every image in image_dir that hasn't been processed yet."""
+        submitted = 0
+        for name in sorted(os.listdir(image_dir)):
+            if not name.endswith(".jpg"):
+                continue
+            stem = os.path.splitext(name)[0]
+            if os.path.exists(os.path.join(self.out_dir, f"{stem}.json")):
+                continue
+            if self.submit(os.path.join(image_dir, name)):
+                submitted += 1
+        return submitted
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+if __name__ == "__main__":
+    # Standalone mode: watch the receiver's output directory and process new files
+    os.makedirs(IMAGE_SAVE_DIR, exist_ok=True)
+    pipeline = ImagePipeline()
+    print(f"👀 Watching {IMAGE_SAVE_DIR}/ for new images...")
+    try:
+        while True:
+            pipeline.scan()
+            time.sleep(POLL_INTERVAL_S)
+    except KeyboardInterrupt:
+        pipeline.shutdown()
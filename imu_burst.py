@@ -0,0 +1,207 @@
+import math
+import random
+import struct
+import sys
+import time
+from array import array
+
+import hardware
+from framing import decode_varint, encode_varint
+
+# --- IMU burst capture ---
+# read_motion_data() gives one rounded reading per contact, which says
+# nothing about vibration or how the attitude moves. A burst records the
+# Sense HAT accelerometer, gyro and magnetometer for a few seconds at up to
+# the IMU's top output rate into a preallocated array, then goes down as one
+# binary product:
+#   [start time f64][sample count u32][channel count u8]
+#   count - 1 varint time deltas in microseconds (the first sample is at start)
+#   then each channel's count float32 values (little-endian), one channel after another
+# Sample times are kept exactly as taken, so the ground sees the real jitter.
+# Values stay float32: the LSM9DS1 only has 16 bits per axis.
+CHANNELS = ('ax', 'ay', 'az', 'gx', 'gy', 'gz', 'mx', 'my', 'mz')
+MAX_RATE_HZ = 952           # LSM9DS1 accelerometer/gyro top output data rate
+MAX_BURST_S = 60
+BURST_HEADER = struct.Struct('>dIB')
+IMU_SAVE_DIR = "received_imu"
+
+
+class SenseHatSource:
+    """
+    Accelerometer (g), gyro (rad/s) and magnetometer (uT) from the Sense HAT.
+    One IMU poll serves all three, where the get_*_raw() calls poll (and
+    sleep) once each. Raises ImportError without a HAT.
+    """
+
+    name = 'Sense HAT'
+
+    def __init__(self):
+        self.sense = hardware.sense_hat()
+        self.sense.set_imu_config(True, True, True)
+        self.imu = getattr(self.sense, '_imu', None)
+
+    def read(self):
+        if self.imu is not None and self.imu.IMURead():
+            data = self.imu.getIMUData()
+            return (*data['accel'], *data['gyro'], *data['compass'])
+        if self.imu is not None:
+            return None     # nothing new since the last poll
+        a = self.sense.get_accelerometer_raw()
+        g = self.sense.get_gyroscope_raw()
+        c = self.sense.get_compass_raw()
+        return (a['x'], a['y'], a['z'], g['x'], g['y'], g['z'], c['x'], c['y'], c['z'])
+
+
+class SyntheticSource:
+    """Stands in for the HAT: 1 g with a 37 Hz vibration, a slow tumble and sensor noise."""
+
+    name = 'synthetic'
+
+    def __init__(self, seed=1):
+        self.rng = random.Random(seed)
+        self.start = time.perf_counter()
+
+    def read(self):
+        t = time.perf_counter() - self.start
+        noise = self.rng.gauss
+        vibration = 0.05 * math.sin(2 * math.pi * 37 * t)
+        return (noise(0, 0.004), noise(0, 0.004) + vibration, 1 + noise(0, 0.004) + vibration,
+                0.02 * math.sin(0.5 * t) + noise(0, 0.001), noise(0, 0.001), 0.1 + noise(0, 0.001),
+                20 + noise(0, 0.3), -15 + noise(0, 0.3), 45 + noise(0, 0.3))
+
+
+def default_source():
+    """The Sense HAT, or the synthetic source when there is none."""
+    try:
+        return SenseHatSource()
+    except ImportError:
+        print("sense_hat library not found. Using synthetic IMU data for the burst.")
+        return SyntheticSource()
+
+
+class Burst:
+    """
+    One burst: times (seconds since start_time, array 'd') and samples
+    (array 'f', one row of len(CHANNELS) values per sample).
+    """
+
+    def __init__(self, start_time, times, samples, target_hz=None):
+        self.start_time = start_time
+        self.times = times
+        self.samples = samples
+        self.target_hz = target_hz
+
+    def __len__(self):
+        return len(self.times)
+
+    def channel(self, name):
+        return self.samples[CHANNELS.index(name)::len(CHANNELS)]
+
+    def stats(self):
+        """Achieved rate and the spread of the sample intervals."""
+        if len(self.times) < 2:
+            return {'samples': len(self.times), 'rate_hz': 0.0, 'jitter_us': 0.0, 'max_gap_ms': 0.0}
+        intervals = [b - a for a, b in zip(self.times, self.times[1:])]
+        mean = (self.times[-1] - self.times[0]) / len(intervals)
+        jitter = math.sqrt(sum((i - mean) ** 2 for i in intervals) / len(intervals))
+        return {'samples': len(self.times), 'rate_hz': round(1 / mean, 1) if mean else 0.0,
+                'jitter_us': round(jitter * 1e6, 1), 'max_gap_ms': round(max(intervals) * 1000, 3)}
+
+    def describe(self):
+        s = self.stats()
+        target = f" (asked for {self.target_hz} Hz)" if self.target_hz else ""
+        return (f"{s['samples']} samples at {s['rate_hz']} Hz{target}, interval jitter {s['jitter_us']} us, "
+                f"longest gap {s['max_gap_ms']} ms")
+
+    def encode(self):
+        count = len(self.times)
+        ticks = [round(t * 1e6) for t in self.times]
+        deltas = b''.join(encode_varint(b - a) for a, b in zip(ticks, ticks[1:]))
+        planes = array('f')
+        for c in range(len(CHANNELS)):
+            planes.extend(self.samples[c::len(CHANNELS)])
+        if sys.byteorder == 'big':
+            planes.byteswap()
+        return BURST_HEADER.pack(self.start_time, count, len(CHANNELS)) + deltas + planes.tobytes()
+
+
+def decode_burst(data):
+    """A Burst from encode()'s bytes. Padding after it is ignored; raises ValueError if it's cut off."""
+    data = bytes(data)
+    if len(data) < BURST_HEADER.size:
+        raise ValueError("IMU burst too short for its header")
+    start_time, count, channels = BURST_HEADER.unpack_from(data)
+    pos = BURST_HEADER.size
+    times = array('d', [0.0] * count)
+    tick = 0
+    for i in range(1, count):
+        delta, pos = decode_varint(data, pos)
+        tick += delta
+        times[i] = tick / 1e6
+    planes = array('f')
+    end = pos + 4 * count * channels
+    if end > len(data):
+        raise ValueError(f"IMU burst cut off: {len(data)} bytes, needs {end}")
+    planes.frombytes(data[pos:end])
+    if sys.byteorder == 'big':
+        planes.byteswap()
+    samples = array('f', bytes(4 * count * channels))
+    for c in range(channels):
+        samples[c::channels] = planes[c * count:(c + 1) * count]
+    return Burst(start_time, times, samples)
+
+
+def capture_burst(source, duration_s, rate_hz=0):
+    """
+    Samples source for duration_s at rate_hz (0: as fast as it delivers, up
+    to MAX_RATE_HZ) into buffers sized up front, so nothing is allocated
+    while sampling. Reads are paced from the burst start rather than from the
+    previous read, so late reads don't push every later one back.
+    """
+    rate_hz = min(rate_hz or MAX_RATE_HZ, MAX_RATE_HZ)
+    duration_s = min(duration_s, MAX_BURST_S)
+    period = 1 / rate_hz
+    capacity = int(duration_s * rate_hz) + 1
+    width = len(CHANNELS)
+    times = array('d', bytes(8 * capacity))
+    samples = array('f', bytes(4 * capacity * width))
+    count = 0
+    start_time = first = None
+    start = next_read = time.perf_counter()
+    end = start + duration_s
+    while count < capacity:
+        now = time.perf_counter()
+        if now >= end:
+            break
+        if now < next_read:
+            time.sleep(next_read - now)
+            continue
+        sample = source.read()
+        if sample is None:
+            continue
+        taken = time.perf_counter()
+        if first is None:
+            # Times count from the first sample, which is what start_time marks
+            start_time, first = time.time(), taken
+        times[count] = taken - first
+        row = count * width
+        for i in range(width):
+            samples[row + i] = sample[i]
+        count += 1
+        next_read += period
+        if next_read < now:
+            next_read = now     # fell behind: carry on from here instead of reading in a rush
+    del times[count:]
+    del samples[count * width:]
+    return Burst(start_time or time.time(), times, samples, target_hz=rate_hz)
+
+
+def save_csv(burst, path):
+    """One row per sample: time since the burst started, then every channel."""
+    width = len(CHANNELS)
+    with open(path, 'w') as f:
+        f.write(f"# start {burst.start_time:.6f}\n")
+        f.write("t," + ",".join(CHANNELS) + "\n")
+        for i, t in enumerate(burst.times):
+            row = burst.samples[i * width:(i + 1) * width]
+            f.write(f"{t:.6f}," + ",".join(f"{v:.6g}" for v in row) + "\n")
@@ -0,0 +1,128 @@
+import heapq
+import random
+import struct
+import time
+from collections import OrderedDict
+
+# --- Capture correlation ---
+# The sender stamps every product of one capture (telemetry, image, ...) with
+# the same capture id and capture time. The receiver matches the halves by id
+# in a JoinBuffer instead of pairing an image with whatever reading came last.
+CAPTURE_MAGIC = b'CI'
+# magic, capture id, capture time in milliseconds since the epoch
+CAPTURE_HEADER = struct.Struct('>2sIQ')
+JOIN_TIMEOUT_S = 120.0
+JOIN_KINDS = ('sensor', 'image')
+COMPLETED_MEMORY = 256      # finished capture ids remembered, so resent halves don't start a new record
+
+
+def new_capture_id():
+    return random.getrandbits(32)
+
+
+def stamp_capture(payload, capture_id, capture_time=None):
+    """Prefixes a payload with its capture header."""
+    capture_time = time.time() if capture_time is None else capture_time
+    return CAPTURE_HEADER.pack(CAPTURE_MAGIC, capture_id, int(capture_time * 1000)) + bytes(payload)
+
+
+def unstamp_capture(data):
+    """
+    Splits a stamped payload into (capture_id, capture_time, payload).
+    Payloads from senders that don't stamp come back as (None, None, data).
+    """
+    data = bytes(data)
+    if len(data) < CAPTURE_HEADER.size or data[:2] != CAPTURE_MAGIC:
+        return None, None, data
+    _, capture_id, capture_ms = CAPTURE_HEADER.unpack_from(data)
+    return capture_id, capture_ms / 1000.0, data[CAPTURE_HEADER.size:]
+
+
+class JoinBuffer:
+    """
+    Time-bounded join of capture halves by id: a dict of partial records plus
+    a heap of deadlines. add() returns the joined record as soon as every
+    kind has arrived; expire() flushes records whose deadline passed with
+    whatever halves they have. Ids of the last COMPLETED_MEMORY records
+    handed out are remembered: a half the sender resent after its capture was
+    already uploaded is dropped rather than uploaded again on its own.
+    """
+
+    def __init__(self, kinds=JOIN_KINDS, timeout_s=JOIN_TIMEOUT_S, completed_memory=COMPLETED_MEMORY):
+        self.kinds = tuple(kinds)
+        self.timeout_s = timeout_s
+        self.completed_memory = completed_memory
+        self.pending = {}   # capture_id -> record dict
+        self.deadlines = []  # heap of (deadline, capture_id)
+        self.completed = OrderedDict()  # capture_id -> None, oldest first
+        self.joined = 0
+        self.expired = 0
+        self.repeats = 0
+
+    def has(self, kind, capture_id):
+        """True if this half of the capture already came in, pending or handed out."""
+        if capture_id in self.completed:
+            return True
+        record = self.pending.get(capture_id)
+        return record is not None and record[kind] is not None
+
+    def add(self, kind, capture_id, capture_time, value, now=None):
+        """
+        Adds one half. Returns a complete record dict, or None while other
+        halves are still outstanding (or the capture was already handed out).
+        A capture_id of None can never be matched, so it is returned straight
+        away as an incomplete record.
+        """
+        now = time.time() if now is None else now
+        if capture_id is None:
+            self.expired += 1
+            return self._new_record(None, capture_time, now, complete=False, **{kind: value})
+        if capture_id in self.completed:
+            self.repeats += 1
+            return None
+
+        record = self.pending.get(capture_id)
+        if record is None:
+            record = self._new_record(capture_id, capture_time, now + self.timeout_s)
+            self.pending[capture_id] = record
+            heapq.heappush(self.deadlines, (record['deadline'], capture_id))
+        record[kind] = value
+        if record['capture_time'] is None:
+            record['capture_time'] = capture_time
+
+        if all(record[k] is not None for k in self.kinds):
+            del self.pending[capture_id]
+            self._complete(capture_id)
+            record['complete'] = True
+            self.joined += 1
+            return record
+        return None
+
+    def _complete(self, capture_id):
+        self.completed[capture_id] = None
+        while len(self.completed) > self.completed_memory:
+            self.completed.popitem(last=False)
+
+    def _new_record(self, capture_id, capture_time, deadline, complete=False, **values):
+        record = {'capture_id': capture_id, 'capture_time': capture_time, 'deadline': deadline, 'complete': complete}
+        for k in self.kinds:
+            record[k] = values.get(k)
+        return record
+
+    def expire(self, now=None):
+        """Returns the unmatched records whose timeout has passed, oldest first."""
+        now = time.time() if now is None else now
+        flushed = []
+        while self.deadlines and self.deadlines[0][0] <= now:
+            deadline, capture_id = heapq.heappop(self.deadlines)
+            record = self.pending.get(capture_id)
+            # Heap entries for records that already joined are skipped lazily
+            if record is not None and record['deadline'] == deadline:
+                del self.pending[capture_id]
+                self._complete(capture_id)
+                self.expired += 1
+                flushed.append(record)
+        return flushed
+
+    def next_deadline(self):
+        return self.deadlines[0][0] if self.deadlines else None
@@ -0,0 +1,231 @@
+import random
+import threading
+import time
+from collections import deque
+
+# --- nRF24L01+ link simulator ---
+# SimRadio mimics the parts of the RF24 API the scripts use, so protocol code
+# can run on a laptop or in benchmarks without hardware. Two radios are joined
+# by a Link that models packet loss, propagation latency, the 3-deep RX FIFO,
+# hardware auto-ACK with retransmits, and ACK payloads. Packets only get
+# through when both radios are on the same channel, and an optional
+# Interferer adds bursty Wi-Fi-like loss on the channels it overlaps.
+RX_FIFO_DEPTH = 3
+DEFAULT_RETRIES = 15                  # RF24 library default for setRetries()
+RATE_BPS = {0: 1_000_000, 1: 2_000_000, 2: 250_000}
+PACKET_OVERHEAD_BYTES = 1 + 5 + 2 + 2  # preamble, address, PCF, CRC
+
+
+class Interferer:
+    """
+    A Wi-Fi access point near the link: it is on the air in bursts of
+    burst_s for a duty_cycle fraction of the time, and while on it wipes out
+    packets on the nRF24 channels it overlaps (channel n is 2400 + n MHz, a
+    20 MHz Wi-Fi channel spans about +-11 MHz around its centre).
+    """
+
+    def __init__(self, center_channel=72, width=22, duty_cycle=0.5, burst_s=0.02, loss=0.9, seed=None):
+        self.low = center_channel - width // 2
+        self.high = center_channel + width // 2
+        self.duty_cycle = duty_cycle
+        self.burst_s = burst_s
+        self.loss = loss
+        self.rng = random.Random(seed)
+        self.active = False
+        self.until = 0.0
+
+    def covers(self, channel):
+        return self.low <= channel <= self.high
+
+    def is_active(self, now):
+        # Alternating on/off periods with exponential lengths; on periods
+        # average burst_s, off periods are sized to give the duty cycle
+        if self.duty_cycle <= 0:
+            return False
+        off_s = self.burst_s * (1 - self.duty_cycle) / self.duty_cycle
+        if now - self.until > 10 * (self.burst_s + off_s):
+            self.until = now
+        while now >= self.until:
+            self.active = not self.active
+            mean = self.burst_s if self.active else off_s
+            self.until += self.rng.expovariate(1 / mean) if mean > 0 else 1.0
+        return self.active
+
+    def busy(self, channel, now):
+        return self.covers(channel) and self.is_active(now)
+
+
+class Link:
+    """A lossy point-to-point channel between two SimRadios."""
+
+    def __init__(self, loss=0.0, latency_s=0.0, seed=None, model_airtime=True, interferer=None):
+        self.loss = loss
+        self.interferer = interferer
+        self.latency_s = latency_s
+        self.model_airtime = model_airtime
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.radios = []
+        self.packets_sent = 0
+        self.packets_lost = 0
+
+    def endpoints(self):
+        a, b = SimRadio(self), SimRadio(self)
+        a.peer, b.peer = b, a
+        self.radios = [a, b]
+        return a, b
+
+    def lost(self, channel=None):
+        loss = self.loss
+        if channel is not None and self.interferer is not None and self.interferer.busy(channel, time.time()):
+            loss = 1 - (1 - loss) * (1 - self.interferer.loss)
+        return self.rng.random() < loss
+
+
+class SimRadio:
+    """Stand-in for RF24.RF24 driven by a Link."""
+
+    def __init__(self, link):
+        self.link = link
+        self.peer = None
+        self.listening = False
+        self.rx_fifo = deque()      # (visible_at, payload)
+        self.ack_payloads = deque()
+        self.channel = 76
+        self.data_rate = 0
+        self.retries = DEFAULT_RETRIES
+        self.powered = True
+        self.rx_dropped = 0
+
+    # --- configuration calls are accepted and mostly ignored ---
+    def begin(self):
+        return True
+
+    def setChannel(self, channel):
+        self.channel = channel
+
+    def getChannel(self):
+        return self.channel
+
+    def setPALevel(self, level, lna=True):
+        pass
+
+    def setDataRate(self, rate):
+        self.data_rate = rate
+        return True
+
+    def setRetries(self, delay, count):
+        self.retries = count
+
+    def setAutoAck(self, enable):
+        pass
+
+    def enableDynamicPayloads(self):
+        pass
+
+    def enableAckPayload(self):
+        pass
+
+    def openWritingPipe(self, address):
+        pass
+
+    def openReadingPipe(self, pipe, address):
+        pass
+
+    def powerDown(self):
+        self.powered = False
+
+    def powerUp(self):
+        self.powered = True
+
+    def maskIRQ(self, tx_ok, tx_fail, rx_ready):
+        pass
+
+    def startListening(self):
+        # Like the nRF24, starting to listen powers the radio up
+        self.powered = True
+        self.listening = True
+
+    def stopListening(self):
+        self.listening = False
+
+    def flush_rx(self):
+        with self.link.lock:
+            self.rx_fifo.clear()
+
+    # --- data path ---
+    def _airtime(self, nbytes):
+        return (PACKET_OVERHEAD_BYTES + nbytes) * 8 / RATE_BPS.get(self.data_rate, 1_000_000)
+
+    def _deliver(self, payload, now):
+        """Puts a packet into this radio's RX FIFO. Returns False on overflow."""
+        if len(self.rx_fifo) >= RX_FIFO_DEPTH:
+            self.rx_dropped += 1
+            return False
+        self.rx_fifo.append((now + self.link.latency_s, bytes(payload)))
+        return True
+
+    def write(self, buf):
+        """Sends one packet with hardware auto-ACK. Returns True if it was ACKed."""
+        payload = bytes(buf[:32])
+        link = self.link
+        if link.model_airtime:
+            time.sleep(self._airtime(len(payload)))
+        with link.lock:
+            link.packets_sent += 1
+            peer = self.peer
+            if (not self.powered or peer is None or not peer.powered or not peer.listening
+                    or peer.channel != self.channel):
+                link.packets_lost += 1
+                return False
+            delivered = False
+            for _ in range(self.retries + 1):
+                if link.lost(self.channel):
+                    link.packets_lost += 1
+                    continue
+                if not delivered:
+                    if not peer._deliver(payload, time.time()):
+                        # Receiver FIFO full: the nRF24 doesn't ACK, so retry
+                        continue
+                    delivered = True
+                if link.lost(self.channel):
+                    # ACK lost; the retransmit is dropped as a duplicate by the PID check
+                    continue
+                if peer.ack_payloads:
+                    self._deliver(peer.ack_payloads.popleft(), time.time())
+                return True
+            return False
+
+    def writeAckPayload(self, pipe, buf):
+        with self.link.lock:
+            if len(self.ack_payloads) >= RX_FIFO_DEPTH:
+                return False
+            self.ack_payloads.append(bytes(buf[:32]))
+            return True
+
+    def available(self):
+        with self.link.lock:
+            return bool(self.rx_fifo) and self.rx_fifo[0][0] <= time.time()
+
+    def available_pipe(self):
+        """(has_payload, pipe): everything arrives on reading pipe 1."""
+        return self.available(), 1
+
+    def getDynamicPayloadSize(self):
+        with self.link.lock:
+            return len(self.rx_fifo[0][1]) if self.rx_fifo else 0
+
+    def read(self, length):
+        with self.link.lock:
+            if not self.rx_fifo:
+                return b''
+            _, payload = self.rx_fifo.popleft()
+            return payload[:length]
+
+    def testRPD(self):
+        """True while the interferer is on the air on this radio's channel."""
+        interferer = self.link.interferer
+        with self.link.lock:
+            return interferer is not None and interferer.busy(self.channel, time.time())
+
+    testCarrier = testRPD
@@ -1,101 +1,240 @@
-from RF24 import RF24
-from PIL import Image
 import time
-import camera
-from sense import read_environmental_data, read_motion_data  # Ensure this is defined
 import uuid
 import os
-
-radio = RF24(22, 0)
-radio.begin()
-radio.setChannel(76)
-radio.setPALevel(2, False)
-radio.setAutoAck(True)
-radio.enableDynamicPayloads()
-radio.enableAckPayload()
-radio.openWritingPipe(b'1Node')
-radio.stopListening()
-
-# ---------- Handshake ----------
-radio.write(b'SYNC')
-print("📡 Sent SYNC, waiting for ACK...")
-time.sleep(1)
-
-radio.startListening()
-start = time.time()
-while time.time() - start < 3:
-    if radio.available():
-        response = radio.read(radio.getDynamicPayloadSize())
-        if response == b'ACK':
-            print("🤝 ACK received, starting data loop.")
-            break
-radio.stopListening()
-
-# ---------- Continuous Loop ----------
-while True:
-    # --- Read and Send Sensor Data ---
-    timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-    env = read_environmental_data()
-    motion = read_motion_data()
-
-    sensor_text = (
-        f"{timestamp}|"
-        f"T:{env['temperature']}C|H:{env['humidity']}%|P:{env['pressure']}hPa|"
-        f"Pitch:{motion['orientation']['pitch']}|Roll:{motion['orientation']['roll']}|Yaw:{motion['orientation']['yaw']}|"
-        f"Ax:{motion['accel_raw']['x']}|Ay:{motion['accel_raw']['y']}|Az:{motion['accel_raw']['z']}|"
-        f"Gx:{motion['gyro_raw']['x']}|Gy:{motion['gyro_raw']['y']}|Gz:{motion['gyro_raw']['z']}|"
-        f"Compass:{motion['compass']}"
-    )
-
-    sensor_bytes = sensor_text.encode()
-
+import hardware
+import power
+from downlink_scheduler import DownlinkQueue, PRIORITY_IMAGE
+from dedup import FrameDeduplicator
+from telemetry_aggregator import SUMMARY_INTERVAL_S, TelemetryAggregator, readings_from
+
+# Set up by main(): importing this file touches no hardware
+radio = None
+tile_encoder = None
+frame_dedup = None
+
+# --- Downlink scheduling ---
+CONTACT_WINDOW_S = 8         # air time available per contact
+CAPTURE_INTERVAL_S = 10      # time between captures / contacts
+TELEMETRY_DEADLINE_S = 300   # telemetry older than this is no longer worth sending
+SUMMARY_DEADLINE_S = 24 * 3600
+IMAGE_DEADLINE_S = 3600
+chunk_size = 32
+OFFSET_BYTES = 4             # image chunks: [offset u32][28 data bytes]
+HANDSHAKE_TIMEOUT_S = 3
+SYNC_LISTEN_S = 0.05
+
+
+def handshake():
+    """
+    Sends SYNC until the receiver answers with ACK. Returns False on timeout.
+    receive.py answers with an ACK payload that rides on the hardware ACK of a
+    later SYNC, sat_receive.py with a packet of its own, so SYNC is repeated
+    with a short listen after each one instead of one long wait.
+    """
+    start = time.time()
+    while time.time() - start < HANDSHAKE_TIMEOUT_S:
+        radio.stopListening()
+        radio.write(b'SYNC')
+        radio.startListening()
+        listen_start = time.time()
+        while time.time() - listen_start < SYNC_LISTEN_S:
+            if radio.available():
+                if radio.read(radio.getDynamicPayloadSize()) == b'ACK':
+                    radio.stopListening()
+                    return True
+            else:
+                time.sleep(0.001)
+    radio.stopListening()
+    return False
+
+
+def send_sensor_bytes(sensor_bytes, prefix=b'SENS'):
+    """
+    Returns False as soon as a packet goes unACKed after the radio's own
+    retries: the receiver has a hole, so the whole product is sent again.
+    """
     # Send sensor prefix
-    radio.write(b'SENS')
+    if not radio.write(prefix):
+        return False
     time.sleep(0.01)
 
     # Chunk sensor data
-    chunk_size = 32
     chunks = [sensor_bytes[i:i + chunk_size] for i in range(0, len(sensor_bytes), chunk_size)]
 
     # Send number of chunks
-    radio.write(len(chunks).to_bytes(1, 'big'))
+    if not radio.write(len(chunks).to_bytes(1, 'big')):
+        return False
     time.sleep(0.01)
 
     # Send each chunk
     for i, chunk in enumerate(chunks):
         if len(chunk) < chunk_size:
             chunk += b'\x00' * (chunk_size - len(chunk))
-        radio.write(chunk)
+        if not radio.write(chunk):
+            print(f"❌ Sensor chunk {i+1}/{len(chunks)} not ACKed.")
+            return False
         print(f"Sent sensor chunk {i+1}/{len(chunks)}")
         time.sleep(0.01)
+    return True
 
-    # --- Capture & Compress Image ---
-    filename = camera.capture_photo("image.jpg")
-    img = Image.open(filename).convert("RGB").resize((2048, 2048))
-    jpeg_filename = f"/tmp/compressed_{uuid.uuid4().hex}.jpg"
-    img.save(jpeg_filename, format="JPEG", quality=50)
-
-    with open(jpeg_filename, "rb") as f:
-        jpeg_bytes = f.read()
-    os.remove(jpeg_filename)
-
-    print(f"📦 JPEG size: {len(jpeg_bytes)} bytes")
 
+def send_image_bytes(jpeg_bytes, prefix=b'IMAG', start=0, end=None):
+    """
+    Returns False as soon as a packet goes unACKed, like send_sensor_bytes().
+    start and end send only the chunks covering that byte range: a product
+    too big for one contact goes down a piece per contact, and the receiver
+    fills in the same buffer until it's whole.
+    """
     # --- Send Image Metadata ---
-    radio.write(b'IMAG')
+    if not radio.write(prefix):
+        return False
     time.sleep(0.01)
-    radio.write(len(jpeg_bytes).to_bytes(4, 'big'))
+    if not radio.write(len(jpeg_bytes).to_bytes(4, 'big')):
+        return False
     time.sleep(0.01)
 
     # --- Send Image in 32-byte Chunks ---
-    chunks = [jpeg_bytes[i:i+chunk_size] for i in range(0, len(jpeg_bytes), chunk_size)]
-
-    for i, chunk in enumerate(chunks):
-        if len(chunk) < chunk_size:
-            chunk += b'\x00' * (chunk_size - len(chunk))
-        radio.write(chunk)
+    # Each carries its byte offset, so the receiver puts it in place even if
+    # an earlier chunk was lost or repeated
+    data_size = chunk_size - OFFSET_BYTES
+    chunks = [jpeg_bytes[i:i+data_size] for i in range(0, len(jpeg_bytes), data_size)]
+    end = len(jpeg_bytes) if end is None else end
+
+    for i in range(start // data_size, -(-end // data_size)):
+        chunk = chunks[i]
+        if len(chunk) < data_size:
+            chunk += b'\x00' * (data_size - len(chunk))
+        if not radio.write((i * data_size).to_bytes(OFFSET_BYTES, 'big') + chunk):
+            print(f"❌ Image chunk {i+1}/{len(chunks)} not ACKed.")
+            return False
         print(f"📤 Sent chunk {i+1}/{len(chunks)}")
         time.sleep(0.015)
 
-    print("✅ Compressed image sent.")
-    time.sleep(10)  # Add a delay to avoid overwhelming the receiver
+    if end < len(jpeg_bytes):
+        print(f"✅ Sent bytes {start}-{end} of the image.")
+    else:
+        print("✅ Compressed image sent.")
+    return True
+
+
+def send_product(kind, payload, start=0, end=None):
+    """
+    Downlinks one queued product, or the byte range of it the queue asks for,
+    using the matching wire format.
+    """
+    if kind == 'telemetry':
+        return send_sensor_bytes(payload)
+    if kind == 'summary':
+        return send_sensor_bytes(payload, prefix=b'SUMM')
+    if kind == 'tiles':
+        delivered = send_image_bytes(payload, b'TILE', start, end)
+        # Later frames are coded against this one only once all of it is down
+        if delivered and (end is None or end >= len(payload)):
+            tile_encoder.delivered(payload)
+            frame_dedup.record_sent(len(payload))
+        return delivered
+    return send_image_bytes(payload, b'IMAG', start, end)
+
+
+def compress_image(image, size, quality):
+    img = image.convert("RGB").resize(size)
+    jpeg_filename = f"/tmp/compressed_{uuid.uuid4().hex}.jpg"
+    img.save(jpeg_filename, format="JPEG", quality=quality)
+    with open(jpeg_filename, "rb") as f:
+        jpeg_bytes = f.read()
+    os.remove(jpeg_filename)
+    return jpeg_bytes
+
+
+def main():
+    global radio, tile_encoder, frame_dedup
+    radio = power.MeteredRadio(hardware.make_radio(hardware.ROLE_SENDER))
+
+    # ---------- Handshake ----------
+    print("📡 Sending SYNC, waiting for ACK...")
+    if handshake():
+        print("🤝 ACK received, starting data loop.")
+
+    # Camera, Sense HAT, PIL and NumPy are slow to import and aren't needed
+    # until the first capture, so they're loaded after the link is up
+    from PIL import Image
+    import numpy as np
+    import camera
+    from sense import read_environmental_data, read_motion_data  # Ensure this is defined
+    from tile_codec import TileEncoder
+
+    # The radio is off between contacts; each contact is one short burst
+    duty_cycle = power.DutyCycle(radio, CAPTURE_INTERVAL_S)
+    radio.powerDown()
+    downlink_queue = DownlinkQueue()
+    frame_dedup = FrameDeduplicator()
+    tile_encoder = TileEncoder()
+    # Readings are summarised every SUMMARY_INTERVAL_S; only ones that trip a
+    # limit or anomaly rule go down raw
+    aggregator = TelemetryAggregator(window_s=SUMMARY_INTERVAL_S)
+    if downlink_queue.items:
+        print(f"📥 Resuming {len(downlink_queue.items)} deferred products from the last contact.")
+
+    # ---------- Continuous Loop ----------
+    while True:
+        # --- Read Sensor Data ---
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+        env = read_environmental_data()
+        motion = read_motion_data()
+
+        sensor_text = (
+            f"{timestamp}|"
+            f"T:{env['temperature']}C|H:{env['humidity']}%|P:{env['pressure']}hPa|"
+            f"Pitch:{motion['orientation']['pitch']}|Roll:{motion['orientation']['roll']}|Yaw:{motion['orientation']['yaw']}|"
+            f"Ax:{motion['accel_raw']['x']}|Ay:{motion['accel_raw']['y']}|Az:{motion['accel_raw']['z']}|"
+            f"Gx:{motion['gyro_raw']['x']}|Gy:{motion['gyro_raw']['y']}|Gz:{motion['gyro_raw']['z']}|"
+            f"Compass:{motion['compass']}"
+        )
+        reasons = aggregator.add(readings_from(env, motion))
+        if reasons:
+            print(f"🚨 Sending raw telemetry: {'; '.join(reasons)}")
+            downlink_queue.enqueue('telemetry', sensor_text.encode(), deadline_s=TELEMETRY_DEADLINE_S)
+        if aggregator.due():
+            summary = aggregator.summary()
+            print(f"📊 Telemetry summary: {len(summary)} bytes")
+            downlink_queue.enqueue('summary', summary, deadline_s=SUMMARY_DEADLINE_S)
+
+        # --- Capture & Compress Image ---
+        # A small thumbnail goes out ahead of the full frame so a short pass still
+        # delivers a preview of every capture.
+        filename = camera.capture_photo("image.jpg")
+        captured = Image.open(filename)
+        # Unchanged scenes are not re-encoded or re-sent
+        if frame_dedup.should_send(captured):
+            thumbnail_bytes = compress_image(captured, (128, 128), 40)
+            downlink_queue.enqueue('thumbnail', thumbnail_bytes, deadline_s=IMAGE_DEADLINE_S)
+            if not any(item['kind'] == 'tiles' for item in downlink_queue.items):
+                # Expired or lost with a restart of the queue: none of it will land
+                tile_encoder.forget_outstanding()
+            if tile_encoder.keyframe_outstanding:
+                # Nothing coded before it lands would be of use, and another
+                # keyframe would only queue behind it
+                print(f"⏳ Keyframe still going down, tiles skipped (thumbnail {len(thumbnail_bytes)} bytes)")
+            else:
+                # Only tiles that changed since the last frame go out at full quality
+                frame = np.asarray(captured.convert("RGB").resize((2048, 2048)))
+                tile_bytes = tile_encoder.encode(frame)
+                print(f"📦 Tile-coded frame: {len(tile_bytes)} bytes, diff {tile_encoder.last_diff_ms:.1f} ms "
+                      f"(thumbnail {len(thumbnail_bytes)} bytes)")
+                # A keyframe takes several contacts: it goes down a piece at a time
+                downlink_queue.enqueue('tiles', tile_bytes, priority=PRIORITY_IMAGE,
+                                       deadline_s=IMAGE_DEADLINE_S, splittable=True)
+        else:
+            print(f"♻️ Scene unchanged, skipping image. {frame_dedup.report()}")
+
+        # --- Fill this contact window, highest priority first ---
+        # Everything queued since the last contact goes out back to back in
+        # one burst, then the radio powers down until the next one.
+        with duty_cycle.burst():
+            downlink_queue.run_contact(send_product, CONTACT_WINDOW_S)
+        print(f"🔋 Radio energy: {radio.report()}")
+        duty_cycle.sleep()  # Also keeps us from overwhelming the receiver
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import struct
+import time
+from multiprocessing import shared_memory
+
+# --- Shared-memory packet ring ---
+# Single-producer / single-consumer ring of fixed-size slots in a
+# multiprocessing.shared_memory block, so the radio-reader process can hand
+# raw packets to a worker without pickling or a pipe round trip per packet.
+# The producer only writes the slots and head, the consumer only tail; each
+# side publishes its counter after the slot it covers is written or read.
+#
+# Layout: header [head u64][tail u64][high water u64][full stalls u64]
+#         then `slots` x [arrival f64][pipe u8][length u8][payload 32 bytes]
+RING_SLOTS = 4096
+PAYLOAD_SIZE = 32
+HEADER = struct.Struct('<QQQQ')
+SLOT = struct.Struct(f'<dBB{PAYLOAD_SIZE}s')
+FULL_WAIT_S = 0.0002
+
+
+class PacketRing:
+    def __init__(self, slots=RING_SLOTS, name=None):
+        """Creates a new ring, or attaches to an existing one by name."""
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=HEADER.size + slots * SLOT.size)
+            self.shm.buf[:HEADER.size] = bytes(HEADER.size)
+            self.owner = True
+        else:
+            # Workers share the creator's resource tracker, so only the creator unlinks
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.name = self.shm.name
+        self.slots = (self.shm.size - HEADER.size) // SLOT.size
+        self.buf = self.shm.buf
+
+    def _counters(self):
+        return HEADER.unpack_from(self.buf, 0)
+
+    def occupancy(self):
+        head, tail, _, _ = self._counters()
+        return head - tail
+
+    def stats(self):
+        head, tail, high_water, stalls = self._counters()
+        return {'capacity': self.slots, 'occupancy': head - tail, 'high_water': high_water,
+                'full_stalls': stalls, 'pushed': head, 'popped': tail}
+
+    # ---------- producer ----------
+    def push(self, payload, pipe=1, arrival=None):
+        """Adds a packet. Returns False if the ring is full (nothing is dropped)."""
+        head, tail, high_water, stalls = self._counters()
+        if head - tail >= self.slots:
+            struct.pack_into('<Q', self.buf, 24, stalls + 1)
+            return False
+        arrival = time.perf_counter() if arrival is None else arrival
+        SLOT.pack_into(self.buf, HEADER.size + (head % self.slots) * SLOT.size,
+                       arrival, pipe, len(payload), bytes(payload))
+        if head + 1 - tail > high_water:
+            struct.pack_into('<Q', self.buf, 16, head + 1 - tail)
+        struct.pack_into('<Q', self.buf, 0, head + 1)
+        return True
+
+    def wait_for_space(self, running=lambda: True):
+        """Blocks while the ring is full. Returns False if running() turned false first."""
+        if self.occupancy() >= self.slots:
+            head, tail, high_water, stalls = self._counters()
+            struct.pack_into('<Q', self.buf, 24, stalls + 1)
+        while self.occupancy() >= self.slots:
+            if not running():
+                return False
+            time.sleep(FULL_WAIT_S)
+        return True
+
+    # ---------- consumer ----------
+    def pop(self):
+        """Returns (arrival, pipe, payload) for the oldest packet, or None if empty."""
+        head, tail = struct.unpack_from('<QQ', self.buf, 0)
+        if head == tail:
+            return None
+        arrival, pipe, length, payload = SLOT.unpack_from(self.buf, HEADER.size + (tail % self.slots) * SLOT.size)
+        struct.pack_into('<Q', self.buf, 8, tail + 1)
+        return arrival, pipe, payload[:length]
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,174 @@
+import time
+from contextlib import contextmanager
+
+# --- Power model ---
+# nRF24L01+ supply current per radio state (datasheet, 3.3 V supply). A PA/LNA
+# module draws more in TX and RX, but the ratios between states are what
+# matter for scheduling: listening costs as much as sending, standby is ~500x
+# cheaper and power-down another ~30x below that.
+SUPPLY_V = 3.3
+CURRENT_A = {
+    'tx': 11.3e-3,          # 0 dBm
+    'rx': 13.5e-3,          # 2 Mbps
+    'standby': 26e-6,       # Standby-I
+    'power_down': 900e-9,
+}
+POWER_UP_S = 1.5e-3         # Tpd2stby: power-down to standby with the crystal running
+CPU_BUSY_W = 0.7            # extra draw of one busy Pi Zero 2 W core over idle
+
+# --- Waiting for packets ---
+POLL_S = 0.001              # sleep between polls when the IRQ line isn't wired
+IRQ_SLICE_S = 0.01          # longest single wait on the IRQ line (covers an edge missed between checks)
+
+_irq_ready = set()
+
+
+def _wait_for_irq(pin, timeout_s):
+    """Blocks until the radio's IRQ line falls or timeout_s passes."""
+    import RPi.GPIO as GPIO
+    if pin not in _irq_ready:
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+        _irq_ready.add(pin)
+    if GPIO.input(pin) == GPIO.LOW:
+        return
+    GPIO.wait_for_edge(pin, GPIO.FALLING, timeout=max(1, int(timeout_s * 1000)))
+
+
+def wait_for_packet(radio, timeout_s, irq_pin=None):
+    """
+    Waits up to timeout_s for a packet in the RX FIFO. Returns True if one is
+    available. With irq_pin the CPU sleeps on the nRF24's IRQ line
+    (see hardware.make_radio), otherwise it polls every POLL_S instead of
+    spinning on radio.available().
+    """
+    deadline = time.monotonic() + timeout_s
+    while not radio.available():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        if irq_pin is not None:
+            _wait_for_irq(irq_pin, min(remaining, IRQ_SLICE_S))
+        else:
+            time.sleep(min(POLL_S, remaining))
+    return True
+
+
+class MeteredRadio:
+    """
+    Wraps a radio (RF24 or link_sim.SimRadio) and books the time it spends in
+    each power state, so energy per delivered byte can be estimated without a
+    current probe. Everything not overridden here goes straight to the radio.
+    """
+
+    def __init__(self, radio):
+        self.radio = radio
+        self.state = 'standby'
+        self.since = time.monotonic()
+        self.seconds = dict.fromkeys(CURRENT_A, 0.0)
+        self.cpu_s = 0.0
+        self.bytes_delivered = 0
+
+    def __getattr__(self, name):
+        return getattr(self.radio, name)
+
+    def _enter(self, state):
+        now = time.monotonic()
+        self.seconds[self.state] += now - self.since
+        self.state = state
+        self.since = now
+
+    def powerUp(self):
+        self.radio.powerUp()
+        self._enter('standby')
+
+    def powerDown(self):
+        self.radio.powerDown()
+        self._enter('power_down')
+
+    def startListening(self):
+        # The nRF24 powers up on its own when it starts listening
+        self.radio.startListening()
+        self._enter('rx')
+
+    def stopListening(self):
+        self.radio.stopListening()
+        self._enter('standby')
+
+    def write(self, buf):
+        self._enter('tx')
+        try:
+            delivered = self.radio.write(buf)
+        finally:
+            self._enter('standby')
+        if delivered:
+            # Hardware-ACKed bytes, protocol headers included
+            self.bytes_delivered += len(buf)
+        return delivered
+
+    @contextmanager
+    def measure(self):
+        """Adds the CPU time this thread spends inside the with block to cpu_s."""
+        cpu_start = time.thread_time()
+        try:
+            yield self
+        finally:
+            self.cpu_s += time.thread_time() - cpu_start
+
+    def radio_joules(self):
+        self._enter(self.state)
+        return sum(self.seconds[state] * CURRENT_A[state] for state in CURRENT_A) * SUPPLY_V
+
+    def joules(self):
+        """Estimated energy so far: radio states plus the CPU time spent driving them."""
+        return self.radio_joules() + self.cpu_s * CPU_BUSY_W
+
+    def joules_per_byte(self):
+        return self.joules() / self.bytes_delivered if self.bytes_delivered else None
+
+    def report(self):
+        per_byte = self.joules_per_byte()
+        per_byte_text = f"{per_byte * 1e6:.1f} µJ/B" if per_byte is not None else "n/a"
+        times = ", ".join(f"{state} {seconds:.2f}s" for state, seconds in self.seconds.items())
+        return (f"{self.joules() * 1000:.1f} mJ for {self.bytes_delivered} B ({per_byte_text}); "
+                f"cpu {self.cpu_s * 1000:.0f} ms; {times}")
+
+
+class DutyCycle:
+    """
+    Keeps the radio powered down except during short transmit bursts, one
+    every interval_s. Work is queued between bursts and sent back to back
+    inside one, so the radio spends its powered time moving data rather than
+    idling in RX or standby between frames.
+    """
+
+    def __init__(self, radio, interval_s):
+        self.radio = radio
+        self.interval_s = interval_s
+        self.burst_start = None
+        self.bursts = 0
+
+    @contextmanager
+    def burst(self):
+        """Powers the radio up for the body of the with block, then back down."""
+        self.burst_start = time.monotonic()
+        cpu_start = time.thread_time()
+        self.radio.powerUp()
+        time.sleep(POWER_UP_S)
+        try:
+            yield self.radio
+        finally:
+            self.radio.stopListening()
+            self.radio.powerDown()
+            self.bursts += 1
+            if isinstance(self.radio, MeteredRadio):
+                self.radio.cpu_s += time.thread_time() - cpu_start
+
+    def sleep(self):
+        """Sleeps, radio off, until the next burst is due."""
+        self.radio.powerDown()
+        if self.burst_start is None:
+            return
+        remaining = self.interval_s - (time.monotonic() - self.burst_start)
+        if remaining > 0:
+            time.sleep(remaining)
@@ -0,0 +1,114 @@
+import mmap
+import tempfile
+
+# --- Receiver-side reassembly ---
+# Chunks are written straight to their place in a buffer sized for the whole
+# transfer, and a bitmap (one bit per chunk) says which have arrived, so
+# duplicates are spotted with one bit test and drops leave a hole in the
+# right place instead of shifting everything after them. Chunk numbers and
+# offsets are plain ints, so nothing wraps the way a 16-bit index does.
+# Transfers above SPILL_BYTES go into an mmap'd temporary file rather than
+# RAM; the Pi's page cache decides what stays resident.
+MAX_TRANSFER_BYTES = 256 * 1024 * 1024   # refuse lengths no sender would produce
+SPILL_BYTES = 4 * 1024 * 1024
+
+
+def expand_index(wire_index, expected, modulus):
+    """
+    Full chunk number for an index sent modulo modulus, nearest to the one
+    expected next. Works while fewer than modulus // 2 chunks are in flight.
+    """
+    index = expected + ((wire_index - expected) % modulus)
+    if index - expected >= modulus // 2:
+        index -= modulus
+    return index
+
+
+class Reassembler:
+    """
+    One transfer of total_len bytes in chunk_size pieces. add() places a
+    chunk by number and returns False for duplicates and chunks outside the
+    transfer. When the chunks aren't all chunk_size, pass how many there are
+    and give add() each one's offset.
+    """
+
+    def __init__(self, total_len, chunk_size, chunks=None, spill_bytes=SPILL_BYTES, spill_dir=None):
+        if not 0 <= total_len <= MAX_TRANSFER_BYTES:
+            raise ValueError(f"transfer length {total_len} out of range")
+        self.total_len = total_len
+        self.chunk_size = chunk_size
+        self.chunks = -(-total_len // chunk_size) if chunks is None else chunks
+        self.bitmap = bytearray((self.chunks + 7) // 8)
+        self.received = 0
+        self.duplicates = 0
+        self._file = None
+        if total_len > spill_bytes:
+            self._file = tempfile.TemporaryFile(dir=spill_dir)
+            self._file.truncate(total_len)
+            self._buffer = mmap.mmap(self._file.fileno(), total_len)
+        else:
+            self._buffer = bytearray(total_len)
+        self._view = memoryview(self._buffer)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def has(self, index):
+        return 0 <= index < self.chunks and bool(self.bitmap[index >> 3] & (1 << (index & 7)))
+
+    def add(self, index, data, offset=None):
+        if not 0 <= index < self.chunks:
+            return False
+        bit = 1 << (index & 7)
+        if self.bitmap[index >> 3] & bit:
+            self.duplicates += 1
+            return False
+        start = index * self.chunk_size if offset is None else offset
+        end = start + len(data)
+        if end > self.total_len:
+            # The last chunk's padding
+            end = max(start, self.total_len)
+            data = data[:end - start]
+        self._view[start:end] = data
+        self.bitmap[index >> 3] |= bit
+        self.received += 1
+        return True
+
+    @property
+    def complete(self):
+        return self.received == self.chunks
+
+    def missing(self):
+        """Chunk numbers not received yet, as (first, last + 1) runs."""
+        runs = []
+        start = None
+        for byte_index, byte in enumerate(self.bitmap):
+            if byte == 0xFF and start is None:
+                continue
+            for bit in range(8):
+                index = byte_index * 8 + bit
+                if index >= self.chunks:
+                    break
+                if not byte & (1 << bit):
+                    if start is None:
+                        start = index
+                elif start is not None:
+                    runs.append((start, index))
+                    start = None
+        if start is not None:
+            runs.append((start, self.chunks))
+        return runs
+
+    def data(self):
+        """The transfer so far (holes are zeros), as a view valid until close()."""
+        return self._view
+
+    def close(self):
+        self._view.release()
+        if self._file is not None:
+            self._buffer.close()
+            self._file.close()
+            self._file = None
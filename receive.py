@@ -1,173 +1,239 @@
-from RF24 import RF24
 import time
-from PIL import Image
 import uuid
 import base64
-import requests
 import os
+import io
+import hardware
+import reassembly
+import telemetry_aggregator
+import upload_sinks
 
 # ## NEW ##: Configuration for saving images locally for debugging
 IMAGE_SAVE_DIR = "received_images"
-# Create the directory if it doesn't exist
-os.makedirs(IMAGE_SAVE_DIR, exist_ok=True)
-
-
-radio = RF24(22, 0)
-radio.begin()
-radio.setChannel(76)
-radio.setPALevel(2, False) # For better range, consider RF24_PA_MAX
-radio.setAutoAck(True)
-radio.enableDynamicPayloads()
-radio.enableAckPayload()
-radio.openReadingPipe(1, b'1Node')
-radio.startListening()
-
-latest_sensor_data = None
-firebase_url = "https://fire-authentic-f5c81-default-rtdb.firebaseio.com/image_log.json"
-
-# FIX 1: Create a variable outside the loop to store the sensor data.
-# This makes it persistent, so it's not forgotten between receiving sensor and image data.
-latest_sensor_data = None
-
-print("ðŸ“¡ Waiting for SYNC...")
-while True:
-    if radio.available():
-        msg = radio.read(4)
-        if msg == b'SYNC':
-            radio.writeAckPayload(1, b'ACK')
-            print("ðŸ¤ Handshake complete.")
-            break
-
-# ---------- Main Listening Loop ----------
-while True:
-    if radio.available():
-        prefix = radio.read(4)
-
-        # ---------- SENSOR DATA ----------
-        if prefix == b'SENS':
-            while not radio.available(): time.sleep(0.001)
-            chunk_count = int.from_bytes(radio.read(1), "big")
-            print(f"Receiving {chunk_count} sensor chunks...")
-            received = bytearray()
-            for i in range(chunk_count):
+CHUNK_SIZE = 32
+OFFSET_BYTES = 4      # image chunks from newSend.py: [offset u32][28 data bytes]
+RESUMABLE_PREFIXES = (b'TILE',)  # products newSend.py splits over several contacts
+
+# Set up by main(): importing this file touches no hardware
+radio = None
+tile_decoder = None
+upload_sink = None      # captures: Firebase unless $UPLOAD_SINK says otherwise (see upload_sinks.py)
+summary_sink = None
+partial_image = None    # (prefix, length, Reassembler) of a split product waiting for its next piece
+summary_url = "https://fire-authentic-f5c81-default-rtdb.firebaseio.com/telemetry_summary.json"
+
+
+def main():
+    global radio, tile_decoder, upload_sink, summary_sink, partial_image
+    # Create the directory if it doesn't exist
+    os.makedirs(IMAGE_SAVE_DIR, exist_ok=True)
+    radio = hardware.make_radio(hardware.ROLE_RECEIVER)
+    upload_sink = upload_sinks.sink_from_env()
+    summary_sink = upload_sinks.sink_from_env(summary_url)
+
+    # FIX 1: Create a variable outside the loop to store the sensor data.
+    # This makes it persistent, so it's not forgotten between receiving sensor and image data.
+    latest_sensor_data = None
+
+    print("ðŸ“¡ Waiting for SYNC...")
+    while True:
+        if radio.available():
+            msg = radio.read(4)
+            if msg == b'SYNC':
+                radio.writeAckPayload(1, b'ACK')
+                print("ðŸ¤ Handshake complete.")
+                break
+
+    # ---------- Main Listening Loop ----------
+    while True:
+        if radio.available():
+            prefix = radio.read(4)
+
+            # ---------- SENSOR DATA ----------
+            if prefix == b'SENS':
                 while not radio.available(): time.sleep(0.001)
-                chunk = radio.read(32)
-                received.extend(chunk)
+                chunk_count = int.from_bytes(radio.read(1), "big")
+                print(f"Receiving {chunk_count} sensor chunks...")
+                received = bytearray()
+                for i in range(chunk_count):
+                    while not radio.available(): time.sleep(0.001)
+                    chunk = radio.read(32)
+                    received.extend(chunk)
             
-            try:
-                sensor_text = received.rstrip(b'\x00').decode()
-                print("\nâœ… Sensor data received:")
-                print(sensor_text)
-
-                # --- Convert to a dictionary ---
-                parts = sensor_text.split("|")
-                parsed_data = {"capture_timestamp": parts[0]}
-                for item in parts[1:]:
-                    if ':' in item:
-                        key, value_raw = item.split(":", 1)
-                        clean_key = key.strip()
-                        # Clean the value to be only numeric/decimal/negative
-                        value = ''.join(c for c in value_raw if c.isdigit() or c == '.' or c == '-')
-                        try:
-                            parsed_data[clean_key] = float(value)
-                        except (ValueError, TypeError):
-                            parsed_data[clean_key] = value_raw
+                try:
+                    sensor_text = received.rstrip(b'\x00').decode()
+                    print("\nâœ… Sensor data received:")
+                    print(sensor_text)
+
+                    # --- Convert to a dictionary ---
+                    parts = sensor_text.split("|")
+                    parsed_data = {"capture_timestamp": parts[0]}
+                    for item in parts[1:]:
+                        if ':' in item:
+                            key, value_raw = item.split(":", 1)
+                            clean_key = key.strip()
+                            # Clean the value to be only numeric/decimal/negative
+                            value = ''.join(c for c in value_raw if c.isdigit() or c == '.' or c == '-')
+                            try:
+                                parsed_data[clean_key] = float(value)
+                            except (ValueError, TypeError):
+                                parsed_data[clean_key] = value_raw
                 
-                # FIX 1 (continued): Store the parsed data in our persistent variable
-                latest_sensor_data = parsed_data
-                print("ðŸ‘ Sensor data parsed and stored for the next upload.")
+                    # FIX 1 (continued): Store the parsed data in our persistent variable
+                    latest_sensor_data = parsed_data
+                    print("ðŸ‘ Sensor data parsed and stored for the next upload.")
 
-            except Exception as e:
-                print("âŒ Failed to decode or parse sensor data:", e)
+                except Exception as e:
+                    print("âŒ Failed to decode or parse sensor data:", e)
                 
-        # ---------- IMAGE DATA ----------
-        elif prefix == b'IMAG':
-            print("\nðŸ–¼ï¸  Receiving image...")
-            while not radio.available(): time.sleep(0.001)
-            length_bytes = radio.read(4)
-            total_len = int.from_bytes(length_bytes, "big")
-            print(f"ðŸ”¥ Expected image size: {total_len} bytes")
-            chunk_count = (total_len + 31) // 32
-            
-            chunks_received = 0
-            received = bytearray()
+            # ---------- TELEMETRY SUMMARIES ----------
+            elif prefix == b'SUMM':
+                while not radio.available(): time.sleep(0.001)
+                chunk_count = int.from_bytes(radio.read(1), "big")
+                received = bytearray()
+                for i in range(chunk_count):
+                    while not radio.available(): time.sleep(0.001)
+                    received.extend(radio.read(32))
+
+                try:
+                    summary = telemetry_aggregator.decode_summary(received)
+                    print(f"\nTelemetry summary: {telemetry_aggregator.describe_summary(summary)}")
+                    summary_sink.post(dict(summary, received=time.strftime("%Y-%m-%d %H:%M:%S")))
+                except Exception as e:
+                    print("Failed to decode or upload telemetry summary:", e)
+
+            # ---------- IMAGE DATA ----------
+            elif prefix in (b'IMAG', b'TILE'):
+                print("\nðŸ–¼ï¸  Receiving image...")
+                while not radio.available(): time.sleep(0.001)
+                length_bytes = radio.read(4)
+                total_len = int.from_bytes(length_bytes, "big")
+                print(f"ðŸ”¥ Expected image size: {total_len} bytes")
+                data_size = CHUNK_SIZE - OFFSET_BYTES
+                try:
+                    chunks = reassembly.Reassembler(total_len, data_size)
+                except ValueError as e:
+                    print(f"âŒ Ignoring image: {e}")
+                    continue
+                chunk_count = chunks.chunks
+                # Settled by the first chunk: a piece that doesn't start at
+                # the top continues the product we kept the start of
+                partial, partial_image = partial_image, None
             
-            # ## NEW ##: Add a timeout to the receive loop
-            RECEPTION_TIMEOUT_S = 2.0 # 2 seconds
-            last_chunk_time = time.time()
+                # ## NEW ##: Add a timeout to the receive loop
+                RECEPTION_TIMEOUT_S = 2.0 # 2 seconds
+                last_chunk_time = time.time()
             
-            while len(received) < total_len:
-                if radio.available():
-                    chunk = radio.read(32)
-                    received.extend(chunk)
-                    chunks_received += 1
-                    print(f"Received chunk {chunks_received}/{chunk_count}", end="\r")
-                    last_chunk_time = time.time() # Reset timeout counter
+                # Chunks land at their own offset: a lost one leaves a hole
+                # in the right place and a repeated one is simply ignored
+                while not chunks.complete:
+                    if radio.available():
+                        chunk = radio.read(CHUNK_SIZE)
+                        offset = int.from_bytes(chunk[:OFFSET_BYTES], "big")
+                        if partial is not None:
+                            if offset and partial[:2] == (prefix, total_len):
+                                chunks.close()
+                                chunks = partial[2]
+                                print(f"Resuming at byte {offset} of {total_len}")
+                            else:
+                                partial[2].close()
+                            partial = None
+                        if offset % data_size == 0:
+                            chunks.add(offset // data_size, chunk[OFFSET_BYTES:])
+                        print(f"Received chunk {chunks.received}/{chunk_count}", end="\r")
+                        last_chunk_time = time.time() # Reset timeout counter
                 
-                # ## NEW ##: Check for timeout
-                if time.time() - last_chunk_time > RECEPTION_TIMEOUT_S:
-                    print(f"\nâš ï¸ Timed out waiting for image chunks after {RECEPTION_TIMEOUT_S} seconds.")
-                    break # Exit the loop if sender stops
+                    # ## NEW ##: Check for timeout
+                    if time.time() - last_chunk_time > RECEPTION_TIMEOUT_S:
+                        print(f"\nâš ï¸ Timed out waiting for image chunks after {RECEPTION_TIMEOUT_S} seconds.")
+                        break # Exit the loop if sender stops
                     
-                time.sleep(0.002)
-
-            print(f"\nðŸ“Š Reception finished. Received {len(received)} of {total_len} bytes.")
-
-            # ## NEW ##: Save the received raw data to a file for analysis, REGARDLESS of completion
-            try:
-                # Generate a unique, informative filename
-                timestamp_str = time.strftime("%Y%m%d_%H%M%S")
-                status = "complete" if len(received) >= total_len else "INCOMPLETE"
-                filename = f"{timestamp_str}_{status}_{len(received)}_of_{total_len}.jpg"
-                filepath = os.path.join(IMAGE_SAVE_DIR, filename)
+                    time.sleep(0.002)
+
+                if partial is not None:
+                    # Nothing came in; whatever we kept is still worth waiting for
+                    partial_image = partial
+                elif not chunks.complete and chunks.received and prefix in RESUMABLE_PREFIXES:
+                    partial_image = (prefix, total_len, chunks)
+                    print(f"\nGot {chunks.received}/{chunk_count} chunks, keeping them for the next piece.")
+                    continue
+
+                received = bytes(chunks.data())
+                received_len = min(total_len, chunks.received * data_size)
+                chunks.close()
+                print(f"\nðŸ“Š Reception finished. Received {received_len} of {total_len} bytes "
+                      f"({chunk_count - chunks.received} chunks missing, {chunks.duplicates} duplicates).")
+
+                # ## NEW ##: Save the received raw data to a file for analysis, REGARDLESS of completion
+                try:
+                    # Generate a unique, informative filename
+                    timestamp_str = time.strftime("%Y%m%d_%H%M%S")
+                    status = "complete" if received_len >= total_len else "INCOMPLETE"
+                    extension = "tile" if prefix == b'TILE' else "jpg"
+                    filename = f"{timestamp_str}_{status}_{received_len}_of_{total_len}.{extension}"
+                    filepath = os.path.join(IMAGE_SAVE_DIR, filename)
                 
-                with open(filepath, 'wb') as f:
-                    f.write(received)
-                print(f"ðŸ’¾ Raw image data saved for analysis to: {filepath}")
-
-            except Exception as e:
-                print(f"âŒ Error saving raw image file: {e}")
-
-
-            # --- Now, proceed with processing and uploading ---
-            try:
-                # Only proceed with upload if the image seems mostly there
-                if len(received) == 0:
-                     raise ValueError("No image data was received.")
-
-                jpeg_data = bytes(received[:total_len]) # Slice to expected length
-                print("Image data prepared for upload.")
+                    with open(filepath, 'wb') as f:
+                        f.write(received)
+                    print(f"ðŸ’¾ Raw image data saved for analysis to: {filepath}")
+
+                except Exception as e:
+                    print(f"âŒ Error saving raw image file: {e}")
+
+
+                # --- Now, proceed with processing and uploading ---
+                try:
+                    # Only proceed with upload if the image seems mostly there
+                    if received_len == 0:
+                         raise ValueError("No image data was received.")
+
+                    jpeg_data = bytes(received[:total_len]) # Slice to expected length
+                    if prefix == b'TILE':
+                        # NumPy and PIL are only loaded once a tile-coded frame shows up
+                        from PIL import Image
+                        from tile_codec import TileDecoder
+                        if tile_decoder is None:
+                            tile_decoder = TileDecoder()
+                        # Changed tiles only: composite them over the last frame we rebuilt
+                        reconstruction = tile_decoder.decode(jpeg_data)
+                        if reconstruction is None:
+                            raise ValueError("Tile update for a frame we never got, waiting for the next keyframe.")
+                        buffer = io.BytesIO()
+                        Image.fromarray(reconstruction).save(buffer, format="JPEG", quality=90)
+                        jpeg_data = buffer.getvalue()
+                    print("Image data prepared for upload.")
                 
-                # FIX 2: Convert the received image data to a Base64 string for Firebase
-                image_base64 = base64.b64encode(jpeg_data).decode('utf-8')
-
-                # Now, prepare the complete payload for Firebase
-                firebase_url = "https://fire-authentic-f5c81-default-rtdb.firebaseio.com/image_log.json"
-                
-                # FIX 1 (conclusion): Check if we have sensor data, then use it for the upload
-                if latest_sensor_data is None:
-                    print("Warning: No sensor data was received before this image. Uploading with placeholder.")
-                    latest_sensor_data = {"error": "data not received"}
-
-                data_payload = {
-                    "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-                    "sensor_readings": latest_sensor_data,
-                    "image_base64": image_base64
-                }
-
-                print("Uploading combined data to Firebase...")
-                res = requests.post(firebase_url, json=data_payload)
-
-                if res.status_code == 200:
-                    print("Uploaded to Firebase successfully!")
-                else:
-                    # Added res.text for better error debugging from Firebase
-                    print(f"Firebase error: {res.status_code}, Response: {res.text}")
+                    # FIX 2: Convert the received image data to a Base64 string for Firebase
+                    image_base64 = base64.b64encode(jpeg_data).decode('utf-8')
+
+                    # Now, prepare the complete payload for Firebase
+                    # FIX 1 (conclusion): Check if we have sensor data, then use it for the upload
+                    if latest_sensor_data is None:
+                        print("Warning: No sensor data was received before this image. Uploading with placeholder.")
+                        latest_sensor_data = {"error": "data not received"}
+
+                    data_payload = {
+                        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+                        "sensor_readings": latest_sensor_data,
+                        "image_base64": image_base64
+                    }
+
+                    print("Uploading combined data to Firebase...")
+                    try:
+                        upload_sink.post(data_payload)
+                        print("Uploaded to Firebase successfully!")
+                    except upload_sinks.UploadError as e:
+                        # The error carries Firebase's status and response text
+                        print(f"Firebase error: {e}")
                 
-                # Reset the sensor data so we don't accidentally re-use old data
-                latest_sensor_data = None
+                    # Reset the sensor data so we don't accidentally re-use old data
+                    latest_sensor_data = None
 
-            except Exception as e:
-                print("A critical error occurred during JPEG processing or Firebase upload:", e)
+                except Exception as e:
+                    print("A critical error occurred during JPEG processing or Firebase upload:", e)
         
-        print("\nReady for next data set.")
+            print("\nReady for next data set.")
+
+
+if __name__ == "__main__":
+    main()
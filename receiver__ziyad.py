@@ -1,43 +1,80 @@
-from RF24 import RF24
 import time
-from PIL import Image
-import uuid
 import base64
-import requests
 import os
+import handshake
+import hardware
+import imu_burst
+import channel_manager
+import compression
+import file_service
+import framing
+import power
+import reassembly
+import rtt
+import security
+import upload_sinks
+import uplink
+from image_pipeline import ImagePipeline
+from dedup import ContentHashCache
+from telemetry_bus import TelemetryBus
+from join_buffer import JoinBuffer, unstamp_capture
 
 # --- NEW: Configuration for Reliable Transfer ---
 CHUNK_NUM_BYTES = 2   # Use 2 bytes for the chunk index
 CHUNK_DATA_SIZE = 32 - CHUNK_NUM_BYTES # 30 bytes of data per packet
-RECEPTION_TIMEOUT_S = 5.0 # Increased timeout for waiting between chunks
+INDEX_MODULUS = 0xFFFF # chunk numbers go out modulo this; 0xFFFF marks metadata
+RECEPTION_TIMEOUT_S = 5.0 # Gap between chunks before giving up, until the real gaps are measured
+IDLE_WAIT_S = 0.1 # longest wait for a packet between passes over the command file and join buffer
+LINK_STATE_FILE = "ground_link_state.json" # sessions and transfers already accepted from the sender
+COMMAND_STATE_FILE = "ground_commands.json" # next uplink request id, so a restart doesn't reuse old ones
 
 # ## NEW ##: Configuration for saving images locally for debugging
 IMAGE_SAVE_DIR = "received_images"
-os.makedirs(IMAGE_SAVE_DIR, exist_ok=True)
 
+# Content hashes of blobs already stored/uploaded, for duplicate suppression
+content_cache = ContentHashCache()
+# ...and of sensor transfers: a record the sender resent because its last ACK
+# went missing arrives twice, byte for byte
+telemetry_cache = ContentHashCache()
 
-radio = RF24(22, 0)
-radio.begin()
-radio.setChannel(76)
-radio.setPALevel(2, False)
-radio.setAutoAck(True)
-radio.enableDynamicPayloads()
-radio.enableAckPayload()
-radio.openReadingPipe(1, b'1Node')
-radio.startListening()
+# Sensor readings and images are matched by capture id, not arrival order
+join_buffer = JoinBuffer()
 
-latest_sensor_data = None
-firebase_url = "https://fire-authentic-f5c81-default-rtdb.firebaseio.com/image_log.json"
+# Set up by main(): importing this file touches no hardware and starts nothing
+radio = None
+session = None
+channels = None
+cipher = None
+image_pipeline = None
+telemetry_bus = None
+gap_timer = None
+assembler = None
+file_receiver = None
+command_client = None
+upload_sink = None      # Firebase unless $UPLOAD_SINK says otherwise (see upload_sinks.py)
+local_offer = None      # what this receiver supports, offered back in every handshake
+handshake_started = None  # when the first SYNC of the handshake in progress was read
+last_chunk_index = None   # wire index of the last chunk of the legacy transfer just completed
 
 # --- NEW: Reliable Receive Function ---
-def receive_reliable_payload(data_type_name="Data"):
+def receive_reliable_payload(data_type_name="Data", prefix=None):
     """
     Receives a payload that was sent in reliable, indexed chunks.
+    prefix is the metadata packet that announced it: repeats of it (our ACK
+    was lost) are re-ACKed rather than taken for the chunk count.
     Returns the complete byte array on success, or None on failure.
     """
+    global last_chunk_index
     # 1. Wait for the chunk count metadata packet
     print(f"Waiting for chunk count for {data_type_name}...")
+    # The sender only sends it once our ACK for the prefix is back
+    gap_timer.start()
     num_chunks_bytes = receive_reliable_chunk(-1, "Chunk Count")
+    while (not num_chunks_bytes or num_chunks_bytes == prefix) and not gap_timer.expired():
+        power.wait_for_packet(radio, gap_timer.timeout, hardware.RADIO_IRQ_PIN)
+        num_chunks_bytes = receive_reliable_chunk(-1, "Chunk Count")
+    if num_chunks_bytes == prefix:
+        num_chunks_bytes = None
     if not num_chunks_bytes:
         print(f"❌ Timed out waiting for chunk count. Aborting {data_type_name} reception.")
         return None
@@ -48,170 +85,513 @@ def receive_reliable_payload(data_type_name="Data"):
     if num_chunks == 0:
         return bytearray() # Handle zero-length data
 
-    # 2. Receive all the data chunks
-    received_chunks = {}
-    last_chunk_time = time.time()
-    
-    while len(received_chunks) < num_chunks:
-        # Receive one chunk with its index
-        chunk_tuple = receive_reliable_chunk(len(received_chunks), "Data") # Expecting next chunk
-        
-        if chunk_tuple:
-            chunk_index, chunk_data = chunk_tuple
-            
-            # If it's a new chunk, store it
-            if chunk_index not in received_chunks:
-                received_chunks[chunk_index] = chunk_data
-                print(f"Received {data_type_name} chunk {chunk_index+1}/{num_chunks}", end="\r")
-            
-            # Always reset the timeout when any valid packet is received
-            last_chunk_time = time.time()
-        
-        # Check for overall timeout
-        if time.time() - last_chunk_time > RECEPTION_TIMEOUT_S:
-            print(f"\n⚠️ Timed out waiting for next chunk after {RECEPTION_TIMEOUT_S}s.")
-            return None
+    # 2. Receive all the data chunks, each written straight into place.
+    # The 16-bit index on the wire is widened back to the full chunk number,
+    # so transfers aren't limited to 65535 chunks
+    gap_timer.start()
+    with reassembly.Reassembler(num_chunks * CHUNK_DATA_SIZE, CHUNK_DATA_SIZE) as chunks:
+        while not chunks.complete:
+            # Receive one chunk with its index
+            chunk_tuple = receive_reliable_chunk(chunks.received, "Data") # Expecting next chunk
 
-    print(f"\n✅ All {num_chunks} chunks for {data_type_name} received.")
-    
-    # 3. Reassemble the payload from sorted chunks
-    full_payload = bytearray()
-    for i in range(num_chunks):
-        full_payload.extend(received_chunks[i])
-        
-    return full_payload
+            if chunk_tuple:
+                wire_index, chunk_data = chunk_tuple
+                chunk_index = reassembly.expand_index(wire_index, chunks.received, INDEX_MODULUS)
+
+                # Duplicates (our ACK was lost) are recognised from the bitmap
+                if chunks.add(chunk_index, chunk_data):
+                    print(f"Received {data_type_name} chunk {chunk_index+1}/{num_chunks}", end="\r")
+                    if chunks.received % 32 == 0 or chunks.complete:
+                        telemetry_bus.publish('progress', {
+                            'transfer': data_type_name, 'received': chunks.received, 'total': num_chunks,
+                        })
+
+                # Always reset the timeout when any valid packet is received
+                gap_timer.heard()
+
+            # Give up once the gap is longer than the sender would keep retrying at this pace
+            if gap_timer.expired():
+                print(f"\n⚠️ Timed out waiting for next chunk after {gap_timer.timeout:.2f}s.")
+                return None
+
+        print(f"\n✅ All {num_chunks} chunks for {data_type_name} received.")
+        last_chunk_index = (num_chunks - 1) % INDEX_MODULUS
+        return bytearray(chunks.data())
 
 def receive_reliable_chunk(expected_index, log_prefix):
     """
     Waits for a single chunk, sends an ACK, and returns the (index, data).
     An expected_index of -1 is for metadata packets.
     """
+    global last_chunk_index
     if radio.available():
-        payload = radio.read(32)
+        payload = radio.read(radio.getDynamicPayloadSize())
+
+        # Between transfers: the sender may be starting a new contact.
+        # Mid transfer b'SY' is just a chunk index
+        if expected_index == -1 and handle_sync(payload):
+            return None
+        handshake_delivered()
+
+        # HOP commands are confirmed by the hardware ACK alone
+        if channels.handle_packet(payload):
+            return None
         
         # Parse the chunk index from the start of the payload
         received_index = int.from_bytes(payload[:CHUNK_NUM_BYTES], 'big')
         
-        # Prepare the ACK: b'ACK' + index (2 bytes)
-        ack_payload = b'ACK' + received_index.to_bytes(2, 'big')
-        
-        # Load the ACK payload to be sent back automatically by the radio
-        radio.writeAckPayload(1, ack_payload)
-        
         # For metadata (like total chunk count), which has a special index
         if received_index == 65535 and expected_index == -1:
+            last_chunk_index = None
+            send_chunk_ack(received_index)
             print(f"  ✅ ACK sent for {log_prefix}")
             return payload[CHUNK_NUM_BYTES:CHUNK_NUM_BYTES+4] # Return the 4-byte count
 
         # For regular data chunks
         elif received_index < 65535 and expected_index != -1:
             # This is a data chunk. Return its index and data.
+            # Duplicates of past chunks (our ACK was likely lost) are
+            # re-ACKed here and dropped by the caller's reassembler
+            send_chunk_ack(received_index)
             chunk_data = payload[CHUNK_NUM_BYTES:]
-            if received_index < expected_index:
-                # This is a duplicate of a past chunk, our ACK was likely lost.
-                # The ACK has already been sent, so we just ignore the data.
-                pass # print(f"  (Got duplicate for #{received_index}, re-ACKed)")
             return received_index, chunk_data
+
+        # Repeats of what we already took, because our ACK went missing:
+        # the chunk count once data is flowing, or the last chunk of the
+        # transfer that just finished. Anything else stays unACKed
+        elif received_index == 65535 or received_index == last_chunk_index:
+            send_chunk_ack(received_index)
+            return None
     
+    # Nothing heard for a while on a hopped channel: meet the sender back home
+    channels.check_resync()
     return None # No chunk available
 
-# ---------- Handshake (Same as before) ----------
-print("📡 Waiting for SYNC...")
-while True:
-    if radio.available():
-        msg = radio.read(4)
-        if msg == b'SYNC':
-            # Send ACK for the SYNC
-            radio.writeAckPayload(1, b'ACK')
-            print("🤝 Handshake complete.")
-            break
-    time.sleep(0.01)
-
-# ---------- Main Listening Loop ----------
-while True:
+def send_chunk_ack(index):
+    """
+    Loads b'ACK' + the 2-byte index to be sent back automatically by the
+    radio with the next packet, with the next uplink command riding along.
+    Only for an index we accepted: the sender takes it as delivered.
+    """
+    radio.writeAckPayload(1, b'ACK' + index.to_bytes(2, 'big') + command_client.tail())
+
+def receive_framed_transfer():
+    """
+    Compact framing (framing.py): reads frames until a whole transfer is in.
+    Returns a framing.Transfer, or None if nothing started or the sender went
+    quiet part way through.
+    """
+    while True:
+        if not radio.available():
+            # Nothing heard for a while on a hopped channel: meet the sender back home
+            channels.check_resync()
+            if not assembler.in_progress:
+                return None
+            if gap_timer.expired():
+                print(f"\n⚠️ Timed out waiting for next frame after {gap_timer.timeout:.2f}s.")
+                assembler.reset()
+                return None
+            power.wait_for_packet(radio, IDLE_WAIT_S, hardware.RADIO_IRQ_PIN)
+            continue
+
+        # Frames are only as long as their content
+        payload = radio.read(radio.getDynamicPayloadSize())
+        # 'S' is the unused frame kind 0x40, so a SYNC can't be mistaken for a frame
+        if handle_sync(payload):
+            return None
+        handshake_delivered()
+        if channels.handle_packet(payload):
+            continue
+        ack, transfer = assembler.feed(payload)
+        if ack is None:
+            continue
+        radio.writeAckPayload(1, ack + command_client.tail())
+        if payload[0] & framing.KIND_MASK == framing.KIND_START:
+            gap_timer.start()
+        else:
+            gap_timer.heard()
+        if transfer is not None:
+            print(f"\n📦 Framing: {framing.describe(transfer.prefix, len(transfer.data), transfer.frames, transfer.header_bytes)}")
+            return transfer
+        if assembler.in_progress:
+            print(f"Received {assembler.received}/{assembler.length} bytes of {assembler.prefix.decode(errors='replace')}", end="\r")
+            if assembler.frames % 32 == 0:
+                telemetry_bus.publish('progress', {
+                    'transfer': assembler.prefix.decode(errors='replace'), 'received': assembler.received,
+                    'total': assembler.length,
+                })
+
+def open_transfer(data, prefix):
+    """
+    Verifies and decrypts a sealed transfer, then undoes its compression.
+    Returns None if it doesn't authenticate or doesn't decompress.
+    """
+    if session.caps & handshake.CAP_AEAD:
+        try:
+            data = cipher.open(data, prefix)
+        except security.AuthenticationError as e:
+            print(f"🚫 Dropping {prefix.decode()} transfer that failed authentication: {e}")
+            return None
+    if session.caps & handshake.CAP_COMPRESSION:
+        try:
+            data = compression.decompress(data)
+        except ValueError as e:
+            print(f"❌ Dropping {prefix.decode()} transfer that failed to decompress: {e}")
+            return None
+    return data
+
+def upload_record(record):
+    """Uploads one capture: its sensor readings and/or its image."""
+    sensor_readings = record['sensor']
+    image = record['image']
+    if sensor_readings is None:
+        print("⚠️ No sensor data arrived for this image. Uploading with placeholder.")
+        sensor_readings = {"error": "data not received"}
+
+    data_payload = {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "capture_id": record['capture_id'],
+        "capture_timestamp": record['capture_time'],
+        "sensor_readings": sensor_readings,
+    }
+    if image is not None:
+        duplicate_of = image['duplicate_of']
+        data_payload["image_sha256"] = image['hash']
+        if duplicate_of is None or duplicate_of["firebase_key"] is None:
+            data_payload["image_base64"] = base64.b64encode(image['bytes']).decode('utf-8')
+        else:
+            data_payload["image_ref"] = duplicate_of["firebase_key"]
+
+
+    def uploaded(firebase_key, error):
+        # Right away, or once the batch this went out in was written
+        if error is not None:
+            print(f"❌ Failed to upload: {error}")
+        else:
+            print(f"Uploaded as {firebase_key}")
+        if image is not None and (image['duplicate_of'] is None or image['duplicate_of']["firebase_key"] is None):
+            content_cache.store(image['hash'], {"file": image['file'], "firebase_key": firebase_key})
+
+    print("⬆️  Uploading capture...")
+    upload_sink.post(data_payload, uploaded)
+
+
+def flush_expired_captures():
+    for record in join_buffer.expire():
+        missing = 'image' if record['image'] is None else 'sensor data'
+        print(f"⌛ Capture {record['capture_id']} timed out without its {missing}, uploading what we have.")
+        upload_record(record)
+
+
+def open_session():
+    """
+    Scans the band, then answers the first valid SYNC. Returns the SessionConfig.
+    Later SYNCs are answered from the main loop (handle_sync).
+    With a shared link key only tagged SYNCs are answered and every transfer
+    must open under the key; anything injected by another radio is dropped.
+    """
+    global cipher, local_offer
+    link_key = security.load_key()
+    cipher = security.LinkCipher(link_key, LINK_STATE_FILE) if link_key else None
+    if cipher is None:
+        print(f"⚠️ No link key in ${security.KEY_ENV} or {security.KEY_FILE}, accepting plaintext.")
+
+    # Channels that look quiet from here; the hop set is what both ends agree on
+    print("📶 Scanning the band...")
+    channel_mask = channel_manager.quiet_channel_mask(channel_manager.cached_scan(radio))
+    radio.startListening()
+
+    # What this receiver supports, offered back during the handshake
+    local_offer = handshake.parse_offer(handshake.build_offer(
+        caps=(handshake.CAP_ACK_PAYLOAD | handshake.CAP_INDEXED_CHUNKS | handshake.CAP_CHANNEL_HOPPING
+              | handshake.CAP_COMPACT_FRAMING | handshake.CAP_COMPRESSION | (handshake.CAP_AEAD if cipher else 0)),
+        max_window=1,
+        codecs=compression.available_codecs(),
+        rates=(handshake.RF24_1MBPS,),
+        preferred_rate=handshake.RF24_1MBPS,
+        channel_mask=channel_mask,
+    ))
+
+    print("📡 Waiting for SYNC...")
+    while True:
+        if radio.available():
+            config = answer_sync(radio.read(radio.getDynamicPayloadSize()))
+            if config is not None:
+                return config
+        time.sleep(0.01)
+
+
+def answer_sync(packet):
+    """
+    Answers a SYNC offer with the configuration both ends will use, as the
+    ACK payload for the sender's next SYNC. Returns the SessionConfig, or
+    None if packet isn't a SYNC (or isn't tagged under our key).
+    """
+    global handshake_started
+    heard = time.perf_counter()
+    if cipher:
+        packet = cipher.verify_offer(packet)
+        if packet is None:
+            print("🚫 Ignoring SYNC without a valid tag for a new session.")
+            return None
+    remote_offer = handshake.parse_offer(packet)
+    if remote_offer is None:
+        return None
+    if handshake_started is None:
+        handshake_started = heard
+    config = handshake.select_config(local_offer, remote_offer)
+    # Send the chosen configuration back as the ACK for the SYNC
+    reply = handshake.build_reply(config)
+    radio.writeAckPayload(1, cipher.sign_control(reply) if cipher else reply)
+    print(f"🤝 Handshake answered: {handshake.describe(config)}")
+    return config
+
+
+def handshake_delivered():
+    """
+    Called for each packet that isn't a SYNC. The sender only moves on once
+    it has our reply, so the first one ends the handshake: negotiation is
+    timed from the first SYNC to here, like the sender's SYNC-to-reply time.
+    """
+    global handshake_started
+    if handshake_started is None:
+        return
+    negotiation_ms = (time.perf_counter() - handshake_started) * 1000
+    handshake_started = None
+    print(f"🤝 Handshake complete in {negotiation_ms:.1f} ms (first SYNC to first packet of the session)")
+
+
+def start_session(config):
+    """Switches the link over to a newly negotiated session."""
+    global session, channels, assembler
+    session = config
+    channels = channel_manager.ChannelManager.from_session(
+        radio, session, cipher=cipher if session.caps & handshake.CAP_AEAD else None)
+    # Frame numbers start again from 0 every session; a transfer cut off by
+    # the sender restarting is dropped
+    if assembler is not None:
+        assembler.reset()
+    assembler = framing.FrameAssembler()
+    command_client.cipher = cipher if session.caps & handshake.CAP_AEAD else None
+
+
+def handle_sync(payload):
+    """
+    A sender starting its next contact sends SYNC again; this receiver keeps
+    running between contacts, so it renegotiates in place, as
+    ground_station.py does. Returns True if payload was a SYNC.
+    """
+    if bytes(payload[:4]) != b'SYNC':
+        return False
+    config = answer_sync(payload)
+    if config is not None:
+        start_session(config)
+    return True
+
+
+def main():
+    global radio, image_pipeline, telemetry_bus, gap_timer, file_receiver, command_client
+    global upload_sink
+    os.makedirs(IMAGE_SAVE_DIR, exist_ok=True)
+    os.makedirs(imu_burst.IMU_SAVE_DIR, exist_ok=True)
+    upload_sink = upload_sinks.sink_from_env()
+
+    # Logs and files the satellite sends back on request, resumed across passes
+    file_receiver = file_service.FileReceiver()
+
+    # Decoding, validation and thumbnails run in worker processes so the radio
+    # loop goes straight back to listening after each image is saved.
+    image_pipeline = ImagePipeline()
+
+    # Local pub/sub so dashboards next to the receiver see readings without Firebase
+    telemetry_bus = TelemetryBus()
+    telemetry_bus.start()
+
+    radio = hardware.make_radio(hardware.ROLE_RECEIVER, channel=channel_manager.HOME_CHANNEL)
+
+    # Commands for the satellite ride on our ACK payloads. Incomplete
+    # downloads are asked for again first; long paths have to go in the
+    # satellite's request file by hand
+    command_client = uplink.CommandClient(state_path=COMMAND_STATE_FILE)
+    for request in file_receiver.pending_requests():
+        line = file_service.format_request(request)
+        try:
+            command_client.submit(f"FILE {line}")
+        except ValueError:
+            print(f"📁 Incomplete download; add to {file_service.REQUEST_FILE} on the satellite: {line}")
+    # Learns the chunk pace over the session, so a dead sender is noticed in
+    # well under a second instead of RECEPTION_TIMEOUT_S
+    gap_timer = rtt.GapTimer(RECEPTION_TIMEOUT_S)
+    start_session(open_session())
+
+    # ---------- Main Listening Loop ----------
     print("\n---------------------------------")
     print("Ready for next data prefix...")
+    while True:
+        flush_expired_captures()
+        # Operators queue commands by writing them to the command file
+        if command_client.submit_file():
+            print(f"🛰️ {command_client.pending} commands queued for the satellite.")
+
+        # Wait for a prefix 'SENS' or 'IMAG'
+        framed = None
+        if session.caps & handshake.CAP_COMPACT_FRAMING:
+            # The prefix and exact length come in the transfer's START frame
+            framed = receive_framed_transfer()
+            prefix_bytes = framed.prefix if framed else None
+        else:
+            prefix_bytes = receive_reliable_chunk(-1, "Prefix")
     
-    # Wait for a prefix 'SENS' or 'IMAG'
-    prefix_bytes = receive_reliable_chunk(-1, "Prefix")
-    
-    if not prefix_bytes:
-        # print("...(listening)...")
-        time.sleep(0.1)
-        continue
+        if not prefix_bytes:
+            # Back as soon as a packet lands: the sender only retries each
+            # frame for so long (rtt.MIN_PATIENCE_S) before it gives up
+            power.wait_for_packet(radio, IDLE_WAIT_S, hardware.RADIO_IRQ_PIN)
+            continue
 
-    prefix = prefix_bytes.rstrip(b'\x00')
+        prefix = prefix_bytes.rstrip(b'\x00')
 
-    # ---------- SENSOR DATA ----------
-    if prefix == b'SENS':
-        print("\n--- Receiving Sensor Data ---")
-        sensor_bytes = receive_reliable_payload("Sensor Data")
-        
-        if sensor_bytes is not None:
-            try:
-                sensor_text = sensor_bytes.rstrip(b'\x00').decode()
-                print("\n✅ Sensor data received and reassembled:")
-                print(sensor_text)
-
-                parts = sensor_text.split("|")
-                parsed_data = {"capture_timestamp": parts[0]}
-                for item in parts[1:]:
-                    if ':' in item:
-                        key, value_raw = item.split(":", 1)
-                        value = ''.join(c for c in value_raw if c.isdigit() or c == '.' or c == '-')
-                        try:
-                            parsed_data[key.strip()] = float(value)
-                        except (ValueError, TypeError):
-                            parsed_data[key.strip()] = value_raw
+        # ---------- SENSOR DATA ----------
+        if prefix == b'SENS':
+            print("\n--- Receiving Sensor Data ---")
+            sensor_bytes = framed.data if framed else receive_reliable_payload("Sensor Data", prefix_bytes)
+            duplicate_of = None
+            if sensor_bytes is not None:
+                sensor_bytes = open_transfer(sensor_bytes, prefix)
+            if sensor_bytes is not None:
+                sensor_hash, duplicate_of = telemetry_cache.lookup(sensor_bytes)
+
+            if duplicate_of is not None:
+                print(f"♻️ Sensor data for capture {duplicate_of['capture_id']} received again, not uploading it twice. "
+                      f"{telemetry_cache.report()}")
+            elif sensor_bytes is not None:
+                try:
+                    capture_id, capture_time, sensor_bytes = unstamp_capture(sensor_bytes)
+                    # Only fixed-index chunks are NUL padded; framed transfers have an exact length
+                    sensor_text = (sensor_bytes if framed else sensor_bytes.rstrip(b'\x00')).decode()
+                    print("\n✅ Sensor data received and reassembled:")
+                    print(sensor_text)
+
+                    parts = sensor_text.split("|")
+                    parsed_data = {"capture_timestamp": parts[0]}
+                    for item in parts[1:]:
+                        if ':' in item:
+                            key, value_raw = item.split(":", 1)
+                            value = ''.join(c for c in value_raw if c.isdigit() or c == '.' or c == '-')
+                            try:
+                                parsed_data[key.strip()] = float(value)
+                            except (ValueError, TypeError):
+                                parsed_data[key.strip()] = value_raw
                 
-                latest_sensor_data = parsed_data
-                print("👍 Sensor data parsed and stored for the next upload.")
+                    telemetry_bus.publish('sensor', dict(parsed_data, capture_id=capture_id))
+                    record = join_buffer.add('sensor', capture_id, capture_time, parsed_data)
+                    telemetry_cache.store(sensor_hash, {'capture_id': capture_id})
+                    if record is not None:
+                        upload_record(record)
+                    else:
+                        print(f"👍 Sensor data for capture {capture_id} parsed, waiting for its image.")
 
-            except Exception as e:
-                print(f"❌ Failed to decode or parse sensor data: {e}")
-        else:
-            print("❌ Sensor data reception failed.")
+                except Exception as e:
+                    print(f"❌ Failed to decode or parse sensor data: {e}")
+            else:
+                print("❌ Sensor data reception failed.")
             
-    # ---------- IMAGE DATA ----------
-    elif prefix == b'IMAG':
-        print("\n--- Receiving Image Data ---")
-        image_bytes = receive_reliable_payload("Image Data")
-        
-        if image_bytes is not None:
-            total_len = len(image_bytes)
-            print(f"📊 Reception finished. Received {total_len} bytes.")
-
-            try:
-                timestamp_str = time.strftime("%Y%m%d_%H%M%S")
-                filename = f"{timestamp_str}_complete_{total_len}.jpg"
-                filepath = os.path.join(IMAGE_SAVE_DIR, filename)
-                with open(filepath, 'wb') as f:
-                    f.write(image_bytes)
-                print(f"💾 Raw image data saved to: {filepath}")
-            except Exception as e:
-                print(f"❌ Error saving raw image file: {e}")
-
-            try:
-                image_base64 = base64.b64encode(image_bytes).decode('utf-8')
-
-                if latest_sensor_data is None:
-                    print("⚠️ No sensor data was received before this image. Uploading with placeholder.")
-                    latest_sensor_data = {"error": "data not received"}
-
-                data_payload = {
-                    "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-                    "sensor_readings": latest_sensor_data,
-                    "image_base64": image_base64
-                }
-
-                print("⬆️  Uploading combined data to Firebase...")
-                res = requests.post(firebase_url, json=data_payload)
-                print("Firebase Response:", res.status_code, res.text)
-                
-                # Reset sensor data so it isn't accidentally re-used
-                latest_sensor_data = None
+        # ---------- IMAGE DATA ----------
+        elif prefix == b'IMAG':
+            print("\n--- Receiving Image Data ---")
+            image_bytes = framed.data if framed else receive_reliable_payload("Image Data", prefix_bytes)
+            if image_bytes is not None:
+                image_bytes = open_transfer(image_bytes, prefix)
 
-            except Exception as e:
-                print(f"A critical error occurred during processing or Firebase upload: {e}")
-        else:
-            print("❌ Image data reception failed.")
+            if image_bytes is not None:
+                capture_id, capture_time, image_bytes = unstamp_capture(image_bytes)
+            if image_bytes is not None and join_buffer.has('image', capture_id):
+                # Resent because our last ACK went missing: it's stored, and
+                # maybe uploaded with its sensor data already
+                print(f"♻️ Image for capture {capture_id} received again, not storing or uploading it twice.")
+            elif image_bytes is not None:
+                total_len = len(image_bytes)
+                print(f"📊 Reception finished. Received {total_len} bytes.")
+                telemetry_bus.publish('image', {'bytes': total_len, 'capture_id': capture_id})
+
+                # Identical blobs (the sender re-sending an unchanged scene) are
+                # stored and uploaded once; later copies just reference the first.
+                image_hash, duplicate_of = content_cache.lookup(image_bytes)
+                filepath = duplicate_of["file"] if duplicate_of else None
+
+                if duplicate_of is None:
+                    try:
+                        timestamp_str = time.strftime("%Y%m%d_%H%M%S")
+                        filename = f"{timestamp_str}_complete_{total_len}.jpg"
+                        filepath = os.path.join(IMAGE_SAVE_DIR, filename)
+                        with open(filepath, 'wb') as f:
+                            f.write(image_bytes)
+                        print(f"💾 Raw image data saved to: {filepath}")
+                        image_pipeline.submit(filepath)
+                    except Exception as e:
+                        print(f"❌ Error saving raw image file: {e}")
+                    # Known from now on, so a copy arriving before this one is uploaded isn't stored twice
+                    content_cache.store(image_hash, {"file": filepath, "firebase_key": None})
+                else:
+                    print(f"♻️ Duplicate of {filepath}, not storing it again. {content_cache.report()}")
+
+                image = {'bytes': image_bytes, 'hash': image_hash, 'duplicate_of': duplicate_of, 'file': filepath}
+                record = join_buffer.add('image', capture_id, capture_time, image)
+                if record is not None:
+                    upload_record(record)
+                else:
+                    print(f"🖼️ Image for capture {capture_id} stored, waiting for its sensor data.")
+            else:
+                print("❌ Image data reception failed.")
+
+        # ---------- IMU BURSTS ----------
+        elif prefix == b'IMUB':
+            data = framed.data if framed else receive_reliable_payload("IMU Burst", prefix_bytes)
+            if data is not None:
+                data = open_transfer(data, prefix)
+            if data is not None:
+                try:
+                    capture_id, capture_time, data = unstamp_capture(data)
+                    burst = imu_burst.decode_burst(data)
+                    filepath = os.path.join(imu_burst.IMU_SAVE_DIR, f"{time.strftime('%Y%m%d_%H%M%S')}_{capture_id}.csv")
+                    imu_burst.save_csv(burst, filepath)
+                    print(f"\n📈 IMU burst for capture {capture_id}: {burst.describe()}, saved to {filepath}")
+                    telemetry_bus.publish('imu', dict(burst.stats(), capture_id=capture_id, file=filepath))
+                except (OSError, ValueError) as e:
+                    print(f"❌ Failed to decode or store IMU burst: {e}")
+            else:
+                print("❌ IMU burst reception failed.")
+
+        # ---------- COMMAND RESPONSES ----------
+        elif prefix == b'RESP':
+            data = framed.data if framed else receive_reliable_payload("Responses", prefix_bytes)
+            if data is not None:
+                data = open_transfer(data, prefix)
+            if data is not None:
+                for line in command_client.handle_responses(data):
+                    print(f"🛰️ {line}")
+
+        # ---------- FILE SERVICE (listings, manifests, file pieces) ----------
+        elif prefix in file_service.KINDS:
+            kind = file_service.KINDS[prefix]
+            data = framed.data if framed else receive_reliable_payload(kind, prefix_bytes)
+            if data is not None:
+                data = open_transfer(data, prefix)
+            if data is not None:
+                try:
+                    print(f"\n📁 {file_receiver.handle(prefix, data)}")
+                except (OSError, ValueError) as e:
+                    print(f"❌ Failed to store {kind}: {e}")
+            else:
+                print(f"❌ {kind} reception failed.")
+
+        print("\n---------------------------------")
+        print("Ready for next data prefix...")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    finally:
+        # Documents still waiting for a batch to fill go out before we exit
+        if upload_sink is not None:
+            upload_sink.close()
@@ -0,0 +1,105 @@
+import time
+
+# --- Retransmission timeouts from measured round trips ---
+# Smoothed RTT and RTT variance as in TCP (RFC 6298): every valid sample
+# updates SRTT and RTTVAR, and the timeout is SRTT + 4 * RTTVAR, clamped to
+# [min_rto, max_rto]. Each expiry doubles the timeout until the next valid
+# sample. Senders use it for ACK waits; receivers feed it the gaps between
+# chunks to decide when a sender has given up on a transfer.
+ALPHA = 1 / 8
+BETA = 1 / 4
+K = 4
+# RFC 6298's G: the smallest margin over SRTT. What limits us is not the clock
+# but how late either end notices a packet (power.POLL_S plus Python scheduling)
+CLOCK_GRANULARITY_S = 0.005
+MIN_RTO_S = 0.005
+MAX_RTO_S = 1.0
+SENDER_RETRIES = 5          # retries the senders make per chunk before giving up
+# ...but never before this long has passed: between transfers a receiver
+# stops polling while it saves and hands off what just came in
+MIN_PATIENCE_S = 1.0
+# So a receiver never gives up on a gap shorter than that plus the longest
+# wait for the last retry's ACK: a transfer it drops the sender must see fail
+MIN_GAP_TIMEOUT_S = MIN_PATIENCE_S + MAX_RTO_S
+
+
+class RttEstimator:
+    def __init__(self, initial_rto=0.2, min_rto=MIN_RTO_S, max_rto=MAX_RTO_S):
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.srtt = None
+        self.rttvar = None
+        self.base_rto = initial_rto
+        self.backoff = 0
+        self.samples = 0
+        self.timeouts = 0
+
+    def sample(self, rtt):
+        """Folds in one round trip and clears any backoff."""
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - BETA) * self.rttvar + BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - ALPHA) * self.srtt + ALPHA * rtt
+        self.base_rto = min(self.max_rto, max(self.min_rto, self.srtt + max(CLOCK_GRANULARITY_S, K * self.rttvar)))
+        self.backoff = 0
+        self.samples += 1
+
+    @property
+    def rto(self):
+        """Current timeout in seconds, including backoff."""
+        return min(self.max_rto, self.base_rto * (2 ** self.backoff))
+
+    def expired(self):
+        """The timer ran out: back off until the next valid sample."""
+        self.backoff += 1
+        self.timeouts += 1
+
+    def patience(self, retries=SENDER_RETRIES):
+        """How long a sender using this timeout keeps retrying before it gives up."""
+        return sum(min(self.max_rto, self.base_rto * (2 ** attempt)) for attempt in range(retries + 1))
+
+    def describe(self):
+        if self.srtt is None:
+            return f"rto={self.rto * 1000:.1f}ms (no samples)"
+        return (f"srtt={self.srtt * 1000:.1f}ms rttvar={self.rttvar * 1000:.1f}ms rto={self.rto * 1000:.1f}ms "
+                f"samples={self.samples} timeouts={self.timeouts}")
+
+
+class GapTimer:
+    """
+    Receiver side: learns the usual gap between chunks of a transfer and
+    gives up waiting once the gap is longer than the sender's whole retry
+    budget would take at that pace, instead of a fixed multi-second wait.
+    Never less than MIN_GAP_TIMEOUT_S, though: senders keep retrying for
+    MIN_PATIENCE_S however fast the link is, and a receiver that resets
+    before they give up drops a transfer that was about to recover.
+    """
+
+    def __init__(self, initial_timeout, min_timeout=MIN_GAP_TIMEOUT_S, max_timeout=None):
+        self.estimator = RttEstimator(initial_rto=initial_timeout)
+        self.initial_timeout = max(initial_timeout, min_timeout)
+        self.min_timeout = min_timeout
+        self.max_timeout = max(self.initial_timeout if max_timeout is None else max_timeout, min_timeout)
+        self.last = None
+
+    def start(self, now=None):
+        """A new transfer began: gaps are only measured within one transfer."""
+        self.last = time.time() if now is None else now
+
+    def heard(self, now=None):
+        now = time.time() if now is None else now
+        if self.last is not None:
+            self.estimator.sample(now - self.last)
+        self.last = now
+
+    @property
+    def timeout(self):
+        if self.estimator.srtt is None:
+            return self.initial_timeout
+        return min(self.max_timeout, max(self.min_timeout, self.estimator.patience()))
+
+    def expired(self, now=None):
+        now = time.time() if now is None else now
+        return self.last is not None and now - self.last > self.timeout
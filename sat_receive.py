@@ -1,163 +1,199 @@
 import time
 import uuid
 import base64
-import requests
 import os
-from RF24 import RF24
+import framing
+import handshake
+import hardware
+import rtt
+import upload_sinks
 
 # --- Radio Setup ---
-radio = RF24(22, 0)
-radio.begin()
-radio.setChannel(76)
-radio.setPALevel(2)
-radio.setAutoAck(True)
-radio.enableDynamicPayloads()
-radio.enableAckPayload()
-radio.openReadingPipe(1, b'1Node')
-radio.startListening()
+# Built in main() (see hardware.make_radio) so importing this file has no
+# hardware side effects.
+radio = None
+CHUNK_TIMEOUT_S = 2.0    # gap between image packets before giving up, until the real gaps are measured
 
 # --- Global variables ---
-latest_sensor_data = None
-firebase_url = "https://fire-authentic-f5c81-default-rtdb.firebaseio.com/image_log.json" # YOUR FIREBASE URL
-
-# ---------- 1. Handshake ----------
-print("Waiting for SYNC...")
-while True:
-    if radio.available():
-        msg = radio.read(4)
-        if msg == b'SYNC':
-            radio.stopListening()
-            radio.write(b'ACK')
-            radio.startListening()
-            print("Handshake complete.")
-            break
-    time.sleep(0.1)
-
-# ---------- 2. Main Listening Loop ----------
-print("\nReady for data...")
-while True:
-    if radio.available():
-        prefix = radio.read(4)
-
-        # ---------- SENSOR DATA ----------
-        if prefix == b'SENS':
-            print("\n--- Receiving Sensor Data ---")
-            while not radio.available(): time.sleep(0.001)
-            chunk_count = int.from_bytes(radio.read(1), "big")
-            received = bytearray()
-            for i in range(chunk_count):
+upload_sink = None   # Firebase unless $UPLOAD_SINK says otherwise (see upload_sinks.py)
+
+# What this receiver can do: explicit ACK packets only, either data rate,
+# and exact-length sensor transfers.
+local_offer = handshake.parse_offer(handshake.build_offer(
+    caps=handshake.CAP_COMPACT_FRAMING,
+    max_window=1,
+    codecs=handshake.CODEC_RAW,
+    rates=(handshake.RF24_1MBPS, handshake.RF24_2MBPS),
+    preferred_rate=handshake.RF24_2MBPS,
+))
+
+def main():
+    global radio, upload_sink
+    radio = hardware.make_radio(hardware.ROLE_RECEIVER, lna=True)
+    upload_sink = upload_sinks.sink_from_env()
+    latest_sensor_data = None
+    # Learns how fast image packets arrive, so a sender that gave up is noticed
+    # after its retry budget at that pace rather than a fixed CHUNK_TIMEOUT_S
+    gap_timer = rtt.GapTimer(CHUNK_TIMEOUT_S)
+
+    # ---------- 1. Handshake ----------
+    print("Waiting for SYNC...")
+    first_sync = None
+    while True:
+        if radio.available():
+            msg = radio.read(radio.getDynamicPayloadSize())
+            remote_offer = handshake.parse_offer(msg)
+            if remote_offer is not None:
+                # Timed from the first SYNC heard to our reply being delivered,
+                # undelivered replies and the sender's retries included
+                if first_sync is None:
+                    first_sync = time.perf_counter()
+                session = handshake.select_config(local_offer, remote_offer)
+                radio.stopListening()
+                delivered = radio.write(handshake.build_reply(session))
+                radio.startListening()
+                if not delivered:
+                    # The sender never saw our choice, so stay on the current rate
+                    # and wait for it to retry the SYNC.
+                    continue
+                radio.setDataRate(session.data_rate)
+                negotiation_ms = (time.perf_counter() - first_sync) * 1000
+                print(f"Handshake complete in {negotiation_ms:.1f} ms: {handshake.describe(session)}")
+                break
+        time.sleep(0.1)
+
+    # ---------- 2. Main Listening Loop ----------
+    print("\nReady for data...")
+    while True:
+        if radio.available():
+            prefix = radio.read(4)
+
+            # ---------- SENSOR DATA ----------
+            if prefix == b'SENS':
+                print("\n--- Receiving Sensor Data ---")
                 while not radio.available(): time.sleep(0.001)
-                chunk = radio.read(32)
-                received.extend(chunk)
+                compact = session.caps & handshake.CAP_COMPACT_FRAMING
+                if compact:
+                    # Exact length, and the last chunk is only as long as it needs to be
+                    sensor_len, _ = framing.decode_varint(radio.read(radio.getDynamicPayloadSize()))
+                    chunk_count = (sensor_len + 31) // 32
+                else:
+                    chunk_count = int.from_bytes(radio.read(1), "big")
+                received = bytearray()
+                for i in range(chunk_count):
+                    while not radio.available(): time.sleep(0.001)
+                    chunk = radio.read(radio.getDynamicPayloadSize() if compact else 32)
+                    received.extend(chunk)
             
-            try:
-                sensor_text = received.rstrip(b'\x00').decode()
-                print("Sensor data received:", sensor_text)
-                parts = sensor_text.split("|")
-                parsed_data = {"capture_timestamp": parts[0]}
-                for item in parts[1:]:
-                    if ':' in item:
-                        key, value_raw = item.split(":", 1)
-                        clean_key = key.strip()
-                        value = ''.join(c for c in value_raw if c.isdigit() or c == '.' or c == '-')
-                        try:
-                            parsed_data[clean_key] = float(value)
-                        except (ValueError, TypeError):
-                            parsed_data[clean_key] = value_raw
-                latest_sensor_data = parsed_data
-                print("Sensor data parsed and stored.")
-            except Exception as e:
-                print("Failed to decode or parse sensor data:", e)
+                try:
+                    sensor_text = (bytes(received[:sensor_len]) if compact else received.rstrip(b'\x00')).decode()
+                    print("Sensor data received:", sensor_text)
+                    parts = sensor_text.split("|")
+                    parsed_data = {"capture_timestamp": parts[0]}
+                    for item in parts[1:]:
+                        if ':' in item:
+                            key, value_raw = item.split(":", 1)
+                            clean_key = key.strip()
+                            value = ''.join(c for c in value_raw if c.isdigit() or c == '.' or c == '-')
+                            try:
+                                parsed_data[clean_key] = float(value)
+                            except (ValueError, TypeError):
+                                parsed_data[clean_key] = value_raw
+                    latest_sensor_data = parsed_data
+                    print("Sensor data parsed and stored.")
+                except Exception as e:
+                    print("Failed to decode or parse sensor data:", e)
         
-        # ---------- RELIABLE IMAGE RECEIVER ----------
-        elif prefix == b'IMAG':
-            print("\n--- Receiving Image ---")
-            radio.stopListening()
-            radio.write(b'ACK_IMAG')
-            radio.startListening()
-
-            # Wait for size packet
-            start_time = time.time()
-            while not radio.available():
-                if time.time() - start_time > 2.0:
-                    print("Timed out waiting for image size.")
-                    break
-                time.sleep(0.01)
-            
-            if not radio.available(): continue
-
-            # We have the size, read it and ACK
-            length_bytes = radio.read(4)
-            total_len = int.from_bytes(length_bytes, "big")
-            print(f"Expected image size: {total_len} bytes")
-            radio.stopListening()
-            radio.write(b'ACK_SIZE')
-            radio.startListening()
-            
-            # Prepare to receive chunks
-            received_data = bytearray()
-            chunk_count = (total_len + 31) // 32
-            
-            for i in range(chunk_count):
-                start_time = time.time()
+            # ---------- RELIABLE IMAGE RECEIVER ----------
+            elif prefix == b'IMAG':
+                print("\n--- Receiving Image ---")
+                radio.stopListening()
+                radio.write(b'ACK_IMAG')
+                radio.startListening()
+
+                # Wait for size packet
+                gap_timer.start()
                 while not radio.available():
-                    if time.time() - start_time > 2.0:
-                        print(f"\nTimed out waiting for chunk {i+1}/{chunk_count}")
+                    if gap_timer.expired():
+                        print("Timed out waiting for image size.")
                         break
                     time.sleep(0.01)
-                
-                if not radio.available(): break
-
-                chunk = radio.read(32)
-                received_data.extend(chunk)
-                print(f"Received chunk {i+1}/{chunk_count}", end="\r")
+            
+                if not radio.available(): continue
 
-                ack_payload = f"ACK{i}".encode()
+                # We have the size, read it and ACK
+                length_bytes = radio.read(4)
+                gap_timer.heard()
+                total_len = int.from_bytes(length_bytes, "big")
+                print(f"Expected image size: {total_len} bytes")
                 radio.stopListening()
-                radio.write(ack_payload)
+                radio.write(b'ACK_SIZE')
                 radio.startListening()
             
-            # Wait for DONE signal
-            print("\nWaiting for DONE signal...")
-            start_time = time.time()
-            done_received = False
-            while time.time() - start_time < 2.0:
-                if radio.available():
-                    if radio.read(4) == b'DONE':
-                        radio.stopListening()
-                        radio.write(b'ACK_DONE')
-                        radio.startListening()
-                        print("Transfer complete signal received.")
-                        done_received = True
-                        break
+                # Prepare to receive chunks
+                received_data = bytearray()
+                chunk_count = (total_len + 31) // 32
+            
+                for i in range(chunk_count):
+                    while not radio.available():
+                        if gap_timer.expired():
+                            print(f"\nTimed out waiting for chunk {i+1}/{chunk_count} after {gap_timer.timeout:.2f}s")
+                            break
+                        time.sleep(0.01)
+                
+                    if not radio.available(): break
 
-            if done_received and len(received_data) >= total_len:
-                print("Image data fully received. Processing...")
-                jpeg_data = bytes(received_data[:total_len])
-                image_base64 = base64.b64encode(jpeg_data).decode('utf-8')
+                    chunk = radio.read(32)
+                    gap_timer.heard()
+                    received_data.extend(chunk)
+                    print(f"Received chunk {i+1}/{chunk_count}", end="\r")
+
+                    ack_payload = f"ACK{i}".encode()
+                    radio.stopListening()
+                    radio.write(ack_payload)
+                    radio.startListening()
+            
+                # Wait for DONE signal
+                print("\nWaiting for DONE signal...")
+                done_received = False
+                while not gap_timer.expired():
+                    if radio.available():
+                        if radio.read(4) == b'DONE':
+                            radio.stopListening()
+                            radio.write(b'ACK_DONE')
+                            radio.startListening()
+                            print("Transfer complete signal received.")
+                            done_received = True
+                            break
+
+                if done_received and len(received_data) >= total_len:
+                    print("Image data fully received. Processing...")
+                    jpeg_data = bytes(received_data[:total_len])
+                    image_base64 = base64.b64encode(jpeg_data).decode('utf-8')
                 
-                if latest_sensor_data is None:
-                    print("Warning: No sensor data. Uploading with placeholder.")
-                    latest_sensor_data = {"error": "data not received"}
+                    if latest_sensor_data is None:
+                        print("Warning: No sensor data. Uploading with placeholder.")
+                        latest_sensor_data = {"error": "data not received"}
 
-                data_payload = {
-                    "upload_timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-                    "sensor_readings": latest_sensor_data,
-                    "image_base64": image_base64
-                }
+                    data_payload = {
+                        "upload_timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+                        "sensor_readings": latest_sensor_data,
+                        "image_base64": image_base64
+                    }
 
-                print("Uploading combined data to Firebase...")
-                try:
-                    res = requests.post(firebase_url, json=data_payload, timeout=10)
-                    if res.status_code == 200:
+                    print("Uploading combined data to Firebase...")
+                    try:
+                        upload_sink.post(data_payload)
                         print("✅✅✅ Uploaded to Firebase successfully! ✅✅✅")
-                    else:
-                        print(f"Firebase error: {res.status_code}, Response: {res.text}")
-                except requests.exceptions.RequestException as e:
-                    print(f"Failed to upload to Firebase: {e}")
+                    except upload_sinks.UploadError as e:
+                        print(f"Failed to upload to Firebase: {e}")
                 
-                latest_sensor_data = None
-            else:
-                print("Transfer failed or did not complete correctly.")
+                    latest_sensor_data = None
+                else:
+                    print("Transfer failed or did not complete correctly.")
         
-        print("\nReady for next data set...")
+            print("\nReady for next data set...")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,19 @@
 import time
 import uuid
 import os
-from RF24 import RF24
-from PIL import Image
+import framing
+import handshake
+import hardware
+import power
+import rtt
 # --- MOCK FUNCTIONS for testing ---
 # Replace these with your actual camera and sense hat libraries
-def capture_photo(filename):
-    """Mocks capturing a photo. Creates a dummy image."""
-    try:
-        from picamera import PiCamera
-        with PiCamera() as camera:
-            camera.resolution = (640, 480)
-            camera.start_preview()
-            time.sleep(2) # Camera warm-up time
-            camera.capture(filename)
-            camera.stop_preview()
+def capture_photo(filename, camera=None):
+    """Captures a photo with a warmed-up hardware.CameraWarmup, or creates a dummy image."""
+    if camera is not None and camera.capture(filename):
         print(f"Photo captured and saved to {filename}")
-    except ImportError:
+    else:
+        from PIL import Image
         print("picamera library not found. Creating a dummy image for testing.")
         dummy_img = Image.new('RGB', (640, 480), color = 'red')
         dummy_img.save(filename, 'JPEG')
@@ -25,8 +22,7 @@ def capture_photo(filename):
 def read_environmental_data():
     """Mocks reading environmental data from Sense HAT."""
     try:
-        from sense_hat import SenseHat
-        sense = SenseHat()
+        sense = hardware.sense_hat()
         return {
             'temperature': round(sense.get_temperature(), 2),
             'humidity': round(sense.get_humidity(), 2),
@@ -39,8 +35,7 @@ def read_environmental_data():
 def read_motion_data():
     """Mocks reading motion data from Sense HAT."""
     try:
-        from sense_hat import SenseHat
-        sense = SenseHat()
+        sense = hardware.sense_hat()
         o = sense.get_orientation()
         a = sense.get_accelerometer_raw()
         g = sense.get_gyroscope_raw()
@@ -62,112 +57,181 @@ def read_motion_data():
 # --- END MOCK FUNCTIONS ---
 
 # --- Radio Setup ---
-# This is for a Raspberry Pi.
-# CE Pin: GPIO22 (Pin 15)
-# CSN Pin: GPIO8 (Pin 24, SPI CE0)
-radio = RF24(22, 0)
-radio.begin()
-radio.setChannel(76)
-radio.setPALevel(2) # Use RF24_PA_MAX for nRF24L01+PA+LNA modules
-radio.setAutoAck(True)
-radio.enableDynamicPayloads()
-radio.enableAckPayload()
-radio.openWritingPipe(b'1Node')
-radio.stopListening()
+# Built in main() (see hardware.make_radio) so importing this file has no
+# hardware side effects.
+radio = None
+session = None
+CHUNK_SIZE = 32
+ACK_TIMEOUT_S = 0.2          # until the first measured round trip
+# sat_receive sleeps 10 ms between polls, so an ACK can take that long on top of the air time
+MIN_ACK_TIMEOUT_S = 0.02
+ack_timer = rtt.RttEstimator(initial_rto=ACK_TIMEOUT_S, min_rto=MIN_ACK_TIMEOUT_S)
 
 def send_reliably(payload, ack_payload):
     """Sends a payload and waits for a specific ACK from the receiver."""
     radio.stopListening()
     retries = 5
     for i in range(retries):
+        sent_at = time.time()
         radio.write(payload)
         radio.startListening()
-        start_time = time.time()
-        while time.time() - start_time < 0.2: # 200ms timeout for ACK
-            if radio.available():
-                response = radio.read(radio.getDynamicPayloadSize())
-                if response == ack_payload:
-                    radio.stopListening()
-                    return True # Success!
+        deadline = sent_at + ack_timer.rto
+        # Sleeps between checks (or on the IRQ line) instead of spinning the CPU
+        while power.wait_for_packet(radio, deadline - time.time(), hardware.RADIO_IRQ_PIN):
+            response = radio.read(radio.getDynamicPayloadSize())
+            if response == ack_payload:
+                radio.stopListening()
+                # Karn's rule: after a retry the ACK may answer either copy, so don't time it
+                if i == 0:
+                    ack_timer.sample(time.time() - sent_at)
+                return True # Success!
         radio.stopListening()
+        ack_timer.expired()
         print(f"Timeout waiting for {ack_payload.decode()}, retry {i+1}/{retries}")
     return False # Failed after all retries
 
-# ---------- 1. Handshake ----------
-print("Attempting handshake...")
-if not send_reliably(b'SYNC', b'ACK'):
-    print("Handshake failed. Aborting.")
-    exit()
-print("Handshake complete.")
-time.sleep(1)
-
-# ---------- 2. Read and Send Sensor Data (Fire-and-forget for speed) ----------
-print("\n--- Sending Sensor Data ---")
-timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-env = read_environmental_data()
-motion = read_motion_data()
-
-sensor_text = (
-    f"{timestamp}|"
-    f"T:{env['temperature']}C|H:{env['humidity']}%|P:{env['pressure']}hPa|"
-    f"Pitch:{motion['orientation']['pitch']}|Roll:{motion['orientation']['roll']}|Yaw:{motion['orientation']['yaw']}"
-)
-sensor_bytes = sensor_text.encode()
-
-radio.write(b'SENS')
-time.sleep(0.01)
-
-chunk_size = 32
-chunks = [sensor_bytes[i:i + chunk_size] for i in range(0, len(sensor_bytes), chunk_size)]
-
-radio.write(len(chunks).to_bytes(1, 'big'))
-time.sleep(0.01)
-
-for i, chunk in enumerate(chunks):
-    if len(chunk) < chunk_size:
-        chunk += b'\x00' * (chunk_size - len(chunk))
-    radio.write(chunk)
+def negotiate_session(offer, retries=5):
+    """Sends the SYNC capability offer and returns the SessionConfig the receiver chose."""
+    radio.stopListening()
+    for i in range(retries):
+        sent_at = time.time()
+        radio.write(offer)
+        radio.startListening()
+        deadline = sent_at + ack_timer.rto
+        while power.wait_for_packet(radio, deadline - time.time(), hardware.RADIO_IRQ_PIN):
+            config = handshake.parse_reply(radio.read(radio.getDynamicPayloadSize()))
+            if config is not None:
+                radio.stopListening()
+                # The handshake round trip seeds the chunk timeout
+                if i == 0:
+                    ack_timer.sample(time.time() - sent_at)
+                return config
+        radio.stopListening()
+        ack_timer.expired()
+        print(f"Timeout waiting for handshake ACK, retry {i+1}/{retries}")
+    return None
+
+def send_sensor_data():
+    """Reads the Sense HAT and sends the reading fire-and-forget."""
+    print("\n--- Sending Sensor Data ---")
+    timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+    env = read_environmental_data()
+    motion = read_motion_data()
+
+    sensor_text = (
+        f"{timestamp}|"
+        f"T:{env['temperature']}C|H:{env['humidity']}%|P:{env['pressure']}hPa|"
+        f"Pitch:{motion['orientation']['pitch']}|Roll:{motion['orientation']['roll']}|Yaw:{motion['orientation']['yaw']}"
+    )
+    sensor_bytes = sensor_text.encode()
+
+    radio.write(b'SENS')
     time.sleep(0.01)
-print("Sensor data sent.")
-time.sleep(1) # Give receiver time to process
-
-# ---------- 3. RELIABLE IMAGE TRANSFER ----------
-print("\n--- Starting Reliable Image Transfer ---")
-# IMPORTANT: Use a SMALL image for testing this protocol!
-filename = "image_to_send.jpg"
-capture_photo(filename)
-img = Image.open(filename).convert("RGB").resize((160, 120), Image.LANCZOS)
-jpeg_filename = f"/tmp/compressed_{uuid.uuid4().hex}.jpg"
-img.save(jpeg_filename, format="JPEG", quality=40)
-
-with open(jpeg_filename, "rb") as f:
-    jpeg_bytes = f.read()
-os.remove(jpeg_filename)
-os.remove(filename)
-print(f"Image size: {len(jpeg_bytes)} bytes")
-
-# Announce image transfer
-if not send_reliably(b'IMAG', b'ACK_IMAG'):
-    print("Receiver did not acknowledge image request. Aborting.")
-    exit()
-
-# Send image size
-size_payload = len(jpeg_bytes).to_bytes(4, 'big')
-if not send_reliably(size_payload, b'ACK_SIZE'):
-    print("Receiver did not acknowledge image size. Aborting.")
-    exit()
-print("Receiver ready for image data.")
-
-# Send Image in Confirmed Chunks
-chunks = [jpeg_bytes[i:i+chunk_size] for i in range(0, len(jpeg_bytes), chunk_size)]
-
-for i, chunk in enumerate(chunks):
-    ack_needed = f"ACK{i}".encode()
-    print(f"Sending chunk {i+1}/{len(chunks)}...", end="\r")
-    if not send_reliably(chunk, ack_needed):
-        print(f"\nFAILED to send chunk {i+1}. Aborting transfer.")
-        break
-else:
+
+    chunks = [sensor_bytes[i:i + CHUNK_SIZE] for i in range(0, len(sensor_bytes), CHUNK_SIZE)]
+    compact = session is not None and session.caps & handshake.CAP_COMPACT_FRAMING
+
+    if compact:
+        # Exact length instead of a chunk count, so the last chunk goes out unpadded
+        radio.write(framing.encode_varint(len(sensor_bytes)))
+    else:
+        radio.write(len(chunks).to_bytes(1, 'big'))
+    time.sleep(0.01)
+
+    for i, chunk in enumerate(chunks):
+        if len(chunk) < CHUNK_SIZE and not compact:
+            chunk += b'\x00' * (CHUNK_SIZE - len(chunk))
+        radio.write(chunk)
+        time.sleep(0.01)
+    print("Sensor data sent.")
+
+
+def send_image(camera=None):
+    """Captures a small image and sends it stop-and-wait. Returns True on success."""
+    from PIL import Image
+
+    print("\n--- Starting Reliable Image Transfer ---")
+    # IMPORTANT: Use a SMALL image for testing this protocol!
+    filename = "image_to_send.jpg"
+    capture_photo(filename, camera)
+    img = Image.open(filename).convert("RGB").resize((160, 120), Image.LANCZOS)
+    jpeg_filename = f"/tmp/compressed_{uuid.uuid4().hex}.jpg"
+    img.save(jpeg_filename, format="JPEG", quality=40)
+
+    with open(jpeg_filename, "rb") as f:
+        jpeg_bytes = f.read()
+    os.remove(jpeg_filename)
+    os.remove(filename)
+    print(f"Image size: {len(jpeg_bytes)} bytes")
+
+    # Announce image transfer
+    if not send_reliably(b'IMAG', b'ACK_IMAG'):
+        print("Receiver did not acknowledge image request. Aborting.")
+        return False
+
+    # Send image size
+    size_payload = len(jpeg_bytes).to_bytes(4, 'big')
+    if not send_reliably(size_payload, b'ACK_SIZE'):
+        print("Receiver did not acknowledge image size. Aborting.")
+        return False
+    print("Receiver ready for image data.")
+
+    # Send Image in Confirmed Chunks
+    chunks = [jpeg_bytes[i:i+CHUNK_SIZE] for i in range(0, len(jpeg_bytes), CHUNK_SIZE)]
+
+    for i, chunk in enumerate(chunks):
+        ack_needed = f"ACK{i}".encode()
+        print(f"Sending chunk {i+1}/{len(chunks)}...", end="\r")
+        if not send_reliably(chunk, ack_needed):
+            print(f"\nFAILED to send chunk {i+1}. Aborting transfer.")
+            return False
     print(f"\nAll {len(chunks)} chunks sent and acknowledged!")
     if send_reliably(b'DONE', b'ACK_DONE'):
         print("✅✅✅ Transfer complete. ✅✅✅")
+        return True
+    return False
+
+
+def main():
+    global radio, session, ack_timer
+    # The camera warms up in the background while the radio is set up and
+    # the handshake runs, instead of before the first packet goes out.
+    camera = hardware.CameraWarmup()
+    radio = power.MeteredRadio(hardware.make_radio(hardware.ROLE_SENDER, lna=True))
+    ack_timer = rtt.RttEstimator(initial_rto=ACK_TIMEOUT_S, min_rto=MIN_ACK_TIMEOUT_S)
+    try:
+        # ---------- 1. Handshake ----------
+        # This sender only does stop-and-wait with explicit ACK packets, so the main
+        # thing to agree on is the fastest data rate both radios are happy with.
+        print("Attempting handshake...")
+        setup_start = time.perf_counter()
+        session = negotiate_session(handshake.build_offer(
+            caps=handshake.CAP_COMPACT_FRAMING,
+            max_window=1,
+            codecs=handshake.CODEC_RAW,
+            rates=(handshake.RF24_1MBPS, handshake.RF24_2MBPS),
+            preferred_rate=handshake.RF24_2MBPS,
+        ))
+        if session is None:
+            print("Handshake failed. Aborting.")
+            return
+        radio.setDataRate(session.data_rate)
+        negotiation_ms = (time.perf_counter() - setup_start) * 1000
+        print(f"Handshake complete in {negotiation_ms:.1f} ms: {handshake.describe(session)}")
+        time.sleep(1)
+
+        with radio.measure():
+            send_sensor_data()
+        time.sleep(1) # Give receiver time to process
+        with radio.measure():
+            send_image(camera)
+    finally:
+        camera.close()
+        # Nothing more to send this run: drop the radio to ~1 µA
+        radio.powerDown()
+        print(f"🔋 Radio energy: {radio.report()}")
+        print(f"⏱️ ACK timing: {ack_timer.describe()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import struct
+from collections import OrderedDict
+
+# --- Link security: authenticated encryption per transfer ---
+# A per-packet nonce and tag would eat half of a 32-byte payload, so instead
+# each whole transfer (one sensor reading, one image) is sealed as a block:
+# encrypted with a BLAKE2b keystream and authenticated with a truncated
+# BLAKE2b MAC, encrypt-then-MAC. The nonce is the sender's boot id plus a
+# transfer counter, so it never repeats under one key and the receiver can
+# reject replays. The boot id is a counter kept in the state file and synced
+# to disk before it is used: random 32-bit ids would collide after some 2^16
+# restarts and repeat a keystream. Short control packets (handshake, HOP,
+# uplink commands) get a 4-byte tag.
+#
+# Sealed block: [magic 'AE'][boot id u32][seq u32][length u32][ciphertext][tag 8]
+# Both ends share a 32-byte key, as hex in $LINK_KEY or in KEY_FILE.
+#
+# Every tag is bound to the session: each SYNC offer carries the next value
+# of the sender's persisted session counter (only its low byte goes on air,
+# the receiver works out the rest from the last one it accepted) and the
+# receiver only takes offers from there on. Control tags and sealed blocks
+# made in an earlier session don't verify in a later one, so recorded
+# packets can't be replayed into it. The counters and the replay window are
+# kept in a state file, so restarting either end doesn't reopen them.
+KEY_FILE = "link.key"
+KEY_ENV = "LINK_KEY"
+BLOCK_MAGIC = b'AE'
+BLOCK_HEADER = struct.Struct('>2sIII')
+TAG_BYTES = 8            # per block: forging needs ~2^64 tries, each a full transfer
+CONTROL_TAG_BYTES = 4    # handshake packets only have a few spare bytes
+KEYSTREAM_BLOCK = 64
+REPLAY_WINDOW = 64       # sender boot ids remembered
+BOOT_ID_MASK = 0xFFFFFFFF
+SESSION_LOOKAHEAD = 16   # how many times 256 sessions a sender may get ahead (handshakes nobody heard)
+
+
+class AuthenticationError(Exception):
+    pass
+
+
+def load_key(path=KEY_FILE):
+    """Returns the shared link key, or None if neither $LINK_KEY nor the key file is set up."""
+    text = os.environ.get(KEY_ENV)
+    if text is None and os.path.exists(path):
+        with open(path) as f:
+            text = f.read()
+    if not text:
+        return None
+    key = bytes.fromhex(text.strip())
+    if len(key) < 16:
+        raise ValueError(f"Link key must be at least 16 bytes, got {len(key)}")
+    return key
+
+
+def _subkey(key, purpose):
+    return hashlib.blake2b(key, digest_size=32, person=b'nrf24-' + purpose).digest()
+
+
+def _keystream_xor(key, nonce, data):
+    """XORs data with BLAKE2b(key, nonce || counter) blocks."""
+    if not data:
+        return b''
+    stream = b''.join(
+        hashlib.blake2b(nonce + counter.to_bytes(8, 'big'), key=key, digest_size=KEYSTREAM_BLOCK).digest()
+        for counter in range((len(data) + KEYSTREAM_BLOCK - 1) // KEYSTREAM_BLOCK)
+    )
+    # One big-int XOR is much faster than a per-byte loop in Python
+    mixed = int.from_bytes(data, 'little') ^ int.from_bytes(stream[:len(data)], 'little')
+    return mixed.to_bytes(len(data), 'little')
+
+
+class LinkCipher:
+    """
+    Seals and opens transfer blocks and tags control packets under one shared
+    key. state_path keeps the boot and session counters and the replay window
+    across restarts; each end needs its own. Without one the boot id is
+    random, which is only safe for a handful of runs under one key.
+    """
+
+    def __init__(self, key, state_path=None):
+        self.enc_key = _subkey(key, b'enc')
+        self.mac_key = _subkey(key, b'mac')
+        self.ctl_key = _subkey(key, b'ctl')
+        self.boot_id = None              # taken from the boot counter at the first seal
+        self.seq = 0
+        self.last_seen = OrderedDict()   # boot id -> highest seq opened
+        self.rejected = 0
+        self.state_path = state_path
+        self.boots = 0                   # boot ids handed out (sender side)
+        self.sessions = 0                # offers made (sender side)
+        self.peer_sessions = 0           # latest offer accepted (receiver side)
+        self.session = 0                 # what every tag is bound to
+        self._load()
+
+    def _load(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+            self.boots = int(state.get('boots', 0))
+            self.sessions = int(state.get('sessions', 0))
+            self.peer_sessions = int(state.get('peer_sessions', 0))
+            self.last_seen = OrderedDict((int(boot_id), int(seq)) for boot_id, seq in state.get('last_seen', []))
+        except (OSError, ValueError, TypeError) as e:
+            print(f"⚠️ {self.state_path} unreadable, starting from fresh link state: {e}")
+
+    def _save(self):
+        if not self.state_path:
+            return
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'boots': self.boots, 'sessions': self.sessions, 'peer_sessions': self.peer_sessions,
+                       'last_seen': list(self.last_seen.items())}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.state_path)
+
+    def _next_boot(self):
+        """Moves to a boot id no block has been sealed under, and restarts seq."""
+        if self.state_path:
+            self.boots += 1
+            # On disk before any block uses it, so a crash can't hand it out twice
+            self._save()
+            self.boot_id = self.boots & BOOT_ID_MASK
+        else:
+            self.boot_id = secrets.randbits(32)
+        self.seq = 0
+
+    def _tag(self, header, associated_data, ciphertext):
+        mac = hashlib.blake2b(key=self.mac_key, digest_size=TAG_BYTES)
+        mac.update(self.session.to_bytes(8, 'big'))
+        mac.update(header)
+        mac.update(associated_data)
+        mac.update(ciphertext)
+        return mac.digest()
+
+    def seal(self, plaintext, associated_data=b''):
+        """
+        Encrypts and authenticates one transfer. associated_data (e.g. the
+        SENS/IMAG prefix) is authenticated but not sent.
+        """
+        if self.boot_id is None or self.seq >= 0xFFFFFFFF:
+            # Never reuse a nonce: start a new boot id instead
+            self._next_boot()
+        self.seq += 1
+        header = BLOCK_HEADER.pack(BLOCK_MAGIC, self.boot_id, self.seq, len(plaintext))
+        ciphertext = _keystream_xor(self.enc_key, header[2:10], bytes(plaintext))
+        return header + ciphertext + self._tag(header, associated_data, ciphertext)
+
+    def open(self, block, associated_data=b''):
+        """
+        Verifies and decrypts a sealed block. Trailing padding from the
+        chunked transfer is ignored. Raises AuthenticationError on a bad tag,
+        a malformed block or a replay.
+        """
+        block = bytes(block)
+        if len(block) < BLOCK_HEADER.size + TAG_BYTES or block[:2] != BLOCK_MAGIC:
+            self.rejected += 1
+            raise AuthenticationError("not a sealed block")
+        _, boot_id, seq, length = BLOCK_HEADER.unpack_from(block)
+        end = BLOCK_HEADER.size + length
+        if len(block) < end + TAG_BYTES:
+            self.rejected += 1
+            raise AuthenticationError("sealed block is truncated")
+        header = block[:BLOCK_HEADER.size]
+        ciphertext = block[BLOCK_HEADER.size:end]
+        if not hmac.compare_digest(block[end:end + TAG_BYTES], self._tag(header, associated_data, ciphertext)):
+            self.rejected += 1
+            raise AuthenticationError("bad tag")
+        if seq <= self.last_seen.get(boot_id, 0):
+            self.rejected += 1
+            raise AuthenticationError(f"replayed block {boot_id:08x}/{seq}")
+        # Only remember the sequence once the tag checked out
+        self.last_seen[boot_id] = seq
+        self.last_seen.move_to_end(boot_id)
+        if len(self.last_seen) > REPLAY_WINDOW:
+            self.last_seen.popitem(last=False)
+        self._save()
+        return _keystream_xor(self.enc_key, header[2:10], ciphertext)
+
+    def _control_tag(self, session, body):
+        return hmac.new(self.ctl_key, session.to_bytes(8, 'big') + body, 'blake2b').digest()[:CONTROL_TAG_BYTES]
+
+    def sign_offer(self, packet):
+        """
+        Starts a new session from this end: appends the low byte of the next
+        session counter and a tag to a SYNC offer. Repeat the returned packet
+        as often as needed; the next call starts another session.
+        """
+        self.sessions += 1
+        self._save()
+        self.session = self.sessions
+        packet = bytes(packet) + bytes([self.session & 0xFF])
+        return packet + self._control_tag(self.session, packet)
+
+    def verify_offer(self, packet):
+        """
+        Returns a SYNC offer without its session byte and tag, and moves to
+        its session, or returns None if the tag doesn't match a session from
+        the latest accepted one on. Repeats of the latest one are accepted:
+        the sender sends every offer until it hears the answer.
+        """
+        packet = bytes(packet)
+        body, tag = packet[:-CONTROL_TAG_BYTES], packet[-CONTROL_TAG_BYTES:]
+        if len(body) < 2:
+            self.rejected += 1
+            return None
+        session = self.peer_sessions + ((body[-1] - self.peer_sessions) & 0xFF)
+        for _ in range(SESSION_LOOKAHEAD):
+            if hmac.compare_digest(tag, self._control_tag(session, body)):
+                self.peer_sessions = self.session = session
+                self._save()
+                return body[:-1]
+            session += 0x100
+        self.rejected += 1
+        return None
+
+    def sign_control(self, packet):
+        """Appends a short tag, bound to the current session, to a control packet."""
+        packet = bytes(packet)
+        return packet + self._control_tag(self.session, packet)
+
+    def verify_control(self, packet):
+        """Returns the packet without its tag, or None if the tag doesn't match this session."""
+        packet = bytes(packet)
+        body, tag = packet[:-CONTROL_TAG_BYTES], packet[-CONTROL_TAG_BYTES:]
+        if len(packet) <= CONTROL_TAG_BYTES or not hmac.compare_digest(tag, self._control_tag(self.session, body)):
+            self.rejected += 1
+            return None
+        return body
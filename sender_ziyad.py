@@ -1,26 +1,42 @@
-from RF24 import RF24
-from PIL import Image
 import time
-import camera
-from sense import read_environmental_data, read_motion_data
 import uuid
 import os
+from concurrent.futures import ThreadPoolExecutor
+import handshake
+import hardware
+import channel_manager
+import compression
+import file_service
+import framing
+import power
+import rtt
+import security
+import uplink
+from store_forward import StoreForwardLog
+from join_buffer import new_capture_id, stamp_capture
 
 # --- NEW: Configuration for Reliable Transfer ---
-RETRY_TIMEOUT = 0.05  # 50ms timeout for waiting for an ACK
+RETRY_TIMEOUT = 0.05  # ACK timeout until the first measured round trip (see rtt.py)
 MAX_RETRIES = 5       # Max number of retries for a single chunk before giving up
 CHUNK_NUM_BYTES = 2   # Use 2 bytes for the chunk index
 CHUNK_DATA_SIZE = 32 - CHUNK_NUM_BYTES # 30 bytes of data per packet
+INDEX_MODULUS = 0xFFFF # chunk numbers go out modulo this; 0xFFFF marks metadata
 
-radio = RF24(22, 0)
-radio.begin()
-radio.setChannel(76)
-radio.setPALevel(2, False)
-radio.setAutoAck(True)
-radio.enableDynamicPayloads()
-radio.enableAckPayload()
-radio.openWritingPipe(b'1Node')
-radio.stopListening()
+PRODUCT_PREFIXES = {'telemetry': b'SENS', 'image': b'IMAG', 'imu': b'IMUB', 'responses': b'RESP',
+                    **file_service.PREFIXES}
+SYNC_LISTEN_S = 0.05
+LINK_STATE_FILE = "link_state.json"   # session counter, so old handshakes can't be replayed
+COMMAND_IDLE_S = 1.0  # keep polling for uplink commands until the ground is quiet this long
+
+# Set up by main(): importing this file touches no hardware
+radio = None
+session = None
+channels = None
+cipher = None
+config = None         # uplink.OnboardConfig: capture and contact settings the ground can change
+commands = None       # uplink.CommandDispatcher for commands riding on the ACK payloads
+ack_timer = rtt.RttEstimator(initial_rto=RETRY_TIMEOUT)
+next_seq = 0          # compact framing: sequence number of the next frame this session
 
 # --- NEW: Reliable Send Function ---
 def send_reliable_payload(payload_bytes, data_type_name="Data"):
@@ -62,106 +78,313 @@ def send_reliable_chunk(chunk_data, chunk_index, log_prefix):
         # Special packet for metadata. We'll use a 4-byte payload.
         payload = b'\xFF\xFF' + chunk_data[:4] # Use index 65535 as a magic number for metadata
     else:
-        # Standard data packet: [index (2 bytes)] + [data (30 bytes)]
-        payload = chunk_index.to_bytes(CHUNK_NUM_BYTES, 'big') + chunk_data
+        # Standard data packet: [index (2 bytes)] + [data (30 bytes)]. The
+        # index wraps; the receiver widens it back to the full chunk number
+        payload = (chunk_index % INDEX_MODULUS).to_bytes(CHUNK_NUM_BYTES, 'big') + chunk_data
+
+    expected_index = 65535 if chunk_index == -1 else chunk_index % INDEX_MODULUS
+    return send_reliable_packet(payload, b'ACK' + expected_index.to_bytes(2, 'big'), f"{log_prefix} #{chunk_index}")
 
-    for attempt in range(MAX_RETRIES):
+def send_reliable_packet(payload, expected_ack, label):
+    """
+    Sends one packet until the ACK payload expected_ack comes back. Returns
+    True on success. Gives up after MAX_RETRIES attempts, but not before
+    rtt.MIN_PATIENCE_S: a receiver busy between transfers hasn't loaded an
+    ACK payload yet, however short our timeout has become.
+    """
+    first_sent = time.time()
+    attempt = 0
+    while attempt < MAX_RETRIES or time.time() - first_sent < rtt.MIN_PATIENCE_S:
         radio.stopListening()
-        # print(f"  > Sending {log_prefix} #{chunk_index}, Attempt {attempt+1}")
-        radio.write(payload)
+        # print(f"  > Sending {label}, Attempt {attempt+1}")
+        sent_at = time.time()
+        delivered = radio.write(payload)
+        channels.record(delivered)
 
         # Immediately switch to listening for the ACK
         radio.startListening()
         
-        start_time = time.time()
-        while time.time() - start_time < RETRY_TIMEOUT:
-            if radio.available():
-                ack_payload = radio.read(radio.getDynamicPayloadSize())
-                
-                # Check if it's a valid ACK for our chunk
-                if len(ack_payload) >= 5 and ack_payload[:3] == b'ACK':
-                    ack_index = int.from_bytes(ack_payload[3:], 'big')
-                    
-                    expected_index = 65535 if chunk_index == -1 else chunk_index
-                    if ack_index == expected_index:
-                        print(f"  ✅ ACK received for {log_prefix} #{chunk_index}")
-                        return True # Success!
-                
-            time.sleep(0.001) # Small delay to prevent busy-waiting
-
-        # If loop finishes, it's a timeout
-        print(f"  ⚠️ Timeout waiting for ACK on {log_prefix} #{chunk_index}. Retrying...")
+        deadline = sent_at + ack_timer.rto
+        # Sleeps on the IRQ line if it's wired, otherwise polls with a short sleep
+        while power.wait_for_packet(radio, deadline - time.time(), hardware.RADIO_IRQ_PIN):
+            ack_payload = radio.read(radio.getDynamicPayloadSize())
+            
+            # Check if it's the ACK for this packet; anything after it is an uplink command
+            if ack_payload[:len(expected_ack)] == expected_ack:
+                if len(ack_payload) > len(expected_ack) and commands is not None:
+                    commands.handle(ack_payload[len(expected_ack):])
+                # Unlike explicit ACK packets this is never ambiguous: an ACK
+                # payload rides on the hardware ACK of the write just made,
+                # so the sample is timed from the last attempt (no Karn's rule)
+                ack_timer.sample(time.time() - sent_at)
+                print(f"  ✅ ACK received for {label}")
+                return True # Success!
+
+        # If loop finishes, it's a timeout. The first one per chunk is how
+        # this protocol works (the ACK comes back on the retry), so only back
+        # off after that, or when the write itself wasn't hardware-ACKed
+        if attempt > 0 or not delivered:
+            ack_timer.expired()
+        attempt += 1
+        print(f"  ⚠️ Timeout waiting for ACK on {label}. Retrying...")
+        # Bursts of timeouts usually mean Wi-Fi on this channel: move on
+        if not channels.maybe_hop():
+            channels.check_resync()
         
     # If all retries fail
     return False
 
 
-# ---------- Handshake (Same as before) ----------
-radio.write(b'SYNC')
-print("📡 Sent SYNC, waiting for ACK...")
-radio.startListening()
-start = time.time()
-ack_ok = False
-while time.time() - start < 3:
-    if radio.available():
-        response = radio.read(radio.getDynamicPayloadSize())
-        if response == b'ACK':
-            print("🤝 Handshake ACK received, starting data transfer.")
-            ack_ok = True
-            break
-if not ack_ok:
-    print("❌ Handshake failed. Exiting.")
-    exit()
-radio.stopListening()
-
-
-# ---------- 1. Read and Send Sensor Data ----------
-print("\n--- Sending Sensor Data ---")
-timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-env = read_environmental_data()
-motion = read_motion_data()
-sensor_text = (
-    f"{timestamp}|T:{env['temperature']}C|H:{env['humidity']}%|P:{env['pressure']}hPa|"
-    f"Pitch:{motion['orientation']['pitch']}|Roll:{motion['orientation']['roll']}|Yaw:{motion['orientation']['yaw']}"
-)
-sensor_bytes = sensor_text.encode()
-
-# Send 'SENS' prefix (reliably)
-if not send_reliable_chunk(b'SENS', -1, "Prefix"):
-    print("❌ Failed to send SENS prefix. Aborting.")
-    exit()
-
-# Send the actual sensor data payload
-if send_reliable_payload(sensor_bytes, "Sensor Data"):
-    print("✅ Sensor data sent successfully.")
-else:
-    print("❌ Failed to send sensor data. Aborting.")
-    exit()
-
-# Small delay between data types
-time.sleep(1) 
-
-# ---------- 2. Capture & Send Image Data ----------
-print("\n--- Sending Image Data ---")
-filename = camera.capture_photo("image.jpg")
-img = Image.open(filename).convert("RGB").resize((1024, 1024))
-jpeg_filename = f"/tmp/compressed_{uuid.uuid4().hex}.jpg"
-img.save(jpeg_filename, format="JPEG", quality=50)
-
-with open(jpeg_filename, "rb") as f:
-    jpeg_bytes = f.read()
-os.remove(jpeg_filename)
-print(f"📦 JPEG size: {len(jpeg_bytes)} bytes")
-
-# Send 'IMAG' prefix (reliably)
-if not send_reliable_chunk(b'IMAG', -1, "Prefix"):
-    print("❌ Failed to send IMAG prefix. Aborting.")
-    exit()
-
-# Send the actual image data payload
-if send_reliable_payload(jpeg_bytes, "Image Data"):
-    print("✅ Compressed image sent successfully.")
-else:
-    print("❌ Failed to send image data.")
-
-print("\nAll tasks complete.")
+def send_framed_payload(prefix, payload, data_type_name="Data"):
+    """
+    Compact framing (framing.py): one START frame with the prefix and exact
+    length, then DATA frames, each only as long as its content.
+    """
+    global next_seq
+    frames = framing.frame_transfer(prefix, payload, next_seq)
+    print(f"Preparing to send {len(frames)} frames for {data_type_name}...")
+    for seq, frame in frames:
+        # Count every attempted frame: the receiver may have it even if we never saw the ACK
+        next_seq = seq + 1
+        if not send_reliable_packet(frame, framing.ack_frame(seq), f"{data_type_name} frame {seq}"):
+            print(f"❌ Failed to send frame {seq} of {data_type_name}. Aborting transfer.")
+            return False
+    print(f"📦 Framing: {framing.describe(prefix, len(payload), len(frames), framing.header_bytes(frames, len(payload)))}")
+    return True
+
+def send_product(kind, payload):
+    """
+    Sends one logged record, file service reply or batch of command
+    responses: the reliable prefix, then the payload. Responses to commands
+    that came in since the last product go first.
+    """
+    if kind != 'responses' and commands is not None and commands.has_responses():
+        send_product('responses', commands.take_responses())
+    prefix = PRODUCT_PREFIXES.get(kind, b'IMAG')
+    print(f"\n--- Sending {kind} ---")
+    if session.caps & handshake.CAP_COMPRESSION:
+        # Before sealing: ciphertext doesn't compress
+        raw_len = len(payload)
+        payload, codec = compression.pack(kind, payload, session.codecs)
+        print(f"🗜️ {compression.describe(kind, raw_len, len(payload), codec)}")
+    if session.caps & handshake.CAP_AEAD:
+        # Sealed at send time so every attempt gets a fresh nonce
+        payload = cipher.seal(payload, prefix)
+    if session.caps & handshake.CAP_COMPACT_FRAMING:
+        if not send_framed_payload(prefix, payload, kind):
+            print(f"❌ Failed to send {kind}.")
+            return False
+        print(f"✅ {kind} sent successfully.")
+        return True
+    if not send_reliable_chunk(prefix, -1, "Prefix"):
+        print(f"❌ Failed to send {prefix.decode()} prefix.")
+        return False
+    if not send_reliable_payload(payload, kind):
+        print(f"❌ Failed to send {kind}.")
+        return False
+    print(f"✅ {kind} sent successfully.")
+    return True
+
+
+def capture_products():
+    """
+    Reads the sensors and the camera, plus an IMU burst when the ground has
+    asked for one (imu_burst_s). Returns [(kind, payload)] ready for the
+    store-and-forward log; every product carries the same capture id so
+    the receiver can pair them even if they arrive in different passes.
+    """
+    # Camera, Sense HAT and PIL are slow to import; only pay for them here
+    from PIL import Image
+    import camera
+    import imu_burst
+    from sense import read_environmental_data, read_motion_data
+
+    capture_id = new_capture_id()
+    capture_time = time.time()
+
+    print("\n--- Reading Sensor Data ---")
+    timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(capture_time))
+    env = read_environmental_data()
+    motion = read_motion_data()
+    sensor_text = (
+        f"{timestamp}|T:{env['temperature']}C|H:{env['humidity']}%|P:{env['pressure']}hPa|"
+        f"Pitch:{motion['orientation']['pitch']}|Roll:{motion['orientation']['roll']}|Yaw:{motion['orientation']['yaw']}"
+    )
+    products = [('telemetry', stamp_capture(sensor_text.encode(), capture_id, capture_time))]
+
+    burst_s = config.get('imu_burst_s')
+    if burst_s:
+        print(f"\n--- IMU burst, {burst_s} s ---")
+        burst = imu_burst.capture_burst(imu_burst.default_source(), burst_s, config.get('imu_rate_hz'))
+        print(f"📈 {burst.describe()}")
+        products.append(('imu', stamp_capture(burst.encode(), capture_id, capture_time)))
+
+    print("\n--- Capturing Image Data ---")
+    # Kept where the file service can send the full-size frame if the ground asks
+    os.makedirs(file_service.CAPTURE_DIR, exist_ok=True)
+    filename = camera.capture_photo(os.path.join(file_service.CAPTURE_DIR, "image.jpg"))
+    size = config.get('image_size')
+    img = Image.open(filename).convert("RGB").resize((size, size))
+    jpeg_filename = f"/tmp/compressed_{uuid.uuid4().hex}.jpg"
+    img.save(jpeg_filename, format="JPEG", quality=config.get('jpeg_quality'))
+
+    with open(jpeg_filename, "rb") as f:
+        jpeg_bytes = f.read()
+    os.remove(jpeg_filename)
+    print(f"📦 JPEG size: {len(jpeg_bytes)} bytes")
+    products.append(('image', stamp_capture(jpeg_bytes, capture_id, capture_time)))
+    return products
+
+
+def open_session():
+    """
+    Scans the band and runs the SYNC handshake. Returns the SessionConfig,
+    or None if the receiver didn't answer.
+
+    Both ends of this pair use ACK payloads and indexed chunks. The data rate
+    stays at 1 Mbps because an ACK payload gives the receiver no way to know the
+    sender saw its choice before switching. The channels that looked quiet in a
+    quick RPD scan are offered for hopping; the receiver picks the shared set.
+    With a shared link key every transfer is sealed and the handshake is tagged,
+    so a receiver without the key (or a spoofed one) never gets a session.
+    """
+    global cipher
+    link_key = security.load_key()
+    cipher = security.LinkCipher(link_key, LINK_STATE_FILE) if link_key else None
+    caps = (handshake.CAP_ACK_PAYLOAD | handshake.CAP_INDEXED_CHUNKS | handshake.CAP_CHANNEL_HOPPING
+            | handshake.CAP_COMPACT_FRAMING | handshake.CAP_COMPRESSION)
+    if cipher:
+        caps |= handshake.CAP_AEAD
+    else:
+        print(f"⚠️ No link key in ${security.KEY_ENV} or {security.KEY_FILE}, sending in the clear.")
+
+    print("\n--- Scanning the band ---")
+    channel_mask = channel_manager.quiet_channel_mask(channel_manager.cached_scan(radio))
+    radio.stopListening()
+    setup_start = time.perf_counter()
+    offer = handshake.build_offer(
+        caps=caps,
+        max_window=1,
+        codecs=compression.available_codecs(),
+        rates=(handshake.RF24_1MBPS,),
+        preferred_rate=handshake.RF24_1MBPS,
+        channel_mask=channel_mask,
+    )
+    packet = cipher.sign_offer(offer) if cipher else offer
+    print("📡 Sending SYNC, waiting for ACK...")
+    # The receiver answers in an ACK payload, which can only ride on the
+    # hardware ACK of a later packet, so SYNC is repeated with a short listen
+    # after each one rather than sent once followed by a long wait.
+    start = time.time()
+    config = None
+    while config is None and time.time() - start < 3:
+        radio.stopListening()
+        radio.write(packet)
+        radio.startListening()
+        listen_start = time.time()
+        while time.time() - listen_start < SYNC_LISTEN_S:
+            if radio.available():
+                reply = radio.read(radio.getDynamicPayloadSize())
+                if cipher:
+                    reply = cipher.verify_control(reply)
+                config = handshake.parse_reply(reply) if reply else None
+                if config is not None:
+                    negotiation_ms = (time.perf_counter() - setup_start) * 1000
+                    print(f"🤝 Handshake ACK received in {negotiation_ms:.1f} ms, starting data transfer.")
+                    print(f"   Session: {handshake.describe(config)}")
+                    break
+            else:
+                time.sleep(0.001)
+    radio.stopListening()
+    return config
+
+
+def main():
+    global radio, session, channels, ack_timer, next_seq, config, commands
+    # Settings the ground changed over the uplink in earlier contacts
+    config = uplink.OnboardConfig()
+    radio = power.MeteredRadio(hardware.make_radio(hardware.ROLE_SENDER, channel=channel_manager.HOME_CHANNEL))
+
+    # ---------- 1. Capture into the store-and-forward log ----------
+    # Everything goes through the on-disk log, so a failed handshake or
+    # transfer (or a reboot) loses nothing: the next run drains whatever is
+    # still pending. The camera and sensors are read on a worker thread while
+    # the band scan and handshake run, so the first packet isn't held up by
+    # the camera; the capture is logged as soon as it's ready either way.
+    store = StoreForwardLog()
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        capture = pool.submit(capture_products)
+        session = open_session()
+        for kind, payload in capture.result():
+            store.append(kind, payload, priority=config.priority(kind))
+        store.sync()
+
+    if session is None:
+        print(f"❌ Handshake failed. {len(store.pending())} records stay in the store-and-forward log for next time.")
+        store.close()
+        return
+    channels = channel_manager.ChannelManager.from_session(
+        radio, session, cipher=cipher if session.caps & handshake.CAP_AEAD else None)
+    ack_timer = rtt.RttEstimator(initial_rto=RETRY_TIMEOUT)
+    next_seq = 0
+    # Remembers what it answered in earlier contacts: a command whose RESP
+    # was lost comes back, re-signed for this session, and mustn't run twice
+    commands = uplink.CommandDispatcher(config, cipher if session.caps & handshake.CAP_AEAD else None,
+                                        uplink.COMMAND_STATE_FILE)
+
+    # ---------- 2. Drain the log, most important records first ----------
+    contact_window_s = config.get('contact_window_s')
+    contact_start = time.time()
+
+    def time_left():
+        return max(0.0, contact_window_s - (time.time() - contact_start))
+
+    with radio.measure():
+        sent, bytes_sent = store.drain(send_product, time_budget_s=contact_window_s)
+
+        # ---------- 3. Uplink commands ----------
+        # The ground can only talk in ACK payloads, so keep sending (pending
+        # responses, or an empty poll) while it still has commands for us.
+        # Commands that come in later, while files go out, still run
+        poll_start = time.time()
+        while time_left() and time.time() - max(commands.last_heard or 0, poll_start) < COMMAND_IDLE_S:
+            if not send_product('responses', commands.take_responses()):
+                break
+
+        # ---------- 4. Files and logs the ground asked for ----------
+        # From the request file and from FILE commands, including ones that
+        # arrive while files are going out. Whatever doesn't fit in this
+        # contact stays in the request file, trimmed to the bytes not yet sent
+        server = file_service.FileServer()
+        requests = file_service.load_requests()
+        while True:
+            requests += commands.take_file_requests()
+            if not requests or not time_left():
+                break
+            requests = server.serve(requests, send_product, time_budget_s=time_left())
+            if requests:
+                break
+        file_service.save_requests(requests + commands.take_file_requests())
+        if server.files_sent or requests:
+            print(f"\n📁 Served {server.files_sent} files ({server.bytes_sent} bytes), "
+                  f"{len(requests)} file requests left for the next contact.")
+
+        # Commands that came in while files went out get their answers too.
+        # Any that don't make it are answered from the cache next contact
+        while commands.has_responses() and time_left():
+            if not send_product('responses', commands.take_responses()):
+                break
+    # The radio stays off until the next run
+    radio.powerDown()
+    remaining = len(store.pending())
+    store.close()
+    print(f"\n📡 Sent {sent} records ({bytes_sent} bytes), {remaining} left in the log for the next contact.")
+    print(f"📶 {channels.hops} channel hops, recent loss per channel: {channels.report()}")
+    print(f"🔋 Radio energy: {radio.report()}")
+    print(f"⏱️ ACK timing: {ack_timer.describe()}")
+    print(f"🛰️ {commands.commands_run} uplink commands run, {commands.rejected} rejected.")
+    print("All tasks complete.")
+
+
+if __name__ == "__main__":
+    main()
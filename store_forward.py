@@ -0,0 +1,294 @@
+import mmap
+import os
+import struct
+import time
+import zlib
+
+from downlink_scheduler import DEFAULT_PRIORITIES
+
+# --- Onboard store-and-forward log ---
+# Every capture is appended to an on-disk segment log before anything is
+# transmitted, so a failed transfer or a reboot never loses data. The
+# transmitter drains the log whenever the link is up and acknowledges each
+# record once the ground has it; segments whose records are all acknowledged
+# are deleted.
+#
+# Layout: LOG_DIR/seg_<first seq>.log files of back-to-back records
+#   [length u32][crc32 u32][seq u64][priority u8][kind u8][payload]
+# where the CRC covers the rest of the header as well as the payload, plus
+# LOG_DIR/acked.log, a list of acknowledged seqs (u64). Acks are appended as
+# they come in; the file is rewritten with just the live ones whenever a
+# segment is retired, so it never outgrows the segments it refers to.
+LOG_DIR = "store_forward"
+SEGMENT_BYTES = 1024 * 1024
+MAX_LOG_BYTES = 256 * 1024 * 1024    # bounded SD-card usage
+FSYNC_EVERY_N = 16                   # fsync after this many appends...
+FSYNC_INTERVAL_S = 2.0               # ...or this long after the first unsynced one
+EVICT_OLDEST = 'oldest'
+EVICT_PRIORITY = 'priority'
+
+RECORD_HEADER = struct.Struct('>IIQBB')
+CRC_FIELDS = struct.Struct('>IQBB')    # the header minus the CRC itself
+ACK_ENTRY = struct.Struct('>Q')
+
+KINDS = ['telemetry', 'thumbnail', 'image', 'log', 'file', 'imu']
+KIND_CODES = {name: code for code, name in enumerate(KINDS)}
+
+
+def record_crc(length, seq, priority, kind, payload):
+    return zlib.crc32(payload, zlib.crc32(CRC_FIELDS.pack(length, seq, priority, kind)))
+
+
+class Segment:
+    def __init__(self, path, first_seq):
+        self.path = path
+        self.first_seq = first_seq
+        self.size = os.path.getsize(path) if os.path.exists(path) else 0
+        self.records = {}   # seq -> (offset, length, priority, kind)
+        self._map = None
+        self._map_size = 0
+
+    def read(self, offset, length):
+        """Reads a payload through an mmap so only the touched pages are loaded."""
+        if self._map is None or offset + length > self._map_size:
+            self.close()
+            with open(self.path, 'rb') as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._map_size = len(self._map)
+        return self._map[offset:offset + length]
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+class StoreForwardLog:
+    def __init__(self, log_dir=LOG_DIR, max_bytes=MAX_LOG_BYTES, eviction=EVICT_OLDEST,
+                 segment_bytes=SEGMENT_BYTES, fsync_every=FSYNC_EVERY_N):
+        self.log_dir = log_dir
+        self.max_bytes = max_bytes
+        self.eviction = eviction
+        self.segment_bytes = segment_bytes
+        self.fsync_every = fsync_every
+        os.makedirs(log_dir, exist_ok=True)
+        self.segments = []
+        self.acked = set()
+        self.next_seq = 0
+        self.active = None
+        self.active_file = None
+        self.unsynced = 0
+        self.first_unsynced_at = None
+        self.evicted = 0
+        self.ack_file = None
+        self._recover()
+
+    # ---------- recovery ----------
+    def _recover(self):
+        ack_path = os.path.join(self.log_dir, "acked.log")
+        if os.path.exists(ack_path):
+            with open(ack_path, 'rb') as f:
+                data = f.read()
+            usable = len(data) - len(data) % ACK_ENTRY.size
+            self.acked = {ACK_ENTRY.unpack_from(data, i)[0] for i in range(0, usable, ACK_ENTRY.size)}
+        self.ack_file = open(ack_path, 'ab')
+
+        names = sorted(n for n in os.listdir(self.log_dir) if n.startswith("seg_") and n.endswith(".log"))
+        for name in names:
+            segment = Segment(os.path.join(self.log_dir, name), int(name[4:-4]))
+            self._scan(segment)
+            self.segments.append(segment)
+            if segment.records:
+                self.next_seq = max(self.next_seq, max(segment.records) + 1)
+        # Never hand out a seq that an old ack entry still refers to
+        self.next_seq = max(self.next_seq, max(self.acked, default=-1) + 1)
+        # Drop acks for segments already gone (a crash before the rewrite)
+        stale = len(self.acked)
+        self.acked.intersection_update(seq for segment in self.segments for seq in segment.records)
+        if not self._delete_finished_segments() and len(self.acked) < stale:
+            self._rewrite_acks()
+        live = sum(len(self._live(s)) for s in self.segments)
+        if live:
+            print(f"📼 Store-and-forward log recovered {live} unsent records.")
+
+    def _scan(self, segment):
+        """Indexes a segment and cuts off a torn record left by a crash mid-append."""
+        good_end = 0
+        with open(segment.path, 'rb') as f:
+            data = f.read()
+        offset = 0
+        while offset + RECORD_HEADER.size <= len(data):
+            length, crc, seq, priority, kind = RECORD_HEADER.unpack_from(data, offset)
+            start = offset + RECORD_HEADER.size
+            payload = data[start:start + length]
+            if len(payload) != length or crc != record_crc(length, seq, priority, kind, payload):
+                break
+            segment.records[seq] = (start, length, priority, kind)
+            offset = start + length
+            good_end = offset
+        if good_end < len(data):
+            print(f"⚠️ Truncating {len(data) - good_end} torn bytes from {segment.path}")
+            with open(segment.path, 'r+b') as f:
+                f.truncate(good_end)
+        segment.size = good_end
+
+    # ---------- appending ----------
+    def append(self, kind, payload, priority=None):
+        """Appends one record and returns its sequence number."""
+        priority = DEFAULT_PRIORITIES.get(kind, 2) if priority is None else priority
+        if self.active is None or self.active.size + RECORD_HEADER.size + len(payload) > self.segment_bytes:
+            self._roll()
+        seq = self.next_seq
+        self.next_seq += 1
+        crc = record_crc(len(payload), seq, priority, KIND_CODES[kind], payload)
+        header = RECORD_HEADER.pack(len(payload), crc, seq, priority, KIND_CODES[kind])
+        self.active_file.write(header + payload)
+        self.active.records[seq] = (self.active.size + RECORD_HEADER.size, len(payload), priority, KIND_CODES[kind])
+        self.active.size += RECORD_HEADER.size + len(payload)
+
+        self.unsynced += 1
+        if self.first_unsynced_at is None:
+            self.first_unsynced_at = time.time()
+        if self.unsynced >= self.fsync_every or time.time() - self.first_unsynced_at >= FSYNC_INTERVAL_S:
+            self.sync()
+        self._enforce_limit()
+        return seq
+
+    def _roll(self):
+        if self.active_file is not None:
+            self.sync()
+            self.active_file.close()
+        path = os.path.join(self.log_dir, f"seg_{self.next_seq:016d}.log")
+        self.active = Segment(path, self.next_seq)
+        self.active_file = open(path, 'ab')
+        self.segments.append(self.active)
+
+    def sync(self):
+        """Forces buffered appends and acks to the SD card."""
+        if self.active_file is not None:
+            self.active_file.flush()
+            os.fsync(self.active_file.fileno())
+        self.ack_file.flush()
+        os.fsync(self.ack_file.fileno())
+        self.unsynced = 0
+        self.first_unsynced_at = None
+
+    # ---------- bounded disk usage ----------
+    def disk_usage(self):
+        return sum(s.size for s in self.segments)
+
+    def _enforce_limit(self):
+        while self.disk_usage() > self.max_bytes:
+            candidates = [s for s in self.segments if s is not self.active]
+            if not candidates:
+                return
+            if self.eviction == EVICT_PRIORITY:
+                # Give up the segment whose most important live record matters least
+                def importance(segment):
+                    live = self._live(segment)
+                    return min((segment.records[seq][2] for seq in live), default=255)
+                victim = max(candidates, key=lambda s: (importance(s), -s.first_seq))
+            else:
+                victim = candidates[0]
+            dropped = len(self._live(victim))
+            self.evicted += dropped
+            print(f"🗑️ Log over {self.max_bytes} bytes, evicting {victim.path} ({dropped} unsent records)")
+            self._delete_segment(victim)
+            self._rewrite_acks()
+
+    # ---------- draining ----------
+    def _live(self, segment):
+        return [seq for seq in segment.records if seq not in self.acked]
+
+    def pending(self):
+        """Unsent records as (priority, seq, segment), most important and oldest first."""
+        items = []
+        for segment in self.segments:
+            for seq in self._live(segment):
+                items.append((segment.records[seq][2], seq, segment))
+        items.sort(key=lambda item: (item[0], item[1]))
+        return items
+
+    def read(self, segment, seq):
+        offset, length, _, kind = segment.records[seq]
+        if segment is self.active:
+            self.active_file.flush()
+        return KINDS[kind], segment.read(offset, length)
+
+    def ack(self, seq):
+        self.acked.add(seq)
+        self.ack_file.write(ACK_ENTRY.pack(seq))
+
+    def drain(self, send_fn, time_budget_s=None, link_up=None):
+        """
+        Sends pending records with send_fn(kind, payload) -> bool until the
+        log is empty, a send fails, the link goes down or the time budget is
+        used up. Returns (sent, bytes_sent).
+        """
+        start = time.time()
+        sent = 0
+        bytes_sent = 0
+        for _, seq, segment in self.pending():
+            if time_budget_s is not None and time.time() - start > time_budget_s:
+                break
+            if link_up is not None and not link_up():
+                break
+            kind, payload = self.read(segment, seq)
+            if not send_fn(kind, payload):
+                break
+            self.ack(seq)
+            sent += 1
+            bytes_sent += len(payload)
+        self.sync()
+        self._delete_finished_segments()
+        return sent, bytes_sent
+
+    def _delete_finished_segments(self):
+        """Retires fully acknowledged segments. Returns True if any were."""
+        if not any(self._live(s) for s in self.segments):
+            # Everything has been delivered: start over with an empty log
+            if self.active_file is not None:
+                self.active_file.close()
+                self.active_file = None
+            self.active = None
+            for segment in list(self.segments):
+                self._delete_segment(segment)
+            self.acked.clear()
+            self._rewrite_acks()
+            return True
+        finished = [s for s in self.segments if s is not self.active and not self._live(s)]
+        for segment in finished:
+            self._delete_segment(segment)
+        if finished:
+            self._rewrite_acks()
+        return bool(finished)
+
+    def _delete_segment(self, segment):
+        segment.close()
+        self.segments.remove(segment)
+        for seq in segment.records:
+            self.acked.discard(seq)
+        try:
+            os.remove(segment.path)
+        except FileNotFoundError:
+            pass
+
+    def _rewrite_acks(self):
+        """Replaces acked.log with the acks still referring to a segment."""
+        ack_path = os.path.join(self.log_dir, "acked.log")
+        self.ack_file.close()
+        tmp_path = ack_path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(b''.join(ACK_ENTRY.pack(seq) for seq in sorted(self.acked)))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, ack_path)
+        self.ack_file = open(ack_path, 'ab')
+
+    def close(self):
+        self.sync()
+        if self.active_file is not None:
+            self.active_file.close()
+        for segment in self.segments:
+            segment.close()
+        self.ack_file.close()
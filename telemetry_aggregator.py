@@ -0,0 +1,249 @@
+import math
+import struct
+import time
+from bisect import insort
+
+# --- Onboard telemetry aggregation ---
+# Instead of downlinking every reading, the sender folds each one into
+# per-field statistics for the current window and sends one summary when the
+# window closes. Raw readings only go out when a rule trips: a hard limit, or
+# a value far outside what the field has done so far. Every field keeps a
+# fixed amount of state however long the window runs: Welford running
+# mean/variance, min/max, and a P² marker set per percentile.
+# Summary wire format (big-endian header, little-endian floats):
+#   [window start f64][duration f32][readings u16][raw sent u16][percentile count u8][field count u8]
+#   percentile count x [percent u8]
+#   then per field seen: [field id u8][min f32][max f32][mean f32][std f32][percentiles f32...]
+FIELDS = ('T', 'H', 'P', 'Pitch', 'Roll', 'Yaw', 'Ax', 'Ay', 'Az', 'Gx', 'Gy', 'Gz', 'Mx', 'My', 'Mz', 'Compass')
+FIELD_IDS = {name: field_id for field_id, name in enumerate(FIELDS)}
+PERCENTILES = (50, 95)
+SUMMARY_INTERVAL_S = 300
+
+# Readings outside these go down raw straight away (units as the HAT reports them)
+LIMITS = {
+    'T': (-10.0, 50.0),
+    'H': (0.0, 90.0),
+    'P': (900.0, 1100.0),
+}
+Z_LIMIT = 5.0               # ... as do readings this many standard deviations from the field's history
+MIN_HISTORY = 20            # readings a field needs before the z-score rule applies
+
+SUMMARY_HEADER = struct.Struct('>dfHHBB')
+
+
+class RunningStats:
+    """Count, mean and variance (Welford) plus min and max, in O(1) memory."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+
+class P2Quantile:
+    """
+    Streaming estimate of the p-quantile (0 < p < 1) with the P² algorithm
+    (Jain & Chlamtac): five markers whose heights are nudged along a
+    parabola as readings come in. Exact until the fifth reading.
+    """
+
+    def __init__(self, p):
+        self.p = p
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x):
+        q, n = self.heights, self.positions
+        if len(q) < 5:
+            insort(q, x)
+            return
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+        for i in (1, 2, 3):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                height = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+                if not q[i - 1] < height < q[i + 1]:
+                    height = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = height
+                n[i] += d
+
+    def value(self):
+        q = self.heights
+        if not q:
+            return math.nan
+        if len(q) < 5:
+            return q[min(len(q) - 1, round(self.p * (len(q) - 1)))]
+        return q[2]
+
+
+class FieldStats:
+    """Window statistics of one field."""
+
+    def __init__(self, percentiles):
+        self.stats = RunningStats()
+        self.quantiles = [P2Quantile(percent / 100) for percent in percentiles]
+
+    def add(self, x):
+        self.stats.add(x)
+        for quantile in self.quantiles:
+            quantile.add(x)
+
+
+def readings_from(env, motion):
+    """{field: value} from read_environmental_data() and read_motion_data()."""
+    values = {'T': env['temperature'], 'H': env['humidity'], 'P': env['pressure']}
+    orientation = motion.get('orientation', {})
+    values.update(Pitch=orientation.get('pitch'), Roll=orientation.get('roll'), Yaw=orientation.get('yaw'))
+    for prefix, key in (('A', 'accel_raw'), ('G', 'gyro_raw'), ('M', 'compass')):
+        axes = motion.get(key)
+        if isinstance(axes, dict):
+            values.update({prefix + axis: axes.get(axis.lower()) for axis in 'xyz'})
+        elif key == 'compass':
+            values['Compass'] = axes     # a heading in degrees
+    return {name: float(value) for name, value in values.items() if isinstance(value, (int, float))}
+
+
+class TelemetryAggregator:
+    """
+    add() folds one set of readings into the window and returns why they
+    should go down raw (empty when nothing tripped). Once due(), summary()
+    encodes the window and starts the next one.
+    """
+
+    def __init__(self, window_s=SUMMARY_INTERVAL_S, percentiles=PERCENTILES, limits=None,
+                 z_limit=Z_LIMIT, min_history=MIN_HISTORY, now=None):
+        self.window_s = window_s
+        self.percentiles = tuple(percentiles)
+        self.limits = LIMITS if limits is None else limits
+        self.z_limit = z_limit
+        self.min_history = min_history
+        self.history = {}       # field -> RunningStats since start, for the z-score rule
+        self.summaries_sent = 0
+        self.raw_triggered = 0
+        self._start_window(time.time() if now is None else now)
+
+    def _start_window(self, now):
+        self.window_start = now
+        self.fields = {}
+        self.readings = 0
+        self.raw_sent = 0
+
+    def check(self, name, value):
+        """Why this reading breaks a rule, or None."""
+        low, high = self.limits.get(name, (-math.inf, math.inf))
+        if not low <= value <= high:
+            return f"{name}={value:g} outside [{low:g}, {high:g}]"
+        history = self.history.get(name)
+        if history is not None and history.count >= self.min_history and history.std > 0:
+            z = (value - history.mean) / history.std
+            if abs(z) > self.z_limit:
+                return f"{name}={value:g} is {z:+.1f} sigma from its mean {history.mean:g}"
+        return None
+
+    def add(self, readings):
+        reasons = []
+        for name, value in readings.items():
+            if name not in FIELD_IDS or math.isnan(value):
+                continue
+            reason = self.check(name, value)
+            if reason:
+                reasons.append(reason)
+            if name not in self.fields:
+                self.fields[name] = FieldStats(self.percentiles)
+                self.history.setdefault(name, RunningStats())
+            self.fields[name].add(value)
+            self.history[name].add(value)
+        self.readings += 1
+        if reasons:
+            self.raw_sent += 1
+            self.raw_triggered += 1
+        return reasons
+
+    def due(self, now=None):
+        now = time.time() if now is None else now
+        return self.readings > 0 and now - self.window_start >= self.window_s
+
+    def summary(self, now=None):
+        now = time.time() if now is None else now
+        out = bytearray(SUMMARY_HEADER.pack(self.window_start, now - self.window_start, min(self.readings, 0xFFFF),
+                                            min(self.raw_sent, 0xFFFF), len(self.percentiles), len(self.fields)))
+        out += bytes(self.percentiles)
+        row = struct.Struct(f'<B{4 + len(self.percentiles)}f')
+        for name, field in self.fields.items():
+            s = field.stats
+            out += row.pack(FIELD_IDS[name], s.min, s.max, s.mean, s.std, *(q.value() for q in field.quantiles))
+        self.summaries_sent += 1
+        self._start_window(now)
+        return bytes(out)
+
+
+def decode_summary(data):
+    """
+    The summary as a dict: window start/duration, reading counts and
+    {field: {'min', 'max', 'mean', 'std', 'p50', ...}}. NUL padding after it
+    is ignored; raises ValueError if it's cut off.
+    """
+    data = bytes(data)
+    if len(data) < SUMMARY_HEADER.size:
+        raise ValueError("telemetry summary too short for its header")
+    start, duration, readings, raw_sent, count, field_count = SUMMARY_HEADER.unpack_from(data)
+    pos = SUMMARY_HEADER.size
+    percentiles = list(data[pos:pos + count])
+    pos += count
+    row = struct.Struct(f'<B{4 + count}f')
+    if pos + field_count * row.size > len(data):
+        raise ValueError(f"telemetry summary cut off: {len(data)} bytes for {field_count} fields")
+    keys = ['min', 'max', 'mean', 'std'] + [f"p{percent}" for percent in percentiles]
+    fields = {}
+    for _ in range(field_count):
+        field_id, *values = row.unpack_from(data, pos)
+        if field_id < len(FIELDS):
+            fields[FIELDS[field_id]] = dict(zip(keys, values))
+        pos += row.size
+    return {'window_start': start, 'duration_s': duration, 'readings': readings, 'raw_sent': raw_sent,
+            'fields': fields}
+
+
+def describe_summary(summary):
+    fields = ", ".join(f"{name} {v['min']:.4g}..{v['max']:.4g} mean {v['mean']:.4g}"
+                       for name, v in list(summary['fields'].items())[:3])
+    return (f"{summary['readings']} readings over {summary['duration_s']:.0f}s, {summary['raw_sent']} sent raw; "
+            f"{fields}{', ...' if len(summary['fields']) > 3 else ''}")
@@ -0,0 +1,237 @@
+"""
+Bulk decoder for archived telemetry. Turns many sensor records at once into
+a NumPy structured array (one row per record, one column per reading)
+instead of splitting and filtering each record in Python the way the
+receivers do for live data. Input is either legacy text, one
+'timestamp|T:25.5C|H:45.2%|...' record per line, or raw received payloads,
+which may carry the join_buffer capture header and trailing NUL padding.
+Files are decoded in chunks so memory stays bounded:
+    python telemetry_archive.py captures.txt out.npy
+"""
+import sys
+
+import numpy as np
+
+from join_buffer import CAPTURE_HEADER, CAPTURE_MAGIC
+
+# Readings the senders emit, in wire order. Missing readings decode as NaN.
+FIELDS = ('T', 'H', 'P', 'Pitch', 'Roll', 'Yaw', 'Ax', 'Ay', 'Az', 'Gx', 'Gy', 'Gz', 'Compass')
+RECORD_DTYPE = np.dtype(
+    [('capture_id', '<u4'), ('capture_time', '<f8'), ('timestamp', 'datetime64[s]')]
+    + [(name, '<f8') for name in FIELDS]
+)
+TIMESTAMP_LEN = 19          # '%Y-%m-%d %H:%M:%S'
+KEY_WIDTH = 8
+VALUE_WIDTH = 24
+CHUNK_BYTES = 4 * 1024 * 1024
+PAYLOAD_BATCH = 50_000
+
+_SORTED_KEYS = np.array(sorted(FIELDS), dtype=f'S{KEY_WIDTH}')
+_KEY_COLUMN = np.array([FIELDS.index(key.decode()) for key in _SORTED_KEYS])
+# Where a well-formed timestamp has its separators; every other byte is a digit
+_TIMESTAMP_SEPARATORS = {4: ord('-'), 7: ord('-'), 10: ord(' '), 13: ord(':'), 16: ord(':')}
+
+
+def _gather(buf, starts, width, stops):
+    """Bytes buf[start:stop] of every field, NUL-padded to width columns."""
+    # Rows of a sliding-window view are copied with one memcpy each
+    padded = np.concatenate([buf, np.zeros(width, dtype=np.uint8)])
+    rows = np.lib.stride_tricks.sliding_window_view(padded, width)[starts]
+    inside = np.arange(width) < (stops - starts)[:, None]
+    rows *= inside
+    return rows, inside
+
+
+def _parse_timestamps(buf, line_starts, line_ends):
+    raw, inside = _gather(buf, line_starts, TIMESTAMP_LEN, line_ends)
+    digits = (raw >= ord('0')) & (raw <= ord('9'))
+    valid = inside.all(axis=1)
+    for pos in range(TIMESTAMP_LEN):
+        expected = _TIMESTAMP_SEPARATORS.get(pos)
+        valid &= (raw[:, pos] == expected) if expected is not None else digits[:, pos]
+    text = raw.view(f'S{TIMESTAMP_LEN}').ravel().copy()
+    text[~valid] = b'NaT'
+    return text.astype('datetime64[s]')
+
+
+def _decode_lines(buf, line_starts, line_ends, out):
+    """
+    Fills out (one row per line) from the text lines buf[start:end]. Fields are
+    found with array searches over the whole buffer: '|' splits fields, ':'
+    splits key from value, and the value keeps everything up to its last
+    digit, which drops units like 'C', '%' and 'hPa'.
+    """
+    out['timestamp'] = _parse_timestamps(buf, line_starts, line_ends)
+
+    pipes = np.flatnonzero(buf == ord('|'))
+    rows = np.searchsorted(line_starts, pipes, side='right') - 1
+    in_line = (rows >= 0) & (pipes < line_ends[np.maximum(rows, 0)])
+    starts, rows = pipes[in_line] + 1, rows[in_line]
+    if len(starts) == 0:
+        return
+    # A field ends at the next '|' or at the end of its line
+    stops = np.sort(np.concatenate([pipes, line_ends]))
+    ends = np.minimum(stops[np.searchsorted(stops, starts)], line_ends[rows])
+    colons = np.append(np.flatnonzero(buf == ord(':')), len(buf))
+    colon = colons[np.searchsorted(colons, starts)]
+    keyed = colon < ends
+    starts, ends, rows, colon = starts[keyed], ends[keyed], rows[keyed], colon[keyed]
+
+    keys, _ = _gather(buf, starts, KEY_WIDTH, np.minimum(colon, starts + KEY_WIDTH))
+    keys = np.char.strip(keys.view(f'S{KEY_WIDTH}').ravel())
+    slot = np.minimum(np.searchsorted(_SORTED_KEYS, keys), len(_SORTED_KEYS) - 1)
+    known = _SORTED_KEYS[slot] == keys
+
+    values, inside = _gather(buf, colon + 1, VALUE_WIDTH, ends)
+    # Plain comparisons: much faster than a lookup table on millions of bytes
+    digit = (values >= ord('0')) & (values <= ord('9'))
+    numeric_end = digit | (values == ord('.'))
+    numeric_end &= inside
+    has_digits = numeric_end.any(axis=1)
+    last = VALUE_WIDTH - 1 - numeric_end[:, ::-1].argmax(axis=1)
+    kept = np.arange(VALUE_WIDTH) <= last[:, None]
+    values *= kept
+    # Anything left besides a number's characters (or padding) makes the value NaN
+    allowed = numeric_end | ~kept | (values == 0)
+    for char in b'eE+- ':
+        allowed |= values == char
+    bad = ~has_digits | (ends - colon - 1 > VALUE_WIDTH) | ~allowed.all(axis=1)
+    text = values.view(f'S{VALUE_WIDTH}').ravel().copy()
+    text[bad] = b'nan'
+    try:
+        numbers = text.astype(np.float64)
+    except ValueError:
+        # Something like '1-2' that passed the character check; fall back per value
+        numbers = np.array([_to_float(value) for value in text])
+
+    columns = _KEY_COLUMN[slot]
+    for column, name in enumerate(FIELDS):
+        pick = known & (columns == column)
+        out[name][rows[pick]] = numbers[pick]
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
+
+
+def _empty(count):
+    out = np.zeros(count, dtype=RECORD_DTYPE)
+    out['capture_time'] = np.nan
+    for name in FIELDS:
+        out[name] = np.nan
+    return out
+
+
+def _line_bounds(buf):
+    newlines = np.flatnonzero(buf == ord('\n'))
+    line_starts = np.concatenate([[0], newlines + 1])
+    line_ends = np.append(newlines, len(buf))
+    # Ignore blank lines, including the one after a trailing newline
+    keep = line_ends > line_starts
+    return line_starts[keep], line_ends[keep]
+
+
+def decode_text(data):
+    """Decodes newline-separated legacy text records (bytes) into a structured array."""
+    buf = np.frombuffer(data, dtype=np.uint8)
+    line_starts, line_ends = _line_bounds(buf)
+    out = _empty(len(line_starts))
+    if len(out):
+        _decode_lines(buf, line_starts, line_ends, out)
+    return out
+
+
+def decode_payloads(payloads):
+    """
+    Decodes a batch of received telemetry payloads, stamped with a capture
+    header or not, into a structured array. capture_id is 0 and
+    capture_time NaN for unstamped payloads.
+    """
+    payloads = [bytes(payload) for payload in payloads]
+    lengths = np.array([len(payload) for payload in payloads], dtype=np.int64)
+    out = _empty(len(payloads))
+    if not len(payloads):
+        return out
+    buf = np.frombuffer(b''.join(payloads), dtype=np.uint8).copy()
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    ends = offsets + lengths
+
+    header, inside = _gather(buf, offsets, CAPTURE_HEADER.size, ends)
+    header_dtype = np.dtype([('magic', 'S2'), ('capture_id', '>u4'), ('capture_ms', '>u8')])
+    fields = header.view(header_dtype).ravel()
+    stamped = inside.all(axis=1) & (fields['magic'] == CAPTURE_MAGIC)
+    out['capture_id'][stamped] = fields['capture_id'][stamped]
+    out['capture_time'][stamped] = fields['capture_ms'][stamped] / 1000.0
+    # Blank out the binary header so its bytes can't be mistaken for '|' or ':'
+    header_bytes = (offsets[stamped, None] + np.arange(CAPTURE_HEADER.size)).ravel()
+    buf[header_bytes] = ord(' ')
+    line_starts = offsets + np.where(stamped, CAPTURE_HEADER.size, 0)
+
+    # Payloads are NUL padded to whole chunks; end each line at its first NUL
+    nuls = np.append(np.flatnonzero(buf == 0), len(buf))
+    line_ends = np.minimum(nuls[np.searchsorted(nuls, line_starts)], ends)
+    _decode_lines(buf, line_starts, np.maximum(line_ends, line_starts), out)
+    return out
+
+
+def _text_blocks(path, chunk_bytes):
+    """Whole lines of a text file, about chunk_bytes at a time."""
+    carry = b''
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(chunk_bytes)
+            if not block:
+                break
+            block = carry + block
+            cut = block.rfind(b'\n') + 1
+            carry = block[cut:]
+            if cut:
+                yield block[:cut]
+    if carry:
+        yield carry
+
+
+def iter_text_file(path, chunk_bytes=CHUNK_BYTES):
+    """Yields structured arrays for a text archive, reading chunk_bytes at a time."""
+    for block in _text_blocks(path, chunk_bytes):
+        yield decode_text(block)
+
+
+def count_text_records(path, chunk_bytes=CHUNK_BYTES):
+    """Number of records decode_text would return for the whole file."""
+    return sum(len(_line_bounds(np.frombuffer(block, dtype=np.uint8))[0])
+               for block in _text_blocks(path, chunk_bytes))
+
+
+def iter_payloads(payloads, batch=PAYLOAD_BATCH):
+    """Yields structured arrays for any iterable of payloads, batch records at a time."""
+    pending = []
+    for payload in payloads:
+        pending.append(payload)
+        if len(pending) >= batch:
+            yield decode_payloads(pending)
+            pending = []
+    if pending:
+        yield decode_payloads(pending)
+
+
+def main():
+    if len(sys.argv) != 3:
+        print("usage: python telemetry_archive.py captures.txt out.npy")
+        return
+    # Sized up front and filled chunk by chunk, so only one chunk is in memory
+    total = count_text_records(sys.argv[1])
+    out = np.lib.format.open_memmap(sys.argv[2], mode='w+', dtype=RECORD_DTYPE, shape=(total,))
+    row = 0
+    for records in iter_text_file(sys.argv[1]):
+        out[row:row + len(records)] = records
+        row += len(records)
+    out.flush()
+    print(f"Decoded {total} records into {sys.argv[2]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import json
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+
+# --- Local telemetry pub/sub bus ---
+# The receiver publishes decoded sensor frames and transfer progress here and
+# any number of local consumers subscribe over TCP (newline-delimited JSON).
+# publish() only appends to per-subscriber bounded buffers and never touches a
+# socket, so a slow or stuck dashboard can't stall the radio loop: when its
+# buffer is full the oldest message is dropped and counted.
+BUS_HOST = "127.0.0.1"
+BUS_PORT = 5570
+SUBSCRIBER_BUFFER = 256        # messages buffered per subscriber
+SEND_BATCH_BYTES = 64 * 1024   # max bytes handed to one send() call
+
+
+class Subscriber:
+    def __init__(self, sock=None, topics=None, buffer_size=SUBSCRIBER_BUFFER):
+        self.sock = sock
+        self.topics = topics            # None means everything
+        self.buffer = deque(maxlen=buffer_size)
+        self.pending = b''              # partially sent bytes
+        self.inbox = b''                # partial control line from the client
+        self.dropped = 0
+        self.delivered = 0
+        self.ready = threading.Event()  # for in-process subscribers
+
+    def wants(self, topic):
+        return self.topics is None or topic in self.topics
+
+    def offer(self, data):
+        if len(self.buffer) == self.buffer.maxlen:
+            self.dropped += 1           # deque drops the oldest for us
+        self.buffer.append(data)
+        self.ready.set()
+
+    def get(self, timeout=None):
+        """Blocking read for in-process subscribers. Returns a decoded message or None."""
+        if not self.buffer and not self.ready.wait(timeout):
+            return None
+        self.ready.clear()
+        try:
+            data = self.buffer.popleft()
+        except IndexError:
+            return None
+        self.delivered += 1
+        return json.loads(data)
+
+
+class TelemetryBus:
+    """
+    In-process broker with a TCP front end. Clients may send
+    'SUB sensor,progress\\n' to filter topics; otherwise they get everything.
+    """
+
+    def __init__(self, host=BUS_HOST, port=BUS_PORT, buffer_size=SUBSCRIBER_BUFFER):
+        self.host = host
+        self.port = port
+        self.buffer_size = buffer_size
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.selector = selectors.DefaultSelector()
+        self.listener = None
+        self.thread = None
+        self.running = False
+        self.published = 0
+        # Wakes the I/O thread when publish() adds data
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._wake_pending = False
+
+    # ---------- publishing side (called from the radio loop) ----------
+    def publish(self, topic, message):
+        """Queues a message for every interested subscriber. Never blocks on I/O."""
+        message = dict(message, topic=topic, published_at=time.time())
+        data = (json.dumps(message) + "\n").encode()
+        with self.lock:
+            self.published += 1
+            for sub in self.subscribers:
+                if sub.wants(topic):
+                    sub.offer(data)
+            wake = not self._wake_pending and self.running
+            self._wake_pending = True
+        if wake:
+            try:
+                self._wake_w.send(b'\0')
+            except BlockingIOError:
+                pass
+
+    def subscribe_local(self, topics=None):
+        """Adds an in-process subscriber; read it with .get()."""
+        sub = Subscriber(topics=set(topics) if topics else None, buffer_size=self.buffer_size)
+        with self.lock:
+            self.subscribers.append(sub)
+        return sub
+
+    def stats(self):
+        with self.lock:
+            return {
+                'published': self.published,
+                'subscribers': len(self.subscribers),
+                'dropped': sum(sub.dropped for sub in self.subscribers),
+                'max_backlog': max((len(sub.buffer) for sub in self.subscribers), default=0),
+            }
+
+    # ---------- TCP front end ----------
+    def start(self):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((self.host, self.port))
+        self.listener.listen(128)
+        self.listener.setblocking(False)
+        self.selector.register(self.listener, selectors.EVENT_READ, 'accept')
+        self.selector.register(self._wake_r, selectors.EVENT_READ, 'wake')
+        self.running = True
+        self.thread = threading.Thread(target=self._io_loop, name="telemetry-bus", daemon=True)
+        self.thread.start()
+        print(f"📣 Telemetry bus listening on {self.host}:{self.port}")
+
+    def stop(self):
+        self.running = False
+        try:
+            self._wake_w.send(b'\0')
+        except OSError:
+            pass
+        if self.thread:
+            self.thread.join(timeout=2)
+
+    def _io_loop(self):
+        while self.running:
+            for key, events in self.selector.select(timeout=0.5):
+                if key.data == 'accept':
+                    self._accept()
+                elif key.data == 'wake':
+                    try:
+                        while self._wake_r.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    with self.lock:
+                        self._wake_pending = False
+                else:
+                    sub = key.data
+                    if events & selectors.EVENT_READ:
+                        self._read_control(sub)
+                    if events & selectors.EVENT_WRITE:
+                        self._flush(sub)
+            self._update_interest()
+        for sub in list(self.subscribers):
+            if sub.sock is not None:
+                self._drop(sub)
+        self.listener.close()
+
+    def _accept(self):
+        try:
+            sock, _ = self.listener.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        sub = Subscriber(sock, buffer_size=self.buffer_size)
+        with self.lock:
+            self.subscribers.append(sub)
+        self.selector.register(sock, selectors.EVENT_READ, sub)
+
+    def _read_control(self, sub):
+        try:
+            data = sub.sock.recv(1024)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self._drop(sub)
+            return
+        sub.inbox += data
+        while b'\n' in sub.inbox:
+            line, sub.inbox = sub.inbox.split(b'\n', 1)
+            if line.startswith(b'SUB '):
+                topics = {t.strip() for t in line[4:].decode(errors='replace').split(',') if t.strip()}
+                sub.topics = topics or None
+
+    def _flush(self, sub):
+        if not sub.pending:
+            parts = []
+            size = 0
+            while sub.buffer and size < SEND_BATCH_BYTES:
+                data = sub.buffer.popleft()
+                parts.append(data)
+                size += len(data)
+            sub.delivered += len(parts)
+            sub.pending = b''.join(parts)
+        if not sub.pending:
+            return
+        try:
+            sent = sub.sock.send(sub.pending)
+            sub.pending = sub.pending[sent:]
+        except BlockingIOError:
+            pass
+        except OSError:
+            self._drop(sub)
+
+    def _update_interest(self):
+        with self.lock:
+            subs = [sub for sub in self.subscribers if sub.sock is not None]
+        for sub in subs:
+            want = selectors.EVENT_READ
+            if sub.buffer or sub.pending:
+                want |= selectors.EVENT_WRITE
+            try:
+                if self.selector.get_key(sub.sock).events != want:
+                    self.selector.modify(sub.sock, want, sub)
+            except (KeyError, ValueError):
+                pass
+
+    def _drop(self, sub):
+        with self.lock:
+            if sub in self.subscribers:
+                self.subscribers.remove(sub)
+        try:
+            self.selector.unregister(sub.sock)
+        except (KeyError, ValueError):
+            pass
+        sub.sock.close()
+
+
+def subscribe(host=BUS_HOST, port=BUS_PORT, topics=None):
+    """Small client helper: yields decoded messages from a running bus."""
+    with socket.create_connection((host, port)) as sock:
+        if topics:
+            sock.sendall(f"SUB {','.join(topics)}\n".encode())
+        for line in sock.makefile('rb'):
+            yield json.loads(line)
+
+
+if __name__ == "__main__":
+    # Print everything the receiver publishes: python telemetry_bus.py
+    for message in subscribe():
+        print(message)
@@ -0,0 +1,240 @@
+import io
+import struct
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# --- Change-detection tile codec ---
+# Frames are split into TILE_SIZE x TILE_SIZE tiles and compared with the
+# previous frame. Each tile falls into one of three classes:
+#   changed   -> sent as its own JPEG at full quality
+#   drifted   -> taken from a small low-quality background JPEG of the frame
+#   unchanged -> nothing sent, the receiver keeps its last reconstruction
+TILE_SIZE = 128
+CHANGE_THRESHOLD = 12.0     # mean abs luma difference for a tile to count as changed
+DRIFT_THRESHOLD = 3.0       # below this a tile is left as it is
+DIFF_SUBSAMPLE = 2          # compare every 2nd pixel in each direction
+TILE_QUALITY = 50
+BACKGROUND_SCALE = 8        # background is sent at 1/8 resolution
+BACKGROUND_QUALITY = 20
+KEYFRAME_EVERY = 20         # bounds drift from JPEG loss on the receiver side
+KEYFRAME_CHANGED_FRACTION = 0.5
+MAX_OUTSTANDING = 4         # undelivered frames whose reconstruction is kept
+
+MAGIC = b'TILE'
+FLAG_KEYFRAME = 1 << 0
+FLAG_BACKGROUND = 1 << 1
+# magic, flags, frame_id, base_frame_id, width, height, tile_size, tile_count
+HEADER = struct.Struct('>4sBIIHHHH')
+TILE_ENTRY = struct.Struct('>BBI')   # tile x, tile y, jpeg length
+BLOB_LEN = struct.Struct('>I')
+
+
+def _jpeg_bytes(array, quality):
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.fromarray(array).save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def _decode_jpeg(data):
+    from PIL import Image
+
+    return np.asarray(Image.open(io.BytesIO(data)).convert("RGB"))
+
+
+def tile_differences(current, reference, tile_size=TILE_SIZE, subsample=DIFF_SUBSAMPLE):
+    """
+    Mean absolute difference of the green channel (a cheap luma stand-in)
+    per tile, computed on a subsampled grid. Returns a (rows, cols) array.
+    """
+    step = subsample
+    cur = current[::step, ::step, 1].astype(np.int16)
+    ref = reference[::step, ::step, 1].astype(np.int16)
+    diff = np.abs(cur - ref)
+    t = tile_size // step
+    rows, cols = diff.shape[0] // t, diff.shape[1] // t
+    return diff[:rows * t, :cols * t].reshape(rows, t, cols, t).mean(axis=(1, 3))
+
+
+class TileEncoder:
+    """
+    Sender side. Keeps what the receiver is known to show: frames are coded
+    against the last one the ground confirmed (delivered()), not the last one
+    encoded, so a frame that fails or expires in the downlink queue doesn't
+    leave the two sides out of step. The reference is rebuilt from the JPEGs
+    as sent, exactly as the receiver decodes them.
+    """
+
+    def __init__(self, tile_size=TILE_SIZE):
+        self.tile_size = tile_size
+        self.reference = None
+        self.reference_id = None
+        self.frame_id = 0
+        self.frames_since_key = 0
+        self.outstanding = OrderedDict()     # frame id -> (reconstruction, frames since key, base id), not yet delivered
+        self.last_diff_ms = 0.0
+
+    def encode(self, frame, force_keyframe=False):
+        """
+        Encodes an RGB uint8 array (height and width multiples of tile_size).
+        Returns the packet bytes to downlink.
+        """
+        height, width = frame.shape[:2]
+        self.frame_id = (self.frame_id + 1) & 0xFFFFFFFF
+        base_id = self.frame_id if self.reference_id is None else self.reference_id
+
+        # Frames still on their way don't matter: this one is coded against
+        # the delivered reference, and delivered() works out whether the
+        # ground could still apply it
+        keyframe = (
+            force_keyframe
+            or self.reference is None
+            or self.reference.shape != frame.shape
+            or self.frames_since_key >= KEYFRAME_EVERY
+        )
+        if not keyframe:
+            start = time.perf_counter()
+            diffs = tile_differences(frame, self.reference, self.tile_size)
+            self.last_diff_ms = (time.perf_counter() - start) * 1000
+            changed = diffs > CHANGE_THRESHOLD
+            drifted = (diffs > DRIFT_THRESHOLD) & ~changed
+            keyframe = changed.mean() > KEYFRAME_CHANGED_FRACTION
+
+        if keyframe:
+            data = _jpeg_bytes(frame, TILE_QUALITY)
+            self._pending(_decode_jpeg(data).copy(), 0, base_id)
+            header = HEADER.pack(MAGIC, FLAG_KEYFRAME, self.frame_id, base_id, width, height, self.tile_size, 0)
+            return header + BLOB_LEN.pack(len(data)) + data
+
+        # Mirror what the receiver will do so both stay in step once it's delivered
+        reconstruction = self.reference.copy()
+        flags = 0
+        body = bytearray()
+        if drifted.any():
+            flags |= FLAG_BACKGROUND
+            small = frame[::BACKGROUND_SCALE, ::BACKGROUND_SCALE]
+            background = _jpeg_bytes(np.ascontiguousarray(small), BACKGROUND_QUALITY)
+            body += BLOB_LEN.pack(len(background)) + background
+            body += np.packbits(drifted.ravel()).tobytes()
+            reconstruction = _composite_background(reconstruction, background, drifted, self.tile_size)
+
+        ts = self.tile_size
+        tile_count = 0
+        for ty, tx in zip(*np.nonzero(changed)):
+            tile = np.ascontiguousarray(frame[ty * ts:(ty + 1) * ts, tx * ts:(tx + 1) * ts])
+            data = _jpeg_bytes(tile, TILE_QUALITY)
+            body += TILE_ENTRY.pack(tx, ty, len(data)) + data
+            reconstruction[ty * ts:(ty + 1) * ts, tx * ts:(tx + 1) * ts] = _decode_jpeg(data)
+            tile_count += 1
+
+        self._pending(reconstruction, self.frames_since_key + 1, base_id)
+        header = HEADER.pack(MAGIC, flags, self.frame_id, base_id, width, height, self.tile_size, tile_count)
+        return header + bytes(body)
+
+    def _pending(self, reconstruction, frames_since_key, base_id):
+        self.outstanding[self.frame_id] = (reconstruction, frames_since_key, base_id)
+        # Each one is a whole frame: past the limit the oldest is forgotten,
+        # and if it's delivered after all the next frame is a keyframe
+        while len(self.outstanding) > MAX_OUTSTANDING:
+            self.outstanding.popitem(last=False)
+
+    @property
+    def keyframe_outstanding(self):
+        """A keyframe is queued or part way down and hasn't been confirmed yet."""
+        return any(since_key == 0 for _, since_key, _ in self.outstanding.values())
+
+    def forget_outstanding(self):
+        """None of the outstanding frames will be delivered (they expired from the queue)."""
+        self.outstanding.clear()
+
+    def delivered(self, packet):
+        """
+        The ground has a packet from encode(): later frames are coded against
+        it. Frames encoded before it and still outstanding were dropped (the
+        downlink queue sends in order), so they are forgotten. A tile update
+        whose base was replaced by an earlier delivery was dropped by the
+        ground too, so it leaves the reference alone.
+        """
+        frame_id = HEADER.unpack_from(packet)[2]
+        entry = self.outstanding.get(frame_id)
+        if entry is None:
+            # Forgotten, or encoded before a restart: we don't know what the ground shows
+            self.reference = self.reference_id = None
+            return
+        while self.outstanding:
+            outstanding_id = next(iter(self.outstanding))
+            del self.outstanding[outstanding_id]
+            if outstanding_id == frame_id:
+                break
+        reconstruction, frames_since_key, base_id = entry
+        if frames_since_key and base_id != self.reference_id:
+            return
+        self.reference, self.frames_since_key = reconstruction, frames_since_key
+        self.reference_id = frame_id
+
+
+def _composite_background(reconstruction, background_jpeg, drifted, tile_size):
+    """Upscales the background and pastes it into the drifted tiles."""
+    small = _decode_jpeg(background_jpeg)
+    scale = reconstruction.shape[0] // small.shape[0]
+    upscaled = np.repeat(np.repeat(small, scale, axis=0), scale, axis=1)
+    out = reconstruction.copy()
+    ts = tile_size
+    for ty, tx in zip(*np.nonzero(drifted)):
+        out[ty * ts:(ty + 1) * ts, tx * ts:(tx + 1) * ts] = upscaled[ty * ts:(ty + 1) * ts, tx * ts:(tx + 1) * ts]
+    return out
+
+
+class TileDecoder:
+    """Receiver side. Composites incoming tiles over the last reconstruction."""
+
+    def __init__(self):
+        self.reconstruction = None
+        self.frame_id = None
+
+    def decode(self, packet):
+        """
+        Returns the reconstructed RGB array, or None if the packet refers to
+        a base frame we don't have (the sender's next keyframe resyncs us).
+        """
+        packet = bytes(packet)
+        magic, flags, frame_id, base_id, width, height, tile_size, tile_count = HEADER.unpack_from(packet)
+        if magic != MAGIC:
+            raise ValueError("Not a tile codec packet")
+        offset = HEADER.size
+
+        if flags & FLAG_KEYFRAME:
+            (length,) = BLOB_LEN.unpack_from(packet, offset)
+            offset += BLOB_LEN.size
+            self.reconstruction = _decode_jpeg(packet[offset:offset + length]).copy()
+            self.frame_id = frame_id
+            return self.reconstruction
+
+        if self.reconstruction is None or self.frame_id != base_id:
+            return None
+
+        rows, cols = height // tile_size, width // tile_size
+        if flags & FLAG_BACKGROUND:
+            (length,) = BLOB_LEN.unpack_from(packet, offset)
+            offset += BLOB_LEN.size
+            background = packet[offset:offset + length]
+            offset += length
+            bitmap_len = (rows * cols + 7) // 8
+            bits = np.frombuffer(packet, dtype=np.uint8, count=bitmap_len, offset=offset)
+            offset += bitmap_len
+            drifted = np.unpackbits(bits)[:rows * cols].reshape(rows, cols).astype(bool)
+            self.reconstruction = _composite_background(self.reconstruction, background, drifted, tile_size)
+
+        ts = tile_size
+        for _ in range(tile_count):
+            tx, ty, length = TILE_ENTRY.unpack_from(packet, offset)
+            offset += TILE_ENTRY.size
+            tile = _decode_jpeg(packet[offset:offset + length])
+            offset += length
+            self.reconstruction[ty * ts:(ty + 1) * ts, tx * ts:(tx + 1) * ts] = tile
+
+        self.frame_id = frame_id
+        return self.reconstruction
@@ -0,0 +1,348 @@
+import json
+import os
+import struct
+import time
+from collections import OrderedDict, deque
+
+import file_service
+
+# --- Uplink command channel ---
+# The receiver only ever answers with ACK payloads, but an ACK payload can
+# hold 32 bytes and the ACK itself needs 1 (compact framing) or 5. The ground
+# appends one command to the rest of each ACK it loads:
+#   [request id u8][op u8][args]           (+ 4-byte control tag with a link key)
+# and the satellite answers in a RESP transfer:
+#   [count u8] then count x [request id u8][status u8][value i32]
+# Commands are pipelined: the ground keeps up to WINDOW unanswered commands
+# and puts a different one on each ACK, so they all reach the satellite
+# before the first response comes back. A command stays outstanding (and is
+# re-sent) until its response arrives; the satellite runs each id once and
+# answers repeats from a cache, so a lost ACK or RESP costs a retry, not a
+# second SET. The cache and the newest id are kept in COMMAND_STATE_FILE
+# (and the ground's next id in its own file), because the ground keeps
+# re-sending a command whose RESP was lost in the next contact. Replays matter: an old SET would undo a newer one and an old
+# FILE would spend the downlink on a file nobody asked for this time. With a
+# link key the tag is bound to the session (security.py), so commands from an
+# earlier session don't verify, and within one the satellite drops an id it
+# no longer remembers answering that is more than WINDOW behind the newest.
+OP_PING = 0
+OP_GET = 1
+OP_SET = 2
+OP_FILE = 3     # args: one file_service request line, queued for this contact
+
+STATUS_OK = 0
+STATUS_UNKNOWN_SETTING = 1
+STATUS_OUT_OF_RANGE = 2
+STATUS_BAD_COMMAND = 3
+STATUS_NAMES = {STATUS_OK: 'ok', STATUS_UNKNOWN_SETTING: 'unknown setting',
+                STATUS_OUT_OF_RANGE: 'out of range', STATUS_BAD_COMMAND: 'bad command'}
+
+COMMAND_HEADER = struct.Struct('>BB')
+SET_ARGS = struct.Struct('>Bi')
+RESPONSE = struct.Struct('>BBi')
+
+MAX_COMMAND_BYTES = 32 - 5 - 4   # fits after a fixed-index ACK (b'ACK' + index) and a control tag
+WINDOW = 8
+RESPONSE_CACHE = 64
+CONFIG_FILE = "sat_config.json"
+COMMAND_STATE_FILE = "sat_commands.json"
+COMMAND_FILE = "uplink_commands.txt"
+
+# Settings the ground may change: id -> (name, default, min, max). Each is
+# read where it is used, so a SET takes effect from the next use on.
+SETTINGS = {
+    1: ('image_size', 1024, 64, 2048),           # square capture resize, pixels
+    2: ('jpeg_quality', 50, 5, 95),
+    3: ('contact_window_s', 60, 5, 600),
+    4: ('priority_telemetry', 0, 0, 9),          # store-and-forward priorities
+    5: ('priority_thumbnail', 1, 0, 9),
+    6: ('priority_log', 2, 0, 9),
+    7: ('priority_image', 3, 0, 9),
+    8: ('imu_burst_s', 0, 0, 60),                # IMU burst per capture, seconds (0: off)
+    9: ('imu_rate_hz', 0, 0, 952),               # burst sample rate (0: as fast as the HAT delivers)
+    10: ('priority_imu', 2, 0, 9),
+}
+SETTING_IDS = {name: setting_id for setting_id, (name, *_) in SETTINGS.items()}
+
+
+def encode_command(request_id, op, args=b''):
+    return COMMAND_HEADER.pack(request_id & 0xFF, op) + bytes(args)
+
+
+def parse_command_line(line):
+    """
+    Turns an operator's line into (op, args, label):
+      PING | GET <setting> | SET <setting> <value> | FILE <file request>
+    Raises ValueError if it isn't a command or won't fit in an ACK payload.
+    """
+    words = line.split(None, 1)
+    if not words:
+        raise ValueError("empty command")
+    op, rest = words[0].upper(), words[1].strip() if len(words) > 1 else ''
+    if op == 'PING' and not rest:
+        return OP_PING, b'', 'PING'
+    if op in ('GET', 'SET'):
+        parts = rest.split()
+        if not parts or parts[0] not in SETTING_IDS or len(parts) != (1 if op == 'GET' else 2):
+            raise ValueError(f"not a {op} of a known setting: {line!r}")
+        if op == 'GET':
+            return OP_GET, bytes([SETTING_IDS[parts[0]]]), f"GET {parts[0]}"
+        return OP_SET, SET_ARGS.pack(SETTING_IDS[parts[0]], int(parts[1])), f"SET {parts[0]} {int(parts[1])}"
+    if op == 'FILE':
+        request = file_service.parse_request(rest)
+        args = file_service.format_request(request).encode()
+        if COMMAND_HEADER.size + len(args) > MAX_COMMAND_BYTES:
+            raise ValueError(f"file request too long for one ACK payload ({len(args)} bytes)")
+        return OP_FILE, args, f"FILE {rest}"
+    raise ValueError(f"unknown command: {line!r}")
+
+
+def _save_json(path, data):
+    """Writes data to path atomically, synced to disk."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _load_json(path):
+    """The JSON in path, or None if there is none or it can't be read."""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ {path} unreadable, starting afresh: {e}")
+        return None
+
+
+def decode_responses(data):
+    """[(request id, status, value)] from a RESP transfer. NUL padding after them is ignored."""
+    data = bytes(data)
+    count = min(data[0], (len(data) - 1) // RESPONSE.size) if data else 0
+    return [RESPONSE.unpack_from(data, 1 + i * RESPONSE.size) for i in range(count)]
+
+
+class OnboardConfig:
+    """The SETTINGS values, kept in a JSON file so changes survive a reboot."""
+
+    def __init__(self, path=CONFIG_FILE):
+        self.path = path
+        self.values = {name: default for name, default, _, _ in SETTINGS.values()}
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    saved = json.load(f)
+                self.values.update({name: int(saved[name]) for name in self.values if name in saved})
+            except (OSError, ValueError) as e:
+                print(f"⚠️ {path} unreadable, using defaults: {e}")
+
+    def get(self, name):
+        return self.values[name]
+
+    def priority(self, kind):
+        """Store-and-forward priority for a product kind, or None for the default."""
+        return self.values.get(f"priority_{kind}")
+
+    def set(self, name, value):
+        self.values[name] = value
+        _save_json(self.path, self.values)
+
+
+class CommandDispatcher:
+    """
+    Satellite side. handle() takes the tail of every ACK payload; responses
+    pile up until take_responses() hands them over for the next RESP
+    transfer. cipher (security.LinkCipher) is required to tag commands when set.
+    state_path keeps the answered commands and the newest id across contacts.
+    """
+
+    def __init__(self, config, cipher=None, state_path=None):
+        self.config = config
+        self.cipher = cipher
+        self.state_path = state_path
+        self.responses = OrderedDict()     # request id -> response, ready to send
+        self.answered = OrderedDict()      # request id -> (command, response), for repeats
+        self.file_requests = []
+        self.commands_run = 0
+        self.rejected = 0
+        self.last_heard = None
+        self.newest = None                 # highest request id seen, modulo 256
+        state = _load_json(state_path)
+        if state:
+            self.newest = state.get('newest')
+            self.answered = OrderedDict((int(request_id), (bytes.fromhex(command), bytes.fromhex(response)))
+                                        for request_id, command, response in state.get('answered', []))
+
+    def _save(self):
+        if not self.state_path:
+            return
+        _save_json(self.state_path, {
+            'newest': self.newest,
+            'answered': [[request_id, command.hex(), response.hex()]
+                         for request_id, (command, response) in self.answered.items()],
+        })
+
+    def handle(self, tail):
+        tail = bytes(tail)
+        if self.cipher:
+            tail = self.cipher.verify_control(tail)
+            if tail is None:
+                self.rejected += 1
+                return
+        if len(tail) < COMMAND_HEADER.size:
+            return
+        self.last_heard = time.time()
+        request_id, op = COMMAND_HEADER.unpack_from(tail)
+        command, response = self.answered.get(request_id, (None, None))
+        if command == tail:
+            # Its response went missing (or is still queued): send it again
+            self.responses[request_id] = response
+            return
+        behind = 0 if self.newest is None else (self.newest - request_id) & 0xFF
+        if WINDOW <= behind < 0x80:
+            # Older than anything the ground can still have in flight: a replay
+            self.rejected += 1
+            return
+        if self.newest is None or behind >= 0x80:
+            self.newest = request_id
+        status, value = self._run(op, tail[COMMAND_HEADER.size:])
+        self.commands_run += 1
+        response = RESPONSE.pack(request_id, status, value)
+        self.responses[request_id] = response
+        self.answered.pop(request_id, None)
+        self.answered[request_id] = (tail, response)
+        if len(self.answered) > RESPONSE_CACHE:
+            self.answered.popitem(last=False)
+        self._save()
+
+    def _run(self, op, args):
+        if op == OP_PING:
+            return STATUS_OK, 0
+        if op == OP_GET and len(args) == 1:
+            if args[0] not in SETTINGS:
+                return STATUS_UNKNOWN_SETTING, 0
+            return STATUS_OK, self.config.get(SETTINGS[args[0]][0])
+        if op == OP_SET and len(args) == SET_ARGS.size:
+            setting_id, value = SET_ARGS.unpack(args)
+            if setting_id not in SETTINGS:
+                return STATUS_UNKNOWN_SETTING, 0
+            name, _, low, high = SETTINGS[setting_id]
+            if not low <= value <= high:
+                return STATUS_OUT_OF_RANGE, self.config.get(name)
+            self.config.set(name, value)
+            print(f"🛰️ Ground set {name} = {value}")
+            return STATUS_OK, value
+        if op == OP_FILE:
+            try:
+                self.file_requests.append(file_service.parse_request(args.decode()))
+            except (UnicodeDecodeError, ValueError):
+                return STATUS_BAD_COMMAND, 0
+            return STATUS_OK, len(self.file_requests)
+        return STATUS_BAD_COMMAND, 0
+
+    def has_responses(self):
+        return bool(self.responses)
+
+    def take_responses(self):
+        data = bytes([len(self.responses)]) + b''.join(self.responses.values())
+        self.responses.clear()
+        return data
+
+    def take_file_requests(self):
+        requests, self.file_requests = self.file_requests, []
+        return requests
+
+
+class CommandClient:
+    """
+    Ground side. submit() queues a command; tail() is what to append to the
+    next ACK payload; handle_responses() takes a RESP transfer and returns a
+    line per newly answered command. state_path keeps the next request id
+    across restarts, so new commands aren't taken for replays of old ones.
+    """
+
+    def __init__(self, cipher=None, window=WINDOW, state_path=None):
+        self.cipher = cipher
+        self.window = window
+        self.state_path = state_path
+        state = _load_json(state_path)
+        self.next_id = state.get('next_id', 0) if state else 0
+        self.queued = deque()                # (op, args, label) not yet in flight
+        self.in_flight = OrderedDict()       # request id -> (label, command, first sent)
+        self.rotation = deque()
+        self.round_trips = []
+
+    def submit(self, line):
+        """Queues an operator's command line. Raises ValueError if it isn't one."""
+        self.queued.append(parse_command_line(line))
+
+    def submit_file(self, path=COMMAND_FILE):
+        """Queues every command in path, then empties it. Returns how many were queued."""
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return 0
+        with open(path) as f:
+            lines = [line for line in f if line.strip() and not line.lstrip().startswith('#')]
+        open(path, 'w').close()
+        count = 0
+        for line in lines:
+            try:
+                self.submit(line)
+                count += 1
+            except ValueError as e:
+                print(f"⚠️ Skipping command: {e}")
+        return count
+
+    @property
+    def pending(self):
+        return len(self.queued) + len(self.in_flight)
+
+    def tail(self):
+        """
+        The command to ride on the next ACK payload, or b''. Tagged as it goes
+        out, so commands still in flight carry over into a new session.
+        """
+        while self.queued and len(self.in_flight) < self.window:
+            while self.next_id in self.in_flight:
+                self.next_id = (self.next_id + 1) & 0xFF
+            op, args, label = self.queued.popleft()
+            self.in_flight[self.next_id] = (label, encode_command(self.next_id, op, args), None)
+            self.rotation.append(self.next_id)
+            self.next_id = (self.next_id + 1) & 0xFF
+            if self.state_path:
+                _save_json(self.state_path, {'next_id': self.next_id})
+        while self.rotation:
+            request_id = self.rotation[0]
+            self.rotation.rotate(-1)
+            if request_id not in self.in_flight:
+                self.rotation.remove(request_id)
+                continue
+            label, command, first_sent = self.in_flight[request_id]
+            if first_sent is None:
+                self.in_flight[request_id] = (label, command, time.time())
+            return self.cipher.sign_control(command) if self.cipher else command
+        return b''
+
+    def handle_responses(self, data):
+        lines = []
+        now = time.time()
+        for request_id, status, value in decode_responses(data):
+            entry = self.in_flight.pop(request_id, None)
+            if entry is None:
+                continue    # a repeat of one already answered
+            label, _, first_sent = entry
+            rtt_s = now - first_sent
+            self.round_trips.append(rtt_s)
+            result = f"= {value}" if status == STATUS_OK else f"failed: {STATUS_NAMES.get(status, status)}"
+            lines.append(f"#{request_id} {label} {result} ({rtt_s * 1000:.0f} ms)")
+        return lines
+
+    def describe(self):
+        if not self.round_trips:
+            return "no commands answered"
+        ordered = sorted(self.round_trips)
+        return (f"{len(ordered)} commands, round trip median {ordered[len(ordered) // 2] * 1000:.0f} ms, "
+                f"max {ordered[-1] * 1000:.0f} ms")
@@ -0,0 +1,396 @@
+import gzip
+import http.client
+import json
+import os
+import queue
+import random
+import secrets
+import sqlite3
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+# --- Upload sinks ---
+# Where receivers put joined captures and summaries. Every sink takes
+# post(document) and returns the document's key, raising UploadError when it
+# couldn't be stored, and shares the same options:
+#   batch_size   documents per write (1: each one goes out as it's posted)
+#   compress     gzip the request body / zlib each stored row
+# A batched post() only queues the document and returns None: the key isn't
+# real until the batch is written. post(document, callback) calls
+# callback(key, error) for each document once its batch was stored (error
+# None) or refused (an UploadError), in either mode. A partial batch goes out
+# after flush_after_s on a timer, or on flush()/close().
+# FirebaseSink talks to the Realtime Database REST API over a pool of
+# keep-alive connections: one POST per document, or one PATCH of
+# {key: document, ...} per batch with keys made here (time-ordered like
+# Firebase push ids). SqliteSink and JsonLinesSink keep documents on local
+# disk, and StubServer answers the REST calls in-process so the upload path
+# can be load-tested without the real database.
+# Receivers pick their sink from $UPLOAD_SINK: an http(s) URL, a .db/.sqlite
+# path (or sqlite:path), or any other path for JSON lines.
+FIREBASE_URL = "https://fire-authentic-f5c81-default-rtdb.firebaseio.com/image_log.json"
+SINK_ENV = "UPLOAD_SINK"
+BATCH_ENV = "UPLOAD_BATCH_SIZE"
+COMPRESS_ENV = "UPLOAD_COMPRESS"
+POOL_SIZE = 4
+TIMEOUT_S = 10
+FLUSH_AFTER_S = 5.0     # a partial batch goes out this long after its first document
+
+
+class UploadError(Exception):
+    pass
+
+
+def new_key():
+    """Sorts by creation time like a Firebase push id: ms timestamp, then random."""
+    return f"{int(time.time() * 1000):012x}{secrets.token_hex(4)}"
+
+
+class UploadSink:
+    """Batching and counters shared by every sink; subclasses implement _write_batch()."""
+
+    def __init__(self, batch_size=1, compress=False, flush_after_s=FLUSH_AFTER_S):
+        self.batch_size = max(1, batch_size)
+        self.compress = compress
+        self.flush_after_s = flush_after_s
+        self.pending = []       # (key, document, callback) waiting for the batch to fill
+        self.timer = None       # flushes the pending batch once it's flush_after_s old
+        self.lock = threading.Lock()
+        self.documents_sent = 0
+        self.documents_failed = 0
+        self.bytes_sent = 0
+
+    def post(self, document, callback=None):
+        """
+        Stores a document, or queues it when batching. Returns its key once it
+        is stored, None while it is only queued. With a callback, errors go to
+        it instead of being raised (see the top of this file).
+        """
+        if self.batch_size == 1:
+            try:
+                key = self._send([(new_key(), document)], single=True)
+            except UploadError as e:
+                if callback is None:
+                    raise
+                callback(None, e)
+                return None
+            if callback is not None:
+                callback(key, None)
+            return key
+        with self.lock:
+            if not self.pending:
+                self.timer = threading.Timer(self.flush_after_s, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+            self.pending.append((new_key(), document, callback))
+            batch = self._take_batch() if len(self.pending) >= self.batch_size else None
+        if batch:
+            self._send_batch(batch)
+        return None
+
+    def _take_batch(self):
+        """Empties the pending batch and stops its timer. Call with the lock held."""
+        batch, self.pending = self.pending, []
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        return batch
+
+    def _send_batch(self, batch):
+        """Writes a batch and tells every document in it how it went."""
+        try:
+            self._send([(key, document) for key, document, _ in batch])
+            error = None
+        except UploadError as e:
+            error = e
+        for key, _, callback in batch:
+            if callback is not None:
+                callback(None if error else key, error)
+        if error is not None and any(callback is None for _, _, callback in batch):
+            print(f"❌ Failed to upload a batch of {len(batch)} documents: {error}")
+
+    def flush(self):
+        with self.lock:
+            batch = self._take_batch()
+        if batch:
+            self._send_batch(batch)
+
+    def close(self):
+        self.flush()
+
+    def _send(self, batch, single=False):
+        try:
+            key, nbytes = self._write_batch(batch, single)
+        except (UploadError, OSError, http.client.HTTPException, sqlite3.Error) as e:
+            with self.lock:
+                self.documents_failed += len(batch)
+            if isinstance(e, UploadError):
+                raise
+            raise UploadError(f"{type(e).__name__}: {e}") from e
+        with self.lock:
+            self.documents_sent += len(batch)
+            self.bytes_sent += nbytes
+        return key
+
+    def _write_batch(self, batch, single):
+        """Stores [(key, document)]. Returns (key of the first, bytes written)."""
+        raise NotImplementedError
+
+    def stats(self):
+        return {'sent': self.documents_sent, 'failed': self.documents_failed, 'bytes': self.bytes_sent,
+                'pending': len(self.pending)}
+
+
+class FirebaseSink(UploadSink):
+    """
+    Realtime Database REST endpoint (a .../path.json URL). pool_size
+    connections are kept open between requests; 0 opens one per request.
+    """
+
+    def __init__(self, url=FIREBASE_URL, pool_size=POOL_SIZE, timeout=TIMEOUT_S, **options):
+        super().__init__(**options)
+        parts = urlsplit(url)
+        self.url = url
+        self.https = parts.scheme == 'https'
+        self.host = parts.netloc
+        self.path = parts.path + (f"?{parts.query}" if parts.query else "")
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.pool = queue.LifoQueue()
+
+    def _connection(self):
+        try:
+            return self.pool.get_nowait()
+        except queue.Empty:
+            cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            return cls(self.host, timeout=self.timeout)
+
+    def _request(self, method, document):
+        body = json.dumps(document).encode()
+        headers = {'Content-Type': 'application/json'}
+        if self.compress:
+            body = gzip.compress(body, compresslevel=6)
+            headers['Content-Encoding'] = 'gzip'
+        for attempt in range(2):
+            connection = self._connection()
+            try:
+                connection.request(method, self.path, body, headers)
+                response = connection.getresponse()
+                data = response.read()
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                if attempt:
+                    raise
+                continue    # a kept-alive connection the server had already closed
+            if self.pool.qsize() < self.pool_size and not response.will_close:
+                self.pool.put(connection)
+            else:
+                connection.close()
+            if response.status != 200:
+                raise UploadError(f"{response.status}, Response: {data[:200].decode(errors='replace')}")
+            return data, len(body)
+
+    def _write_batch(self, batch, single):
+        if single:
+            key, document = batch[0]
+            data, nbytes = self._request('POST', document)
+            # Firebase answers a POST with the generated key as {"name": ...}
+            return json.loads(data).get("name"), nbytes
+        _, nbytes = self._request('PATCH', dict(batch))
+        return batch[0][0], nbytes
+
+    def close(self):
+        super().close()
+        while not self.pool.empty():
+            self.pool.get_nowait().close()
+
+
+class SqliteSink(UploadSink):
+    """One row per document in a local SQLite database."""
+
+    def __init__(self, path, **options):
+        super().__init__(**options)
+        self.path = path
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS documents "
+                        "(key TEXT PRIMARY KEY, stored REAL, compressed INTEGER, body BLOB)")
+        self.db_lock = threading.Lock()
+
+    def _write_batch(self, batch, single):
+        now = time.time()
+        rows = []
+        for key, document in batch:
+            body = json.dumps(document).encode()
+            rows.append((key, now, int(self.compress), zlib.compress(body) if self.compress else body))
+        with self.db_lock, self.db:
+            self.db.executemany("INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?)", rows)
+        return batch[0][0], sum(len(row[3]) for row in rows)
+
+    def documents(self):
+        """{key: document} of everything stored, oldest first."""
+        with self.db_lock:
+            rows = self.db.execute("SELECT key, compressed, body FROM documents ORDER BY key").fetchall()
+        return {key: json.loads(zlib.decompress(body) if compressed else body) for key, compressed, body in rows}
+
+    def close(self):
+        super().close()
+        self.db.close()
+
+
+class JsonLinesSink(UploadSink):
+    """Appends {"key": ..., "document": ...} lines to a file (gzip members when compressing)."""
+
+    def __init__(self, path, **options):
+        super().__init__(**options)
+        self.path = path
+        self.file_lock = threading.Lock()
+
+    def _write_batch(self, batch, single):
+        data = "".join(json.dumps({'key': key, 'document': document}) + "\n" for key, document in batch).encode()
+        if self.compress:
+            data = gzip.compress(data, compresslevel=6)
+        with self.file_lock, open(self.path, 'ab') as f:
+            f.write(data)
+        return batch[0][0], len(data)
+
+
+def make_sink(target, **options):
+    """The sink for a URL or path (see the top of this file), or None for no target."""
+    if not target:
+        return None
+    if target.startswith(('http://', 'https://')):
+        return FirebaseSink(target, **options)
+    if target.startswith('sqlite:'):
+        return SqliteSink(target[len('sqlite:'):], **options)
+    if target.endswith(('.db', '.sqlite')):
+        return SqliteSink(target, **options)
+    return JsonLinesSink(target, **options)
+
+
+def env_options():
+    """Sink options from $UPLOAD_BATCH_SIZE and $UPLOAD_COMPRESS."""
+    return {'batch_size': int(os.environ.get(BATCH_ENV, "1")),
+            'compress': os.environ.get(COMPRESS_ENV, "") not in ("", "0")}
+
+
+def sink_from_env(default=FIREBASE_URL):
+    """The sink $UPLOAD_SINK names (default when unset), with env_options()."""
+    return make_sink(os.environ.get(SINK_ENV, default), **env_options())
+
+
+class StubServer:
+    """
+    In-process stand-in for the Realtime Database: POST stores a document
+    under a new key and answers {"name": key}, PATCH/PUT merge {key: document}
+    into the collection. latency_s is added to every request, and a
+    failure_rate fraction of writes is refused with a 503 and not stored.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency_s=0.0, failure_rate=0.0, seed=None):
+        self.latency_s = latency_s
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+        self.documents = {}
+        self.requests = 0
+        self.failures = 0
+        self.bytes_received = 0
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes: without this, each
+            # kept-alive response waits out the client's delayed ACK
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, obj):
+                body = json.dumps(obj).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _body(self):
+                data = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                with stub.lock:
+                    stub.requests += 1
+                    stub.bytes_received += len(data)
+                if self.headers.get('Content-Encoding') == 'gzip':
+                    data = gzip.decompress(data)
+                if stub.latency_s:
+                    time.sleep(stub.latency_s)
+                return json.loads(data)
+
+            def _refused(self):
+                with stub.lock:
+                    refuse = stub.failure_rate and stub.rng.random() < stub.failure_rate
+                    if refuse:
+                        stub.failures += 1
+                if refuse:
+                    self._reply(503, {'error': "Service Unavailable"})
+                return refuse
+
+            def do_POST(self):
+                try:
+                    document = self._body()
+                except ValueError as e:
+                    return self._reply(400, {'error': str(e)})
+                if self._refused():
+                    return
+                key = new_key()
+                with stub.lock:
+                    stub.documents[key] = document
+                self._reply(200, {'name': key})
+
+            def do_PATCH(self):
+                try:
+                    documents = self._body()
+                except ValueError as e:
+                    return self._reply(400, {'error': str(e)})
+                if not isinstance(documents, dict):
+                    return self._reply(400, {'error': "PATCH needs an object"})
+                if self._refused():
+                    return
+                with stub.lock:
+                    stub.documents.update(documents)
+                self._reply(200, documents)
+
+            do_PUT = do_PATCH
+
+            def do_GET(self):
+                with stub.lock:
+                    self._reply(200, {'documents': len(stub.documents), 'requests': stub.requests})
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/image_log.json"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()